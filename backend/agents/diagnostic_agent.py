@@ -252,17 +252,56 @@ Pricing Guidance:
             Diagnostic result with root cause, confidence, and recommendations
         """
         if not self.agent_executor:
-            return {
-                "success": False,
-                "error": "Agent not initialized",
-                "diagnosis": None
-            }
+            return self._not_initialized()
         
         try:
-            # Build input
-            vehicle_info = f"{vehicle_context.get('brand', 'Unknown')} {vehicle_context.get('model', '')} {vehicle_context.get('year', '')}"
+            # Execute with callback for token tracking
+            with get_openai_callback() as cb:
+                result = self.agent_executor.invoke(
+                    self._build_input(symptoms, vehicle_context, chat_history)
+                )
+                
+                logger.info(f"Agent tokens used: {cb.total_tokens}, Cost: ${cb.total_cost:.4f}")
+            
+            return self._build_result(result, cb)
             
-            input_text = f"""
+        except Exception as e:
+            return self._failed(e)
+    
+    async def adiagnose(
+        self,
+        symptoms: str,
+        vehicle_context: Dict[str, Any],
+        chat_history: List[Dict] = None
+    ) -> Dict[str, Any]:
+        """Async variant of diagnose() for the ASGI serving mode"""
+        if not self.agent_executor:
+            return self._not_initialized()
+        
+        try:
+            with get_openai_callback() as cb:
+                result = await self.agent_executor.ainvoke(
+                    self._build_input(symptoms, vehicle_context, chat_history)
+                )
+                
+                logger.info(f"Agent tokens used: {cb.total_tokens}, Cost: ${cb.total_cost:.4f}")
+            
+            return self._build_result(result, cb)
+            
+        except Exception as e:
+            return self._failed(e)
+    
+    def _build_input(
+        self,
+        symptoms: str,
+        vehicle_context: Dict[str, Any],
+        chat_history: Optional[List[Dict]]
+    ) -> Dict[str, Any]:
+        """Agent input: instruction text plus the last few chat messages"""
+        # Build input
+        vehicle_info = f"{vehicle_context.get('brand', 'Unknown')} {vehicle_context.get('model', '')} {vehicle_context.get('year', '')}"
+        
+        input_text = f"""
 Vehicle: {vehicle_info}
 Symptoms: {symptoms}
 
@@ -274,47 +313,53 @@ Analyze these symptoms and:
 5. Recommend diagnostic actions
 
 Return structured response with clear reasoning.
-            """.strip()
-            
-            # Format chat history
-            formatted_history = []
-            if chat_history:
-                for msg in chat_history[-5:]:  # Last 5 messages
-                    if msg.get("role") == "user":
-                        formatted_history.append(HumanMessage(content=msg.get("content", "")))
-                    else:
-                        formatted_history.append(AIMessage(content=msg.get("content", "")))
-            
-            # Execute with callback for token tracking
-            with get_openai_callback() as cb:
-                result = self.agent_executor.invoke({
-                    "input": input_text,
-                    "chat_history": formatted_history
-                })
-                
-                logger.info(f"Agent tokens used: {cb.total_tokens}, Cost: ${cb.total_cost:.4f}")
-            
-            # Parse and structure response
-            output = result.get("output", "")
-            
-            # Try to extract structured data from output
-            parsed = self._parse_diagnostic_output(output)
-            
-            return {
-                "success": True,
-                "diagnosis": parsed,
-                "raw_output": output,
-                "tokens_used": cb.total_tokens,
-                "cost": cb.total_cost
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Diagnosis failed: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "diagnosis": None
-            }
+        """.strip()
+        
+        # Format chat history
+        formatted_history = []
+        if chat_history:
+            for msg in chat_history[-5:]:  # Last 5 messages
+                if msg.get("role") == "user":
+                    formatted_history.append(HumanMessage(content=msg.get("content", "")))
+                else:
+                    formatted_history.append(AIMessage(content=msg.get("content", "")))
+        
+        return {
+            "input": input_text,
+            "chat_history": formatted_history
+        }
+    
+    def _build_result(self, result: Dict[str, Any], cb) -> Dict[str, Any]:
+        # Parse and structure response
+        output = result.get("output", "")
+        
+        # Try to extract structured data from output
+        parsed = self._parse_diagnostic_output(output)
+        
+        return {
+            "success": True,
+            "diagnosis": parsed,
+            "raw_output": output,
+            "tokens_used": cb.total_tokens,
+            "cost": cb.total_cost
+        }
+    
+    @staticmethod
+    def _not_initialized() -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": "Agent not initialized",
+            "diagnosis": None
+        }
+    
+    @staticmethod
+    def _failed(e: Exception) -> Dict[str, Any]:
+        logger.error(f"❌ Diagnosis failed: {e}")
+        return {
+            "success": False,
+            "error": str(e),
+            "diagnosis": None
+        }
     
     def _parse_diagnostic_output(self, output: str) -> Dict[str, Any]:
         """Parse agent output into structured diagnostic data"""
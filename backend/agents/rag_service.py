@@ -4,6 +4,7 @@ Combines LlamaIndex retrieval with LangChain generation
 """
 
 import os
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
@@ -15,6 +16,9 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from llama_index.core import VectorStoreIndex, Document
 from llama_index.core.retrievers import VectorIndexRetriever
 
+from services.embedding_cache import CachedEmbeddings
+from knowledge_base.filters import vehicle_filters
+
 logger = logging.getLogger(__name__)
 
 
@@ -72,9 +76,12 @@ Response:"""
                     temperature=0.1,
                     api_key=os.getenv("OPENAI_API_KEY")
                 )
-                self.embeddings = OpenAIEmbeddings(
-                    model="text-embedding-3-small",
-                    api_key=os.getenv("OPENAI_API_KEY")
+                self.embeddings = CachedEmbeddings(
+                    OpenAIEmbeddings(
+                        model="text-embedding-3-small",
+                        api_key=os.getenv("OPENAI_API_KEY")
+                    ),
+                    model="text-embedding-3-small"
                 )
                 logger.info("✅ RAG service using OpenAI")
             
@@ -107,76 +114,120 @@ Response:"""
             RAGResponse with answer and sources
         """
         try:
-            # Get knowledge base
-            from knowledge_base.index_manager import get_knowledge_base
-            kb = get_knowledge_base()
-            
-            # Enhance query with vehicle context
-            enhanced_query = self._enhance_query(question, vehicle_context)
-            
-            # Retrieve relevant documents
-            search_results = kb.search(enhanced_query, top_k=top_k)
-            
+            search_results = self._retrieve(question, vehicle_context, top_k)
             if not search_results:
-                return RAGResponse(
-                    answer="I don't have sufficient information in my knowledge base to answer this question.",
-                    sources=[],
-                    confidence=0.0,
-                    retrieved_context=[],
-                    tokens_used=0
-                )
-            
-            # Format context
-            context = self._format_context(search_results)
-            retrieved_context = [r.content for r in search_results]
+                return self._no_results()
             
             # Generate answer
             if self.llm:
-                prompt_input = self.prompt.format(
-                    context=context,
-                    question=question
-                )
-                
+                prompt_input = self._prompt_input(question, search_results)
                 response = self.llm.invoke(prompt_input)
-                answer = response.content if hasattr(response, 'content') else str(response)
-                
-                # Estimate tokens (rough approximation)
-                tokens_used = len(prompt_input.split()) + len(answer.split())
-            else:
-                # Fallback without LLM - return raw context
-                answer = self._format_fallback_answer(search_results)
-                tokens_used = 0
+                return self._build_response(search_results, prompt_input, response)
+            return self._build_response(search_results)
             
-            # Calculate confidence based on retrieval scores
-            confidence = self._calculate_confidence(search_results)
-            
-            # Format sources
-            sources = [
-                {
-                    "source": r.source,
-                    "score": r.score,
-                    "excerpt": r.content[:200] + "..."
-                }
-                for r in search_results
-            ]
+        except Exception as e:
+            return self._failed(e)
+    
+    async def aquery(
+        self,
+        question: str,
+        vehicle_context: Optional[Dict] = None,
+        top_k: int = 5
+    ) -> RAGResponse:
+        """
+        Async variant of query() for the ASGI serving mode
+        
+        Retrieval stays synchronous (run in a worker thread); only the LLM
+        call is awaited on the event loop.
+        """
+        try:
+            search_results = await asyncio.to_thread(self._retrieve, question, vehicle_context, top_k)
+            if not search_results:
+                return self._no_results()
             
-            return RAGResponse(
-                answer=answer,
-                sources=sources,
-                confidence=confidence,
-                retrieved_context=retrieved_context,
-                tokens_used=tokens_used
-            )
+            if self.llm:
+                prompt_input = self._prompt_input(question, search_results)
+                response = await self.llm.ainvoke(prompt_input)
+                return self._build_response(search_results, prompt_input, response)
+            return self._build_response(search_results)
             
         except Exception as e:
-            logger.error(f"❌ RAG query failed: {e}")
-            return RAGResponse(
-                answer=f"Error processing query: {str(e)}",
-                sources=[],
-                confidence=0.0,
-                retrieved_context=[],
-                tokens_used=0
-            )
+            return self._failed(e)
+    
+    def _retrieve(self, question: str, vehicle_context: Optional[Dict], top_k: int):
+        """Retrieve relevant documents, restricted to the vehicle when known"""
+        # Get knowledge base
+        from knowledge_base.index_manager import get_knowledge_base
+        kb = get_knowledge_base()
+        
+        # Brand / model / year pre-filter the search (relaxed when too few
+        # chunks match) instead of being appended to the query text
+        filters = vehicle_filters(vehicle_context)
+        query = question if filters else self._enhance_query(question, vehicle_context)
+        
+        return kb.search(query, top_k=top_k, filters=filters)
+    
+    def _prompt_input(self, question: str, search_results: List) -> str:
+        return self.prompt.format(
+            context=self._format_context(search_results),
+            question=question
+        )
+    
+    def _build_response(self, search_results: List, prompt_input: str = None, llm_response=None) -> RAGResponse:
+        """Assemble the RAGResponse; without an LLM response the raw context is returned"""
+        retrieved_context = [r.content for r in search_results]
+        
+        if llm_response is not None:
+            answer = llm_response.content if hasattr(llm_response, 'content') else str(llm_response)
+            
+            # Estimate tokens (rough approximation)
+            tokens_used = len(prompt_input.split()) + len(answer.split())
+        else:
+            # Fallback without LLM - return raw context
+            answer = self._format_fallback_answer(search_results)
+            tokens_used = 0
+        
+        # Calculate confidence based on retrieval scores
+        confidence = self._calculate_confidence(search_results)
+        
+        # Format sources
+        sources = [
+            {
+                "source": r.source,
+                "score": r.score,
+                "excerpt": r.content[:200] + "..."
+            }
+            for r in search_results
+        ]
+        
+        return RAGResponse(
+            answer=answer,
+            sources=sources,
+            confidence=confidence,
+            retrieved_context=retrieved_context,
+            tokens_used=tokens_used
+        )
+    
+    @staticmethod
+    def _no_results() -> RAGResponse:
+        return RAGResponse(
+            answer="I don't have sufficient information in my knowledge base to answer this question.",
+            sources=[],
+            confidence=0.0,
+            retrieved_context=[],
+            tokens_used=0
+        )
+    
+    @staticmethod
+    def _failed(e: Exception) -> RAGResponse:
+        logger.error(f"❌ RAG query failed: {e}")
+        return RAGResponse(
+            answer=f"Error processing query: {str(e)}",
+            sources=[],
+            confidence=0.0,
+            retrieved_context=[],
+            tokens_used=0
+        )
     
     def _enhance_query(
         self,
@@ -0,0 +1,73 @@
+"""
+ASGI Entry Point for EKA-AI Platform (Production v4.5)
+Serves the same Flask application as wsgi.py, but awaits the LLM-bound
+routes on an event loop instead of pinning a worker thread per request.
+
+Async routes (POST): /api/chat, /api/speak, /api/kb/query,
+/api/agent/diagnose, /api/agent/enhanced-chat. Every other route (CRUD,
+billing, job cards, ...) runs through the regular WSGI app in a thread pool.
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 8001 --workers 3 --timeout-keep-alive 30
+"""
+import os
+import sys
+import asyncio
+import logging
+
+# Configure logging before importing app
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from middleware.async_bridge import AsgiBridge
+from services.llm_clients import model_clients
+
+try:
+    from server import flask_app
+    logger.info("✅ ASGI: Flask application loaded successfully")
+except Exception as e:
+    logger.error(f"❌ ASGI: Failed to load Flask application: {e}")
+    raise
+
+ASYNC_ROUTES = (
+    '/api/chat',
+    '/api/speak',
+    '/api/kb/query',
+    '/api/agent/diagnose',
+    '/api/agent/enhanced-chat',
+)
+
+
+async def startup():
+    """Build and warm this worker's LLM clients before it accepts traffic."""
+    try:
+        model_clients.reset()
+        await asyncio.to_thread(model_clients.warm)
+    except Exception as e:
+        logger.warning(f"⚠️ LLM client warm-up skipped: {e}")
+
+
+async def shutdown():
+    """Flush queued audit rows and release pooled connections on worker shutdown."""
+    try:
+        from services.audit_sink import audit_sink
+        await asyncio.to_thread(audit_sink.flush)
+    except Exception as e:
+        logger.warning(f"⚠️ Audit sink flush error: {e}")
+
+    await model_clients.aclose()
+    model_clients.close()
+
+
+# Export the application object for uvicorn
+app = AsgiBridge(flask_app, ASYNC_ROUTES, on_startup=startup, on_shutdown=shutdown)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:app", host='0.0.0.0', port=int(os.environ.get('PORT', 8001)))
@@ -0,0 +1,60 @@
+-- Vehicle-partitioned knowledge base search
+-- match_documents scans the whole ivfflat index and cannot filter, so a
+-- question about a 2019 Swift competes with every other manual. Chunks now
+-- carry their lower-cased vehicle fields under metadata->'vehicle'
+-- (knowledge_base.filters.vehicle_metadata); match_documents_filtered
+-- selects that partition through a GIN index first and ranks only the
+-- partition by cosine distance. A partition is a few thousand chunks at
+-- most, so the exact scan is cheaper than probing the ivfflat lists and
+-- discarding most of what they return.
+-- Requires match_documents.sql and migration_kb_dedup.sql.
+
+create index if not exists documents_metadata_idx
+on documents
+using gin (metadata jsonb_path_ops);
+
+create or replace function match_documents_filtered (
+  query_embedding vector(768),
+  match_threshold float,
+  match_count int,
+  filter jsonb
+) returns table (
+  id bigint,
+  content text,
+  metadata jsonb,
+  similarity float
+) language plpgsql stable as $$
+begin
+  return query
+  with partition as materialized (
+    select documents.id, documents.content, documents.metadata, documents.embedding
+    from documents
+    where documents.metadata @> filter
+  )
+  select
+    partition.id,
+    partition.content,
+    partition.metadata,
+    1 - (partition.embedding <=> query_embedding) as similarity
+  from partition
+  where 1 - (partition.embedding <=> query_embedding) > match_threshold
+  order by partition.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
+
+-- Backfill the normalised vehicle fields on rows ingested before this migration
+update documents
+set metadata = metadata || jsonb_build_object('vehicle', jsonb_strip_nulls(jsonb_build_object(
+  'brand', nullif(lower(btrim(metadata->>'brand')), ''),
+  'car_model', nullif(lower(btrim(metadata->>'car_model')), ''),
+  'year', nullif(lower(btrim(metadata->>'year')), '')
+)))
+where not metadata ? 'vehicle';
+
+-- For a brand with a very large corpus, a partial ivfflat index keeps the
+-- approximate scan inside that brand as well, e.g.
+--
+-- create index if not exists documents_embedding_maruti_idx
+-- on documents using ivfflat (embedding vector_cosine_ops) with (lists = 50)
+-- where metadata->'vehicle'->>'brand' = 'maruti';
@@ -0,0 +1,31 @@
+-- Knowledge base deduplication / incremental re-ingestion
+-- Each chunk row records its source document, the version it belongs to
+-- and the SHA-256 of its whitespace-normalised text, so re-ingesting an
+-- updated manual only embeds new chunks and deletes the dropped ones.
+
+alter table documents add column if not exists source text;
+alter table documents add column if not exists version text;
+alter table documents add column if not exists content_hash text;
+
+create index if not exists documents_source_hash_idx
+on documents (source, content_hash);
+
+-- Backfill rows ingested before this migration (same normalisation as
+-- knowledge_base.ingestion.content_hash: collapse whitespace, trim)
+update documents
+set content_hash = encode(sha256(convert_to(btrim(regexp_replace(content, '\s+', ' ', 'g')), 'UTF8')), 'hex')
+where content_hash is null;
+
+update documents
+set source = metadata->>'source'
+where source is null and metadata ? 'source';
+
+-- The old ingest_pdf never recorded a source, so most legacy rows keep
+-- source = NULL here. They are claimed when their manual is re-ingested:
+-- IngestionPipeline.run matches NULL-source rows by content_hash, stamps
+-- them with the new source and version, and only embeds the chunks that
+-- have no match. Once every manual has been re-ingested, whatever is still
+-- NULL (chunks no current manual contains, and extra copies the old
+-- ingestion inserted) can be removed as a one-off:
+--
+--   delete from documents where source is null;
@@ -0,0 +1,50 @@
+"""
+Gunicorn server hooks for EKA-AI Platform (Production v4.5)
+Loaded automatically from the working directory; command-line flags
+(bind, workers, threads, timeout) still take precedence.
+"""
+import os
+import sys
+import logging
+import subprocess
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def when_ready(server):
+    """Pre-warm the shared TTS cache with fixed phrases, off the request path."""
+    if os.getenv("TTS_PREWARM_ON_START", "true").lower() != "true":
+        return
+    try:
+        subprocess.Popen(
+            [sys.executable, "-m", "services.tts_cache"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            start_new_session=True,
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ TTS pre-warm not started: {e}")
+
+
+def post_worker_init(worker):
+    """Build and warm this worker's LLM clients before it accepts traffic."""
+    try:
+        from services.llm_clients import model_clients
+        model_clients.reset()
+        model_clients.warm()
+    except Exception as e:
+        logger.warning(f"⚠️ LLM client warm-up skipped: {e}")
+
+
+def worker_exit(server, worker):
+    """Flush queued audit rows and release pooled connections on worker shutdown."""
+    try:
+        from services.audit_sink import audit_sink
+        audit_sink.flush()
+    except Exception as e:
+        logger.warning(f"⚠️ Audit sink flush error: {e}")
+
+    try:
+        from services.llm_clients import model_clients
+        model_clients.close()
+    except Exception as e:
+        logger.warning(f"⚠️ LLM client shutdown error: {e}")
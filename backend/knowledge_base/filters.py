@@ -0,0 +1,77 @@
+"""
+knowledge_base/filters.py
+Metadata filters for knowledge base retrieval.
+
+Vehicle fields (brand, car_model, year) are stored twice on every chunk:
+as given, and lower-cased under metadata["vehicle"]. The filtered
+match_documents_filtered RPC pre-filters with JSONB containment on that
+normalised copy (GIN-indexed, see database/match_documents_filtered.sql),
+so "Swift", "swift" and year 2020 vs "2020" all select the same partition.
+
+relaxations() is the fallback ladder used when a vehicle partition holds
+too few matching chunks: drop year, then model, then brand, then search
+unfiltered.
+"""
+from typing import Dict, List, Optional
+
+VEHICLE_FIELDS = ("brand", "car_model", "year")
+RELAX_ORDER = ("year", "car_model", "brand")  # least to most specific kept longest
+
+
+def _normalize(value) -> str:
+    return str(value).strip().lower()
+
+
+def vehicle_metadata(metadata: Dict) -> Dict:
+    """Normalised vehicle fields of ``metadata`` for the ``vehicle`` key."""
+    return {f: _normalize(metadata[f]) for f in VEHICLE_FIELDS if metadata.get(f) not in (None, "")}
+
+
+def containment_filter(filters: Optional[Dict]) -> Dict:
+    """JSONB containment document for ``filters`` (vehicle fields go under ``vehicle``)."""
+    document: Dict = {}
+    vehicle = vehicle_metadata(filters or {})
+    if vehicle:
+        document["vehicle"] = vehicle
+    for field, value in (filters or {}).items():
+        if field not in VEHICLE_FIELDS and value not in (None, ""):
+            document[field] = value
+    return document
+
+
+def matches_filters(metadata: Dict, filters: Optional[Dict]) -> bool:
+    """Equality on metadata fields, case-insensitive; a list value means any of."""
+    for field, wanted in (filters or {}).items():
+        value = _normalize(metadata.get(field, ""))
+        options = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        if value not in {_normalize(option) for option in options}:
+            return False
+    return True
+
+
+def relaxations(filters: Optional[Dict]) -> List[Optional[Dict]]:
+    """``filters``, then with vehicle fields dropped one at a time, then None (unfiltered)."""
+    current = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    if not current:
+        return [None]
+    ladder = [dict(current)]
+    for field in RELAX_ORDER:
+        if field in current:
+            del current[field]
+            ladder.append(dict(current) if current else None)
+    if ladder[-1] is not None:
+        ladder.append(None)
+    return ladder
+
+
+def vehicle_filters(vehicle_context: Optional[Dict]) -> Optional[Dict]:
+    """Map a RAG vehicle context ({"brand", "model", "year", ...}) to search filters."""
+    if not vehicle_context:
+        return None
+    filters = {
+        "brand": vehicle_context.get("brand"),
+        "car_model": vehicle_context.get("car_model") or vehicle_context.get("model"),
+        "year": vehicle_context.get("year"),
+    }
+    filters = {k: v for k, v in filters.items() if v not in (None, "")}
+    return filters or None
@@ -0,0 +1,176 @@
+"""
+knowledge_base/hybrid_search.py
+Hybrid retrieval: vector similarity + BM25, fused with reciprocal rank fusion.
+
+Both retrievers return their best KB_SEARCH_CANDIDATES chunks for the
+query; each chunk then scores
+
+    sum over retrievers of 1 / (KB_RRF_K + rank)
+
+and the top_k chunks by that sum are returned. RRF needs no score
+calibration between cosine similarity and BM25 and rewards chunks both
+retrievers agree on. KB_SEARCH_MODE=vector|lexical|hybrid selects the
+retrievers (hybrid by default).
+
+SearchResult.score is the fused score scaled to 0-1 (1.0 = ranked first
+by every retriever used), so callers that turn scores into a confidence
+keep working; the raw similarity and BM25 score are kept alongside.
+
+Filters pre-filter both retrievers (the vector leg through the
+match_documents_filtered RPC). When a filtered search returns fewer than
+KB_FILTER_MIN_RESULTS chunks, the filters are relaxed step by step
+(filters.relaxations) down to an unfiltered search; results from the
+narrower partition stay ahead of the ones added by a wider one.
+"""
+import os
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from knowledge_base.lexical_index import LexicalIndex
+from knowledge_base.filters import relaxations
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SEARCH_MODE = os.getenv("KB_SEARCH_MODE", "hybrid").lower()  # vector, lexical or hybrid
+RRF_K = int(os.getenv("KB_RRF_K", "60"))
+CANDIDATES = int(os.getenv("KB_SEARCH_CANDIDATES", "30"))  # per retriever, before fusion
+FILTER_MIN_RESULTS = int(os.getenv("KB_FILTER_MIN_RESULTS", "3"))  # fewer and the filters are relaxed
+MODES = ("vector", "lexical", "hybrid")
+
+
+@dataclass
+class SearchResult:
+    """One retrieved knowledge base chunk"""
+    content: str
+    source: str
+    score: float
+    metadata: Dict = field(default_factory=dict)
+    node_id: str = ""
+    vector_score: Optional[float] = None
+    lexical_score: Optional[float] = None
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Fuse ranked id lists; returns (id, fused score) best first, ties in first-seen order."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class HybridRetriever:
+    """
+    ``vector_search(query, count, filters)`` returns rows
+    {"id", "content", "metadata", "similarity"} best first;
+    ``lexical`` is a LexicalIndex over the same rows.
+
+    Usage:
+        results = retriever.search("P0301 after plug change", top_k=5, filters={"brand": "Maruti"})
+    """
+
+    def __init__(self, vector_search: Callable[[str, int, Optional[Dict]], List[Dict]],
+                 lexical: LexicalIndex, mode: str = SEARCH_MODE, rrf_k: int = RRF_K,
+                 candidates: int = CANDIDATES, min_results: int = FILTER_MIN_RESULTS):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported search mode: {mode}")
+        self.vector_search = vector_search
+        self.lexical = lexical
+        self.mode = mode
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.min_results = min_results
+        self.searches = 0
+        self.filtered = 0
+        self.fallbacks = 0
+        self.latency_ms = {"vector": 0.0, "lexical": 0.0}
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None,
+               mode: Optional[str] = None, fallback: bool = True) -> List[SearchResult]:
+        """
+        Best ``top_k`` chunks for ``query``. With ``filters``, the filtered
+        partition is searched first and relaxed while it yields fewer than
+        ``min_results`` chunks (unless ``fallback`` is False).
+        """
+        ladder = relaxations(filters) if fallback else [filters or None]
+        enough = min(top_k, self.min_results)
+        results: List[SearchResult] = []
+        seen = set()
+        for level, applied in enumerate(ladder):
+            for result in self._search(query, top_k, applied, mode or self.mode):
+                if result.node_id not in seen:
+                    seen.add(result.node_id)
+                    results.append(result)
+            if len(results) >= enough:
+                break
+        self.searches += 1
+        if ladder[0] is not None:
+            self.filtered += 1
+            self.fallbacks += level > 0
+        return results[:top_k]
+
+    def _search(self, query: str, top_k: int, filters: Optional[Dict], mode: str) -> List[SearchResult]:
+        count = max(self.candidates, top_k)
+        rows: Dict[int, Dict] = {}
+        similarity: Dict[int, float] = {}
+        bm25: Dict[int, float] = {}
+        rankings = []
+
+        if mode in ("vector", "hybrid"):
+            started = time.perf_counter()
+            hits = self.vector_search(query, count, filters)
+            self.latency_ms["vector"] += (time.perf_counter() - started) * 1000
+            for row in hits:
+                rows.setdefault(row["id"], row)
+                similarity[row["id"]] = float(row.get("similarity", 0.0))
+            rankings.append([row["id"] for row in hits])
+
+        if mode in ("lexical", "hybrid"):
+            started = time.perf_counter()
+            hits = self.lexical.search(query, count, filters)
+            self.latency_ms["lexical"] += (time.perf_counter() - started) * 1000
+            for row_id, score in hits:
+                bm25[row_id] = score
+                if row_id not in rows:
+                    doc = self.lexical.get(row_id)
+                    if doc:
+                        rows[row_id] = doc
+            rankings.append([row_id for row_id, _ in hits])
+
+        best = 1.0 / (self.rrf_k + 1) * len(rankings)
+        results = []
+        for row_id, fused in reciprocal_rank_fusion(rankings, self.rrf_k):
+            row = rows.get(row_id)
+            if row is None:
+                continue
+            metadata = row.get("metadata") or {}
+            results.append(SearchResult(
+                content=row.get("content", ""),
+                source=metadata.get("source", ""),
+                score=round(fused / best, 4),
+                metadata=metadata,
+                node_id=str(row_id),
+                vector_score=similarity.get(row_id),
+                lexical_score=bm25.get(row_id),
+            ))
+            if len(results) >= top_k:
+                break
+        return results
+
+    def get_stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "rrf_k": self.rrf_k,
+            "candidates": self.candidates,
+            "searches": self.searches,
+            "filtered": self.filtered,
+            "filter_fallbacks": self.fallbacks,
+            "avg_latency_ms": {
+                leg: round(total / self.searches, 2) if self.searches else 0.0
+                for leg, total in self.latency_ms.items()
+            },
+            "lexical_index": self.lexical.get_stats(),
+        }
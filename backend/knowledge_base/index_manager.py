@@ -1,53 +1,134 @@
 import os
-from PyPDF2 import PdfReader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import time
+import tempfile
+import threading
+from dataclasses import asdict
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from database.supabase_client import supabase_client
+from services.embedding_cache import CachedEmbeddings
+from services.retrieval_cache import retrieval_cache
+from knowledge_base.ingestion import Document, IngestionPipeline, SupabaseDocumentStore
+from knowledge_base.lexical_index import LexicalIndex
+from knowledge_base.hybrid_search import HybridRetriever, SearchResult
+
+EMBEDDING_MODEL = "models/embedding-001"
+MATCH_THRESHOLD = float(os.getenv("KB_MATCH_THRESHOLD", "0.2"))
+LEXICAL_INDEX_DIR = os.getenv("KB_LEXICAL_INDEX_DIR", os.path.join(tempfile.gettempdir(), "eka-kb-lexical"))
+LEXICAL_SYNC_INTERVAL = float(os.getenv("KB_LEXICAL_SYNC_INTERVAL", "300"))  # seconds between fingerprint checks
 
 class KnowledgeBaseManager:
     def __init__(self):
-        # Using Gemini embeddings for cost-efficiency
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=os.getenv("GEMINI_API_KEY")
+        # Using Gemini embeddings for cost-efficiency, memoized in the shared embedding cache
+        self.embeddings = CachedEmbeddings(
+            GoogleGenerativeAIEmbeddings(
+                model=EMBEDDING_MODEL,
+                google_api_key=os.getenv("GEMINI_API_KEY")
+            ),
+            model=EMBEDDING_MODEL
+        )
+        self.store = SupabaseDocumentStore(supabase_client)
+        self.pipeline = IngestionPipeline(self.embeddings.embed_documents, self.store)
+
+        # BM25 over the same chunks, rebuilt from 'documents' when its fingerprint changes
+        self.lexical = LexicalIndex(LEXICAL_INDEX_DIR)
+        self.lexical.load()
+        self._lexical_checked = None
+        self._lexical_lock = threading.Lock()
+        self.retriever = HybridRetriever(self._vector_search, self.lexical)
+
+    def search(self, query: str, top_k: int = 5, filters: dict = None):
+        """Hybrid search: vector similarity and BM25 results fused with reciprocal rank fusion.
+        Results are cached per index version, so repeated questions skip embedding and search."""
+        self._sync_lexical()
+        rows = retrieval_cache.get_or_search(
+            query, top_k, filters, mode=self.retriever.mode,
+            search=lambda: [asdict(r) for r in self.retriever.search(query, top_k=top_k, filters=filters)]
         )
+        return [SearchResult(**row) for row in rows]
+
+    def _vector_search(self, query: str, count: int, filters: dict = None):
+        vector = self.embeddings.embed_query(query)
+        # Filters are applied in the database, before the similarity scan
+        return self.store.match(vector, count, MATCH_THRESHOLD, filters)
+
+    def _sync_lexical(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._lexical_checked is not None and now - self._lexical_checked < LEXICAL_SYNC_INTERVAL:
+            return
+        if not self._lexical_lock.acquire(blocking=False):
+            return  # another request is rebuilding; keep serving the current index
+        try:
+            self._lexical_checked = now
+            fingerprint = self.store.fingerprint()
+            if fingerprint != self.lexical.fingerprint:
+                changed = self.lexical.fingerprint is not None
+                fresh = LexicalIndex(LEXICAL_INDEX_DIR)
+                fresh.build(self.store.rows(), fingerprint)
+                self.lexical = self.retriever.lexical = fresh
+                if changed:
+                    retrieval_cache.bump()  # documents changed outside this worker
+        except Exception as e:
+            print(f"⚠️ Lexical index sync failed, searching the previous index: {str(e)}")
+        finally:
+            self._lexical_lock.release()
 
-    def ingest_pdf(self, file_path: str, metadata: dict):
-        """Reads a PDF, chunks it, embeds it, and stores in Supabase"""
-        print(f"📄 Processing {file_path}...")
+    def get_stats(self):
+        return {
+            "index_ready": len(self.lexical) > 0,
+            "vector_store_connected": supabase_client is not None,
+            **self.retriever.get_stats(),
+            "retrieval_cache": retrieval_cache.get_stats(),
+        }
+
+    def add_documents(self, documents: list, source_type: str = "manual") -> bool:
+        """Chunks, embeds and stores loose documents (objects with .text and .metadata)"""
+        try:
+            report = self.pipeline.add_documents(documents, source_type)
+            if report["added"]:
+                retrieval_cache.bump()
+                self._sync_lexical(force=True)
+            print(f"✅ Added {report['documents']} {source_type} documents: {report['added']} new chunks, "
+                  f"{report['duplicate']} already stored.")
+            return True
+        except Exception as e:
+            print(f"❌ Error adding documents: {str(e)}")
+            return False
+
+    def ingest_pdf(self, file_path: str, metadata: dict, dry_run: bool = False):
+        """Streams a PDF through extract → chunk → embed → bulk insert into Supabase.
+        Only chunks not already stored for the source are embedded; chunks the new
+        version dropped are deleted. Re-running after a failure resumes from the
+        last committed page. dry_run only reports the added/removed/unchanged counts."""
+        print(f"📄 {'Planning' if dry_run else 'Processing'} {file_path}...")
         
         try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-
-            # Chunking with overlap to preserve context
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            chunks = splitter.split_text(text)
-
-            print(f"⚡ Generating embeddings for {len(chunks)} chunks...")
-            
-            # Batch process could be added here for scale, doing 1-by-1 for MVP
-            for i, chunk in enumerate(chunks):
-                vector = self.embeddings.embed_query(chunk)
-                
-                payload = {
-                    "content": chunk,
-                    "embedding": vector,
-                    "metadata": metadata
-                }
-                
-                # Insert into Supabase 'documents' table
-                supabase_client.table('documents').insert(payload).execute()
-                
-            print(f"✅ Ingestion Complete for {file_path}.")
+            report = self.pipeline.run(file_path, metadata, dry_run=dry_run)
+            for stage, s in report["stages"].items():
+                print(f"   {stage:<8} {s['items']:>6} in {s['busy_s']:>7.2f}s  ({s['per_s']}/s)")
+            print(f"{'📋' if dry_run else '✅'} {report['source']}: {report['added']} added, "
+                  f"{report['removed']} removed, {report['unchanged']} unchanged "
+                  f"({report['pages']} pages in {report['elapsed_s']}s).")
+            if not dry_run:
+                if report["added"] or report["removed"]:
+                    retrieval_cache.bump()
+                self._sync_lexical(force=True)
+            return report
         except Exception as e:
-            print(f"❌ Error ingesting {file_path}: {str(e)}")
+            print(f"❌ Error ingesting {file_path}: {str(e)} (re-run to resume)")
+
+
+# Singleton
+_kb_instance = None
+
+def get_knowledge_base() -> KnowledgeBaseManager:
+    """Get knowledge base singleton"""
+    global _kb_instance
+    if _kb_instance is None:
+        _kb_instance = KnowledgeBaseManager()
+    return _kb_instance
 
 # Example Usage:
 # kb = KnowledgeBaseManager()
 # kb.ingest_pdf("./manuals/swift_service.pdf", {"car_model": "Swift", "year": "2020"})
+# kb.ingest_pdf("./manuals/swift_service_v2.pdf", {"source": "swift_service.pdf"}, dry_run=True)
+# kb.search("P0301 misfire after plug change", top_k=5, filters={"car_model": "Swift"})
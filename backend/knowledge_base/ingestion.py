@@ -0,0 +1,555 @@
+"""
+knowledge_base/ingestion.py
+Streaming PDF ingestion pipeline for the knowledge base.
+
+KnowledgeBaseManager.ingest_pdf used to concatenate every page into one
+string, embed the chunks and insert one row per chunk. Here the stages
+overlap and every provider / database call carries a batch:
+
+1. extract  pages are read in a process pool, KB_INGEST_PAGES_PER_TASK
+            pages per task, and consumed in page order as tasks finish
+2. chunk    each page is split as soon as it arrives; the last (possibly
+            short) chunk is carried over and split again with the next page
+3. embed    chunks are embedded KB_EMBED_BATCH at a time
+4. insert   rows are bulk-inserted KB_INSERT_BATCH at a time
+
+Every row carries its source document, the version it was ingested as
+(the file's SHA-256 unless given) and the SHA-256 of its whitespace-
+normalised text. Re-ingesting an updated manual only embeds the delta:
+chunks whose hash is already stored for the source are re-stamped with the
+new version instead of re-inserted, and once the file is done the rows
+still carrying an older version (chunks that disappeared, and duplicates
+of kept ones) are deleted. Rows stored before sources were recorded
+(source NULL) are claimed by content hash: a matching legacy row is moved
+to the source and kept instead of being embedded again. run(..., dry_run=True) reports what would be
+added, removed and kept without embedding or writing anything.
+
+After every bulk write the position of the first chunk not yet stored
+(page and character offset) is checkpointed under the file's SHA-256, so
+re-running ingestion of the same file resumes there. The checkpoint is
+removed once the whole file is stored.
+
+Chunk metadata also gets the lower-cased vehicle fields under "vehicle"
+(filters.vehicle_metadata), which match_documents_filtered pre-filters on.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import textwrap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from PyPDF2 import PdfReader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from knowledge_base.filters import containment_filter, vehicle_metadata
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WORKERS = int(os.getenv("KB_INGEST_WORKERS", str(os.cpu_count() or 2)))  # extraction processes
+PAGES_PER_TASK = int(os.getenv("KB_INGEST_PAGES_PER_TASK", "8"))
+EMBED_BATCH = int(os.getenv("KB_EMBED_BATCH", "64"))  # chunks per embed_documents call
+INSERT_BATCH = int(os.getenv("KB_INSERT_BATCH", "200"))  # rows per Supabase insert
+CHECKPOINT_DIR = os.getenv("KB_INGEST_CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "eka-ingest"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+PAGE_SEPARATOR = "\n"
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path: str, first: int, last: int) -> Tuple[List[str], float]:
+    """Text of pages [first, last) and the seconds it took (runs in a worker process)."""
+    started = time.perf_counter()
+    reader = PdfReader(path)
+    texts = [reader.pages[i].extract_text() or "" for i in range(first, min(last, len(reader.pages)))]
+    return texts, time.perf_counter() - started
+
+
+@dataclass
+class Chunk:
+    text: str
+    index: int
+    page: int    # page the chunk starts on (0-based)
+    offset: int  # character offset of the chunk start within that page
+
+
+@dataclass
+class Document:
+    """Loose text added through the API (same shape as a LlamaIndex Document)."""
+    text: str
+    metadata: Dict = field(default_factory=dict)
+
+
+class StageTimer:
+    """Items handled and busy seconds per pipeline stage."""
+
+    def __init__(self):
+        self.items: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, stage: str, items: int, seconds: float):
+        self.items[stage] = self.items.get(stage, 0) + items
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time(self, stage: str, items: int):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, items, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict:
+        return {
+            stage: {
+                "items": self.items[stage],
+                "busy_s": round(self.seconds[stage], 3),
+                "per_s": round(self.items[stage] / self.seconds[stage], 1) if self.seconds[stage] else 0.0,
+            }
+            for stage in self.items
+        }
+
+
+class StreamingChunker:
+    """
+    Splits text page by page. Everything but the last chunk of the buffer
+    is emitted; the last one is carried into the next page so chunks still
+    span page breaks the way they did when the whole document was split.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 first_index: int = 0):
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                       add_start_index=True)
+        self.next_index = first_index
+        self._carry = ""
+        self._spans: List[Tuple[int, int, int]] = []  # (buffer offset, page, page offset)
+
+    @property
+    def position(self) -> Optional[Tuple[int, int]]:
+        """(page, offset) where the carried text starts, or None when nothing is carried."""
+        return self._spans[0][1:] if self._carry else None
+
+    def _locate(self, spans, position: int) -> Tuple[int, int]:
+        for start, page, offset in reversed(spans):
+            if start <= position:
+                return page, offset + position - start
+        return spans[0][1:]
+
+    def feed(self, page: int, text: str, offset: int = 0) -> List[Chunk]:
+        buffer = self._carry + PAGE_SEPARATOR if self._carry else ""
+        spans = self._spans + [(len(buffer), page, offset)]
+        buffer += text[offset:]
+        documents = self.splitter.create_documents([buffer])
+        if not documents:
+            self._carry, self._spans = "", []
+            return []
+
+        emitted = [self._chunk(doc, spans) for doc in documents[:-1]]
+        tail = documents[-1].metadata["start_index"]
+        tail_page, tail_offset = self._locate(spans, tail)
+        self._carry = buffer[tail:]
+        self._spans = [(0, tail_page, tail_offset)] + [(s - tail, p, o) for s, p, o in spans if s > tail]
+        return emitted
+
+    def finish(self) -> List[Chunk]:
+        """Emit the carried text once the last page has been fed."""
+        if not self._carry.strip():
+            return []
+        chunks = [self._chunk(doc, self._spans) for doc in self.splitter.create_documents([self._carry])]
+        self._carry, self._spans = "", []
+        return chunks
+
+    def _chunk(self, document, spans) -> Chunk:
+        page, offset = self._locate(spans, document.metadata["start_index"])
+        chunk = Chunk(document.page_content, self.next_index, page, offset)
+        self.next_index += 1
+        return chunk
+
+
+class SupabaseDocumentStore:
+    """
+    Row access to the Supabase ``documents`` table used by the pipeline
+    (columns from database/migration_kb_dedup.sql).
+    """
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, client, table: str = "documents"):
+        self.client = client
+        self.table = table
+
+    def existing(self, source: Optional[str]) -> Dict[str, List[int]]:
+        """content_hash -> row ids stored for ``source`` (None: legacy rows without one), oldest first."""
+        hashes: Dict[str, List[int]] = {}
+        start = 0
+        while True:
+            query = self.client.table(self.table).select("id, content_hash")
+            query = query.eq("source", source) if source is not None else query.is_("source", "null")
+            rows = (query.order("id").range(start, start + self.PAGE_SIZE - 1).execute().data) or []
+            for row in rows:
+                hashes.setdefault(row["content_hash"], []).append(row["id"])
+            if len(rows) < self.PAGE_SIZE:
+                return hashes
+            start += self.PAGE_SIZE
+
+    def rows(self) -> Iterator[Dict]:
+        """Every chunk as {"id", "content", "metadata"}, paged."""
+        start = 0
+        while True:
+            rows = (self.client.table(self.table).select("id, content, metadata")
+                    .order("id").range(start, start + self.PAGE_SIZE - 1).execute().data) or []
+            yield from rows
+            if len(rows) < self.PAGE_SIZE:
+                return
+            start += self.PAGE_SIZE
+
+    def fingerprint(self) -> str:
+        """Changes whenever rows are inserted or deleted (row count and newest id)."""
+        result = (self.client.table(self.table).select("id", count="exact")
+                  .order("id", desc=True).limit(1).execute())
+        return f"{result.count}:{result.data[0]['id'] if result.data else 0}"
+
+    def match(self, embedding: Sequence[float], count: int, threshold: float,
+              filters: Optional[Dict] = None) -> List[Dict]:
+        """Nearest chunks by cosine similarity, best first. With ``filters`` only
+        chunks whose metadata contains them are scanned (match_documents_filtered)."""
+        params = {
+            "query_embedding": list(embedding),
+            "match_threshold": threshold,
+            "match_count": count,
+        }
+        if filters:
+            return self.client.rpc("match_documents_filtered", {
+                **params, "filter": containment_filter(filters),
+            }).execute().data or []
+        return self.client.rpc("match_documents", params).execute().data or []
+
+    def insert(self, rows: List[Dict]):
+        self.client.table(self.table).insert(rows).execute()
+
+    def stamp(self, ids: List[int], version: str, source: Optional[str] = None):
+        """Mark rows as part of ``version`` (and move them to ``source`` when given)."""
+        values = {"version": version, **({"source": source} if source is not None else {})}
+        self.client.table(self.table).update(values).in_("id", ids).execute()
+
+    def delete_stale(self, source: str, version: str) -> int:
+        """Delete rows of ``source`` not stamped with ``version``; returns how many."""
+        result = (self.client.table(self.table).delete().eq("source", source)
+                  .or_(f"version.is.null,version.neq.{version}").execute())
+        return len(result.data or [])
+
+
+class IngestionPipeline:
+    """
+    extract → chunk → hash → embed → bulk write, incremental and resumable.
+
+    ``embed_documents(texts)`` returns one vector per text; ``store`` has
+    the SupabaseDocumentStore methods.
+
+    Usage:
+        report = pipeline.run("manual.pdf", {"car_model": "Swift"})
+        plan = pipeline.run("manual_v2.pdf", {"source": "manual.pdf"}, dry_run=True)
+    """
+
+    def __init__(self, embed_documents: Callable[[List[str]], List[Sequence[float]]],
+                 store, workers: int = WORKERS,
+                 pages_per_task: int = PAGES_PER_TASK, embed_batch: int = EMBED_BATCH,
+                 insert_batch: int = INSERT_BATCH, checkpoint_dir: str = CHECKPOINT_DIR,
+                 chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        self.embed_documents = embed_documents
+        self.store = store
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.embed_batch = embed_batch
+        self.insert_batch = insert_batch
+        self.checkpoint_dir = checkpoint_dir
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    # ─────────────────────────────────────────
+    # CHECKPOINTS
+    # ─────────────────────────────────────────
+    def _checkpoint_path(self, digest: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{digest}.json")
+
+    def load_checkpoint(self, digest: str) -> Optional[Dict]:
+        try:
+            with open(self._checkpoint_path(digest)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_checkpoint(self, digest: str, state: Dict):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = self._checkpoint_path(digest)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _clear_checkpoint(self, digest: str):
+        try:
+            os.unlink(self._checkpoint_path(digest))
+        except OSError:
+            pass
+
+    # ─────────────────────────────────────────
+    # STAGES
+    # ─────────────────────────────────────────
+    def _pages(self, path: str, first: int, total: int, timer: StageTimer) -> Iterator[Tuple[int, str]]:
+        """(page, text) in page order; up to 2 tasks per worker are extracted ahead."""
+        ranges = iter([(p, min(p + self.pages_per_task, total)) for p in range(first, total, self.pages_per_task)])
+        if self.workers <= 1:
+            for start, end in ranges:
+                texts, seconds = extract_pages(path, start, end)
+                timer.add("extract", len(texts), seconds)
+                yield from enumerate(texts, start)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+
+            def submit():
+                task = next(ranges, None)
+                if task:
+                    pending.append((task[0], pool.submit(extract_pages, path, *task)))
+
+            for _ in range(2 * self.workers):
+                submit()
+            while pending:
+                start, future = pending.popleft()
+                texts, seconds = future.result()
+                submit()
+                timer.add("extract", len(texts), seconds)
+                yield from enumerate(texts, start)
+
+    def run(self, path: str, metadata: Dict, dry_run: bool = False) -> Dict:
+        """
+        Ingest ``path`` as the current version of its source document
+        (``metadata["source"]``, else the file name).
+
+        Returns counts of chunks added, kept unchanged, skipped as in-file
+        duplicates and rows removed, plus per-stage throughput.
+        """
+        started = time.perf_counter()
+        digest = file_digest(path)
+        source = metadata.get("source") or os.path.basename(path)
+        version = str(metadata.get("version") or digest)
+        vehicle = vehicle_metadata(metadata)
+        state = (None if dry_run else self.load_checkpoint(digest)) or {"page": 0, "offset": 0, "chunk": 0}
+        resumed = any(state.values())
+        if resumed:
+            logger.info(f"Resuming ingestion of {path} at page {state['page'] + 1}")
+
+        first_page, first_offset = state["page"], state["offset"]
+        total = page_count(path)
+        timer = StageTimer()
+        with timer.time("lookup", 1):
+            existing = self.store.existing(source)
+            legacy = self.store.existing(None)  # rows ingested before sources were recorded
+        chunker = StreamingChunker(self.chunk_size, self.chunk_overlap, first_index=state["chunk"])
+        counts = {"added": 0, "unchanged": 0, "duplicate": 0}
+        added_pages = set()
+        seen = set()
+        to_embed: List[Tuple[Chunk, str]] = []
+        to_insert: List[Dict] = []
+        to_stamp: List[int] = []
+        to_claim: List[int] = []
+
+        def route(chunk: Chunk):
+            key = content_hash(chunk.text)
+            if key in seen:
+                counts["duplicate"] += 1
+            elif key in existing:
+                counts["unchanged"] += 1
+                if not dry_run:
+                    to_stamp.append(existing[key][0])
+            elif legacy.get(key):
+                counts["unchanged"] += 1
+                claimed = legacy[key].pop(0)
+                if not dry_run:
+                    to_claim.append(claimed)
+            else:
+                counts["added"] += 1
+                added_pages.add(chunk.page + 1)
+                if not dry_run:
+                    to_embed.append((chunk, key))
+            seen.add(key)
+
+        def embed():
+            with timer.time("embed", len(to_embed)):
+                vectors = self.embed_documents([chunk.text for chunk, _ in to_embed])
+            for (chunk, key), vector in zip(to_embed, vectors):
+                to_insert.append({
+                    "content": chunk.text,
+                    "embedding": vector,
+                    "metadata": {**metadata, "source": source, "page": chunk.page + 1, "chunk": chunk.index,
+                                 "vehicle": vehicle},
+                    "source": source,
+                    "version": version,
+                    "content_hash": key,
+                })
+            to_embed.clear()
+
+        def commit(resume_at: Optional[Tuple[int, int, int]]):
+            # Chunks before the checkpoint must all be stored, including
+            # ones still waiting for a full embed batch
+            if to_embed:
+                embed()
+            if to_insert:
+                with timer.time("insert", len(to_insert)):
+                    self.store.insert(list(to_insert))
+                to_insert.clear()
+            if to_stamp:
+                with timer.time("stamp", len(to_stamp)):
+                    self.store.stamp(list(to_stamp), version)
+                to_stamp.clear()
+            if to_claim:
+                with timer.time("stamp", len(to_claim)):
+                    self.store.stamp(list(to_claim), version, source)
+                to_claim.clear()
+            if resume_at is not None:
+                state["page"], state["offset"], state["chunk"] = resume_at
+                self._save_checkpoint(digest, state)
+
+        for page, text in self._pages(path, first_page, total, timer):
+            with timer.time("chunk", 1):
+                emitted = chunker.feed(page, text, first_offset if page == first_page else 0)
+            for i, chunk in enumerate(emitted):
+                route(chunk)
+                if len(to_embed) >= self.embed_batch:
+                    embed()
+                if max(len(to_insert), len(to_stamp), len(to_claim)) >= self.insert_batch:
+                    following = emitted[i + 1] if i + 1 < len(emitted) else None
+                    if following:
+                        commit((following.page, following.offset, following.index))
+                    else:
+                        commit((*(chunker.position or (page + 1, 0)), chunker.next_index))
+
+        for chunk in chunker.finish():
+            route(chunk)
+        commit(None)
+
+        if dry_run:
+            removed = sum(len(ids) for h, ids in existing.items() if h not in seen)
+            removed += sum(len(ids) - 1 for h, ids in existing.items() if h in seen)
+        else:
+            with timer.time("delete", 1):
+                removed = self.store.delete_stale(source, version)
+            self._clear_checkpoint(digest)
+
+        report = {
+            "file": path,
+            "source": source,
+            "version": version,
+            "dry_run": dry_run,
+            "pages": total,
+            **counts,
+            "removed": removed,
+            "added_pages": sorted(added_pages),
+            "resumed": bool(resumed),
+            "elapsed_s": round(time.perf_counter() - started, 3),
+            "stages": timer.snapshot(),
+        }
+        logger.info(f"{'Planned' if dry_run else 'Ingested'} {path}: "
+                    f"+{counts['added']} -{removed} ={counts['unchanged']}")
+        return report
+
+    def add_documents(self, documents: Sequence, source_type: str = "manual") -> Dict:
+        """
+        Chunk, embed and insert loose documents (``.text`` / ``.metadata``),
+        each under ``metadata["source"]`` or else ``source_type``. Chunks
+        already stored for their source are skipped; nothing is deleted.
+        """
+        timer = StageTimer()
+        known: Dict[str, set] = {}
+        pending: List[Dict] = []
+        counts = {"documents": len(documents), "added": 0, "duplicate": 0}
+        for document in documents:
+            metadata = {**(document.metadata or {}), "source_type": source_type}
+            source = metadata.get("source") or source_type
+            if source not in known:
+                with timer.time("lookup", 1):
+                    known[source] = set(self.store.existing(source))
+            chunker = StreamingChunker(self.chunk_size, self.chunk_overlap)
+            with timer.time("chunk", 1):
+                chunks = chunker.feed(0, document.text or "") + chunker.finish()
+            for chunk in chunks:
+                key = content_hash(chunk.text)
+                if key in known[source]:
+                    counts["duplicate"] += 1
+                    continue
+                known[source].add(key)
+                pending.append({
+                    "content": chunk.text,
+                    "metadata": {**metadata, "source": source, "chunk": chunk.index,
+                                 "vehicle": vehicle_metadata(metadata)},
+                    "source": source,
+                    "content_hash": key,
+                })
+
+        for start in range(0, len(pending), self.insert_batch):
+            rows = pending[start:start + self.insert_batch]
+            for first in range(0, len(rows), self.embed_batch):
+                batch = rows[first:first + self.embed_batch]
+                with timer.time("embed", len(batch)):
+                    vectors = self.embed_documents([row["content"] for row in batch])
+                for row, vector in zip(batch, vectors):
+                    row["embedding"] = vector
+            with timer.time("insert", len(rows)):
+                self.store.insert(rows)
+            counts["added"] += len(rows)
+
+        logger.info(f"Added {counts['documents']} documents: +{counts['added']} chunks, "
+                    f"{counts['duplicate']} already stored")
+        return {**counts, "stages": timer.snapshot()}
+
+
+def write_text_pdf(path: str, pages: Sequence[str], line_width: int = 90):
+    """Minimal PDF with one text block per page, for tests and benchmarks."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = textwrap.wrap(text, line_width) or [""]
+        escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+        stream = "BT /F1 9 Tf 11 TL 30 810 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
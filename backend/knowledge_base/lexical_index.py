@@ -0,0 +1,191 @@
+"""
+knowledge_base/lexical_index.py
+Compact on-disk BM25 index over the knowledge base chunks.
+
+Vector search misses the exact tokens mechanics type: DTCs (P0301), part
+numbers (16510-61J00), torque specs (25 Nm). This index scores chunks by
+BM25 over tokens that keep those intact:
+
+- text is lower-cased and split into alphanumeric runs; runs joined by
+  '-', '.' or '/' (part numbers, decimals, 5W-30) are kept whole *and*
+  indexed by their parts, so "16510-61J00" and "16510 61J00" both match
+- the postings live in flat numpy arrays (sorted term list, offsets, doc
+  indexes, term frequencies) saved in one .npz together with each chunk's
+  row id, content and metadata (as JSON bytes), written under a
+  per-process temporary name and swapped in with a single rename, so
+  workers rebuilding at the same time never mix two builds
+
+The index is rebuilt from the documents table (build) whenever its
+fingerprint changes; a search is a binary search per query term plus one
+vectorised score accumulation.
+"""
+import os
+import re
+import json
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from knowledge_base.filters import matches_filters
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to "
+    "was what when where which why will with my do does should can".split()
+)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in TOKEN_RE.findall(text.lower()):
+        parts = re.split(r"[-./]", match)
+        if len(parts) > 1:
+            tokens.append(match)
+        tokens.extend(p for p in parts if p and p not in STOPWORDS)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Immutable BM25 index, persisted under ``directory``.
+
+    Usage:
+        index.build(rows, fingerprint)   # rows: {"id", "content", "metadata"}
+        hits = index.search("P0301 misfire", top_k=20)   # [(row id, score)]
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.fingerprint: Optional[str] = None
+        self._reset()
+
+    def _reset(self):
+        self.terms = np.array([], dtype=str)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.array([], dtype=np.int32)
+        self.tfs = np.array([], dtype=np.uint16)
+        self.doc_lengths = np.array([], dtype=np.int32)
+        self.docs: List[Dict] = []
+        self._row_index: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # ─────────────────────────────────────────
+    # BUILD
+    # ─────────────────────────────────────────
+    def build(self, rows: Iterable[Dict], fingerprint: Optional[str] = None):
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        docs, lengths = [], []
+        for row in rows:
+            counts = Counter(tokenize(row.get("content") or ""))
+            doc = len(docs)
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc, min(tf, 65535)))
+            docs.append({"id": row["id"], "content": row.get("content") or "", "metadata": row.get("metadata") or {}})
+            lengths.append(sum(counts.values()))
+
+        terms = sorted(postings)
+        sizes = np.array([len(postings[t]) for t in terms], dtype=np.int64)
+        flat = [entry for t in terms for entry in postings[t]]
+        self.terms = np.array(terms, dtype=str)
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.postings = np.array([d for d, _ in flat], dtype=np.int32)
+        self.tfs = np.array([tf for _, tf in flat], dtype=np.uint16)
+        self.doc_lengths = np.array(lengths, dtype=np.int32)
+        self.docs = docs
+        self._row_index = {doc["id"]: i for i, doc in enumerate(docs)}
+        self.fingerprint = fingerprint
+        if self.directory:
+            self.save()
+        logger.info(f"Lexical index built: {len(docs)} chunks, {len(terms)} terms")
+
+    # ─────────────────────────────────────────
+    # PERSISTENCE
+    # ─────────────────────────────────────────
+    def _path(self) -> str:
+        return os.path.join(self.directory, "lexical.npz")
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path()
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        meta = json.dumps({"fingerprint": self.fingerprint, "docs": self.docs}).encode("utf-8")
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, terms=self.terms, offsets=self.offsets, postings=self.postings,
+                         tfs=self.tfs, doc_lengths=self.doc_lengths, meta=np.frombuffer(meta, dtype=np.uint8))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def load(self) -> bool:
+        """Load the saved index; False when there is none (or it is unreadable)."""
+        if not self.directory:
+            return False
+        try:
+            with np.load(self._path()) as data:
+                self.terms, self.offsets, self.postings = data["terms"], data["offsets"], data["postings"]
+                self.tfs, self.doc_lengths = data["tfs"], data["doc_lengths"]
+                saved = json.loads(data["meta"].tobytes().decode("utf-8"))
+        except (OSError, ValueError, KeyError):
+            self._reset()
+            return False
+        self.docs = saved["docs"]
+        self.fingerprint = saved["fingerprint"]
+        self._row_index = {doc["id"]: i for i, doc in enumerate(self.docs)}
+        return True
+
+    # ─────────────────────────────────────────
+    # SEARCH
+    # ─────────────────────────────────────────
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict] = None) -> List[Tuple[int, float]]:
+        """Best ``top_k`` chunks as (row id, BM25 score), highest first."""
+        n = len(self.docs)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not n or not terms:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        avg_length = float(self.doc_lengths.mean()) or 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / avg_length)
+        positions = np.searchsorted(self.terms, terms)
+        for term, pos in zip(terms, positions):
+            if pos >= len(self.terms) or self.terms[pos] != term:
+                continue
+            start, end = self.offsets[pos], self.offsets[pos + 1]
+            docs, tf = self.postings[start:end], self.tfs[start:end].astype(np.float32)
+            idf = np.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm[docs])
+
+        candidates = np.flatnonzero(scores)
+        if filters:
+            candidates = np.array([i for i in candidates if matches_filters(self.docs[i]["metadata"], filters)],
+                                  dtype=np.int64)
+        if not candidates.size:
+            return []
+        best = candidates[np.argsort(-scores[candidates], kind="stable")[:top_k]]
+        return [(self.docs[i]["id"], float(scores[i])) for i in best]
+
+    def get(self, row_id: int) -> Optional[Dict]:
+        index = self._row_index.get(row_id)
+        return self.docs[index] if index is not None else None
+
+    def get_stats(self) -> Dict:
+        return {
+            "chunks": len(self.docs),
+            "terms": len(self.terms),
+            "postings": int(len(self.postings)),
+            "bytes": int(self.terms.nbytes + self.offsets.nbytes + self.postings.nbytes
+                         + self.tfs.nbytes + self.doc_lengths.nbytes),
+            "fingerprint": self.fingerprint,
+        }
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+EKA-AI Serving Mode Concurrency Benchmark
+Compares Gunicorn gthread (wsgi.py) with uvicorn + AsgiBridge (asgi.py) on
+an LLM-bound route at equal memory: both modes run the same number of worker
+processes against a local fake provider with a fixed response latency, and
+the report shows how many upstream calls each mode keeps in flight, the
+resulting throughput/latency, and the servers' total RSS.
+
+The benchmarked view uses the same resolve(Deferred(...)) pattern as the
+real /api/chat route, so the sync path is what Gunicorn runs today and the
+async path is what asgi.py runs.
+
+Usage:
+    python bench_asgi_concurrency.py --workers 2 --threads 4 --clients 200 --latency 1.0
+    python bench_asgi_concurrency.py --mode asgi --clients 500 --duration 30
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from flask import Flask, jsonify, request
+
+from middleware.async_bridge import AsgiBridge, Deferred, resolve
+
+PROVIDER_URL = os.getenv("BENCH_PROVIDER_URL", "http://127.0.0.1:18080/generate")
+ASGI_THREADS = int(os.getenv("BENCH_ASGI_THREADS", "4"))
+
+# ─────────────────────────────────────────
+# BENCHMARKED APP (imported by gunicorn / uvicorn)
+# ─────────────────────────────────────────
+flask_app = Flask(__name__)
+_clients = {}
+
+
+def sync_client():
+    import httpx
+    if "sync" not in _clients:
+        _clients["sync"] = httpx.Client(timeout=60, limits=httpx.Limits(max_connections=1000))
+    return _clients["sync"]
+
+
+async def apost(payload):
+    import httpx
+    if "async" not in _clients:
+        _clients["async"] = httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=1000))
+    response = await _clients["async"].post(PROVIDER_URL, json=payload)
+    return response.json()
+
+
+@flask_app.route("/health")
+def health():
+    return jsonify({"status": "ok"})
+
+
+@flask_app.route("/api/chat", methods=["POST"])
+def chat():
+    payload = request.get_json()
+    return resolve(Deferred(
+        run=lambda: sync_client().post(PROVIDER_URL, json=payload).json(),
+        arun=lambda: apost(payload),
+        finish=jsonify
+    ))
+
+
+asgi_app = AsgiBridge(flask_app, ["/api/chat"], threads=ASGI_THREADS)
+
+
+# ─────────────────────────────────────────
+# FAKE PROVIDER
+# ─────────────────────────────────────────
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """Answers every POST after a fixed delay and tracks peak concurrency."""
+    protocol_version = "HTTP/1.1"
+    latency = 1.0
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = FakeProviderHandler
+        with cls.lock:
+            cls.in_flight += 1
+            cls.peak = max(cls.peak, cls.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+        body = json.dumps({"response_content": {"visual_text": "Check battery terminals."}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 2048
+
+
+# ─────────────────────────────────────────
+# HARNESS
+# ─────────────────────────────────────────
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, args, env):
+    if mode == "wsgi":
+        cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+               "--workers", str(args.workers), "--threads", str(args.threads),
+               "--worker-class", "gthread", "--timeout", "120", "--log-level", "warning",
+               "bench_asgi_concurrency:flask_app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "bench_asgi_concurrency:asgi_app",
+               "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers),
+               "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                time.sleep(1.0)  # let every worker finish booting
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def server_rss_mb(proc):
+    import psutil
+    root = psutil.Process(proc.pid)
+    procs = [root] + root.children(recursive=True)
+    return sum(p.memory_info().rss for p in procs if p.is_running()) / (1024 * 1024)
+
+
+async def drive(url, clients, duration):
+    import aiohttp
+    latencies, errors = [], 0
+    stop = time.perf_counter() + duration
+    payload = {"history": [{"role": "user", "parts": [{"text": "My car won't start"}]}]}
+
+    async def client(session):
+        nonlocal errors
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=payload) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                        continue
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=clients)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(client(session) for _ in range(clients)))
+    return latencies, errors
+
+
+def run_mode(mode, args, provider_url):
+    port = free_port()
+    env = {**os.environ, "BENCH_PROVIDER_URL": provider_url, "BENCH_ASGI_THREADS": str(args.threads)}
+    proc = start_server(mode, port, args, env)
+    try:
+        FakeProviderHandler.peak = 0
+        rss_idle = server_rss_mb(proc)
+        latencies, errors = asyncio.run(drive(f"http://127.0.0.1:{port}/api/chat", args.clients, args.duration))
+        rss_loaded = server_rss_mb(proc)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+    ordered = sorted(latencies) or [0.0]
+    return {
+        "mode": mode,
+        "ok": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / args.duration,
+        "p50_ms": statistics.median(ordered),
+        "p99_ms": ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)],
+        "upstream_peak": FakeProviderHandler.peak,
+        "rss_idle_mb": rss_idle,
+        "rss_loaded_mb": rss_loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gthread vs ASGI concurrency at equal memory")
+    parser.add_argument("--mode", choices=["both", "wsgi", "asgi"], default="both")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes (both modes)")
+    parser.add_argument("--threads", type=int, default=4, help="gthread threads / ASGI sync pool size")
+    parser.add_argument("--clients", type=int, default=200, help="concurrent load-generator clients")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per mode")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake provider latency (s)")
+    args = parser.parse_args()
+
+    FakeProviderHandler.latency = args.latency
+    provider_port = free_port()
+    provider = ProviderServer(("127.0.0.1", provider_port), FakeProviderHandler)
+    threading.Thread(target=provider.serve_forever, daemon=True).start()
+    provider_url = f"http://127.0.0.1:{provider_port}/generate"
+
+    modes = ["wsgi", "asgi"] if args.mode == "both" else [args.mode]
+    print(f"\n{'=' * 78}")
+    print(f"Serving-mode benchmark: {args.workers} workers, {args.threads} threads, "
+          f"{args.clients} clients, provider latency {args.latency}s")
+    print(f"{'=' * 78}")
+    print(f"{'mode':<6}{'ok':>8}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'upstream':>10}{'RSS idle':>10}{'RSS load':>10}")
+    for mode in modes:
+        r = run_mode(mode, args, provider_url)
+        print(f"{r['mode']:<6}{r['ok']:>8}{r['errors']:>6}{r['rps']:>9.1f}{r['p50_ms']:>10.0f}"
+              f"{r['p99_ms']:>10.0f}{r['upstream_peak']:>10}{r['rss_idle_mb']:>9.0f}M{r['rss_loaded_mb']:>9.0f}M")
+    print("\nupstream = peak concurrent provider calls; gthread is capped at workers x threads.")
+    provider.shutdown()
+
+
+if __name__ == "__main__":
+    main()
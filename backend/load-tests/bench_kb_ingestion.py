@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+EKA-AI Knowledge Base Ingestion Benchmark
+Writes a synthetic N-page manual and ingests it twice against simulated
+provider and database round trips:
+
+- legacy:   concatenate all pages, split, embed in one call per chunk,
+            one insert per row (the old ingest_pdf shape)
+- pipeline: IngestionPipeline (process-pool extraction, streaming
+            chunking, batched embeddings, bulk inserts)
+
+and prints wall time plus the pipeline's per-stage throughput.
+
+Usage:
+    python bench_kb_ingestion.py --pages 400
+    python bench_kb_ingestion.py --pages 400 --embed-ms 150 --insert-ms 40 --workers 4
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from knowledge_base.ingestion import (
+    IngestionPipeline, extract_pages, page_count, write_text_pdf, CHUNK_SIZE, CHUNK_OVERLAP, PAGE_SEPARATOR
+)
+from services.embedding_batcher import FakeEmbedder
+
+WORDS = ("brake pad rotor caliper fluid engine oil filter spark plug coolant gasket torque "
+         "sensor injector throttle clutch gearbox alternator battery").split()
+
+
+class Remote:
+    """A round trip costing a fixed latency per call plus a small cost per item."""
+
+    def __init__(self, call_ms, item_ms=0.0, fn=None):
+        self.call_s = call_ms / 1000
+        self.item_s = item_ms / 1000
+        self.fn = fn or (lambda items: None)
+        self.calls = 0
+
+    def __call__(self, items):
+        self.calls += 1
+        time.sleep(self.call_s + self.item_s * len(items))
+        return self.fn(items)
+
+
+class Store:
+    """Empty documents table whose bulk insert is ``insert``."""
+
+    def __init__(self, insert):
+        self.insert = insert
+
+    def existing(self, source):
+        return {}
+
+    def stamp(self, ids, version):
+        pass
+
+    def delete_stale(self, source, version):
+        return 0
+
+
+def legacy(path, embed, insert):
+    text = ""
+    for page in extract_pages(path, 0, page_count(path))[0]:
+        text += page + PAGE_SEPARATOR
+    chunks = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP).split_text(text)
+    for chunk in chunks:
+        vector = embed([chunk])[0]
+        insert([{"content": chunk, "embedding": vector, "metadata": {}}])
+    return len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy vs pipelined PDF ingestion")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--embed-ms", type=float, default=120.0, help="simulated embed call latency")
+    parser.add_argument("--insert-ms", type=float, default=30.0, help="simulated insert call latency")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "manual.pdf")
+    write_text_pdf(path, [" ".join(rng.choice(WORDS) for _ in range(450)) for _ in range(args.pages)])
+    embedder = FakeEmbedder(dim=768)
+
+    legacy_embed, legacy_insert = Remote(args.embed_ms, 1, embedder), Remote(args.insert_ms, 0.2)
+    started = time.perf_counter()
+    chunks = legacy(path, legacy_embed, legacy_insert)
+    legacy_s = time.perf_counter() - started
+
+    embed, insert = Remote(args.embed_ms, 1, embedder), Remote(args.insert_ms, 0.2)
+    pipeline = IngestionPipeline(embed, Store(insert), workers=args.workers, checkpoint_dir=directory)
+    report = pipeline.run(path, {})
+
+    print(f"\n{'=' * 66}")
+    print(f"Ingestion: {args.pages} pages, {chunks} chunks, embed {args.embed_ms:g}ms, insert {args.insert_ms:g}ms")
+    print(f"{'=' * 66}")
+    print(f"{'':<10}{'wall s':>10}{'embed calls':>14}{'insert calls':>14}{'speedup':>10}")
+    print(f"{'legacy':<10}{legacy_s:>10.2f}{legacy_embed.calls:>14}{legacy_insert.calls:>14}{1:>10.1f}")
+    print(f"{'pipeline':<10}{report['elapsed_s']:>10.2f}{embed.calls:>14}{insert.calls:>14}"
+          f"{legacy_s / report['elapsed_s']:>10.1f}")
+    print(f"\n{'stage':<10}{'items':>10}{'busy s':>10}{'per s':>12}")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<10}{s['items']:>10}{s['busy_s']:>10.2f}{s['per_s']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
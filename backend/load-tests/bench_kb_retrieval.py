@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+EKA-AI Knowledge Base Retrieval Benchmark
+Runs the labelled eval set (data/kb_eval_set.json) through the three
+search modes of HybridRetriever and reports, per mode:
+
+- recall@k and MRR, overall and split into exact-token queries (DTCs,
+  part numbers, torque specs) and paraphrased queries
+- p50/p99 search latency
+
+The vector leg is a brute-force cosine search over the chunk embeddings,
+the same ranking match_documents returns. --embedder gemini embeds with
+the production model (needs GEMINI_API_KEY); the default local embedder
+hashes character n-grams into 768 dimensions, a deterministic offline
+stand-in that blurs near-identical codes the way dense models do but has
+no real semantics, so paraphrase recall is understated without Gemini.
+--filler adds synthetic distractor chunks to measure latency at scale.
+--vehicle filters every query by the brand/model/year of its first
+relevant chunk, as RAGService does with a known vehicle; the vector leg
+then ranks only that partition, like match_documents_filtered.
+
+Usage:
+    python bench_kb_retrieval.py
+    python bench_kb_retrieval.py --embedder gemini --top-k 5
+    python bench_kb_retrieval.py --filler 50000
+    python bench_kb_retrieval.py --filler 50000 --vehicle
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from knowledge_base.lexical_index import LexicalIndex
+from knowledge_base.filters import matches_filters, VEHICLE_FIELDS
+from knowledge_base.hybrid_search import HybridRetriever, MODES
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "kb_eval_set.json")
+DIM = 768
+
+
+class NgramEmbedder:
+    """Hashed character 3-5 grams, L2-normalised (offline stand-in for a dense model)."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        v = np.zeros(DIM, dtype=np.float32)
+        padded = f" {' '.join(text.lower().split())} "
+        for n in (3, 4, 5):
+            for i in range(len(padded) - n + 1):
+                bucket = int.from_bytes(hashlib.md5(padded[i:i + n].encode()).digest()[:4], "little")
+                v[bucket % DIM] += 1.0 if bucket & (1 << 31) else -1.0
+        norm = np.linalg.norm(v)
+        return (v / norm if norm else v).tolist()
+
+
+def gemini_embedder():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=os.environ["GEMINI_API_KEY"])
+
+
+def filler_chunks(count, start_id, seed=0):
+    rng = random.Random(seed)
+    words = ("inspect replace check torque sensor valve hose pump filter bearing bushing seal relay fuse "
+             "module harness connector bracket gasket coolant oil fluid pressure voltage noise leak").split()
+    models = ["Swift", "Baleno", "Creta", "i20", "Nexon", "XUV700", "City"]
+    for i in range(count):
+        text = " ".join(rng.choice(words) for _ in range(40))
+        text += f" P{rng.randint(1000, 2999)} part {rng.randint(10000, 99999)}-{rng.randint(10, 99)}A00"
+        yield {"id": start_id + i, "content": text,
+               "metadata": {"source": "filler.pdf", "brand": "Generic", "car_model": rng.choice(models), "year": "2020"}}
+
+
+class BruteForceVectors:
+    """match_documents / match_documents_filtered equivalent over an in-memory matrix."""
+
+    def __init__(self, embedder, rows):
+        self.embedder = embedder
+        self.rows = rows
+        self.matrix = np.asarray(embedder.embed_documents([r["content"] for r in rows]), dtype=np.float32)
+        self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True) + 1e-12
+        self.everything = np.arange(len(rows))
+        self.partitions = {}  # stands in for the GIN index on metadata
+
+    def partition(self, filters):
+        if not filters:
+            return self.everything
+        key = json.dumps(filters, sort_keys=True, default=str)
+        if key not in self.partitions:
+            self.partitions[key] = np.array(
+                [i for i, row in enumerate(self.rows) if matches_filters(row["metadata"], filters)], dtype=np.int64)
+        return self.partitions[key]
+
+    def __call__(self, query, count, filters=None):
+        q = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        candidates = self.partition(filters)
+        sims = self.matrix[candidates] @ (q / (np.linalg.norm(q) + 1e-12))
+        order = np.argsort(-sims)[:count]
+        return [{**self.rows[candidates[i]], "similarity": float(sims[i])} for i in order]
+
+
+def with_vehicle_filters(queries, rows):
+    by_id = {row["id"]: row for row in rows}
+    for q in queries:
+        metadata = by_id[q["relevant"][0]]["metadata"]
+        yield {**q, "filters": {f: metadata[f] for f in VEHICLE_FIELDS if f in metadata}}
+
+
+def evaluate(retriever, queries, mode, top_k):
+    recalls, reciprocal, latencies = {"exact": [], "semantic": []}, [], []
+    for q in queries:
+        started = time.perf_counter()
+        results = retriever.search(q["query"], top_k=top_k, filters=q.get("filters"), mode=mode)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids = [int(r.node_id) for r in results]
+        relevant = set(q["relevant"])
+        recalls[q["kind"]].append(len(relevant & set(ids)) / len(relevant))
+        rank = next((i for i, row_id in enumerate(ids, 1) if row_id in relevant), None)
+        reciprocal.append(1.0 / rank if rank else 0.0)
+    latencies.sort()
+    every = recalls["exact"] + recalls["semantic"]
+    return {
+        "recall": statistics.mean(every),
+        "recall_exact": statistics.mean(recalls["exact"]),
+        "recall_semantic": statistics.mean(recalls["semantic"]),
+        "mrr": statistics.mean(reciprocal),
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector vs lexical vs hybrid knowledge base retrieval")
+    parser.add_argument("--embedder", choices=["local", "gemini"], default="local")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--filler", type=int, default=0, help="synthetic distractor chunks to add")
+    parser.add_argument("--vehicle", action="store_true", help="filter each query by its vehicle")
+    args = parser.parse_args()
+
+    with open(EVAL_SET) as f:
+        data = json.load(f)
+    rows = data["chunks"] + list(filler_chunks(args.filler, start_id=100000))
+    embedder = gemini_embedder() if args.embedder == "gemini" else NgramEmbedder()
+
+    started = time.perf_counter()
+    lexical = LexicalIndex()
+    lexical.build(rows)
+    build_s = time.perf_counter() - started
+    retriever = HybridRetriever(BruteForceVectors(embedder, rows), lexical)
+    queries = list(with_vehicle_filters(data["queries"], rows)) if args.vehicle else data["queries"]
+
+    results = {mode: evaluate(retriever, queries, mode, args.top_k) for mode in MODES}
+
+    print(f"\n{'=' * 82}")
+    print(f"KB retrieval: {len(rows)} chunks, {len(data['queries'])} queries, top_k={args.top_k}, "
+          f"embedder={args.embedder}, vehicle filters {'on' if args.vehicle else 'off'}, "
+          f"lexical build {build_s * 1000:.0f}ms")
+    print(f"{'=' * 82}")
+    print(f"{'mode':<10}{'recall':>9}{'exact':>9}{'semantic':>10}{'MRR':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<10}{r['recall']:>9.3f}{r['recall_exact']:>9.3f}{r['recall_semantic']:>10.3f}"
+              f"{r['mrr']:>8.3f}{r['p50']:>10.2f}{r['p99']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+EKA-AI LLM Client Overhead Benchmark
+Measures per-call client overhead for the chat router against a local fake
+Gemini/Anthropic provider: a fresh client per call (the old call_gemini path)
+versus the pooled keep-alive clients in services/llm_clients.py.
+
+Usage:
+    python bench_llm_clients.py --calls 200
+    python bench_llm_clients.py --calls 500 --latency 20
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODEL_JSON = json.dumps({
+    "response_content": {"visual_text": "Check battery terminals.", "audio_text": "Check battery."},
+    "job_status_update": "CREATED"
+})
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """Answers Gemini generateContent and Anthropic messages calls."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    latency = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        FakeProviderHandler.connections += 1
+
+    def do_GET(self):
+        self._reply({"name": "models/gemini-2.0-flash"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        if "generateContent" in self.path:
+            body = {"candidates": [{
+                "content": {"role": "model", "parts": [{"text": MODEL_JSON}]},
+                "finishReason": "STOP"
+            }]}
+        else:
+            body = {
+                "id": "msg_bench", "type": "message", "role": "assistant",
+                "model": "claude-3-5-sonnet-20241022",
+                "content": [{"type": "text", "text": MODEL_JSON}],
+                "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": 10, "output_tokens": 10}
+            }
+        self._reply(body)
+
+    def _reply(self, body):
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_provider(latency_ms: float) -> str:
+    FakeProviderHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeProviderHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+HISTORY = [{"role": "user", "parts": [{"text": "Swift 2020 won't start"}]}]
+
+
+def gemini_fresh_client(base_url):
+    from google import genai
+    client = genai.Client(api_key="bench", http_options={"base_url": base_url})
+    response = client.models.generate_content(
+        model="gemini-2.0-flash", contents=HISTORY,
+        config={"system_instruction": "bench", "response_mime_type": "application/json"}
+    )
+    return json.loads(response.text)
+
+
+def gemini_pooled_client(base_url):
+    from services.llm_clients import model_clients
+    with model_clients.slot("gemini"):
+        response = model_clients.gemini().models.generate_content(
+            model="gemini-2.0-flash", contents=HISTORY,
+            config={"system_instruction": "bench", "response_mime_type": "application/json"}
+        )
+    return json.loads(response.text)
+
+
+def claude_fresh_client(base_url):
+    import anthropic
+    client = anthropic.Anthropic(api_key="bench", base_url=base_url)
+    msg = client.messages.create(
+        model="claude-3-5-sonnet-20241022", max_tokens=64, system="bench",
+        messages=[{"role": "user", "content": "Swift 2020 won't start"}]
+    )
+    return json.loads(msg.content[0].text)
+
+
+def claude_pooled_client(base_url):
+    from services.llm_clients import model_clients
+    with model_clients.slot("claude"):
+        msg = model_clients.claude().messages.create(
+            model="claude-3-5-sonnet-20241022", max_tokens=64, system="bench",
+            messages=[{"role": "user", "content": "Swift 2020 won't start"}]
+        )
+    return json.loads(msg.content[0].text)
+
+
+def measure(fn, base_url, calls, latency_ms):
+    fn(base_url)  # exclude one-off import cost
+    connections_before = FakeProviderHandler.connections
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn(base_url)
+        samples.append((time.perf_counter() - start) * 1000 - latency_ms)
+    samples.sort()
+    return {
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[int(len(samples) * 0.95) - 1],
+        "connections": FakeProviderHandler.connections - connections_before
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM client overhead benchmark")
+    parser.add_argument("--calls", type=int, default=200, help="Calls per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake provider latency (ms)")
+    args = parser.parse_args()
+
+    base_url = start_fake_provider(args.latency)
+    os.environ.update({
+        "GEMINI_API_KEY": "bench", "GEMINI_BASE_URL": base_url,
+        "ANTHROPIC_API_KEY": "bench", "ANTHROPIC_BASE_URL": base_url,
+    })
+
+    scenarios = [
+        ("gemini  fresh client (before)", gemini_fresh_client),
+        ("gemini  pooled client (after)", gemini_pooled_client),
+        ("claude  fresh client (before)", claude_fresh_client),
+        ("claude  pooled client (after)", claude_pooled_client),
+    ]
+
+    print(f"\nPer-call client overhead, {args.calls} calls, fake provider latency {args.latency}ms")
+    print("=" * 78)
+    print(f"{'scenario':34} {'mean':>9} {'p50':>9} {'p95':>9} {'new conns':>12}")
+    for name, fn in scenarios:
+        r = measure(fn, base_url, args.calls, args.latency)
+        print(f"{name:34} {r['mean_ms']:8.2f}ms {r['p50_ms']:8.2f}ms {r['p95_ms']:8.2f}ms {r['connections']:>12}")
+    print("=" * 78)
+    print("Fresh clients also pay a TLS handshake per call against the real providers;")
+    print("the 'new conns' column shows how many connections each scenario opened.\n")
+
+
+if __name__ == "__main__":
+    main()
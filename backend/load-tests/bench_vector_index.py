@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+EKA-AI Semantic Cache Index Benchmark
+Loads N synthetic 768-dim vectors into a local Redis Stack under a
+throwaway prefix, builds a FLAT index and one HNSW index per (M,
+EF_CONSTRUCTION) over the same documents, and reports for every
+configuration:
+
+- build (backfill) time
+- p50/p99 lookup latency of the real cache query (VectorEngine.knn_query)
+- recall@1 against FLAT, which is exact
+
+EF_RUNTIME is a query-time setting, so several values are measured
+against each HNSW index without rebuilding it.
+
+Usage:
+    python bench_vector_index.py --entries 10000
+    python bench_vector_index.py --entries 50000 --configs HNSW:16:200:10,HNSW:16:200:50,HNSW:32:400:100
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from services.vector_engine import VectorEngine, VECTOR_DIM, cache_schema, to_vector_bytes
+
+PREFIX = "benchidx:"
+
+
+def parse_configs(text):
+    """'HNSW:16:200:10,FLAT' -> [("HNSW", 16, 200, 10), ("FLAT", None, None, 0)]"""
+    configs = []
+    for item in filter(None, text.split(",")):
+        parts = item.split(":")
+        if parts[0].upper() == "FLAT":
+            configs.append(("FLAT", None, None, 0))
+        else:
+            m, efc, ef = (int(p) for p in parts[1:4])
+            configs.append(("HNSW", m, efc, ef))
+    return configs
+
+
+def synthetic(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 50), dim)).astype(np.float32)
+    data = centers[rng.integers(len(centers), size=n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def load(client, vectors):
+    pipe = client.pipeline(transaction=False)
+    for i, vector in enumerate(vectors):
+        pipe.json().set(f"{PREFIX}{i}", "$", {"query": f"q{i}", "response": f"answer {i}",
+                                              "scope": "global", "vector": vector.tolist()})
+        if i % 500 == 499:
+            pipe.execute()
+    pipe.execute()
+
+
+def build(client, name, algorithm, m, efc):
+    from redis.commands.search.index_definition import IndexDefinition, IndexType
+    started = time.perf_counter()
+    client.ft(name).create_index(fields=cache_schema(algorithm, m, efc),
+                                 definition=IndexDefinition(prefix=[PREFIX], index_type=IndexType.JSON))
+    while float(client.ft(name).info().get("percent_indexed", 1)) < 1.0:
+        time.sleep(0.1)
+    return time.perf_counter() - started
+
+
+def run_queries(client, name, queries, ef_runtime):
+    latencies, top = [], []
+    for q in queries:
+        params = {"vec": to_vector_bytes(q)}
+        started = time.perf_counter()
+        docs = client.ft(name).search(VectorEngine.knn_query("global", ef_runtime=ef_runtime), query_params=params).docs
+        latencies.append((time.perf_counter() - started) * 1000)
+        top.append(docs[0].id if docs else None)
+    latencies.sort()
+    return top, statistics.median(latencies), latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FLAT vs HNSW semantic cache index benchmark")
+    parser.add_argument("--redis", default="redis://localhost:6379/0", help="Redis Stack URL")
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--configs", default="HNSW:16:200:10,HNSW:16:200:50,HNSW:32:400:100",
+                        help="comma-separated HNSW:M:EF_CONSTRUCTION:EF_RUNTIME entries")
+    args = parser.parse_args()
+
+    import redis
+    client = redis.from_url(args.redis, decode_responses=True)
+    client.ping()
+
+    vectors = synthetic(args.entries, VECTOR_DIM)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(args.entries, size=args.queries)] + 0.05 * rng.standard_normal(
+        (args.queries, VECTOR_DIM)).astype(np.float32)
+
+    print(f"Loading {args.entries} vectors into {args.redis} ...")
+    load(client, vectors)
+    indexes = []
+    try:
+        flat_name = "benchidx:flat"
+        indexes.append(flat_name)
+        flat_build = build(client, flat_name, "FLAT", None, None)
+        truth, flat_p50, flat_p99 = run_queries(client, flat_name, queries, 0)
+
+        rows = [("FLAT", "-", "-", "-", flat_build, flat_p50, flat_p99, 1.0)]
+        built = {}
+        for algorithm, m, efc, ef in parse_configs(args.configs):
+            if algorithm == "FLAT":
+                continue
+            name = f"benchidx:hnsw-m{m}-efc{efc}"
+            if name not in built:
+                indexes.append(name)
+                built[name] = build(client, name, algorithm, m, efc)
+            top, p50, p99 = run_queries(client, name, queries, ef)
+            recall = sum(a == b for a, b in zip(top, truth)) / len(truth)
+            rows.append((algorithm, m, efc, ef, built[name], p50, p99, recall))
+    finally:
+        for name in indexes:
+            try:
+                client.ft(name).dropindex(delete_documents=False)
+            except Exception:
+                pass
+        for batch_start in range(0, args.entries, 1000):
+            client.delete(*(f"{PREFIX}{i}" for i in range(batch_start, min(args.entries, batch_start + 1000))))
+
+    print(f"\n{'=' * 78}")
+    print(f"Semantic cache index: {args.entries} x {VECTOR_DIM} vectors, {args.queries} queries")
+    print(f"{'=' * 78}")
+    print(f"{'algo':<6}{'M':>5}{'EF_C':>7}{'EF_R':>7}{'build s':>10}{'p50 ms':>10}{'p99 ms':>10}{'recall@1':>11}")
+    for algorithm, m, efc, ef, build_s, p50, p99, recall in rows:
+        print(f"{algorithm:<6}{m:>5}{efc:>7}{ef:>7}{build_s:>10.1f}{p50:>10.2f}{p99:>10.2f}{recall:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+EKA-AI Semantic Cache Hit-Path Micro-Benchmark
+Measures the per-hit cost of VectorEngine.search_cache after the KNN result
+comes back, old path vs new path:
+
+- old: the full JSON document (including the 768-float vector) is returned,
+  json.loads'd, and cosine similarity is recomputed in pure Python
+- new: only the score and the hit fields are returned; similarity is
+  1 - the distance RediSearch already computed (VectorEngine._match)
+
+With --redis the same comparison is made end to end against a Redis Stack
+server (FT.SEARCH returning the whole document vs VectorEngine.knn_query).
+
+Usage:
+    python bench_vector_search.py --iterations 20000
+    python bench_vector_search.py --redis redis://localhost:6379/0 --entries 2000
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import statistics
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from services.vector_engine import VectorEngine, SCORE_FIELD, to_vector_bytes, physical_index_name
+
+DIM = 768
+
+
+def random_vector(rng):
+    return [rng.uniform(-1, 1) for _ in range(DIM)]
+
+
+def old_cosine(v1, v2):
+    """The pre-NumPy implementation, kept here for comparison."""
+    dot = sum(a * b for a, b in zip(v1, v2))
+    norm1 = math.sqrt(sum(a * a for a in v1))
+    norm2 = math.sqrt(sum(b * b for b in v2))
+    return dot / (norm1 * norm2) if norm1 and norm2 else 0.0
+
+
+def old_hit(top_doc, query_vector):
+    doc_data = json.loads(top_doc.json)
+    similarity = old_cosine(query_vector, doc_data["vector"])
+    return {"text": doc_data["response"], "similarity": similarity, "timestamp": doc_data["timestamp"]}
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        "p50_us": statistics.median(samples),
+        "p99_us": samples[min(int(len(samples) * 0.99), len(samples) - 1)],
+    }
+
+
+def bench_local(args):
+    rng = random.Random(7)
+    query_vector = random_vector(rng)
+    stored = [q + rng.uniform(-0.05, 0.05) for q in query_vector]
+    body = {"query": "car won't start", "response": "Check the battery terminals." * 20,
+            "scope": "global", "vector": stored, "timestamp": "2026-01-01T00:00:00", "metadata": {}}
+    full_doc = SimpleNamespace(id="cache:abc", json=json.dumps(body))
+    distance = 1.0 - float(np.dot(query_vector, stored) / (np.linalg.norm(query_vector) * np.linalg.norm(stored)))
+    lean_doc = SimpleNamespace(id="cache:abc", scope="global", response=body["response"],
+                               query=body["query"], timestamp=body["timestamp"], **{SCORE_FIELD: str(distance)})
+    engine = VectorEngine.__new__(VectorEngine)
+
+    results = [
+        ("old: json + py cosine", timed(lambda: old_hit(full_doc, query_vector), args.iterations), len(full_doc.json)),
+        ("new: returned score", timed(lambda: engine._match(lean_doc, "global"), args.iterations),
+         sum(len(str(v)) for v in vars(lean_doc).values())),
+        ("numpy cosine only", timed(lambda: engine.cosine_similarity(query_vector, stored), args.iterations), 0),
+    ]
+    return results
+
+
+def bench_redis(args):
+    import redis
+    from redis.commands.search.query import Query
+
+    client = redis.from_url(args.redis, decode_responses=True)
+    engine = VectorEngine.__new__(VectorEngine)
+    engine.redis, engine.index_name, engine.doc_prefix = client, "bench_semantic_idx", "benchcache:"
+    try:
+        client.ft(physical_index_name(engine.index_name)).dropindex(delete_documents=True)
+    except Exception:
+        pass
+    engine._ensure_index()
+
+    rng = random.Random(7)
+    pipe = client.pipeline(transaction=False)
+    vectors = [random_vector(rng) for _ in range(args.entries)]
+    for i, vector in enumerate(vectors):
+        pipe.json().set(f"benchcache:{i}", "$", {"query": f"q{i}", "response": f"answer {i}", "scope": "global",
+                                                  "vector": vector, "timestamp": "2026-01-01T00:00:00"})
+    pipe.execute()
+    time.sleep(1.0)  # let the index catch up
+
+    query_vector = vectors[0]
+    params = {"vec": to_vector_bytes(query_vector)}
+    old_query = (Query("(@scope:{global})=>[KNN 5 @vector $vec AS score]")
+                 .sort_by("score").paging(0, 1).dialect(2))
+
+    def old_path():
+        docs = client.ft(engine.index_name).search(old_query, query_params=params).docs
+        return old_hit(docs[0], query_vector)
+
+    def new_path():
+        docs = client.ft(engine.index_name).search(engine.knn_query("global"), query_params=params).docs
+        return engine._match(docs[0], "global")
+
+    results = [
+        ("old: full doc round trip", timed(old_path, args.iterations), 0),
+        ("new: RETURN fields round trip", timed(new_path, args.iterations), 0),
+    ]
+    client.ft(physical_index_name(engine.index_name)).dropindex(delete_documents=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic cache hit-path micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--redis", help="Redis Stack URL for the end-to-end comparison")
+    parser.add_argument("--entries", type=int, default=1000, help="documents to index in --redis mode")
+    args = parser.parse_args()
+
+    results = bench_redis(args) if args.redis else bench_local(args)
+    print(f"\n{'=' * 66}")
+    print(f"Cache hit path ({'redis ' + args.redis if args.redis else 'local'}), {args.iterations} iterations")
+    print(f"{'=' * 66}")
+    print(f"{'path':<32}{'p50 us':>10}{'p99 us':>10}{'payload B':>12}")
+    for name, r, payload in results:
+        print(f"{name:<32}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{payload or '-':>12}")
+
+
+if __name__ == "__main__":
+    main()
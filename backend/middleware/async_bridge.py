@@ -0,0 +1,304 @@
+"""
+middleware/async_bridge.py
+One view implementation for both WSGI (Gunicorn) and ASGI (uvicorn) serving.
+
+LLM-bound views split their work around the slow upstream call and return
+``resolve(Deferred(run, arun, finish, on_error))``:
+
+- Under WSGI, resolve() runs ``run()`` inline and returns ``finish(result)``,
+  so the view behaves exactly as a plain synchronous view.
+- Under the ASGI runner (asgi.py) the request environ carries
+  ASYNC_ENVIRON_KEY, so resolve() hands the Deferred back up through the
+  view's decorators. The runner awaits ``arun()`` on the event loop and then
+  calls ``finish(result)`` in a worker thread. ``finish`` may itself return
+  another Deferred (e.g. RAG retrieval followed by a chat turn).
+
+Errors raised by the upstream call or by ``finish`` go to ``on_error`` when
+given, mirroring the view's own try/except. ``arun`` runs on the event loop:
+it must not block, and should capture what it needs from the request up front.
+
+Serve with:
+    uvicorn asgi:app --host 0.0.0.0 --port 8001 --workers 3
+"""
+import io
+import os
+import sys
+import copy
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from flask import request, has_request_context
+from flask.signals import request_started
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "16"))  # pool for the blocking parts of each request
+ASYNC_ENVIRON_KEY = "eka.async"
+
+
+class Deferred:
+    """The upstream part of a view, runnable either blocking or awaited."""
+
+    __slots__ = ("run", "arun", "finish", "on_error")
+
+    def __init__(self, run: Callable[[], object], arun: Callable[[], Awaitable],
+                 finish: Callable[[object], object], on_error: Optional[Callable[[Exception], object]] = None):
+        self.run = run
+        self.arun = arun
+        self.finish = finish
+        self.on_error = on_error
+
+
+def is_async_request() -> bool:
+    """True when the current request is being served by the ASGI runner."""
+    return has_request_context() and bool(request.environ.get(ASYNC_ENVIRON_KEY))
+
+
+def resolve(rv):
+    """Complete deferred upstream calls inline, unless the ASGI runner will await them."""
+    if is_async_request():
+        return rv
+    while isinstance(rv, Deferred):
+        try:
+            rv = rv.finish(rv.run())
+        except Exception as e:
+            if rv.on_error is None:
+                raise
+            rv = rv.on_error(e)
+    return rv
+
+
+def build_environ(scope: Dict, body: bytes) -> Dict:
+    """WSGI environ for an ASGI HTTP scope with a fully read request body."""
+    script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+    path_info = scope["path"].encode("utf8").decode("latin1")
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = raw_value.decode("latin1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    environ["CONTENT_LENGTH"] = str(len(body))  # body is fully buffered, even if it arrived chunked
+    return environ
+
+
+class AsgiBridge:
+    """
+    ASGI application serving a Flask app.
+
+    POST requests to ``async_paths`` go through the Deferred protocol: the
+    view's blocking parts (auth, rate limiting, DB lookups, response
+    building) run in a bounded thread pool and the upstream model call is
+    awaited on the event loop, so a slow provider no longer pins a thread.
+    Every other request runs through ``flask_app.wsgi_app`` in the same
+    pool, exactly as under Gunicorn.
+
+    Each request gets its own contextvars.Context that every step runs in,
+    so Flask's request context survives the hops between loop and threads.
+    """
+
+    def __init__(self, flask_app, async_paths: Iterable[str], threads: int = ASGI_THREADS,
+                 on_startup: Optional[Callable] = None, on_shutdown: Optional[Callable] = None):
+        self.app = flask_app
+        self.async_paths = frozenset(async_paths)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-sync")
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+        self.async_requests = 0
+        self.sync_requests = 0
+        self.awaiting = 0  # upstream calls currently awaited on the loop
+        self.peak_awaiting = 0
+        self._middleware = None  # (wsgi_app it was built from, environ-only copy of the chain)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    # ─────────────────────────────────────────
+    # LIFESPAN
+    # ─────────────────────────────────────────
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self._hook(self.on_startup)
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await self._hook(self.on_shutdown)
+                except Exception as e:
+                    logger.warning(f"⚠️ ASGI shutdown hook error: {e}")
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _hook(hook):
+        if hook is not None:
+            result = hook()
+            if asyncio.iscoroutine(result):
+                await result
+
+    # ─────────────────────────────────────────
+    # HTTP
+    # ─────────────────────────────────────────
+    def _blocking(self, cv: contextvars.Context, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, cv.run, fn, *args)
+
+    async def _http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        environ = build_environ(scope, b"".join(chunks))
+        cv = contextvars.copy_context()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+
+        if scope["method"] == "POST" and scope["path"] in self.async_paths:
+            self.async_requests += 1
+            environ[ASYNC_ENVIRON_KEY] = True
+            app_iter = await self._dispatch(environ, cv, start_response)
+        else:
+            self.sync_requests += 1
+            app_iter = await self._blocking(cv, self.app.wsgi_app, environ, start_response)
+        await self._send_body(app_iter, cv, started, send)
+
+    def _through_middleware(self, environ):
+        """
+        The environ as ``flask_app.wsgi_app`` middleware (ProxyFix, ...) hands
+        it to Flask. Async requests build their request context directly, so
+        the chain is replayed with Flask swapped for a stub that returns the
+        environ it receives.
+        """
+        chain = self.app.wsgi_app
+        if self._middleware is None or self._middleware[0] is not chain:
+            def capture(env, start_response):
+                return [env]
+
+            def rebuild(layer):
+                inner = getattr(layer, "app", None)
+                if not callable(inner):  # Flask's own wsgi_app
+                    return capture
+                clone = copy.copy(layer)
+                clone.app = rebuild(inner)
+                return clone
+            self._middleware = (chain, rebuild(chain))
+        result = self._middleware[1](environ, lambda *args: None)
+        rewritten = next(iter(result), None)
+        return rewritten if isinstance(rewritten, dict) else environ
+
+    async def _dispatch(self, environ, cv, start_response):
+        """Flask's full_dispatch_request, with Deferred upstream calls awaited here."""
+        environ = self._through_middleware(environ)
+        ctx = self.app.request_context(environ)
+        error = None
+        try:
+            rv = await self._blocking(cv, self._front, ctx)
+            while isinstance(rv, Deferred):
+                try:
+                    result = await self._await_upstream(rv, cv)
+                    rv = await self._blocking(cv, rv.finish, result)
+                except Exception as e:
+                    handler = rv.on_error or self.app.handle_user_exception
+                    rv = await self._blocking(cv, handler, e)
+            response = await self._blocking(cv, self.app.finalize_request, rv)
+        except Exception as e:
+            error = e
+            response = await self._blocking(cv, self.app.handle_exception, e)
+        try:
+            return await self._blocking(cv, response, environ, start_response)
+        finally:
+            await self._blocking(cv, ctx.pop, error)
+
+    def _front(self, ctx):
+        """Everything up to the upstream call: context push, before_request hooks, the view."""
+        ctx.push()
+        try:
+            request_started.send(self.app, _async_wrapper=self.app.ensure_sync)
+            rv = self.app.preprocess_request()
+            if rv is None:
+                rv = self.app.dispatch_request()
+        except Exception as e:
+            rv = self.app.handle_user_exception(e)
+        return rv
+
+    async def _await_upstream(self, deferred: Deferred, cv: contextvars.Context):
+        self.awaiting += 1
+        self.peak_awaiting = max(self.peak_awaiting, self.awaiting)
+        try:
+            return await asyncio.get_running_loop().create_task(deferred.arun(), context=cv)
+        finally:
+            self.awaiting -= 1
+
+    async def _send_body(self, app_iter, cv, started, send):
+        iterator = iter(app_iter)
+        sent_start = False
+        try:
+            while True:
+                chunk = await self._blocking(cv, next, iterator, None)
+                if chunk is None:
+                    break
+                if not sent_start:
+                    await send({"type": "http.response.start", "status": started["status"],
+                                "headers": started["headers"]})
+                    sent_start = True
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not sent_start:
+                await send({"type": "http.response.start", "status": started["status"],
+                            "headers": started["headers"]})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            close = getattr(app_iter, "close", None)
+            if callable(close):
+                await self._blocking(cv, close)
+
+    def get_stats(self) -> Dict:
+        return {
+            "async_requests": self.async_requests,
+            "sync_requests": self.sync_requests,
+            "awaiting_upstream": self.awaiting,
+            "peak_awaiting_upstream": self.peak_awaiting,
+            "threads": self.executor._max_workers,
+        }
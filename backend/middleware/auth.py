@@ -15,6 +15,23 @@ def get_jwt_secret():
         raise ValueError("JWT_SECRET environment variable not set")
     return secret
 
+def _decode_token(token):
+    """Validate a bearer token and return its claims (raises jwt/ValueError errors)."""
+    return jwt.decode(
+        token, 
+        get_jwt_secret(), 
+        algorithms=['HS256'],
+        options={"require": ["sub", "role", "workshop_id", "exp", "iat"]}
+    )
+
+def _bind_user(payload):
+    """Store user context in Flask g object"""
+    g.user_id = payload['sub']
+    g.user_role = payload['role']
+    g.workshop_id = payload['workshop_id']
+    g.user_email = payload.get('email')
+    g.token_exp = payload['exp']
+
 def require_auth(allowed_roles=None):
     """
     Authentication decorator with optional role-based access control.
@@ -37,19 +54,8 @@ def require_auth(allowed_roles=None):
             
             try:
                 # Decode and validate token
-                payload = jwt.decode(
-                    token, 
-                    get_jwt_secret(), 
-                    algorithms=['HS256'],
-                    options={"require": ["sub", "role", "workshop_id", "exp", "iat"]}
-                )
-                
-                # Store user context in Flask g object
-                g.user_id = payload['sub']
-                g.user_role = payload['role']
-                g.workshop_id = payload['workshop_id']
-                g.user_email = payload.get('email')
-                g.token_exp = payload['exp']
+                payload = _decode_token(token)
+                _bind_user(payload)
                 
                 # Role-based access control
                 if allowed_roles and payload['role'] not in allowed_roles:
@@ -72,6 +78,34 @@ def require_auth(allowed_roles=None):
     return decorator
 
 
+def optional_auth():
+    """
+    Bind the caller's user and workshop when a valid bearer token is sent,
+    without requiring one.
+    
+    For public endpoints (e.g. /api/chat) that scope caches and coalescing
+    by g.workshop_id: authenticated callers get their workshop, anonymous
+    callers (no token, or one that does not validate) are served with
+    g.workshop_id unset and share the global namespace.
+    
+    Usage:
+        @optional_auth()
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            auth_header = request.headers.get('Authorization', '')
+            token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else ''
+            if token:
+                try:
+                    _bind_user(_decode_token(token))
+                except (jwt.InvalidTokenError, ValueError):
+                    pass
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
 def generate_token(user_id: str, role: str, workshop_id: str, email: str = None, expiry_hours: int = 24) -> str:
     """
     Generate a JWT token for a user.
@@ -0,0 +1,269 @@
+"""
+middleware/single_flight.py
+Single-flight coalescing for identical concurrent AI requests.
+
+When the same job card is open on several screens, or a client retries
+while its first request is still running, identical requests arrive
+together. Only one of them (the leader) runs the view; the duplicates wait
+and receive a copy of the leader's response.
+
+- Within a worker, duplicates wait on an in-process event.
+- Across workers (Redis available), the leader holds a short-lived lock
+  ``sf:lock:<key>`` whose value is a flight token; it publishes the
+  serialized response under ``sf:result:<key>:<token>`` and waiting
+  workers poll that key. If the lock disappears without a result (leader
+  crashed or timed out), a waiter takes over as leader.
+
+Keys hash (endpoint, canonical JSON payload, workshop), so requests from
+different workshops never share an answer.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import request, g, make_response, Response
+
+from middleware.async_bridge import is_async_request
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+WAIT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_WAIT", "45"))  # seconds a duplicate waits
+LOCK_TTL_MS = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL_MS", "60000"))
+RESULT_TTL = 10  # seconds a published result stays readable by waiters
+POLL_INTERVAL = 0.05  # seconds between Redis result polls
+LOCK_PREFIX = "sf:lock:"
+RESULT_PREFIX = "sf:result:"
+COALESCED_HEADER = "X-Coalesced"
+_SKIP_HEADERS = {"content-length", "set-cookie", "transfer-encoding", "connection"}
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def _canonical(value):
+    """Key-order and whitespace-insensitive form of a JSON payload."""
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+def flight_key(endpoint: str, payload, workshop: Optional[str]) -> str:
+    raw = json.dumps([endpoint, _canonical(payload), workshop or ""], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+
+    ``do()`` works with any JSON-serializable result; ``coalesce()`` wraps a
+    Flask view and shares its serialized response.
+    """
+
+    def __init__(self, use_redis: bool = True, wait_timeout: float = WAIT_TIMEOUT):
+        self.wait_timeout = wait_timeout
+        self.redis = None
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced_local = 0
+        self.coalesced_remote = 0
+        self.takeovers = 0
+        self.timeouts = 0
+
+        if use_redis and REDIS_AVAILABLE:
+            try:
+                self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+                self.redis.ping()
+            except Exception as e:
+                logger.warning(f"⚠️ Single-flight coalescing is per-worker only: {e}")
+                self.redis = None
+
+    # ─────────────────────────────────────────
+    # CORE
+    # ─────────────────────────────────────────
+    def do(self, key: str, fn: Callable[[], object]) -> Tuple[object, bool]:
+        """
+        Run ``fn`` once for all concurrent callers with ``key``.
+
+        Returns:
+            (result, shared) where ``shared`` is True for callers that reused
+            another caller's result. Errors from ``fn`` propagate to every
+            waiter of the same local flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                self._count("timeouts")
+                return fn(), False
+            self._count("coalesced_local")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, shared = self._run_distributed(key, fn)
+            return flight.result, shared
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _run_distributed(self, key: str, fn: Callable[[], object]) -> Tuple[object, bool]:
+        """Leader of the local flight: coordinate with other workers if Redis is up."""
+        if not self.redis:
+            self._count("leaders")
+            return fn(), False
+
+        lock_key = f"{LOCK_PREFIX}{key}"
+        deadline = time.monotonic() + self.wait_timeout
+        token = uuid.uuid4().hex
+        uncoalesced = False
+        try:
+            while True:
+                if self.redis.set(lock_key, token, nx=True, px=LOCK_TTL_MS):
+                    break
+                owner = self.redis.get(lock_key)
+                if not owner:
+                    continue  # lock expired between SET and GET
+                found, result = self._await_remote(key, owner, deadline)
+                if found:
+                    self._count("coalesced_remote")
+                    return result, True
+                if time.monotonic() >= deadline:
+                    self._count("timeouts")
+                    uncoalesced = True
+                    break
+                self._count("takeovers")  # owner finished without a result or died
+        except Exception as e:
+            logger.error(f"❌ Single-flight Redis error, running uncoalesced: {e}")
+            uncoalesced = True
+        if uncoalesced:
+            return fn(), False
+
+        self._count("leaders")
+        try:
+            result = fn()
+            try:
+                self.redis.set(f"{RESULT_PREFIX}{key}:{token}", json.dumps(result), ex=RESULT_TTL)
+            except Exception as e:
+                logger.error(f"❌ Single-flight result publish failed: {e}")
+            return result, False
+        finally:
+            self._release(lock_key, token)
+
+    def _await_remote(self, key: str, owner: str, deadline: float) -> Tuple[bool, object]:
+        """Poll for the owner's result until it appears, the lock moves on, or time runs out."""
+        result_key = f"{RESULT_PREFIX}{key}:{owner}"
+        lock_key = f"{LOCK_PREFIX}{key}"
+        while time.monotonic() < deadline:
+            raw = self.redis.get(result_key)
+            if raw is not None:
+                return True, json.loads(raw)
+            if self.redis.get(lock_key) != owner:
+                raw = self.redis.get(result_key)  # published just before release
+                return (True, json.loads(raw)) if raw is not None else (False, None)
+            time.sleep(POLL_INTERVAL)
+        return False, None
+
+    def _release(self, lock_key: str, token: str):
+        try:
+            if self.redis.get(lock_key) == token:
+                self.redis.delete(lock_key)
+        except Exception as e:
+            logger.error(f"❌ Single-flight lock release failed: {e}")
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    # ─────────────────────────────────────────
+    # FLASK INTEGRATION
+    # ─────────────────────────────────────────
+    def coalesce(self, endpoint: str, skip_if: Optional[Callable[[Dict], bool]] = None):
+        """
+        Decorator sharing one view execution among identical concurrent requests.
+        Place it below auth decorators so ``g.workshop_id`` is populated.
+        Requests served by the ASGI runner (asgi.py) pass straight through.
+
+        Args:
+            endpoint: name used in the key
+            skip_if: predicate on the JSON body; True runs the view uncoalesced
+                (e.g. streaming responses, which cannot be shared)
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                payload = request.get_json(silent=True)
+                # Under the ASGI runner the view returns a Deferred that cannot be snapshotted
+                if not payload or (skip_if and skip_if(payload)) or is_async_request():
+                    return view(*args, **kwargs)
+
+                key = flight_key(endpoint, payload, getattr(g, "workshop_id", None))
+                snapshot, shared = self.do(key, lambda: self._snapshot(view(*args, **kwargs)))
+                response = Response(
+                    snapshot["body"], status=snapshot["status"], headers=snapshot["headers"]
+                )
+                if shared:
+                    response.headers[COALESCED_HEADER] = "1"
+                return response
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _snapshot(rv) -> Dict:
+        response = make_response(rv)
+        return {
+            "status": response.status_code,
+            "headers": [(k, v) for k, v in response.headers.items() if k.lower() not in _SKIP_HEADERS],
+            "body": response.get_data(as_text=True),
+        }
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced_local": self.coalesced_local,
+                "coalesced_remote": self.coalesced_remote,
+                "coalesced_total": self.coalesced_local + self.coalesced_remote,
+                "takeovers": self.takeovers,
+                "timeouts": self.timeouts,
+                "shared": self.redis is not None,
+            }
+
+
+# Singleton instance for application use
+single_flight = SingleFlight()
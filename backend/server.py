@@ -4,7 +4,7 @@ Governed Automobile Intelligence System for Go4Garage Private Limited
 Features: Triple-Model Router, Rate Limiting, JWT Auth, Supabase Integration, PDI Pipeline
 """
 
-from flask import Flask, jsonify, request, send_from_directory, g, redirect
+from flask import Flask, jsonify, request, send_from_directory, g, redirect, Response, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -14,6 +14,10 @@ from functools import wraps
 import os
 import json
 import base64
+import hmac
+import time
+import threading
+import asyncio
 import jwt
 import datetime
 import logging
@@ -31,12 +35,27 @@ from services.pdi_manager import PDIManager, PDIStatus, STANDARD_PDI_ITEMS
 from services.invoice_manager import InvoiceManager
 from services.ai_governance import AIGovernance
 from services.subscription_service import SubscriptionService
-from services.vector_engine import vector_engine, get_cached_response, cache_response
+from services.vector_engine import vector_engine, get_cached_response, cache_response, query_batcher, delete_matching
+from services.llm_clients import model_clients, GEMINI_MODEL, CLAUDE_MODEL
+from services.model_router import ModelRouter
+from services.prompt_cache import PromptCache, estimate_tokens
+from services.history_manager import HistoryManager, conversation_id, message_text, message_tokens
+from services.stream_parser import IncrementalJSONParser
+from services.response_parser import response_parser
+from services.embedding_cache import embedding_cache
+from services.retrieval_cache import retrieval_cache
+from services.response_cache import chat_cache, build_scope, BYPASS_HEADER, BYPASS
+from services.audit_sink import audit_sink
+from services.vehicle_cache import vehicle_cache
+from services.batch_inference import batch_jobs, parse_requests, run_job, BatchInputError, BATCH_MAX_ITEMS, BATCH_RUNNER
+from services.tts_cache import tts_cache, TTS_VOICE, synthesize, asynthesize, normalize_text
 from services.scheduler import start_scheduler
 from services.backup_service import backup_service, perform_backup
-from middleware.auth import require_auth, get_current_user
+from middleware.auth import require_auth, optional_auth, get_current_user
 from middleware.monitoring import MonitoringMiddleware, track_performance
 from middleware.rate_limit import init_rate_limiter, init_error_handlers
+from middleware.single_flight import single_flight
+from middleware.async_bridge import Deferred, resolve
 from routes.dashboard import dashboard_bp
 
 # Phase 3: Initialize monitoring (Sentry)
@@ -101,7 +120,6 @@ logger.info(f"✅ Phase 3: Cognitive Layer (Vector Cache) status: {vector_engine
 # CLIENT INITIALIZATION (Graceful Degradation)
 # ─────────────────────────────────────────
 supabase = None
-anthropic_client = None
 
 try:
     if os.environ.get("SUPABASE_URL"):
@@ -114,13 +132,13 @@ try:
 except Exception as e: 
     print(f"⚠️  Supabase Warning: {e}")
 
-try:
-    if os.environ.get("ANTHROPIC_API_KEY"):
-        import anthropic
-        anthropic_client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-        print("✅ Anthropic Connected")
-except Exception as e: 
-    print(f"⚠️  Anthropic Warning: {e}")
+# Audit rows are batched off the request path
+audit_sink.bind(supabase)
+
+# LLM clients are pooled per worker (keep-alive, built after fork)
+anthropic_client = model_clients.claude()
+if anthropic_client:
+    print("✅ Anthropic Connected")
 
 # ─────────────────────────────────────────
 # MANAGER INITIALIZATION HELPERS
@@ -208,33 +226,40 @@ JSON OUTPUT SCHEMA (STRICT)
 }
 """
 
+# Static constitution is sent as a cacheable prefix; only the per-turn tail varies
+prompt_cache = PromptCache(EKA_CONSTITUTION)
+
 # ─────────────────────────────────────────
 # DATABASE HELPERS
 # ─────────────────────────────────────────
+def _load_vehicle_row(reg_number):
+    """Uncached vehicles table lookup"""
+    res = supabase.table('vehicles').select("*").eq('registration_number', reg_number.upper()).execute()
+    return res.data[0] if res.data else None
+
 def fetch_vehicle_from_db(reg_number):
-    """Fetch verified vehicle data from Supabase"""
+    """Fetch verified vehicle data from Supabase (TTL/LRU cached per plate)"""
     if not reg_number or not supabase: 
         return None
     try:
-        res = supabase.table('vehicles').select("*").eq('registration_number', reg_number.upper()).execute()
-        return res.data[0] if res.data else None
+        return vehicle_cache.get_or_load(reg_number, _load_vehicle_row)
     except Exception as e: 
         print(f"DB Fetch Error: {e}")
         return None
 
 def log_audit(mode, status, query, response, confidence=None):
-    """Audit trail logging"""
+    """Audit trail logging (queued; bulk-inserted by the audit sink)"""
     if not supabase:
         return
     try:
-        supabase.table('intelligence_logs').insert({
+        audit_sink.submit('intelligence_logs', {
             "mode": mode,
             "status": status,
             "user_query": query[:500],  # Truncate for safety
             "ai_response": response[:1000],
             "confidence_score": confidence,
             "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
-        }).execute()
+        }, client=supabase)
     except Exception as e:
         print(f"Audit Log Error: {e}")
 
@@ -243,36 +268,204 @@ def log_audit(mode, status, query, response, confidence=None):
 # ─────────────────────────────────────────
 def call_gemini(history, system_prompt):
     """Primary Gemini Flash 2.0 Router"""
-    from google import genai
-    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-    
-    response = client.models.generate_content(
-        model='gemini-2.0-flash',
-        contents=history,
-        config={
-            "system_instruction": system_prompt, 
-            "response_mime_type": "application/json",
-            "temperature": 0.1
-        }
-    )
-    return json.loads(response.text)
+    client = model_clients.gemini()
+    if client is None:
+        raise RuntimeError("Gemini not configured")
+    
+    contents, prompt_config = prompt_cache.gemini_request(client, GEMINI_MODEL, system_prompt, history)
+    
+    def generate(extra_turns):
+        started = time.perf_counter()
+        with model_clients.slot("gemini"):
+            try:
+                response = client.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=contents + extra_turns,
+                    config={
+                        **prompt_config,
+                        "response_mime_type": "application/json",
+                        "temperature": 0.1
+                    }
+                )
+            except Exception:
+                if "cached_content" in prompt_config:
+                    prompt_cache.invalidate_gemini()
+                raise
+        prompt_cache.record("gemini", response.usage_metadata, (time.perf_counter() - started) * 1000)
+        return response.text
+    
+    # Repairs fences/trailing text/truncation; re-asks only if that fails
+    return response_parser.parse_with_reask("gemini", generate)
 
 def call_claude(history, system_prompt):
     """Fallback Claude 3.5 Sonnet Router (for THINKING mode)"""
-    # Convert Gemini format to Claude format
+    client = model_clients.claude()
+    if client is None:
+        raise RuntimeError("Anthropic not configured")
+    
+    def generate(extra_turns):
+        started = time.perf_counter()
+        with model_clients.slot("claude"):
+            msg = client.messages.create(
+                model=CLAUDE_MODEL,
+                max_tokens=4096,
+                system=prompt_cache.claude_system(system_prompt),
+                messages=to_claude_messages(history + extra_turns)
+            )
+        prompt_cache.record("claude", msg.usage, (time.perf_counter() - started) * 1000)
+        return msg.content[0].text
+    
+    return response_parser.parse_with_reask("claude", generate)
+
+def to_claude_messages(history):
+    """Convert Gemini format to Claude format"""
     messages = []
     for msg in history:
         role = "user" if msg.get("role") == "user" else "assistant"
         content = msg["parts"][0]["text"]
         messages.append({"role": role, "content": content})
+    return messages
+
+def stream_gemini(history, system_prompt):
+    """Streaming variant of call_gemini; yields raw text chunks"""
+    client = model_clients.gemini()
+    if client is None:
+        raise RuntimeError("Gemini not configured")
+    
+    contents, prompt_config = prompt_cache.gemini_request(client, GEMINI_MODEL, system_prompt, history)
+    started = time.perf_counter()
+    ttft_ms, usage = None, None
+    with model_clients.slot("gemini"):
+        try:
+            for chunk in client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=contents,
+                config={
+                    **prompt_config,
+                    "response_mime_type": "application/json",
+                    "temperature": 0.1
+                }
+            ):
+                usage = chunk.usage_metadata or usage
+                if chunk.text:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                    yield chunk.text
+        except Exception:
+            if "cached_content" in prompt_config and ttft_ms is None:
+                prompt_cache.invalidate_gemini()
+            raise
+    prompt_cache.record("gemini", usage, (time.perf_counter() - started) * 1000, ttft_ms)
+
+def stream_claude(history, system_prompt):
+    """Streaming variant of call_claude; yields raw text chunks"""
+    client = model_clients.claude()
+    if client is None:
+        raise RuntimeError("Anthropic not configured")
+    
+    started = time.perf_counter()
+    ttft_ms = None
+    with model_clients.slot("claude"):
+        with client.messages.stream(
+            model=CLAUDE_MODEL,
+            max_tokens=4096,
+            system=prompt_cache.claude_system(system_prompt),
+            messages=to_claude_messages(history)
+        ) as stream:
+            for text in stream.text_stream:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                yield text
+            usage = stream.get_final_message().usage
+    prompt_cache.record("claude", usage, (time.perf_counter() - started) * 1000, ttft_ms)
+
+async def acall_gemini(history, system_prompt):
+    """Async variant of call_gemini (ASGI serving mode)"""
+    client = model_clients.gemini_async()
+    if client is None:
+        raise RuntimeError("Gemini not configured")
+    
+    # Context-cache creation is a blocking call on the sync client; keep it off the loop
+    contents, prompt_config = await asyncio.to_thread(
+        prompt_cache.gemini_request, model_clients.gemini(), GEMINI_MODEL, system_prompt, history
+    )
     
-    msg = anthropic_client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=4096,
-        system=system_prompt,
-        messages=messages
+    async def generate(extra_turns):
+        started = time.perf_counter()
+        async with model_clients.aslot("gemini"):
+            try:
+                response = await client.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=contents + extra_turns,
+                    config={
+                        **prompt_config,
+                        "response_mime_type": "application/json",
+                        "temperature": 0.1
+                    }
+                )
+            except Exception:
+                if "cached_content" in prompt_config:
+                    prompt_cache.invalidate_gemini()
+                raise
+        prompt_cache.record("gemini", response.usage_metadata, (time.perf_counter() - started) * 1000)
+        return response.text
+    
+    return await response_parser.aparse_with_reask("gemini", generate)
+
+async def acall_claude(history, system_prompt):
+    """Async variant of call_claude (ASGI serving mode)"""
+    client = model_clients.claude_async()
+    if client is None:
+        raise RuntimeError("Anthropic not configured")
+    
+    async def generate(extra_turns):
+        started = time.perf_counter()
+        async with model_clients.aslot("claude"):
+            msg = await client.messages.create(
+                model=CLAUDE_MODEL,
+                max_tokens=4096,
+                system=prompt_cache.claude_system(system_prompt),
+                messages=to_claude_messages(history + extra_turns)
+            )
+        prompt_cache.record("claude", msg.usage, (time.perf_counter() - started) * 1000)
+        return msg.content[0].text
+    
+    return await response_parser.aparse_with_reask("claude", generate)
+
+# Latency-aware routing with per-provider circuit breakers (and optional FAST hedging)
+model_router = ModelRouter(
+    {'gemini': call_gemini, 'claude': call_claude},
+    available={
+        'gemini': lambda: bool(os.environ.get("GEMINI_API_KEY")),
+        'claude': lambda: anthropic_client is not None,
+    },
+    async_providers={'gemini': acall_gemini, 'claude': acall_claude}
+)
+STREAMERS = {'gemini': stream_gemini, 'claude': stream_claude}
+
+def summarize_history(previous_summary, messages):
+    """Rolling summary of older chat turns (runs off the request path)"""
+    client = model_clients.gemini()
+    if client is None:
+        raise RuntimeError("Gemini not configured")
+    
+    transcript = "\n".join(f"{m.get('role', 'user').upper()}: {message_text(m)}" for m in messages)
+    prompt = (
+        "Summarize this workshop diagnostic conversation so an assistant can continue it. "
+        "Keep vehicle facts, symptoms, DTC codes, checks done, findings, parts, estimates "
+        "and open questions. Plain text, at most 150 words.\n\n"
+        f"PREVIOUS SUMMARY:\n{previous_summary or '(none)'}\n\nNEW TURNS:\n{transcript}"
     )
-    return json.loads(msg.content[0].text)
+    with model_clients.slot("gemini"):
+        response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config={"temperature": 0.1, "max_output_tokens": 400}
+        )
+    return response.text
+
+# Long conversations are fitted to a token budget before each model call
+history_manager = HistoryManager(summarizer=summarize_history)
 
 def normalize_response(result, default_status):
     """Ensures consistent API response shape"""
@@ -296,6 +489,103 @@ def normalize_response(result, default_status):
         "service_history": safe_response.get("service_history")
     }
 
+def apply_output_guard(envelope):
+    """LlamaGuard output validation on the assembled visual text"""
+    try:
+        from services.llama_guard import validate_ai_output
+        visual_text = (envelope.get("response_content") or {}).get("visual_text", "")
+        safety_result = validate_ai_output(visual_text, context="chat")
+        if not safety_result.is_safe and safety_result.action == "BLOCK":
+            logger.warning("LlamaGuard blocked output", extra={
+                "category": safety_result.category.value if safety_result.category else None,
+                "confidence": safety_result.confidence
+            })
+            envelope["response_content"] = {
+                "visual_text": "⚠️ Response withheld due to safety policy.",
+                "audio_text": "Response withheld due to safety policy."
+            }
+            envelope["ui_triggers"] = {"theme_color": "#FF0000", "show_orange_border": True}
+    except Exception as lg_err:
+        logger.error(f"LlamaGuard output check error: {lg_err}")
+    return envelope
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def wants_stream(data):
+    """Streaming is opt-in via {"stream": true} or Accept: text/event-stream"""
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+def stream_chat_response(history, system_prompt, mode, status, op_mode, cache_scope=None, user_query=None):
+    """
+    SSE variant of the chat router.
+    Emits `token` events carrying visual_text deltas as the model writes them,
+    then one `final` event with the normalized, safety-checked envelope.
+    """
+    workshop = getattr(g, 'workshop_id', None)
+    
+    def generate():
+        parser = IncrementalJSONParser()
+        result = None
+        started = time.perf_counter()
+        provider = model_router.pick(mode)
+        recorded = False
+        try:
+            if provider is None:
+                raise RuntimeError(f"No provider available for {mode}")
+            for chunk in STREAMERS[provider](history, system_prompt):
+                delta = parser.feed(chunk)
+                if delta:
+                    yield sse_event('token', {'visual_text': delta})
+            result = response_parser.parse(parser.text, provider)
+            model_router.record(provider, (time.perf_counter() - started) * 1000, ok=True)
+            recorded = True
+        except Exception as e:
+            print(f"Streaming Model Error ({mode}): {e}")
+            if provider is not None:
+                model_router.record(provider, (time.perf_counter() - started) * 1000, ok=False)
+                recorded = True
+            if not parser.value:
+                # Nothing shown yet: fall back to a blocking routed call
+                try:
+                    result, _ = model_router.route(mode, history, system_prompt, exclude=(provider,))
+                except Exception as fallback_err:
+                    print(f"Streaming Fallback Error: {fallback_err}")
+        finally:
+            # Client disconnects arrive as GeneratorExit, which skips the
+            # handler above; release a HALF_OPEN probe claimed by pick()
+            if provider is not None and not recorded:
+                model_router.abandon(provider)
+        
+        if result is None:
+            yield sse_event('error', {
+                "response_content": {
+                    "visual_text": "⚠️ Governance system encountered an error. Please retry.",
+                    "audio_text": "System error."
+                },
+                "job_status_update": status,
+                "ui_triggers": {"theme_color": "#FF0000", "brand_identity": "ERROR", "show_orange_border": True}
+            })
+            return
+        
+        envelope = apply_output_guard(normalize_response(result, status))
+        query = user_query if user_query is not None else (history[-1]['parts'][0]['text'] if history else "")
+        log_audit(op_mode, envelope['job_status_update'], query,
+                  envelope['response_content'].get('visual_text', ''))
+        yield sse_event('final', envelope)
+        
+        guarded = envelope['response_content'] != result.get('response_content')
+        if cache_scope is not None and isinstance(result, dict) and result.get('response_content') and not guarded:
+            chat_cache.store(query, cache_scope, envelope, (time.perf_counter() - started) * 1000,
+                             owner=workshop)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # ─────────────────────────────────────────
 # API ENDPOINTS
 # ─────────────────────────────────────────
@@ -316,6 +606,8 @@ def health():
 
 @flask_app.route('/api/chat', methods=['POST'])
 @limiter.limit("15 per minute")
+@optional_auth()
+@single_flight.coalesce('chat', skip_if=wants_stream)
 def chat():
     """Main intelligence endpoint with LlamaGuard safety"""
     try:
@@ -329,116 +621,198 @@ def chat():
         mode = data.get('intelligence_mode', 'FAST')
         op_mode = data.get('operating_mode', 0)
         
-        # ─────────────────────────────────────────
-        # PHASE 5: LLAMAGUARD SAFETY CHECK (Input)
-        # ─────────────────────────────────────────
-        try:
-            from services.llama_guard import validate_ai_input
-            user_message = history[-1]['parts'][0]['text'] if history else ""
-            safety_result = validate_ai_input(user_message, context="chat")
-            
-            if not safety_result.is_safe and safety_result.action == "BLOCK":
-                logger.warning("LlamaGuard blocked input", extra={
-                    "category": safety_result.category.value if safety_result.category else None,
-                    "confidence": safety_result.confidence
-                })
-                return jsonify({
-                    "response_content": {
-                        "visual_text": f"⚠️ Request blocked due to safety policy ({safety_result.category.value if safety_result.category else 'Unknown'}). This content violates our acceptable use policy.",
-                        "audio_text": "Request blocked due to safety policy."
-                    },
-                    "job_status_update": status,
-                    "ui_triggers": {"theme_color": "#FF0000", "show_orange_border": True}
-                }), 400
-            
-            # Use redacted input
-            if history:
-                history[-1]['parts'][0]['text'] = safety_result.redacted_input
-                
-        except Exception as lg_err:
-            logger.error(f"LlamaGuard check error: {lg_err}")
-            # Continue without blocking if LlamaGuard fails
+        blocked = screen_input(history, status)
+        if blocked:
+            return jsonify(blocked), 400
 
         # Enrich context from database
-        if context.get('registrationNumber'):
-            db_veh = fetch_vehicle_from_db(context['registrationNumber'])
-            if db_veh: 
-                context.update({
-                    'brand': db_veh.get('brand', context.get('brand')),
-                    'model': db_veh.get('model', context.get('model')),
-                    'year': db_veh.get('year', context.get('year')),
-                    'fuel_type': db_veh.get('fuel_type', context.get('fuelType')),
-                    'vin': db_veh.get('vin', context.get('vin'))
-                })
-
-        system_prompt = f"{EKA_CONSTITUTION}\n[OPERATING_MODE]: {op_mode}\n[CURRENT_STATUS]: {status}\n[VEHICLE_CONTEXT]: {json.dumps(context)}"
-        
-        # Router Logic
-        result = None
-        try:
-            if mode == 'THINKING' and anthropic_client:
-                result = call_claude(history, system_prompt)
-            else:
-                result = call_gemini(history, system_prompt)
-                
+        enrich_context(context)
+
+        system_prompt = prompt_cache.build(op_mode, status, context)
+        
+        # Response cache (exact + semantic), scoped to job state, vehicle,
+        # the caller's workshop (from the bearer token when one is sent;
+        # anonymous calls share one global namespace) and the earlier turns
+        # of this conversation
+        user_query = history[-1]['parts'][0]['text'] if history else ""
+        cache_scope = build_scope(status, op_mode, context, history=history,
+                                  workshop=getattr(g, 'workshop_id', None), intelligence_mode=mode)
+        if request.headers.get(BYPASS_HEADER) or 'no-cache' in request.headers.get('Cache-Control', ''):
+            chat_cache.record_bypass()
+            cache_state = BYPASS
+        else:
+            cached, cache_state = chat_cache.lookup(user_query, cache_scope)
+            if cached:
+                if wants_stream(data):
+                    response = Response(sse_event('final', cached), mimetype='text/event-stream')
+                else:
+                    response = jsonify(cached)
+                response.headers['X-Cache'] = cache_state
+                return response
+        
+        # Keep the last turns verbatim; older ones become a rolling summary
+        conv_id = conversation_id(history, data.get('conversation_id'), context.get('registrationNumber', ''))
+        history = history_manager.compact(conv_id, history)
+        
+        if wants_stream(data):
+            return stream_chat_response(history, system_prompt, mode, status, op_mode, cache_scope, user_query)
+        
+        # Router Logic: preferred provider for the mode, failover to the other one
+        started = time.perf_counter()
+        workshop = getattr(g, 'workshop_id', None)
+        
+        def finish(routed):
+            result, _ = routed
+            
             # Log successful interaction
-            user_query = history[-1]['parts'][0]['text'] if history else ""
             log_audit(op_mode, result.get('job_status_update', status), user_query, 
                      result.get('response_content', {}).get('visual_text', ''))
-                     
-        except Exception as e:
-            print(f"Primary Model Error ({mode}): {e}")
-            # Fallback to Gemini
-            result = call_gemini(history, system_prompt)
 
-        return jsonify(normalize_response(result, status))
+            envelope = normalize_response(result, status)
+            if isinstance(result, dict) and result.get('response_content'):
+                chat_cache.store(user_query, cache_scope, envelope, (time.perf_counter() - started) * 1000,
+                                 owner=workshop)
+            
+            response = jsonify(envelope)
+            response.headers['X-Cache'] = cache_state
+            return response
+        
+        # Awaited on the event loop under asgi.py, called inline under Gunicorn
+        return resolve(Deferred(
+            run=lambda: model_router.route(mode, history, system_prompt),
+            arun=lambda: model_router.aroute(mode, history, system_prompt),
+            finish=finish,
+            on_error=chat_error_response
+        ))
 
     except Exception as e:
-        print(f"Chat Endpoint Error: {e}")
-        return jsonify({
-            "response_content": {
-                "visual_text": "⚠️ Governance system encountered an error. Please retry.",
-                "audio_text": "System error."
-            },
-            "job_status_update": "CREATED",
-            "ui_triggers": {"theme_color": "#FF0000", "brand_identity": "ERROR", "show_orange_border": True}
-        }), 500
+        return chat_error_response(e)
+
+def screen_input(history, status):
+    """
+    PHASE 5: LlamaGuard safety check on the latest user message.
+    Returns the blocked-response envelope, or None after redacting the message in place.
+    """
+    try:
+        from services.llama_guard import validate_ai_input
+        user_message = history[-1]['parts'][0]['text'] if history else ""
+        safety_result = validate_ai_input(user_message, context="chat")
+        
+        if not safety_result.is_safe and safety_result.action == "BLOCK":
+            logger.warning("LlamaGuard blocked input", extra={
+                "category": safety_result.category.value if safety_result.category else None,
+                "confidence": safety_result.confidence
+            })
+            return {
+                "response_content": {
+                    "visual_text": f"⚠️ Request blocked due to safety policy ({safety_result.category.value if safety_result.category else 'Unknown'}). This content violates our acceptable use policy.",
+                    "audio_text": "Request blocked due to safety policy."
+                },
+                "job_status_update": status,
+                "ui_triggers": {"theme_color": "#FF0000", "show_orange_border": True}
+            }
+        
+        # Use redacted input
+        if history:
+            history[-1]['parts'][0]['text'] = safety_result.redacted_input
+            
+    except Exception as lg_err:
+        logger.error(f"LlamaGuard check error: {lg_err}")
+        # Continue without blocking if LlamaGuard fails
+    return None
+
+def enrich_context(context):
+    """Fill vehicle details in ``context`` from the vehicles table (cached)"""
+    if context.get('registrationNumber'):
+        db_veh = fetch_vehicle_from_db(context['registrationNumber'])
+        if db_veh: 
+            context.update({
+                'brand': db_veh.get('brand', context.get('brand')),
+                'model': db_veh.get('model', context.get('model')),
+                'year': db_veh.get('year', context.get('year')),
+                'fuel_type': db_veh.get('fuel_type', context.get('fuelType')),
+                'vin': db_veh.get('vin', context.get('vin'))
+            })
+
+def chat_error_response(e):
+    print(f"Chat Endpoint Error: {e}")
+    return jsonify({
+        "response_content": {
+            "visual_text": "⚠️ Governance system encountered an error. Please retry.",
+            "audio_text": "System error."
+        },
+        "job_status_update": "CREATED",
+        "ui_triggers": {"theme_color": "#FF0000", "brand_identity": "ERROR", "show_orange_border": True}
+    }), 500
 
 @flask_app.route('/api/speak', methods=['POST'])
 @limiter.limit("20 per minute")
 def speak():
-    """Text-to-Speech using Gemini Multimodal"""
+    """
+    Text-to-Speech using Gemini Multimodal.
+    Clips are served from a content-addressed disk cache keyed by (voice, text).
+    Send {"stream": true} or Accept: audio/* for a chunked binary response
+    instead of base64 JSON.
+    """
     data = request.get_json()
     text = data.get('text', '') if data else ''
-    api_key = os.environ.get("GEMINI_API_KEY")
-    
-    if not api_key:
-        return jsonify({'error': 'TTS not configured'}), 500
+    voice = (data.get('voice') if data else None) or TTS_VOICE
     
     if not text:
         return jsonify({'error': 'No text provided'}), 400
-        
-    try:
-        from google import genai
-        client = genai.Client(api_key=api_key)
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=text,
-            config={
-                "response_modalities": ["AUDIO"],
-                "speech_config": {
-                    "voice_config": {"prebuilt_voice_config": {"voice_name": "Kore"}}
-                }
-            }
-        )
-        for part in response.candidates[0].content.parts:
-            if part.inline_data and part.inline_data.mime_type.startswith('audio/'):
-                b64_audio = base64.b64encode(part.inline_data.data).decode('utf-8')
-                return jsonify({'audio_data': b64_audio, 'mime_type': part.inline_data.mime_type})
-        return jsonify({'error': 'No audio generated'}), 500
-    except Exception as e:
+    
+    stream = data.get('stream') or request.headers.get('Accept', '').startswith('audio/')
+    
+    def respond(mime, path, hit):
+        if stream:
+            response = Response(stream_with_context(tts_cache.iter_chunks(path)), mimetype=mime)
+        else:
+            audio = tts_cache.read(path)[1]
+            response = jsonify({'audio_data': base64.b64encode(audio).decode('utf-8'), 'mime_type': mime})
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+    
+    def failed(e):
         print(f"TTS Error: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    try:
+        # Cached clips are served even when Gemini is not configured
+        cached = tts_cache.lookup(text, voice)
+        if cached:
+            return respond(*cached, hit=True)
+        
+        spoken = normalize_text(text)
+        return resolve(Deferred(
+            run=lambda: synthesize(spoken, voice),
+            arun=lambda: asynthesize(spoken, voice),
+            finish=lambda clip: respond(clip[0], tts_cache.put(text, voice, *clip), hit=False),
+            on_error=failed
+        ))
+    except Exception as e:
+        return failed(e)
+
+@flask_app.route('/api/webhooks/vehicles', methods=['POST'])
+def vehicles_webhook():
+    """
+    Supabase database webhook for the vehicles table.
+    Invalidates cached vehicle context on INSERT/UPDATE/DELETE.
+    """
+    secret = os.environ.get('VEHICLE_WEBHOOK_SECRET')
+    if not secret:
+        return jsonify({'error': 'Webhook not configured'}), 500
+    if not hmac.compare_digest(request.headers.get('X-Webhook-Secret', ''), secret):
+        return jsonify({'error': 'Invalid webhook secret'}), 401
+    
+    data = request.get_json() or {}
+    plates = {
+        row.get('registration_number')
+        for row in (data.get('record'), data.get('old_record'))
+        if isinstance(row, dict) and row.get('registration_number')
+    }
+    for plate in plates:
+        vehicle_cache.invalidate(plate)
+    return jsonify({'success': True, 'invalidated': sorted(plates)})
 
 @flask_app.route('/api/upload-pdi', methods=['POST'])
 @limiter.limit("30 per minute")
@@ -958,6 +1332,7 @@ def kb_search():
 
 @flask_app.route('/api/kb/query', methods=['POST'])
 @require_auth()
+@single_flight.coalesce('kb_query')
 def kb_query():
     """
     Query knowledge base with LLM synthesis (RAG)
@@ -976,14 +1351,7 @@ def kb_query():
     if not query:
         return jsonify({'error': 'Query is required'}), 400
     
-    try:
-        rag = get_rag_service()
-        response = rag.query(
-            question=query,
-            vehicle_context=vehicle_context,
-            top_k=5
-        )
-        
+    def respond(response):
         return jsonify({
             'query': query,
             'answer': response.answer,
@@ -992,10 +1360,22 @@ def kb_query():
             'tokens_used': response.tokens_used,
             'success': True
         })
-        
-    except Exception as e:
+    
+    def failed(e):
         logger.error(f"RAG query error: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    try:
+        rag = get_rag_service()
+        return resolve(Deferred(
+            run=lambda: rag.query(question=query, vehicle_context=vehicle_context, top_k=5),
+            arun=lambda: rag.aquery(question=query, vehicle_context=vehicle_context, top_k=5),
+            finish=respond,
+            on_error=failed
+        ))
+        
+    except Exception as e:
+        return failed(e)
 
 
 @flask_app.route('/api/kb/documents', methods=['POST'])
@@ -1019,11 +1399,11 @@ def kb_add_documents():
         return jsonify({'error': 'Documents array is required'}), 400
     
     try:
-        from llama_index.core import Document
+        from knowledge_base.index_manager import Document
         
         kb = get_knowledge_base()
         
-        # Convert to LlamaIndex documents
+        # Stored (and the retrieval cache invalidated) by kb.add_documents
         idx_docs = []
         for doc in documents:
             idx_doc = Document(
@@ -1058,6 +1438,7 @@ def kb_add_documents():
 @flask_app.route('/api/agent/diagnose', methods=['POST'])
 @require_auth()
 @limiter.limit("10 per minute")
+@single_flight.coalesce('agent_diagnose')
 def agent_diagnose():
     """
     Intelligent diagnostic with LangChain agent
@@ -1077,14 +1458,7 @@ def agent_diagnose():
     if not symptoms:
         return jsonify({'error': 'Symptoms description is required'}), 400
     
-    try:
-        agent = get_diagnostic_agent()
-        result = agent.diagnose(
-            symptoms=symptoms,
-            vehicle_context=vehicle_context,
-            chat_history=chat_history
-        )
-        
+    def respond(result):
         if result['success']:
             return jsonify({
                 'success': True,
@@ -1098,10 +1472,22 @@ def agent_diagnose():
                 'success': False,
                 'error': result.get('error', 'Diagnosis failed')
             }), 500
-            
-    except Exception as e:
+    
+    def failed(e):
         logger.error(f"Agent diagnosis error: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    try:
+        agent = get_diagnostic_agent()
+        return resolve(Deferred(
+            run=lambda: agent.diagnose(symptoms=symptoms, vehicle_context=vehicle_context, chat_history=chat_history),
+            arun=lambda: agent.adiagnose(symptoms=symptoms, vehicle_context=vehicle_context, chat_history=chat_history),
+            finish=respond,
+            on_error=failed
+        ))
+            
+    except Exception as e:
+        return failed(e)
 
 
 @flask_app.route('/api/agent/enhanced-chat', methods=['POST'])
@@ -1126,15 +1512,7 @@ def agent_enhanced_chat():
     if not user_message:
         return jsonify({'error': 'Message is required'}), 400
     
-    try:
-        # First, retrieve relevant context from knowledge base
-        rag = get_rag_service()
-        rag_response = rag.query(
-            question=user_message,
-            vehicle_context=vehicle_context,
-            top_k=3
-        )
-        
+    def augment(rag_response):
         # Augment the user message with retrieved context
         augmented_message = f"""User Question: {user_message}
 
@@ -1153,11 +1531,174 @@ Please provide a comprehensive answer using the above context."""
         
         # Call existing chat endpoint logic
         return chat()
-        
-    except Exception as e:
+    
+    def fallback(e):
         logger.error(f"Enhanced chat error: {e}")
         # Fallback to regular chat
         return chat()
+    
+    try:
+        # First, retrieve relevant context from knowledge base
+        rag = get_rag_service()
+        return resolve(Deferred(
+            run=lambda: rag.query(question=user_message, vehicle_context=vehicle_context, top_k=3),
+            arun=lambda: rag.aquery(question=user_message, vehicle_context=vehicle_context, top_k=3),
+            finish=augment,
+            on_error=fallback
+        ))
+        
+    except Exception as e:
+        return fallback(e)
+
+
+# ─────────────────────────────────────────
+# BATCH INFERENCE (bulk chat / diagnosis jobs)
+# ─────────────────────────────────────────
+def batch_chat(payload, owner=None):
+    """One /api/chat turn for a batch job (non-streaming, no history compaction)"""
+    history = payload.get('history') or []
+    if not history and payload.get('message'):
+        history = [{'role': 'user', 'parts': [{'text': payload['message']}]}]
+    if not history or not message_text(history[-1]).strip():
+        raise ValueError("message or history is required")
+    context = dict(payload.get('context') or {})
+    status = payload.get('status', 'CREATED')
+    mode = payload.get('intelligence_mode', 'FAST')
+    op_mode = payload.get('operating_mode', 0)
+    
+    blocked = screen_input(history, status)
+    if blocked:
+        return blocked, {'blocked': True}
+    enrich_context(context)
+    system_prompt = prompt_cache.build(op_mode, status, context)
+    
+    user_query = history[-1]['parts'][0]['text']
+    cache_scope = build_scope(status, op_mode, context, history=history, workshop=owner, intelligence_mode=mode)
+    cached, cache_state = chat_cache.lookup(user_query, cache_scope)
+    if cached:
+        return cached, {'cached': cache_state}
+    
+    started = time.perf_counter()
+    result, provider = model_router.route(mode, history, system_prompt)
+    envelope = normalize_response(result, status)
+    if isinstance(result, dict) and result.get('response_content'):
+        chat_cache.store(user_query, cache_scope, envelope, (time.perf_counter() - started) * 1000,
+                         owner=owner)
+    log_audit(op_mode, envelope['job_status_update'], user_query,
+              envelope['response_content'].get('visual_text', ''))
+    
+    return envelope, {
+        'provider': provider,
+        'tokens_in': estimate_tokens(str(system_prompt)) + sum(message_tokens(m) for m in history),
+        'tokens_out': estimate_tokens(json.dumps(result)),
+    }
+
+def batch_diagnose(payload, owner=None):
+    """One /api/agent/diagnose call for a batch job"""
+    if not KNOWLEDGE_BASE_AVAILABLE:
+        raise RuntimeError("Agent not available")
+    if not payload.get('symptoms'):
+        raise ValueError("symptoms is required")
+    
+    result = get_diagnostic_agent().diagnose(
+        symptoms=payload['symptoms'],
+        vehicle_context=payload.get('vehicle_context', {}),
+        chat_history=payload.get('history', [])
+    )
+    if not result['success']:
+        raise RuntimeError(result.get('error', 'Diagnosis failed'))
+    return result['diagnosis'], {
+        'provider': 'agent',
+        'tokens_in': result.get('tokens_used', 0),
+        'cost': result.get('cost', 0),
+    }
+
+BATCH_HANDLERS = {'chat': batch_chat, 'diagnose': batch_diagnose}
+
+def start_batch_job(job_id):
+    """
+    Run a batch job in a background thread. Only with BATCH_RUNNER=celery is
+    it queued on Celery: a reachable broker does not mean a worker consumes it.
+    """
+    if BATCH_RUNNER == 'celery':
+        try:
+            from workers.tasks import run_batch_job
+            run_batch_job.delay(job_id)
+            return 'celery'
+        except Exception as e:
+            logger.warning(f"Celery unavailable, running batch job {job_id} in-process: {e}")
+    threading.Thread(target=run_job, args=(job_id, BATCH_HANDLERS), daemon=True,
+                     name=f"batch-{job_id[:8]}").start()
+    return 'local'
+
+def load_batch_job(job_id):
+    """Status document of a job owned by the caller's workshop, or None"""
+    status = batch_jobs.load(job_id)
+    if not status or status.get('owner') != getattr(g, 'workshop_id', None):
+        return None
+    return status
+
+@flask_app.route('/api/batch/jobs', methods=['POST'])
+@require_auth(allowed_roles=['OWNER', 'MANAGER', 'FLEET_MANAGER'])
+@limiter.limit("10 per hour")
+def create_batch_job():
+    """
+    Submit a batch of chat/diagnose requests.
+    Body: JSONL (Content-Type application/x-ndjson) or {"requests": [...]}.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        lines = [json.dumps(item) for item in data.get('requests', [])]
+    else:
+        lines = request.get_data(as_text=True).splitlines()
+    
+    try:
+        items, rejected = parse_requests(lines, BATCH_HANDLERS, BATCH_MAX_ITEMS)
+    except BatchInputError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        job_id = batch_jobs.create(lines, owner=getattr(g, 'workshop_id', None))
+        runner = start_batch_job(job_id)
+    except Exception as e:
+        logger.error(f"Batch job submission error: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'accepted': len(items),
+        'rejected': len(rejected),
+        'runner': runner,
+        'status_url': f"/api/batch/jobs/{job_id}",
+        'results_url': f"/api/batch/jobs/{job_id}/results"
+    }), 202
+
+@flask_app.route('/api/batch/jobs/<job_id>', methods=['GET'])
+@require_auth(allowed_roles=['OWNER', 'MANAGER', 'FLEET_MANAGER'])
+def get_batch_job(job_id):
+    """Progress, throughput and cost of a batch job"""
+    status = load_batch_job(job_id)
+    if not status:
+        return jsonify({'error': 'Batch job not found'}), 404
+    status.pop('output', None)  # server path
+    return jsonify(status)
+
+@flask_app.route('/api/batch/jobs/<job_id>/results', methods=['GET'])
+@require_auth(allowed_roles=['OWNER', 'MANAGER', 'FLEET_MANAGER'])
+def get_batch_results(job_id):
+    """Results written so far, as JSONL (complete once the job state is COMPLETED)"""
+    if not load_batch_job(job_id):
+        return jsonify({'error': 'Batch job not found'}), 404
+    path = batch_jobs.path(job_id, 'output.jsonl')
+    if not os.path.exists(path):
+        return Response('', mimetype='application/x-ndjson')
+    
+    def lines():
+        with open(path) as f:
+            for line in f:
+                yield line
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -2323,6 +2864,19 @@ def get_metrics():
         "errors": monitor.error_count,
         "error_rate": (monitor.error_count / max(monitor.request_count, 1)) * 100,
         "avg_response_time": sum(monitor.response_times) / max(len(monitor.response_times), 1),
+        "llm_clients": model_clients.get_stats(),
+        "chat_cache": chat_cache.get_stats(),
+        "audit_sink": audit_sink.get_stats(),
+        "vehicle_cache": vehicle_cache.get_stats(),
+        "model_router": model_router.get_stats(),
+        "prompt_cache": prompt_cache.get_stats(),
+        "history": history_manager.get_stats(),
+        "single_flight": single_flight.get_stats(),
+        "tts_cache": tts_cache.get_stats(),
+        "response_parser": response_parser.get_stats(),
+        "embedding_cache": embedding_cache.get_stats(),
+        "retrieval_cache": retrieval_cache.get_stats(),
+        "embedding_batcher": query_batcher.get_stats(),
         "timestamp": time.time()
     })
 
@@ -2357,19 +2911,18 @@ def list_subscriptions():
 @require_auth(allowed_roles=['OWNER'])
 def cache_stats():
     """Get semantic cache statistics (admin only)"""
-    return jsonify(vector_engine.get_cache_stats())
+    return jsonify({**vector_engine.get_cache_stats(), 'chat': chat_cache.get_stats()})
 
 @flask_app.route('/api/cache/clear', methods=['POST'])
 @require_auth(allowed_roles=['OWNER'])
 def clear_cache():
     """Clear semantic cache (admin only)"""
     try:
-        # Clear all cache entries with prefix
+        # Clear all cache entries with prefix (incremental SCAN, never KEYS)
         if vector_engine.redis:
-            keys = vector_engine.redis.keys("cache:*")
-            if keys:
-                vector_engine.redis.delete(*keys)
-            return jsonify({"message": f"Cleared {len(keys)} cache entries"})
+            cleared = delete_matching(vector_engine.redis, "cache:*") + delete_matching(vector_engine.redis, "chat:exact:*")
+            vector_engine.budget.reset()
+            return jsonify({"message": f"Cleared {cleared} cache entries"})
         return jsonify({"error": "Redis not available"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -16,6 +16,8 @@ from enum import Enum
 import re
 import logging
 
+from services.audit_sink import audit_sink
+
 logger = logging.getLogger(__name__)
 
 
@@ -669,17 +671,17 @@ class AIGovernance:
             return "Unable to process request due to:\n" + "\n".join(messages)
     
     def _log_decision(self, decision: GovernanceDecision):
-        """Log governance decision to database"""
+        """Queue governance decision for the audit sink"""
         try:
             if self.supabase:
-                self.supabase.table(self.logs_table).insert({
+                audit_sink.submit(self.logs_table, {
                     "mode": 6,  # Governance mode
                     "status": decision.overall_result.value,
                     "user_query": decision.metadata.get("query", "")[:500],
                     "ai_response": json.dumps(decision.to_dict())[:1000],
                     "confidence_score": int(decision.overall_score * 100),
                     "created_at": datetime.now(timezone.utc).isoformat()
-                }).execute()
+                }, client=self.supabase)
         except Exception as e:
             logger.error(f"Error logging governance decision: {e}")
     
@@ -0,0 +1,317 @@
+"""
+services/audit_sink.py
+Non-blocking, batched sink for audit and intelligence log rows.
+
+Request handlers enqueue rows and return immediately. A background thread
+flushes them to Supabase as bulk inserts (one round trip per table per
+batch) whenever the batch fills up or the flush interval elapses. If
+Supabase is unreachable, rows are appended to a local JSONL spill file and
+replayed once inserts succeed again. When the database rejects a batch
+(a constraint violation, an oversized field) the batch is bisected so the
+good rows still go in; a row rejected on its own is moved to a dead-letter
+JSONL file instead of being spilled and replayed forever. Pending rows are
+flushed on shutdown.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "100"))  # rows per batch
+FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2.0"))  # seconds
+QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", "/tmp/eka_audit_spill.jsonl")
+DEAD_LETTER_PATH = os.getenv("AUDIT_DEAD_LETTER_PATH", "/tmp/eka_audit_dead.jsonl")
+REPLAY_BATCH = 500
+
+
+def rejected(error: Exception) -> bool:
+    """
+    True when the database answered and refused the rows (e.g. a postgrest
+    APIError carrying a SQLSTATE such as 23502), False for outages.
+
+    PostgREST's own PGRST0xx codes mean it could not reach Postgres, so those
+    count as outages too.
+    """
+    code = getattr(error, "code", None)
+    return bool(code) and not str(code).startswith("PGRST0")
+
+
+class AuditSink:
+    """
+    Process-local audit queue with a single background flusher.
+
+    Usage:
+        audit_sink.bind(supabase)
+        audit_sink.submit("audit_logs", {...})
+    """
+
+    def __init__(self, flush_size: int = FLUSH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 spill_path: str = SPILL_PATH, queue_size: int = QUEUE_SIZE,
+                 dead_letter_path: str = DEAD_LETTER_PATH):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self.queue_size = queue_size
+        self.client = None
+
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self.enqueued = 0
+        self.inserted = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failures = 0
+        self.dead_lettered = 0
+
+    def bind(self, client):
+        """Set the Supabase client used for inserts."""
+        if client is not None:
+            self.client = client
+
+    # ─────────────────────────────────────────
+    # PRODUCER SIDE
+    # ─────────────────────────────────────────
+    def submit(self, table: str, record: Dict, client=None) -> None:
+        """
+        Enqueue one row for ``table``. Never blocks on the network.
+
+        Args:
+            table: Supabase table name
+            record: Row to insert
+            client: Supabase client to bind if the sink has none yet
+        """
+        if self.client is None:
+            self.bind(client)
+        if self.client is None:
+            return
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((table, record))
+            self._count("enqueued")
+        except queue.Full:
+            logger.warning("⚠️ Audit queue full, spilling row to disk")
+            self._spill([(table, record)])
+
+    def _ensure_worker(self):
+        """Start the flusher thread (again) in this process, e.g. after fork."""
+        pid = os.getpid()
+        if self._pid == pid and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == pid and self._thread and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                self._queue = queue.Queue(maxsize=self.queue_size)
+            self._stopping.clear()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+            self._thread.start()
+
+    # ─────────────────────────────────────────
+    # FLUSHER THREAD
+    # ─────────────────────────────────────────
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+            stopping = self._stopping.is_set()
+            if len(batch) >= self.flush_size or time.monotonic() >= deadline or stopping:
+                if stopping:
+                    batch.extend(self._drain())
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+                if stopping:
+                    return
+
+    def _drain(self) -> List:
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _write(self, rows: List):
+        """Bulk insert rows grouped by table; spill what failed, dead-letter what was rejected."""
+        by_table = defaultdict(list)
+        for table, record in rows:
+            by_table[table].append(record)
+
+        failed, dead = [], []
+        for table, records in by_table.items():
+            retry, rejected_rows = self._store(table, records, "inserted")
+            failed.extend((table, record) for record in retry)
+            dead.extend(rejected_rows)
+
+        if dead:
+            self._dead_letter(dead)
+        if failed:
+            self._spill(failed)
+        elif self.spill_path and os.path.exists(self.spill_path):
+            self._replay()
+
+    def _store(self, table: str, records: List[Dict], counter: str) -> Tuple[List[Dict], List]:
+        """
+        Insert records, bisecting around rows the database rejects.
+
+        Returns:
+            (records to retry later, [(table, record, error)] rejected on their own)
+        """
+        error = self._insert(table, records)
+        if error is None:
+            self._count(counter, len(records))
+            self._count("batches")
+            return [], []
+        if not rejected(error):
+            return records, []
+        if len(records) == 1:
+            return [], [(table, records[0], str(error))]
+
+        mid = len(records) // 2
+        retry, dead = self._store(table, records[:mid], counter)
+        if retry:
+            # Supabase went away mid-bisect; keep the rest for later
+            return retry + records[mid:], dead
+        retry, more_dead = self._store(table, records[mid:], counter)
+        return retry, dead + more_dead
+
+    def _insert(self, table: str, records: List[Dict]) -> Optional[Exception]:
+        """Insert in one round trip; returns the error, or None on success."""
+        if self.client is None:
+            return RuntimeError("no Supabase client bound")
+        try:
+            self.client.table(table).insert(records).execute()
+            return None
+        except Exception as e:
+            self._count("failures")
+            logger.error(f"❌ Audit bulk insert into {table} failed ({len(records)} rows): {e}")
+            return e
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    # ─────────────────────────────────────────
+    # SPILL / REPLAY
+    # ─────────────────────────────────────────
+    def _spill(self, rows: List):
+        if not self.spill_path:
+            return
+        try:
+            with self._spill_lock, open(self.spill_path, "a", encoding="utf-8") as f:
+                for table, record in rows:
+                    f.write(json.dumps({"table": table, "record": record}, default=str) + "\n")
+            self._count("spilled", len(rows))
+        except Exception as e:
+            logger.error(f"❌ Audit spill failed, {len(rows)} rows lost: {e}")
+
+    def _dead_letter(self, rows: List):
+        """Park rows the database rejected on their own; they are never retried."""
+        logger.error(f"❌ {len(rows)} audit rows rejected, moved to {self.dead_letter_path}")
+        if not self.dead_letter_path:
+            return
+        try:
+            with self._spill_lock, open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for table, record, error in rows:
+                    f.write(json.dumps({"table": table, "record": record, "error": error}, default=str) + "\n")
+            self._count("dead_lettered", len(rows))
+        except Exception as e:
+            logger.error(f"❌ Audit dead-letter write failed, {len(rows)} rows lost: {e}")
+
+    def _replay(self):
+        """Re-insert spilled rows now that Supabase accepts writes again."""
+        replay_path = f"{self.spill_path}.replay.{os.getpid()}"
+        with self._spill_lock:
+            try:
+                os.replace(self.spill_path, replay_path)
+            except FileNotFoundError:
+                return
+
+        pending = []
+        with open(replay_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    pending.append((entry["table"], entry["record"]))
+                except (ValueError, KeyError):
+                    logger.warning("Skipping malformed audit spill line")
+
+        failed, dead = [], []
+        for start in range(0, len(pending), REPLAY_BATCH):
+            by_table = defaultdict(list)
+            for table, record in pending[start:start + REPLAY_BATCH]:
+                by_table[table].append(record)
+            for table, records in by_table.items():
+                if failed:
+                    failed.extend((table, record) for record in records)
+                    continue
+                retry, rejected_rows = self._store(table, records, "replayed")
+                failed.extend((table, record) for record in retry)
+                dead.extend(rejected_rows)
+
+        os.remove(replay_path)
+        if dead:
+            self._dead_letter(dead)
+        if failed:
+            self._spill(failed)
+        else:
+            logger.info(f"✅ Replayed {len(pending) - len(dead)} spilled audit rows")
+
+    # ─────────────────────────────────────────
+    # LIFECYCLE
+    # ─────────────────────────────────────────
+    def flush(self, timeout: float = 10.0):
+        """Flush everything queued so far and stop the flusher thread."""
+        thread = self._thread
+        if not thread or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("⚠️ Audit sink did not drain before timeout")
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = {
+                "enqueued": self.enqueued,
+                "inserted": self.inserted,
+                "batches": self.batches,
+                "spilled": self.spilled,
+                "replayed": self.replayed,
+                "failures": self.failures,
+                "dead_lettered": self.dead_lettered,
+            }
+        stats["queued"] = self._queue.qsize() if self._queue else 0
+        stats["spill_pending"] = os.path.exists(self.spill_path) if self.spill_path else False
+        return stats
+
+
+# Singleton instance for application use
+audit_sink = AuditSink()
+atexit.register(audit_sink.flush)
@@ -0,0 +1,365 @@
+"""
+services/batch_inference.py
+Offline batch inference for bulk chat and diagnosis jobs.
+
+Fleet customers hand over hundreds of symptom reports at once. A batch job
+is a JSONL file with one request per line:
+
+    {"id": "r1", "type": "chat", "message": "AC not cooling", "context": {"brand": "Tata"}}
+    {"id": "r2", "type": "diagnose", "symptoms": "Knocking at idle", "vehicle_context": {}}
+
+BatchRunner executes a job with a bounded worker pool (BATCH_CONCURRENCY
+upstream calls in flight; the per-provider slots in llm_clients still
+apply), runs each distinct request once (identical requests share one
+result), and appends one line per input request to the output JSONL as soon
+as its result is ready. Handlers are plain callables (see server.py
+BATCH_HANDLERS); the chat handler goes through the response cache, so
+answers already known to /api/chat cost nothing.
+
+Progress, throughput and estimated cost are kept in a status document
+(Redis ``batch:job:<id>`` when reachable, and always ``status.json`` in the
+job directory).
+
+Jobs run in a background thread of the API process that accepted them.
+With BATCH_RUNNER=celery they go to workers.tasks.run_batch_job instead;
+only set that when a Celery worker is deployed and mounts the same
+BATCH_DIR as the API (input and results are files there). From a shell:
+    python -m services.batch_inference requests.jsonl -o results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, IO, Iterable, List, Optional, Tuple
+
+from middleware.single_flight import flight_key
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+BATCH_DIR = os.getenv("BATCH_DIR", "/tmp/eka_batch")
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+BATCH_RUNNER = os.getenv("BATCH_RUNNER", "local").lower()  # local (API process) or celery
+STATUS_TTL = 7 * 24 * 3600  # seconds a job status stays in Redis
+PROGRESS_INTERVAL = 2.0  # seconds between status updates while running
+KEY_PREFIX = "batch:job:"
+
+# USD per million tokens (input, output), used for cost estimates
+PRICING_PER_MTOK = {
+    "gemini": (float(os.getenv("GEMINI_PRICE_IN_PER_MTOK", "0.10")),
+               float(os.getenv("GEMINI_PRICE_OUT_PER_MTOK", "0.40"))),
+    "claude": (float(os.getenv("CLAUDE_PRICE_IN_PER_MTOK", "3.00")),
+               float(os.getenv("CLAUDE_PRICE_OUT_PER_MTOK", "15.00"))),
+}
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+class BatchInputError(ValueError):
+    """Raised when a submitted batch cannot be accepted as a whole."""
+
+
+def estimate_cost(provider: Optional[str], tokens_in: int, tokens_out: int) -> float:
+    price_in, price_out = PRICING_PER_MTOK.get(provider, (0.0, 0.0))
+    return (tokens_in * price_in + tokens_out * price_out) / 1_000_000
+
+
+def parse_requests(lines: Iterable[str], kinds: Iterable[str], max_items: int = BATCH_MAX_ITEMS) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Parse JSONL request lines.
+
+    Returns:
+        (items, rejected): items are {"id", "type", "payload"}; rejected are
+        output-ready error records for lines that are not valid requests.
+    Raises:
+        BatchInputError: if the batch is empty or larger than ``max_items``
+    """
+    kinds = set(kinds)
+    items, rejected = [], []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("each line must be a JSON object")
+        except ValueError as e:
+            rejected.append({"id": f"line-{number}", "type": None, "ok": False, "error": f"invalid JSON: {e}"})
+            continue
+        kind = record.pop("type", "chat")
+        request_id = str(record.pop("id", f"line-{number}"))
+        if kind not in kinds:
+            rejected.append({"id": request_id, "type": kind, "ok": False, "error": f"unknown type {kind!r}"})
+            continue
+        items.append({"id": request_id, "type": kind, "payload": record})
+        if len(items) > max_items:
+            raise BatchInputError(f"batch exceeds {max_items} requests")
+    if not items and not rejected:
+        raise BatchInputError("batch is empty")
+    return items, rejected
+
+
+class BatchRunner:
+    """
+    Runs parsed batch items through per-type handlers.
+
+    A handler takes the request payload (and, from run_job, ``owner=`` the
+    submitting workshop) and returns ``(result, meta)``; meta
+    may carry ``provider``, ``cached`` (cache tier or False), ``tokens_in``,
+    ``tokens_out`` and ``cost``. Handler exceptions become error lines.
+
+    Usage:
+        runner = BatchRunner({"chat": batch_chat}, concurrency=8)
+        with open("out.jsonl", "w") as out:
+            summary = runner.run(items, out)
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[Dict], Tuple[Dict, Dict]]],
+                 concurrency: int = BATCH_CONCURRENCY,
+                 on_progress: Optional[Callable[[Dict], None]] = None,
+                 progress_interval: float = PROGRESS_INTERVAL):
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.peak_in_flight = 0
+
+    def run(self, items: List[Dict], out: IO[str], rejected: Iterable[Dict] = ()) -> Dict:
+        """Execute ``items`` and write one JSON line per item (plus ``rejected``) to ``out``."""
+        started = time.monotonic()
+        groups: Dict[str, List[Dict]] = {}
+        for item in items:
+            groups.setdefault(flight_key(f"batch:{item['type']}", item["payload"], None), []).append(item)
+
+        stats = {
+            "total": len(items), "unique": len(groups), "done": 0, "succeeded": 0, "failed": 0,
+            "deduplicated": len(items) - len(groups), "cache_hits": 0, "rejected": 0,
+            "tokens_in": 0, "tokens_out": 0, "cost_usd": 0.0, "by_provider": {},
+        }
+        for record in rejected:
+            self._write(out, record)
+            stats["rejected"] += 1
+        last_report = started
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as pool:
+            futures = {
+                pool.submit(self._execute, group[0]["type"], group[0]["payload"]): group
+                for group in groups.values()
+            }
+            for future in as_completed(futures):
+                group = futures[future]
+                outcome = future.result()
+                for position, item in enumerate(group):
+                    self._write(out, {"id": item["id"], "type": item["type"], **outcome,
+                                      "deduplicated": position > 0})
+                self._account(stats, outcome, len(group))
+
+                now = time.monotonic()
+                if self.on_progress and now - last_report >= self.progress_interval:
+                    last_report = now
+                    self.on_progress(self._summary(stats, started, RUNNING))
+
+        return self._summary(stats, started, COMPLETED)
+
+    def _execute(self, kind: str, payload: Dict) -> Dict:
+        with self._lock:
+            self._in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        started = time.perf_counter()
+        try:
+            result, meta = self.handlers[kind](payload)
+            meta = meta or {}
+            tokens_in, tokens_out = meta.get("tokens_in", 0), meta.get("tokens_out", 0)
+            cost = meta.get("cost")
+            if cost is None:
+                cost = 0.0 if meta.get("cached") else estimate_cost(meta.get("provider"), tokens_in, tokens_out)
+            return {
+                "ok": True,
+                "result": result,
+                "provider": meta.get("provider"),
+                "cached": meta.get("cached") or False,
+                "tokens_in": tokens_in,
+                "tokens_out": tokens_out,
+                "cost_usd": round(cost, 6),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ Batch {kind} request failed: {e}")
+            return {"ok": False, "error": str(e), "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    @staticmethod
+    def _write(out: IO[str], record: Dict):
+        out.write(json.dumps(record, default=str) + "\n")
+        out.flush()
+
+    @staticmethod
+    def _account(stats: Dict, outcome: Dict, copies: int):
+        stats["done"] += copies
+        if not outcome["ok"]:
+            stats["failed"] += copies
+            return
+        stats["succeeded"] += copies
+        if outcome["cached"]:
+            stats["cache_hits"] += copies
+            return
+        stats["tokens_in"] += outcome["tokens_in"]
+        stats["tokens_out"] += outcome["tokens_out"]
+        stats["cost_usd"] += outcome["cost_usd"]
+        provider = outcome["provider"] or "none"
+        stats["by_provider"][provider] = stats["by_provider"].get(provider, 0) + 1
+
+    @staticmethod
+    def _summary(stats: Dict, started: float, state: str) -> Dict:
+        elapsed = time.monotonic() - started
+        rate = stats["done"] / elapsed if elapsed > 0 else 0.0
+        remaining = stats["total"] - stats["done"]
+        return {
+            **stats,
+            "cost_usd": round(stats["cost_usd"], 6),
+            "by_provider": dict(stats["by_provider"]),
+            "state": state,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_per_s": round(rate, 2),
+            "eta_s": round(remaining / rate, 1) if rate and remaining else 0.0,
+        }
+
+
+class BatchJobStore:
+    """Job directories on disk plus status documents mirrored to Redis."""
+
+    def __init__(self, root: str = BATCH_DIR, use_redis: bool = True):
+        self.root = root
+        self.redis = None
+        if use_redis and REDIS_AVAILABLE:
+            try:
+                self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+                self.redis.ping()
+            except Exception as e:
+                logger.warning(f"⚠️ Batch job status kept on disk only: {e}")
+                self.redis = None
+
+    def path(self, job_id: str, name: str) -> str:
+        return os.path.join(self.root, job_id, name)
+
+    def create(self, lines: Iterable[str], owner: Optional[str] = None) -> str:
+        """Store an input JSONL and return the new job id."""
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root, job_id), exist_ok=True)
+        with open(self.path(job_id, "input.jsonl"), "w") as f:
+            for line in lines:
+                line = line.strip()
+                if line:
+                    f.write(line + "\n")
+        self.save(job_id, {"state": QUEUED, "owner": owner, "created_at": datetime.utcnow().isoformat()})
+        return job_id
+
+    def save(self, job_id: str, status: Dict):
+        status = {**(self.load(job_id) or {}), **status, "job_id": job_id}
+        tmp = self.path(job_id, "status.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp, self.path(job_id, "status.json"))
+        if self.redis:
+            try:
+                self.redis.set(f"{KEY_PREFIX}{job_id}", json.dumps(status), ex=STATUS_TTL)
+            except Exception as e:
+                logger.error(f"❌ Batch status publish failed: {e}")
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        if self.redis:
+            try:
+                raw = self.redis.get(f"{KEY_PREFIX}{job_id}")
+                if raw:
+                    return json.loads(raw)
+            except Exception as e:
+                logger.error(f"❌ Batch status read failed: {e}")
+        try:
+            with open(self.path(job_id, "status.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+def run_job(job_id: str, handlers: Dict[str, Callable], store: "BatchJobStore" = None,
+            concurrency: int = BATCH_CONCURRENCY,
+            on_progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Execute a stored job, streaming results to its output.jsonl and updating its status."""
+    store = store or batch_jobs
+
+    def progress(status):
+        store.save(job_id, status)
+        if on_progress:
+            on_progress(status)
+
+    # Handlers scope caches to the workshop that submitted the job
+    owner = (store.load(job_id) or {}).get("owner")
+    handlers = {kind: functools.partial(handler, owner=owner) for kind, handler in handlers.items()}
+
+    output = store.path(job_id, "output.jsonl")
+    store.save(job_id, {"state": RUNNING, "started_at": datetime.utcnow().isoformat(), "output": output})
+    try:
+        with open(store.path(job_id, "input.jsonl")) as f:
+            items, rejected = parse_requests(f, handlers)
+        runner = BatchRunner(handlers, concurrency=concurrency, on_progress=progress)
+        with open(output, "w") as out:
+            summary = runner.run(items, out, rejected)
+    except Exception as e:
+        logger.error(f"❌ Batch job {job_id} failed: {e}")
+        store.save(job_id, {"state": FAILED, "error": str(e), "finished_at": datetime.utcnow().isoformat()})
+        raise
+    summary["finished_at"] = datetime.utcnow().isoformat()
+    store.save(job_id, summary)
+    logger.info(f"✅ Batch job {job_id}: {summary['succeeded']}/{summary['total']} ok, "
+                f"{summary['throughput_per_s']}/s, ${summary['cost_usd']}")
+    return summary
+
+
+# Singleton instance for application use
+batch_jobs = BatchJobStore()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run a batch of chat/diagnose requests locally")
+    parser.add_argument("input", help="JSONL file, one request per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file for results")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+
+    from server import BATCH_HANDLERS
+
+    def report(status):
+        print(f"[{status['state']}] {status['done']}/{status['total']} done, {status['failed']} failed, "
+              f"{status['cache_hits']} cache hits, {status['throughput_per_s']}/s, "
+              f"${status['cost_usd']:.4f}, eta {status['eta_s']}s", file=sys.stderr)
+
+    with open(args.input) as f:
+        items, rejected = parse_requests(f, BATCH_HANDLERS)
+    with open(args.output, "w") as out:
+        summary = BatchRunner(BATCH_HANDLERS, concurrency=args.concurrency, on_progress=report).run(items, out, rejected)
+    report(summary)
+    sys.exit(1 if summary["failed"] or summary["rejected"] else 0)
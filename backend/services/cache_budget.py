@@ -0,0 +1,239 @@
+"""
+services/cache_budget.py
+Size budget and eviction for the chat caches: the semantic cache documents
+(``cache:*``) and the exact-match tier in front of them (``chat:exact:*``).
+
+The cache used to be bounded only by its 24h TTL. Under the production
+``maxmemory-policy allkeys-lru`` an unbounded cache makes Redis evict
+whatever is least recently used, including rate-limiter counters and
+single-flight locks. The budget keeps the cache itself small instead:
+
+- every cached document and exact-tier entry is tracked in the sorted set
+  ``semantic_cache:usage`` (and in ``semantic_cache:usage:ws:<workshop>``
+  for the workshop that wrote it), scored by the eviction policy:
+    lru  score = last access time
+    lfu  score = insert time / LFU_DECAY + hits, so an entry needs one
+         extra hit per LFU_DECAY seconds of age to stay ahead of a newer one
+- after each insert the lowest-scored entries are evicted until the cache
+  is back under SEMANTIC_CACHE_MAX_ENTRIES and the writing workshop is
+  back under SEMANTIC_CACHE_WORKSHOP_QUOTA
+- sweep() reconciles the bookkeeping incrementally (ZSCAN / SCAN in small
+  batches): expired documents are forgotten, untracked documents are
+  adopted with the lowest score, and both limits are enforced
+
+A chat answer is stored in both tiers, so it counts twice against
+SEMANTIC_CACHE_MAX_ENTRIES and the workshop quota. Only keys that carry
+one of the two prefixes and appear in the usage set are ever deleted.
+"""
+import os
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+WORKSHOP_QUOTA = int(os.getenv("SEMANTIC_CACHE_WORKSHOP_QUOTA", "2000"))
+EVICTION_POLICY = os.getenv("SEMANTIC_CACHE_EVICTION", "lfu").lower()  # lfu or lru
+LFU_DECAY = float(os.getenv("SEMANTIC_CACHE_LFU_DECAY", "3600"))  # seconds of age worth one hit
+SWEEP_BATCH = 500
+
+USAGE_KEY = "semantic_cache:usage"
+OWNERS_KEY = "semantic_cache:owners"
+WORKSHOP_PREFIX = "semantic_cache:usage:ws:"
+SHARED_OWNER = "shared"
+EXACT_PREFIX = "chat:exact:"  # services.response_cache tier 1
+
+
+class CacheBudget:
+    """
+    Tracks cache documents and evicts the coldest ones past the budget.
+
+    ``redis_client`` is a callable returning the current client, or None
+    while Redis is down (every method is then a no-op).
+    """
+
+    def __init__(self, redis_client: Callable[[], Optional[object]], prefix: str = "cache:",
+                 exact_prefix: Optional[str] = EXACT_PREFIX, max_entries: int = MAX_ENTRIES,
+                 workshop_quota: int = WORKSHOP_QUOTA, policy: str = EVICTION_POLICY,
+                 on_evict: Callable[[int], None] = None, clock: Callable[[], float] = time.time):
+        if policy not in ("lfu", "lru"):
+            raise ValueError(f"Unsupported eviction policy: {policy}")
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.exact_prefix = exact_prefix
+        self.max_entries = max_entries
+        self.workshop_quota = workshop_quota
+        self.policy = policy
+        self.on_evict = on_evict or (lambda count: None)
+        self.clock = clock
+
+    def _score(self) -> float:
+        now = self.clock()
+        return now / LFU_DECAY if self.policy == "lfu" else now
+
+    @staticmethod
+    def _owner_set(owner: str) -> str:
+        return f"{WORKSHOP_PREFIX}{owner}"
+
+    # ─────────────────────────────────────────
+    # HOT PATH
+    # ─────────────────────────────────────────
+    def admit(self, key: str, owner: Optional[str] = None) -> int:
+        """Track a freshly written document and evict down to the budget. Returns evictions."""
+        client = self.redis_client()
+        if not client:
+            return 0
+        owner = str(owner) if owner else SHARED_OWNER
+        try:
+            previous = client.hget(OWNERS_KEY, key)
+            score = self._score()
+            pipe = client.pipeline(transaction=False)
+            if previous and previous != owner:
+                pipe.zrem(self._owner_set(previous), key)
+            # LFU keeps the hit count of a document that is simply rewritten
+            pipe.zadd(USAGE_KEY, {key: score}, nx=self.policy == "lfu")
+            pipe.zadd(self._owner_set(owner), {key: score}, nx=self.policy == "lfu")
+            pipe.hset(OWNERS_KEY, key, owner)
+            pipe.zcard(USAGE_KEY)
+            pipe.zcard(self._owner_set(owner))
+            *_, total, owned = pipe.execute()
+
+            evicted = 0
+            if owner != SHARED_OWNER and owned > self.workshop_quota:
+                evicted += self._evict_from(client, self._owner_set(owner), owned - self.workshop_quota)
+            if total - evicted > self.max_entries:
+                evicted += self._evict_from(client, USAGE_KEY, total - evicted - self.max_entries)
+            return evicted
+        except Exception as e:
+            logger.error(f"❌ Cache budget update failed: {e}")
+            return 0
+
+    def touch(self, key: str):
+        """Record a cache hit on ``key``."""
+        client = self.redis_client()
+        if not client:
+            return
+        try:
+            owner = client.hget(OWNERS_KEY, key)
+            pipe = client.pipeline(transaction=False)
+            for zset in filter(None, (USAGE_KEY, owner and self._owner_set(owner))):
+                if self.policy == "lfu":
+                    pipe.zadd(zset, {key: 1}, xx=True, incr=True)
+                else:
+                    pipe.zadd(zset, {key: self._score()}, xx=True)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Cache hit not recorded for eviction: {e}")
+
+    # ─────────────────────────────────────────
+    # EVICTION
+    # ─────────────────────────────────────────
+    def _evict_from(self, client, zset: str, count: int) -> int:
+        """Pop the ``count`` coldest members of ``zset`` and delete their documents."""
+        popped = [member for member, _ in client.zpopmin(zset, count)]
+        evicted = self._forget(client, popped, delete=True)
+        if evicted:
+            self.on_evict(evicted)
+            logger.info(f"🧹 Evicted {evicted} chat cache entries ({self.policy}, {zset})")
+        return evicted
+
+    def _prefixes(self) -> tuple:
+        return tuple(p for p in (self.prefix, self.exact_prefix) if p)
+
+    def _forget(self, client, keys: List[str], delete: bool) -> int:
+        """Drop ``keys`` from all bookkeeping; with ``delete`` also unlink the documents."""
+        keys = [k for k in keys if k.startswith(self._prefixes())]
+        if not keys:
+            return 0
+        owners = client.hmget(OWNERS_KEY, keys)
+        pipe = client.pipeline(transaction=False)
+        pipe.zrem(USAGE_KEY, *keys)
+        for key, owner in zip(keys, owners):
+            if owner:
+                pipe.zrem(self._owner_set(owner), key)
+        pipe.hdel(OWNERS_KEY, *keys)
+        if delete:
+            pipe.unlink(*keys)
+        pipe.execute()
+        return len(keys)
+
+    # ─────────────────────────────────────────
+    # SWEEPER
+    # ─────────────────────────────────────────
+    def sweep(self, batch: int = SWEEP_BATCH) -> Dict:
+        """
+        Incremental reconciliation, safe to run while serving traffic.
+
+        Returns:
+            {"stale": forgotten members whose document expired,
+             "adopted": untracked documents now tracked,
+             "evicted": documents deleted to meet the limits,
+             "entries": tracked documents afterwards}
+        """
+        client = self.redis_client()
+        if not client:
+            return {"status": "disabled"}
+        report = {"stale": 0, "adopted": 0, "evicted": 0}
+
+        # 1. Members whose document expired (TTL) or was deleted elsewhere
+        for chunk in _chunks((member for member, _ in client.zscan_iter(USAGE_KEY, count=batch)), batch):
+            pipe = client.pipeline(transaction=False)
+            for key in chunk:
+                pipe.exists(key)
+            gone = [key for key, exists in zip(chunk, pipe.execute()) if not exists]
+            report["stale"] += self._forget(client, gone, delete=False)
+
+        # 2. Entries written before tracking existed: adopt them as the coldest entries
+        for prefix, key_type in ((self.prefix, "ReJSON-RL"), (self.exact_prefix, "string")):
+            if prefix:
+                report["adopted"] += self._adopt(client, prefix, key_type, batch)
+
+        # 3. Limits
+        for zset in client.scan_iter(match=f"{WORKSHOP_PREFIX}*", count=batch):
+            if zset == self._owner_set(SHARED_OWNER):
+                continue
+            over = client.zcard(zset) - self.workshop_quota
+            if over > 0:
+                report["evicted"] += self._evict_from(client, zset, over)
+        over = client.zcard(USAGE_KEY) - self.max_entries
+        if over > 0:
+            report["evicted"] += self._evict_from(client, USAGE_KEY, over)
+
+        report["entries"] = client.zcard(USAGE_KEY)
+        logger.info(f"✅ Semantic cache sweep: {report}")
+        return report
+
+    def _adopt(self, client, prefix: str, key_type: str, batch: int) -> int:
+        """Track untracked ``prefix`` keys of ``key_type`` as shared, coldest entries."""
+        adopted = 0
+        for chunk in _chunks(client.scan_iter(match=f"{prefix}*", count=batch, _type=key_type), batch):
+            pipe = client.pipeline(transaction=False)
+            for key in chunk:
+                pipe.zscore(USAGE_KEY, key)
+            untracked = [key for key, score in zip(chunk, pipe.execute()) if score is None]
+            if untracked:
+                client.zadd(USAGE_KEY, {key: 0 for key in untracked}, nx=True)
+                client.zadd(self._owner_set(SHARED_OWNER), {key: 0 for key in untracked}, nx=True)
+                client.hset(OWNERS_KEY, mapping={key: SHARED_OWNER for key in untracked})
+                adopted += len(untracked)
+        return adopted
+
+    def reset(self):
+        """Drop all bookkeeping (after the cache documents were cleared)."""
+        client = self.redis_client()
+        if not client:
+            return
+        client.unlink(USAGE_KEY, OWNERS_KEY, *client.scan_iter(match=f"{WORKSHOP_PREFIX}*", count=SWEEP_BATCH))
+
+
+def _chunks(items: Iterable[str], size: int) -> Iterable[List[str]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
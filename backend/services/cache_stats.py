@@ -0,0 +1,159 @@
+"""
+services/cache_stats.py
+Hit/miss telemetry for the semantic cache, cheap to update and to scrape.
+
+Counters are accumulated in-process and flushed to one Redis hash
+(``semantic_cache:stats``) with HINCRBY / HINCRBYFLOAT at most every
+STATS_FLUSH_INTERVAL seconds, so every worker adds to the same totals
+without a Redis round trip per lookup and without read-modify-write races.
+Reading the stats is a single HGETALL; nothing here ever scans keys.
+
+Tracked: hits, misses, stores, evictions, total latency saved on hits,
+and a histogram of the nearest-neighbour similarity seen by lookups
+(which shows how close misses come to SIMILARITY_THRESHOLD).
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STATS_KEY = "semantic_cache:stats"  # deliberately outside the indexed cache: prefix
+FLUSH_INTERVAL = float(os.getenv("CACHE_STATS_FLUSH_INTERVAL", "1.0"))  # seconds
+SIMILARITY_BUCKETS = [0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0]
+FLOAT_FIELDS = {"latency_saved_ms"}
+
+
+def similarity_field(similarity: float) -> str:
+    index = bisect_left(SIMILARITY_BUCKETS, similarity)
+    return f"sim_le_{SIMILARITY_BUCKETS[index]:g}" if index < len(SIMILARITY_BUCKETS) else "sim_le_+Inf"
+
+
+class CacheStats:
+    """
+    Incrementally maintained counters shared by all workers through Redis.
+
+    ``redis_client`` is a callable returning the current client (or None
+    while Redis is down; counts then stay local until it returns).
+    """
+
+    def __init__(self, redis_client: Callable[[], Optional[object]], key: str = STATS_KEY,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.redis_client = redis_client
+        self.key = key
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = {}
+        self._flushed: Dict[str, float] = {}  # what this worker already pushed (for the local view)
+        self._last_flush = time.monotonic()
+
+    # ─────────────────────────────────────────
+    # RECORDING
+    # ─────────────────────────────────────────
+    def record_hit(self, latency_saved_ms: Optional[float] = None):
+        increments = {"hits": 1}
+        if latency_saved_ms is not None:
+            increments["hits_with_latency"] = 1
+            increments["latency_saved_ms"] = max(latency_saved_ms, 0.0)
+        self._add(increments)
+
+    def record_miss(self):
+        self._add({"misses": 1})
+
+    def record_similarity(self, similarity: float):
+        self._add({similarity_field(similarity): 1})
+
+    def record_store(self):
+        self._add({"stores": 1})
+
+    def record_evictions(self, count: int):
+        if count:
+            self._add({"evictions": count})
+
+    def _add(self, increments: Dict[str, float]):
+        with self._lock:
+            for field, amount in increments.items():
+                self._pending[field] = self._pending.get(field, 0) + amount
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Push pending increments to Redis atomically per field."""
+        client = self.redis_client()
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not client or not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+        try:
+            pipe = client.pipeline(transaction=False)
+            for field, amount in pending.items():
+                if field in FLOAT_FIELDS:
+                    pipe.hincrbyfloat(self.key, field, amount)
+                else:
+                    pipe.hincrby(self.key, field, int(amount))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Cache stats flush failed, keeping counts locally: {e}")
+            with self._lock:
+                for field, amount in pending.items():
+                    self._pending[field] = self._pending.get(field, 0) + amount
+            return
+        with self._lock:
+            for field, amount in pending.items():
+                self._flushed[field] = self._flushed.get(field, 0) + amount
+
+    # ─────────────────────────────────────────
+    # READING
+    # ─────────────────────────────────────────
+    def snapshot(self) -> Dict:
+        """Cluster-wide totals (one HGETALL), or this worker's counts while Redis is down."""
+        self.flush()
+        totals: Dict[str, float] = {}
+        client = self.redis_client()
+        source = "redis"
+        if client:
+            try:
+                totals = {k: float(v) for k, v in client.hgetall(self.key).items()}
+            except Exception as e:
+                logger.warning(f"⚠️ Cache stats read failed: {e}")
+                client = None
+        if not client:
+            source = "local"
+            with self._lock:
+                for counts in (self._flushed, self._pending):
+                    for field, amount in counts.items():
+                        totals[field] = totals.get(field, 0) + amount
+
+        hits, misses = int(totals.get("hits", 0)), int(totals.get("misses", 0))
+        with_latency = int(totals.get("hits_with_latency", 0))
+        saved = totals.get("latency_saved_ms", 0.0)
+        histogram = {similarity_field(b): 0 for b in SIMILARITY_BUCKETS}
+        histogram["sim_le_+Inf"] = 0
+        for field, amount in totals.items():
+            if field.startswith("sim_le_"):
+                histogram[field] = int(amount)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "stores": int(totals.get("stores", 0)),
+            "evictions": int(totals.get("evictions", 0)),
+            "latency_saved_ms": round(saved, 1),
+            "avg_latency_saved_ms": round(saved / with_latency, 1) if with_latency else 0.0,
+            "similarity_histogram": histogram,
+            "counters": source,
+        }
+
+    def reset(self):
+        client = self.redis_client()
+        with self._lock:
+            self._pending.clear()
+            self._flushed.clear()
+        if client:
+            client.delete(self.key)
@@ -0,0 +1,226 @@
+"""
+services/embedding_batcher.py
+Micro-batching of embedding calls across concurrent requests.
+
+Each request embeds its own query, so under load the provider sees dozens
+of single-text HTTP calls per second. Callers here submit one text and get
+a Future; a background loop collects submissions for up to
+EMBED_BATCH_WAIT_MS (or until EMBED_BATCH_SIZE texts are waiting), sends
+one batched embed call and resolves every future from it. Identical texts
+in the same batch are embedded once.
+
+Batch sizes, provider latency per batch and queue wait are kept as
+fixed-bucket histograms (get_stats). FakeEmbedder is a deterministic
+local embedder for tests and benchmarks.
+"""
+import os
+import time
+import queue
+import asyncio
+import hashlib
+import logging
+import threading
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))  # texts per provider call
+BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))  # how long the first text waits for company
+BATCH_CONCURRENCY = int(os.getenv("EMBED_BATCH_CONCURRENCY", "4"))  # provider calls in flight
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "30"))  # seconds a caller waits for its vector
+
+SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+class Histogram:
+    """Counts per upper bound; values above the last bound go to "+Inf"."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self) -> Dict:
+        labels = [f"le_{b:g}" for b in self.bounds] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else 0.0,
+        }
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces single-text embed requests into batched provider calls.
+
+    ``embed_many(texts)`` must return one vector per text, in order.
+
+    Usage:
+        vector = batcher.embed(text)
+        future = batcher.submit(text)
+        vector = await batcher.aembed(text)
+    """
+
+    def __init__(self, embed_many: Callable[[List[str]], List[Sequence[float]]], name: str = "embeddings",
+                 max_batch: int = BATCH_SIZE, max_wait_ms: float = BATCH_WAIT_MS,
+                 concurrency: int = BATCH_CONCURRENCY):
+        self.embed_many = embed_many
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.concurrency = concurrency
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None  # worker that owns the loop thread; re-created after fork
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[threading.Semaphore] = None
+        self.batches = 0
+        self.texts = 0
+        self.deduplicated = 0
+        self.failures = 0
+        self.sizes = Histogram(SIZE_BUCKETS)
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.wait_ms = Histogram(LATENCY_BUCKETS_MS)
+
+    # ─────────────────────────────────────────
+    # CALLER SIDE
+    # ─────────────────────────────────────────
+    def submit(self, text: str) -> Future:
+        self._ensure_loop()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str, timeout: float = EMBED_TIMEOUT) -> List[float]:
+        return self.submit(text).result(timeout)
+
+    async def aembed(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    # LangChain-style aliases so the batcher can sit under CachedEmbeddings
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = [self.submit(text) for text in texts]
+        return [f.result(EMBED_TIMEOUT) for f in futures]
+
+    # ─────────────────────────────────────────
+    # BATCH LOOP
+    # ─────────────────────────────────────────
+    def _ensure_loop(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                thread_name_prefix=f"embed-{self.name}")
+            self._slots = threading.Semaphore(self.concurrency)
+            threading.Thread(target=self._loop, name=f"embed-batcher-{self.name}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _loop(self):
+        q = self._queue
+        while True:
+            first = q.get()
+            # While every provider slot is busy the backlog keeps growing,
+            # so the next batch leaves full instead of one text at a time
+            self._slots.acquire()
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch: List):
+        try:
+            started = time.perf_counter()
+            live = [(text, future, queued) for text, future, queued in batch if future.set_running_or_notify_cancel()]
+            if not live:
+                return
+            texts = list(dict.fromkeys(text for text, _, _ in live))
+            try:
+                vectors = self.embed_many(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"embedder returned {len(vectors)} vectors for {len(texts)} texts")
+            except Exception as e:
+                logger.error(f"❌ Embedding batch of {len(texts)} failed ({self.name}): {e}")
+                with self._lock:
+                    self.failures += 1
+                for _, future, _ in live:
+                    future.set_exception(e)
+                return
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            by_text = dict(zip(texts, vectors))
+            for text, future, _ in live:
+                future.set_result(list(by_text[text]))
+            with self._lock:
+                self.batches += 1
+                self.texts += len(live)
+                self.deduplicated += len(live) - len(texts)
+                self.sizes.observe(len(texts))
+                self.latency_ms.observe(elapsed_ms)
+                for _, _, queued in live:
+                    self.wait_ms.observe((started - queued) * 1000)
+        finally:
+            self._slots.release()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "texts": self.texts,
+                "deduplicated": self.deduplicated,
+                "failures": self.failures,
+                "queued": self._queue.qsize(),
+                "batch_size": self.sizes.snapshot(),
+                "batch_latency_ms": self.latency_ms.snapshot(),
+                "queue_wait_ms": self.wait_ms.snapshot(),
+            }
+
+
+class FakeEmbedder:
+    """
+    Deterministic local embedder: each text maps to a fixed unit vector
+    seeded from its SHA-256, so the same text always embeds identically.
+    Records every call; ``latency`` simulates a provider round trip.
+    """
+
+    def __init__(self, dim: int = 768, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls.append(list(texts))
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.vector(text) for text in texts]
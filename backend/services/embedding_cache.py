@@ -0,0 +1,242 @@
+"""
+services/embedding_cache.py
+Shared memoization of embedding vectors.
+
+The same text is embedded several times per request: the semantic cache
+embeds the query in search_cache and again in cache_response on a miss,
+and the RAG service and knowledge base embed the same questions and chunks
+once more. Every one of those is a paid provider round trip.
+
+Vectors are cached under (model, task_type, sha256(text)):
+
+- an in-process LRU (EMBEDDING_CACHE_SIZE entries) per worker
+- optionally Redis ``emb:<model>:<task_type>:<hash>`` holding the vector
+  packed as little-endian float32 bytes, shared by all workers
+
+Both tiers store the same float32 bytes, so a vector reads back
+identically whichever tier served it. Provider failures are never cached.
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))  # in-process entries per worker
+CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 86400)))  # seconds in Redis
+REDIS_TIER = os.getenv("EMBEDDING_CACHE_REDIS", "true").lower() == "true"
+KEY_PREFIX = "emb:"
+QUERY_TASK = "retrieval_query"
+DOCUMENT_TASK = "retrieval_document"
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def pack(vector) -> bytes:
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def unpack(blob: bytes) -> List[float]:
+    return np.frombuffer(blob, dtype="<f4").tolist()
+
+
+def embedding_key(model: str, task_type: str, text: str) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}{model}:{task_type}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of embedding vectors.
+
+    Usage:
+        vector = embedding_cache.get_or_embed(model, "retrieval_query", text, embed_fn)
+        vectors = embedding_cache.get_or_embed_many(model, "retrieval_document", texts, embed_many)
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, use_redis: bool = REDIS_TIER,
+                 ttl: int = CACHE_TTL, redis_client=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis = redis_client
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "redis_hits": 0, "misses": 0, "embedded": 0, "redis_errors": 0}
+
+        if self.redis is None and use_redis and REDIS_AVAILABLE:
+            try:
+                self.redis = redis.from_url(REDIS_URL)  # raw bytes, not decoded
+                self.redis.ping()
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding cache is per-worker only: {e}")
+                self.redis = None
+
+    # ─────────────────────────────────────────
+    # LOOKUP
+    # ─────────────────────────────────────────
+    def get(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        return self._get_many(model, task_type, [text])[0]
+
+    def put(self, model: str, task_type: str, text: str, vector: Sequence[float]):
+        self._put_many(model, task_type, [text], [vector])
+
+    def get_or_embed(self, model: str, task_type: str, text: str,
+                     embed: Callable[[str], Optional[Sequence[float]]]) -> Optional[List[float]]:
+        """Cached vector for ``text``, calling ``embed(text)`` only on a miss."""
+        cached = self.get(model, task_type, text)
+        if cached is not None:
+            return cached
+        vector = embed(text)
+        if not vector:
+            return None
+        self.put(model, task_type, text, vector)
+        return unpack(pack(vector))
+
+    def get_or_embed_many(self, model: str, task_type: str, texts: List[str],
+                          embed_many: Callable[[List[str]], List[Sequence[float]]]) -> List[List[float]]:
+        """
+        Vectors for ``texts`` in order. Misses are embedded with one
+        ``embed_many`` call, each distinct text once.
+        """
+        vectors, missing = self.lookup_many(model, task_type, texts)
+        if missing:
+            self.fill(model, task_type, texts, vectors, missing, embed_many(missing))
+        return vectors
+
+    def lookup_many(self, model: str, task_type: str, texts: List[str]):
+        """(vectors with None for misses, distinct missing texts in order)"""
+        vectors = self._get_many(model, task_type, texts)
+        return vectors, list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+
+    def fill(self, model: str, task_type: str, texts: List[str], vectors: List, missing: List[str],
+             embedded: List[Sequence[float]]):
+        """Store freshly embedded ``missing`` texts and fill their slots in ``vectors``."""
+        self._put_many(model, task_type, missing, embedded)
+        fresh = {text: unpack(pack(vector)) for text, vector in zip(missing, embedded)}
+        for i, text in enumerate(texts):
+            if vectors[i] is None:
+                vectors[i] = fresh[text]
+
+    # ─────────────────────────────────────────
+    # TIERS
+    # ─────────────────────────────────────────
+    def _get_many(self, model: str, task_type: str, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [embedding_key(model, task_type, text) for text in texts]
+        blobs: List[Optional[bytes]] = []
+        with self._lock:
+            for key in keys:
+                blob = self._entries.get(key)
+                if blob is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                blobs.append(blob)
+
+        remote = [i for i, blob in enumerate(blobs) if blob is None]
+        if remote and self.redis is not None:
+            try:
+                found = self.redis.mget([keys[i] for i in remote])
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding cache read failed: {e}")
+                self._count("redis_errors")
+                found = [None] * len(remote)
+            for i, blob in zip(remote, found):
+                if blob:
+                    blobs[i] = blob
+                    self._remember(keys[i], blob)
+                    self._count("redis_hits")
+
+        self._count("misses", sum(1 for blob in blobs if blob is None))
+        return [unpack(blob) if blob is not None else None for blob in blobs]
+
+    def _put_many(self, model: str, task_type: str, texts: List[str], vectors: List[Sequence[float]]):
+        items = {embedding_key(model, task_type, t): pack(v) for t, v in zip(texts, vectors) if v is not None}
+        self._count("embedded", len(items))
+        for key, blob in items.items():
+            self._remember(key, blob)
+        if items and self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, blob in items.items():
+                    pipe.set(key, blob, ex=self.ttl)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding cache write failed: {e}")
+                self._count("redis_errors")
+
+    def _remember(self, key: str, blob: bytes):
+        with self._lock:
+            self._entries[key] = blob
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, name: str, n: int = 1):
+        if n:
+            with self._lock:
+                self._stats[name] += n
+
+    def clear(self):
+        """Drop the in-process tier (Redis entries expire on their own)."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        stats["redis"] = self.redis is not None
+        return stats
+
+
+class CachedEmbeddings:
+    """
+    LangChain-style embeddings object (embed_query / embed_documents and
+    their async variants) that goes through the shared cache before
+    calling the wrapped provider client.
+    """
+
+    def __init__(self, base, model: str, cache: Optional[EmbeddingCache] = None,
+                 query_task: str = QUERY_TASK, document_task: str = DOCUMENT_TASK):
+        self.base = base
+        self.model = model
+        self.cache = cache or embedding_cache
+        self.query_task = query_task
+        self.document_task = document_task
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.get_or_embed(self.model, self.query_task, text, self.base.embed_query)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.cache.get_or_embed_many(self.model, self.document_task, texts, self.base.embed_documents)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        cached = self.cache.get(self.model, self.query_task, text)
+        if cached is not None:
+            return cached
+        vector = await self.base.aembed_query(text)
+        self.cache.put(self.model, self.query_task, text, vector)
+        return unpack(pack(vector))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self.cache.lookup_many(self.model, self.document_task, texts)
+        if missing:
+            embedded = await self.base.aembed_documents(missing)
+            self.cache.fill(self.model, self.document_task, texts, vectors, missing, embedded)
+        return vectors
+
+
+# Singleton instance for application use
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,284 @@
+"""
+services/history_manager.py
+Token-budgeted chat history compaction with rolling conversation summaries.
+
+The frontend resends the whole conversation on every turn. Before a turn is
+sent to a model, the history is fitted to a token budget:
+
+- the last N messages are always kept verbatim;
+- older messages are replaced by a rolling summary cached per conversation id,
+  when one exists that covers exactly those messages;
+- anything still over budget is dropped oldest-first.
+
+Summaries are produced out-of-band on a small background pool and stored in
+Redis (or in-process when Redis is down); the request path never waits on
+them. A turn that arrives before its summary is ready simply gets the
+trimmed window.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.prompt_cache import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))  # messages kept verbatim
+SUMMARY_TTL = int(os.getenv("HISTORY_SUMMARY_TTL", "86400"))  # seconds
+SUMMARY_MIN_NEW = 2  # uncovered messages before a summary is refreshed
+SUMMARY_WORKERS = 2
+LOCAL_SUMMARY_SIZE = 1000
+KEY_PREFIX = "chat:summary:"
+SUMMARY_LABEL = "[EARLIER_CONVERSATION_SUMMARY]"
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def message_text(message: Dict) -> str:
+    """Text of a Gemini-format message ({"role", "parts": [{"text"}]})."""
+    return "".join(part.get("text", "") for part in message.get("parts", []) if isinstance(part, dict))
+
+
+def message_tokens(message: Dict) -> int:
+    return estimate_tokens(message_text(message)) + 4  # role/framing overhead
+
+
+def prefix_hash(messages: List[Dict]) -> str:
+    """Fingerprint of the messages a summary covers."""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.get('role')}\x1f{message_text(message)}\x1e".encode())
+    return digest.hexdigest()[:24]
+
+
+def conversation_id(history: List[Dict], explicit: Optional[str] = None, scope: str = "") -> str:
+    """Client-supplied id, else one derived from the conversation's first message."""
+    if explicit:
+        return str(explicit)[:128]
+    first = message_text(history[0]) if history else ""
+    return hashlib.sha256(f"{scope}\x1f{first}".encode()).hexdigest()[:24]
+
+
+class HistoryManager:
+    """
+    Fits chat histories to a token budget.
+
+    Args:
+        summarizer: callable(previous_summary, messages) -> summary text; runs off
+            the request path
+        token_budget: max estimated tokens of history sent to a model
+        keep_turns: trailing messages that are never summarized or dropped
+    """
+
+    def __init__(self, summarizer: Optional[Callable[[str, List[Dict]], str]] = None,
+                 token_budget: int = HISTORY_TOKEN_BUDGET, keep_turns: int = HISTORY_KEEP_TURNS,
+                 use_redis: bool = True):
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.redis = None
+        self._local = OrderedDict()  # conversation id -> (expires_at, entry)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, object] = {}  # conversation id -> Future
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+        self.compactions = 0
+        self.summary_hits = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.summaries_built = 0
+        self.summary_failures = 0
+
+        if use_redis and REDIS_AVAILABLE:
+            try:
+                self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+                self.redis.ping()
+            except Exception as e:
+                logger.warning(f"⚠️ History summaries kept in-process only: {e}")
+                self.redis = None
+
+    # ─────────────────────────────────────────
+    # COMPACTION (request path)
+    # ─────────────────────────────────────────
+    def compact(self, conv_id: str, history: List[Dict]) -> List[Dict]:
+        """
+        Return ``history`` fitted to the token budget. Never blocks on a model call;
+        schedules a summary refresh when older messages are being cut.
+        """
+        if not history:
+            return history
+        total = sum(message_tokens(m) for m in history)
+        if total <= self.token_budget:
+            return history
+
+        split = self._split_index(history)
+        older, recent = history[:split], history[split:]
+
+        head: List[Dict] = []
+        rest = older
+        entry = self._get_summary(conv_id)
+        if entry and 0 < entry["covered"] <= len(older) \
+                and entry["hash"] == prefix_hash(older[:entry["covered"]]):
+            rest = older[entry["covered"]:]
+            head = [{"role": "user", "parts": [{"text": f"{SUMMARY_LABEL}: {entry['summary']}"}]}]
+            with self._lock:
+                self.summary_hits += 1
+
+        covered = entry["covered"] if head else 0
+        if len(older) - covered >= SUMMARY_MIN_NEW:
+            self._schedule(conv_id, older, entry if head else None)
+
+        # Drop oldest uncovered messages until the window fits
+        budget = self.token_budget - sum(message_tokens(m) for m in head + recent)
+        kept = []
+        for message in reversed(rest):
+            cost = message_tokens(message)
+            if cost > budget:
+                break
+            kept.append(message)
+            budget -= cost
+        kept.reverse()
+        while kept and kept[0].get("role") != "user":
+            kept.pop(0)
+
+        compacted = self._join(head, kept + recent)
+        with self._lock:
+            self.compactions += 1
+            self.tokens_in += total
+            self.tokens_out += sum(message_tokens(m) for m in compacted)
+        return compacted
+
+    def _split_index(self, history: List[Dict]) -> int:
+        """Start of the verbatim tail, moved back so the tail opens with a user turn."""
+        split = max(len(history) - self.keep_turns, 0)
+        while split > 0 and history[split].get("role") != "user":
+            split -= 1
+        return split
+
+    @staticmethod
+    def _join(head: List[Dict], messages: List[Dict]) -> List[Dict]:
+        """Fold the summary into the first user message so roles keep alternating."""
+        if not head:
+            return messages
+        if messages and messages[0].get("role") == "user":
+            first = {
+                "role": "user",
+                "parts": [{"text": f"{message_text(head[0])}\n\n{message_text(messages[0])}"}],
+            }
+            return [first] + messages[1:]
+        return head + messages
+
+    # ─────────────────────────────────────────
+    # SUMMARIES (background)
+    # ─────────────────────────────────────────
+    def _pool(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS,
+                                                        thread_name_prefix="history-summary")
+                    self._pending = {}
+                    self._pid = pid
+        return self._executor
+
+    def _schedule(self, conv_id: str, older: List[Dict], entry: Optional[Dict]):
+        if self.summarizer is None:
+            return
+        pool = self._pool()
+        with self._lock:
+            if conv_id in self._pending:
+                return
+            self._pending[conv_id] = pool.submit(self._summarize, conv_id, list(older), entry)
+
+    def _summarize(self, conv_id: str, older: List[Dict], entry: Optional[Dict]):
+        try:
+            previous = entry["summary"] if entry else ""
+            new_messages = older[entry["covered"]:] if entry else older
+            summary = (self.summarizer(previous, new_messages) or "").strip()
+            if summary:
+                self._set_summary(conv_id, {
+                    "covered": len(older),
+                    "hash": prefix_hash(older),
+                    "summary": summary,
+                    "updated_at": time.time(),
+                })
+                with self._lock:
+                    self.summaries_built += 1
+        except Exception as e:
+            with self._lock:
+                self.summary_failures += 1
+            logger.error(f"❌ History summary failed for {conv_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(conv_id, None)
+
+    def wait_idle(self, timeout: float = 10.0):
+        """Block until scheduled summaries finish (tests and shutdown)."""
+        with self._lock:
+            futures = list(self._pending.values())
+        if futures:
+            wait(futures, timeout=timeout)
+
+    # ─────────────────────────────────────────
+    # STORAGE
+    # ─────────────────────────────────────────
+    def _get_summary(self, conv_id: str) -> Optional[Dict]:
+        if self.redis:
+            try:
+                raw = self.redis.get(f"{KEY_PREFIX}{conv_id}")
+                return json.loads(raw) if raw else None
+            except Exception as e:
+                logger.error(f"❌ History summary read failed: {e}")
+                return None
+        with self._lock:
+            item = self._local.get(conv_id)
+            if not item:
+                return None
+            expires_at, entry = item
+            if expires_at < time.time():
+                del self._local[conv_id]
+                return None
+            self._local.move_to_end(conv_id)
+            return entry
+
+    def _set_summary(self, conv_id: str, entry: Dict):
+        if self.redis:
+            try:
+                self.redis.set(f"{KEY_PREFIX}{conv_id}", json.dumps(entry), ex=SUMMARY_TTL)
+            except Exception as e:
+                logger.error(f"❌ History summary write failed: {e}")
+            return
+        with self._lock:
+            self._local[conv_id] = (time.time() + SUMMARY_TTL, entry)
+            self._local.move_to_end(conv_id)
+            while len(self._local) > LOCAL_SUMMARY_SIZE:
+                self._local.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "keep_turns": self.keep_turns,
+                "compactions": self.compactions,
+                "summary_hits": self.summary_hits,
+                "summaries_built": self.summaries_built,
+                "summary_failures": self.summary_failures,
+                "summaries_pending": len(self._pending),
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "shared": self.redis is not None,
+            }
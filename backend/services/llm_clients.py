@@ -0,0 +1,317 @@
+"""
+services/llm_clients.py
+Process-wide pool of warm LLM provider clients.
+
+Each Gunicorn worker owns one Gemini and one Anthropic client backed by
+keep-alive HTTP connection pools, so chat turns reuse established TLS
+connections instead of paying a handshake and client setup every call.
+Clients are (re)created lazily after fork and can be warmed at boot.
+
+Async (asyncio) variants of both clients back the ASGI serving mode; they
+get their own, much larger, concurrency limits because an awaited call does
+not pin a worker thread.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+GEMINI_MODEL = "gemini-2.0-flash"
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))  # seconds
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))  # seconds
+SLOT_TIMEOUT = float(os.getenv("LLM_SLOT_TIMEOUT", "30"))  # seconds to wait for a free slot
+PROVIDER_CONCURRENCY = {
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+    "claude": int(os.getenv("CLAUDE_MAX_CONCURRENCY", "4")),
+}
+ASYNC_PROVIDER_CONCURRENCY = {
+    "gemini": int(os.getenv("GEMINI_ASYNC_MAX_CONCURRENCY", "256")),
+    "claude": int(os.getenv("CLAUDE_ASYNC_MAX_CONCURRENCY", "128")),
+}
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+    logger.warning("httpx not available. LLM clients will use SDK default transports.")
+
+
+class ProviderBusyError(RuntimeError):
+    """Raised when no concurrency slot frees up for a provider in time."""
+
+
+class ModelClientPool:
+    """
+    Lazily-built, fork-aware registry of provider clients.
+
+    Clients are keyed to the PID that created them; the first access in a
+    freshly forked worker discards inherited clients (their sockets belong
+    to the parent) and builds new ones.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._clients: Dict[str, object] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._created_at: Dict[str, float] = {}
+        self._rejected: Dict[str, int] = {}
+        self._async_slots: Dict[str, tuple] = {}  # provider -> (loop, asyncio.Semaphore)
+        self._async_in_flight: Dict[str, int] = {}
+
+    # ─────────────────────────────────────────
+    # CLIENT CONSTRUCTION
+    # ─────────────────────────────────────────
+    def _ensure_process(self):
+        """Drop clients inherited across a fork."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._clients = {}
+            self._created_at = {}
+            self._slots = {
+                name: threading.BoundedSemaphore(limit)
+                for name, limit in PROVIDER_CONCURRENCY.items()
+            }
+            self._in_flight = {name: 0 for name in PROVIDER_CONCURRENCY}
+            self._rejected = {name: 0 for name in PROVIDER_CONCURRENCY}
+            self._async_slots = {}
+            self._async_in_flight = {name: 0 for name in ASYNC_PROVIDER_CONCURRENCY}
+            self._pid = pid
+
+    def _limits(self, provider: str, concurrency: Dict[str, int] = PROVIDER_CONCURRENCY):
+        size = concurrency.get(provider, 4)
+        return httpx.Limits(
+            max_connections=size * 2,
+            max_keepalive_connections=size,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+
+    def _build_gemini(self):
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            return None
+        from google import genai
+        from google.genai import types
+
+        options = {"timeout": int(REQUEST_TIMEOUT * 1000)}  # milliseconds
+        if os.environ.get("GEMINI_BASE_URL"):
+            options["base_url"] = os.environ["GEMINI_BASE_URL"]
+        if HTTPX_AVAILABLE:
+            options["client_args"] = {"limits": self._limits("gemini")}
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(**options))
+
+    def _build_claude(self):
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            return None
+        import anthropic
+
+        kwargs = {"api_key": api_key, "timeout": REQUEST_TIMEOUT, "max_retries": 1}
+        if HTTPX_AVAILABLE and hasattr(anthropic, "DefaultHttpxClient"):
+            kwargs["http_client"] = anthropic.DefaultHttpxClient(limits=self._limits("claude"))
+        return anthropic.Anthropic(**kwargs)
+
+    def _build_gemini_async(self):
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            return None
+        from google import genai
+        from google.genai import types
+
+        options = {"timeout": int(REQUEST_TIMEOUT * 1000)}
+        if os.environ.get("GEMINI_BASE_URL"):
+            options["base_url"] = os.environ["GEMINI_BASE_URL"]
+        if HTTPX_AVAILABLE:
+            options["httpx_async_client"] = httpx.AsyncClient(
+                limits=self._limits("gemini", ASYNC_PROVIDER_CONCURRENCY), timeout=REQUEST_TIMEOUT
+            )
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(**options)).aio
+
+    def _build_claude_async(self):
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            return None
+        import anthropic
+
+        kwargs = {"api_key": api_key, "timeout": REQUEST_TIMEOUT, "max_retries": 1}
+        if HTTPX_AVAILABLE and hasattr(anthropic, "DefaultAsyncHttpxClient"):
+            kwargs["http_client"] = anthropic.DefaultAsyncHttpxClient(
+                limits=self._limits("claude", ASYNC_PROVIDER_CONCURRENCY)
+            )
+        return anthropic.AsyncAnthropic(**kwargs)
+
+    def _get(self, provider: str, builder):
+        self._ensure_process()
+        if provider in self._clients:
+            return self._clients[provider]
+        with self._lock:
+            if provider not in self._clients:
+                try:
+                    self._clients[provider] = builder()
+                    self._created_at[provider] = time.time()
+                except Exception as e:
+                    logger.error(f"❌ Failed to build {provider} client: {e}")
+                    self._clients[provider] = None
+        return self._clients[provider]
+
+    def gemini(self):
+        """Shared google-genai client for this worker (None if not configured)."""
+        return self._get("gemini", self._build_gemini)
+
+    def claude(self):
+        """Shared Anthropic client for this worker (None if not configured)."""
+        return self._get("claude", self._build_claude)
+
+    def gemini_async(self):
+        """Shared google-genai asyncio client (``client.aio``) for this worker."""
+        return self._get("gemini_async", self._build_gemini_async)
+
+    def claude_async(self):
+        """Shared AsyncAnthropic client for this worker."""
+        return self._get("claude_async", self._build_claude_async)
+
+    # ─────────────────────────────────────────
+    # CONCURRENCY LIMITS
+    # ─────────────────────────────────────────
+    @contextmanager
+    def slot(self, provider: str, timeout: float = SLOT_TIMEOUT):
+        """
+        Hold one of the provider's concurrency slots for the duration of a call.
+
+        Raises:
+            ProviderBusyError: if no slot frees up within ``timeout`` seconds
+        """
+        self._ensure_process()
+        semaphore = self._slots.get(provider)
+        if semaphore is None:
+            yield
+            return
+        if not semaphore.acquire(timeout=timeout):
+            self._rejected[provider] += 1
+            raise ProviderBusyError(f"{provider} concurrency limit reached")
+        self._in_flight[provider] += 1
+        try:
+            yield
+        finally:
+            self._in_flight[provider] -= 1
+            semaphore.release()
+
+    @asynccontextmanager
+    async def aslot(self, provider: str, timeout: float = SLOT_TIMEOUT):
+        """
+        Async counterpart of slot() for calls awaited on the event loop.
+
+        Raises:
+            ProviderBusyError: if no slot frees up within ``timeout`` seconds
+        """
+        self._ensure_process()
+        limit = ASYNC_PROVIDER_CONCURRENCY.get(provider)
+        if limit is None:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        bound = self._async_slots.get(provider)
+        if bound is None or bound[0] is not loop:
+            bound = self._async_slots[provider] = (loop, asyncio.Semaphore(limit))
+        semaphore = bound[1]
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._rejected[provider] = self._rejected.get(provider, 0) + 1
+            raise ProviderBusyError(f"{provider} async concurrency limit reached")
+        self._async_in_flight[provider] += 1
+        try:
+            yield
+        finally:
+            self._async_in_flight[provider] -= 1
+            semaphore.release()
+
+    # ─────────────────────────────────────────
+    # LIFECYCLE
+    # ─────────────────────────────────────────
+    def warm(self):
+        """
+        Build clients and open one connection per provider so the first
+        real request skips DNS, TCP and TLS setup.
+        """
+        gemini = self.gemini()
+        if gemini:
+            try:
+                gemini.models.get(model=GEMINI_MODEL)
+                logger.info("✅ Gemini client warmed")
+            except Exception as e:
+                logger.warning(f"⚠️ Gemini warm-up failed: {e}")
+
+        claude = self.claude()
+        if claude and hasattr(claude, "models"):
+            try:
+                claude.models.retrieve(CLAUDE_MODEL)
+                logger.info("✅ Anthropic client warmed")
+            except Exception as e:
+                logger.warning(f"⚠️ Anthropic warm-up failed: {e}")
+
+    def close(self):
+        """Close pooled sync connections (worker shutdown); async clients are left to aclose()."""
+        with self._lock:
+            for name in [n for n in self._clients if not n.endswith("_async")]:
+                client = self._clients.pop(name)
+                self._created_at.pop(name, None)
+                closer = getattr(client, "close", None)
+                if callable(closer):
+                    try:
+                        closer()
+                    except Exception as e:
+                        logger.debug(f"Error closing {name} client: {e}")
+
+    async def aclose(self):
+        """Close the async clients' connection pools (ASGI shutdown)."""
+        for name in ("gemini_async", "claude_async"):
+            client = self._clients.pop(name, None)
+            self._created_at.pop(name, None)
+            closer = getattr(client, "aclose", None) or getattr(client, "close", None)
+            if callable(closer):
+                try:
+                    result = closer()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.debug(f"Error closing {name} client: {e}")
+
+    def reset(self):
+        """Forget all clients and slots; the next access rebuilds them."""
+        with self._lock:
+            self._pid = None
+        self._ensure_process()
+
+    def get_stats(self) -> Dict:
+        """Per-provider client and concurrency statistics."""
+        self._ensure_process()
+        return {
+            name: {
+                "configured": self._clients.get(name) is not None,
+                "created_at": self._created_at.get(name),
+                "max_concurrency": limit,
+                "in_flight": self._in_flight.get(name, 0),
+                "rejected": self._rejected.get(name, 0),
+                "async_max_concurrency": ASYNC_PROVIDER_CONCURRENCY.get(name),
+                "async_in_flight": self._async_in_flight.get(name, 0),
+            }
+            for name, limit in PROVIDER_CONCURRENCY.items()
+        }
+
+
+# Singleton instance for application use
+model_clients = ModelClientPool()
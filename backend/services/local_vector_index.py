@@ -0,0 +1,296 @@
+"""
+services/local_vector_index.py
+In-process approximate nearest-neighbour index for the semantic cache.
+
+Used by VectorEngine as a degraded-mode tier while Redis/RediSearch is
+unreachable, so semantic caching keeps working per worker instead of
+switching off for the life of the process.
+
+- Vectors live in a float32 matrix backed by a memory-mapped scratch file
+  (LOCAL_INDEX_CAPACITY rows), L2-normalised so a dot product is cosine
+  similarity.
+- An IVF structure (spherical k-means centroids, one list id per row) is
+  trained once enough rows exist and retrained as the index doubles; a
+  search scans only the LOCAL_INDEX_NPROBE nearest lists. Below the
+  training threshold, search is exact brute force. Training runs in a
+  background thread on a snapshot of the vectors; searches keep using the
+  previous lists (or brute force) until the new centroids are swapped in.
+- The index is bounded: inserting into a full index evicts the least
+  recently used entry. Entries also expire after the cache TTL; a search
+  skips expired rows and returns the nearest live one.
+- Entries written while Redis is down are remembered as pending so
+  VectorEngine can copy them to Redis when it comes back (drain_pending).
+"""
+import os
+import time
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CAPACITY = int(os.getenv("LOCAL_INDEX_CAPACITY", "10000"))  # rows per worker
+INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", tempfile.gettempdir())
+NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))  # IVF lists scanned per search
+TRAIN_MIN = 1024  # rows before IVF is trained; smaller indexes are searched exactly
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 20000
+
+
+def _normalize(vector) -> Optional[np.ndarray]:
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else None
+
+
+def spherical_kmeans(data: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS,
+                     seed: int = 0) -> np.ndarray:
+    """Unit-norm centroids for unit-norm rows, maximising cosine similarity."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                centroids[c] = data[rng.integers(len(data))]
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+    return centroids
+
+
+class LocalVectorIndex:
+    """
+    Bounded, scope-filtered ANN index.
+
+    Usage:
+        index.add(key, vector, {"scope": ..., "response": ...}, ttl=86400)
+        match = index.search(vector, scope)   # (similarity, entry) or None
+    """
+
+    def __init__(self, dim: int = 768, capacity: int = CAPACITY, directory: str = INDEX_DIR,
+                 nprobe: int = NPROBE, train_min: int = TRAIN_MIN, clock=time.time,
+                 background_training: bool = True):
+        self.dim = dim
+        self.capacity = capacity
+        self.directory = directory
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.clock = clock
+        self.background_training = background_training
+        self._lock = threading.RLock()
+        self._pid = None
+        self._epoch = 0  # bumped whenever the storage is recreated
+        self._trainer: Optional[threading.Thread] = None
+        self.searches = 0
+        self.evictions = 0
+
+    # ─────────────────────────────────────────
+    # STORAGE
+    # ─────────────────────────────────────────
+    def _storage(self):
+        """Create the memmap lazily, once per worker process (never shared across fork)."""
+        if self._pid == os.getpid():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="eka-vectors-", suffix=".f32", dir=self.directory)
+        os.close(fd)
+        self._vectors = np.memmap(path, dtype=np.float32, mode="w+", shape=(self.capacity, self.dim))
+        try:
+            os.unlink(path)  # the mapping stays valid; the file goes away with the process
+        except OSError:
+            pass
+        self._scope_ids = np.full(self.capacity, -1, dtype=np.int32)  # -1 marks a free row
+        self._assign = np.full(self.capacity, -1, dtype=np.int32)  # IVF list per row
+        self._expires = np.full(self.capacity, np.inf)  # expiry time per row
+        self._entries: Dict[int, Dict] = {}
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._scopes: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._high = 0  # rows [0, _high) have been used
+        self._pending: set = set()
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_at = 0
+        self._training = False
+        self._dirty: set = set()  # rows written while a training run is in flight
+        self._epoch += 1
+        self._pid = os.getpid()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._lru) if self._pid == os.getpid() else 0
+
+    # ─────────────────────────────────────────
+    # WRITE
+    # ─────────────────────────────────────────
+    def add(self, key: str, vector: Sequence[float], entry: Dict, ttl: Optional[float] = None,
+            pending: bool = False) -> bool:
+        """Insert or replace ``key``; ``entry`` must carry its ``scope``."""
+        v = _normalize(vector)
+        if v is None or v.shape[0] != self.dim:
+            return False
+        with self._lock:
+            self._storage()
+            if key in self._lru:
+                self._remove(key)
+            elif len(self._lru) >= self.capacity:
+                self._remove(next(iter(self._lru)))
+                self.evictions += 1
+
+            row = self._free.pop() if self._free else self._high
+            self._high = max(self._high, row + 1)
+            self._vectors[row] = v
+            self._scope_ids[row] = self._scopes.setdefault(entry.get("scope", ""), len(self._scopes))
+            expires_at = self.clock() + ttl if ttl else None
+            self._entries[row] = {**entry, "key": key, "expires_at": expires_at}
+            self._expires[row] = expires_at if expires_at is not None else np.inf
+            self._lru[key] = row
+            if pending:
+                self._pending.add(key)
+            if self._centroids is not None:
+                self._assign[row] = int(np.argmax(self._centroids @ v))
+            if self._training:
+                self._dirty.add(row)
+            elif len(self._lru) >= max(self.train_min, 2 * self._trained_at):
+                self._start_training()
+            return True
+
+    def _remove(self, key: str):
+        row = self._lru.pop(key)
+        self._entries.pop(row, None)
+        self._scope_ids[row] = -1
+        self._assign[row] = -1
+        self._expires[row] = np.inf
+        self._pending.discard(key)
+        self._free.append(row)
+
+    def _start_training(self):
+        """Snapshot the live rows (under the lock) and train on them off the request path."""
+        rows = np.sort(np.fromiter(self._lru.values(), dtype=np.int64))
+        snapshot = np.asarray(self._vectors[rows])  # fancy indexing copies
+        self._training = True
+        self._trained_at = len(rows)
+        args = (rows, snapshot, self._epoch)
+        if not self.background_training:
+            self._train(*args)
+            return
+        self._trainer = threading.Thread(target=self._train, args=args, name="local-ivf-train", daemon=True)
+        self._trainer.start()
+
+    def _train(self, rows: np.ndarray, snapshot: np.ndarray, epoch: int):
+        started = time.perf_counter()
+        try:
+            nlist = max(1, int(np.sqrt(len(rows))))
+            sample = snapshot
+            if len(rows) > KMEANS_SAMPLE:
+                sample = snapshot[np.random.default_rng(0).choice(len(rows), size=KMEANS_SAMPLE, replace=False)]
+            centroids = spherical_kmeans(sample, nlist)
+            assign = np.full(self.capacity, -1, dtype=np.int32)
+            assign[rows] = np.argmax(snapshot @ centroids.T, axis=1)
+        except Exception as e:
+            logger.error(f"❌ Local vector index training failed: {e}")
+            with self._lock:
+                if self._epoch == epoch:
+                    self._training = False
+                    self._dirty.clear()
+            return
+
+        with self._lock:
+            if self._epoch != epoch:
+                return  # cleared or forked while training
+            # Rows written since the snapshot get assigned now; freed rows drop out
+            dirty = np.array(sorted(self._dirty), dtype=np.int64)
+            if dirty.size:
+                assign[dirty] = np.argmax(np.asarray(self._vectors[dirty]) @ centroids.T, axis=1)
+            assign[self._scope_ids < 0] = -1
+            self._assign, self._centroids = assign, centroids
+            self._training = False
+            self._dirty.clear()
+        logger.info(f"Local vector index trained: {nlist} lists over {len(rows)} rows "
+                    f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def wait_for_training(self, timeout: Optional[float] = None):
+        """Block until an in-flight background training run has been swapped in."""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+
+    # ─────────────────────────────────────────
+    # READ
+    # ─────────────────────────────────────────
+    def search(self, vector: Sequence[float], scope: str, exact: bool = False) -> Optional[Tuple[float, Dict]]:
+        """Nearest live entry in ``scope`` as (cosine similarity, entry), or None."""
+        q = _normalize(vector)
+        if q is None or q.shape[0] != self.dim:
+            return None
+        with self._lock:
+            if self._pid != os.getpid() or scope not in self._scopes:
+                return None
+            self.searches += 1
+            in_scope = self._scope_ids[:self._high] == self._scopes[scope]
+            candidates = self._live(np.flatnonzero(in_scope if exact else in_scope & self._probe_mask(q)))
+            if candidates.size == 0 and not exact:
+                # Probed lists hold nothing live from this scope; scan the scope exactly
+                candidates = self._live(np.flatnonzero(in_scope))
+            if candidates.size == 0:
+                return None
+            sims = self._vectors[candidates] @ q
+            best = int(np.argmax(sims))
+            entry = self._entries[int(candidates[best])]
+            self._lru.move_to_end(entry["key"])
+            return float(sims[best]), entry
+
+    def _live(self, candidates: np.ndarray) -> np.ndarray:
+        """Drop (and remove) expired rows from ``candidates``."""
+        expired = self._expires[candidates] <= self.clock()
+        for row in candidates[expired]:
+            self._remove(self._entries[int(row)]["key"])
+        return candidates[~expired]
+
+    def _probe_mask(self, q: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.ones(self._high, dtype=bool)
+        nprobe = min(self.nprobe, len(self._centroids))
+        probe = np.argpartition(self._centroids @ q, -nprobe)[-nprobe:]
+        return np.isin(self._assign[:self._high], probe)
+
+    # ─────────────────────────────────────────
+    # RESYNC
+    # ─────────────────────────────────────────
+    def drain_pending(self) -> List[Tuple[str, List[float], Dict]]:
+        """Entries written while Redis was down, as (key, vector, entry); clears the pending set."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return []
+            now = self.clock()
+            drained = []
+            for key in list(self._pending):
+                row = self._lru[key]
+                entry = self._entries[row]
+                if entry["expires_at"] is None or entry["expires_at"] > now:
+                    drained.append((key, self._vectors[row].tolist(), entry))
+            self._pending.clear()
+            return drained
+
+    def clear(self):
+        with self._lock:
+            self._pid = None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            active = self._pid == os.getpid()
+            return {
+                "entries": len(self._lru) if active else 0,
+                "capacity": self.capacity,
+                "pending_resync": len(self._pending) if active else 0,
+                "ivf_lists": len(self._centroids) if active and self._centroids is not None else 0,
+                "training": bool(active and self._training),
+                "searches": self.searches,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,359 @@
+"""
+services/model_router.py
+Latency-aware model router with circuit breakers and hedged requests.
+
+Tracks per-provider EWMA latency and error rate, opens a circuit breaker on
+sustained failures, and fails over to the *other* provider instead of
+retrying the one that just failed. In FAST mode it can optionally hedge:
+if the primary has not answered within a p95-derived delay, the secondary is
+fired as well and the first valid JSON result wins.
+
+aroute() is the asyncio twin of route() for the ASGI serving mode; both
+share the same health tracking and breakers.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 200  # samples kept for percentile estimates
+BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", "5"))  # consecutive failures
+BREAKER_ERROR_RATE = float(os.getenv("ROUTER_BREAKER_ERROR_RATE", "0.5"))  # EWMA error rate
+BREAKER_MIN_CALLS = 10  # calls before the error-rate rule applies
+BREAKER_COOLDOWN = float(os.getenv("ROUTER_BREAKER_COOLDOWN", "30"))  # seconds open before a probe
+HEDGE_FAST = os.getenv("ROUTER_HEDGE_FAST", "false").lower() == "true"
+HEDGE_DEFAULT_DELAY_MS = 2500.0  # used until enough latency samples exist
+HEDGE_MIN_DELAY_MS = 250.0
+HEDGE_MAX_DELAY_MS = 8000.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_POOL_SIZE = int(os.getenv("ROUTER_HEDGE_POOL_SIZE", "16"))
+
+# Provider preference per intelligence mode
+ROUTES = {
+    "THINKING": ["claude", "gemini"],
+    "FAST": ["gemini", "claude"],
+}
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class NoProviderAvailable(RuntimeError):
+    """Raised when every provider is unconfigured, open, or failed."""
+
+
+class ProviderHealth:
+    """EWMA latency/error tracking plus a circuit breaker for one provider."""
+
+    def __init__(self, name: str, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.latency_ewma_ms: Optional[float] = None
+        self.error_ewma = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now (OPEN lets one probe through after cooldown)."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= BREAKER_COOLDOWN:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            return self.state == HALF_OPEN and not self._probe_in_flight
+
+    def begin(self):
+        """Mark a call as started; in HALF_OPEN it becomes the single probe."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = True
+
+    def abandon(self):
+        """A started call was cancelled (lost a hedge) before it finished."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, latency_ms: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self.error_ewma = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_ewma
+            if ok:
+                self.latencies.append(latency_ms)
+                self.latency_ewma_ms = latency_ms if self.latency_ewma_ms is None else (
+                    EWMA_ALPHA * latency_ms + (1 - EWMA_ALPHA) * self.latency_ewma_ms
+                )
+                self.consecutive_failures = 0
+                if self.state != CLOSED:
+                    logger.info(f"✅ Circuit for {self.name} closed")
+                self.state = CLOSED
+                self._probe_in_flight = False
+                return
+
+            self.failures += 1
+            self.consecutive_failures += 1
+            sustained = (
+                self.consecutive_failures >= BREAKER_FAILURES
+                or (self.calls >= BREAKER_MIN_CALLS and self.error_ewma >= BREAKER_ERROR_RATE)
+            )
+            if self.state == HALF_OPEN or (self.state == CLOSED and sustained):
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self._probe_in_flight = False
+                logger.warning(f"⚠️ Circuit for {self.name} opened "
+                               f"({self.consecutive_failures} consecutive failures)")
+
+    def percentile_ms(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "calls": self.calls,
+                "failures": self.failures,
+                "consecutive_failures": self.consecutive_failures,
+                "latency_ewma_ms": round(self.latency_ewma_ms, 1) if self.latency_ewma_ms else None,
+                "error_rate_ewma": round(self.error_ewma, 4),
+            }
+
+
+class ModelRouter:
+    """
+    Routes a chat turn to a provider.
+
+    Args:
+        providers: name -> callable(history, system_prompt) returning the parsed JSON dict
+        available: optional name -> callable() telling whether a provider is configured
+        hedge_fast: hedge FAST-mode calls across two providers
+        async_providers: name -> coroutine function(history, system_prompt) used by aroute()
+    """
+
+    def __init__(self, providers: Dict[str, Callable], available: Optional[Dict[str, Callable]] = None,
+                 hedge_fast: bool = HEDGE_FAST, clock: Callable[[], float] = time.monotonic,
+                 async_providers: Optional[Dict[str, Callable]] = None):
+        self.providers = providers
+        self.async_providers = async_providers or {}
+        self.available = available or {}
+        self.hedge_fast = hedge_fast
+        self.health = {name: ProviderHealth(name, clock) for name in providers}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    # ─────────────────────────────────────────
+    # SELECTION
+    # ─────────────────────────────────────────
+    def candidates(self, mode: str) -> List[str]:
+        """Configured providers for ``mode`` in preference order (ignores breakers)."""
+        order = ROUTES.get(mode, ROUTES["FAST"])
+        return [
+            name for name in order
+            if name in self.providers and self.available.get(name, lambda: True)()
+        ]
+
+    def _allowed(self, mode: str) -> List[str]:
+        return [name for name in self.candidates(mode) if self.health[name].allow()]
+
+    def record(self, name: str, latency_ms: float, ok: bool):
+        """Record an outcome observed outside route(), e.g. a streamed call."""
+        if name in self.health:
+            self.health[name].record(latency_ms, ok)
+
+    def abandon(self, name: str):
+        """Release a pick() whose call ended without an outcome (e.g. client disconnect)."""
+        if name in self.health:
+            self.health[name].abandon()
+
+    def pick(self, mode: str) -> Optional[str]:
+        """
+        Claim the first provider the breaker currently allows for ``mode``.
+        The caller must report the outcome with record(), or release it with abandon().
+        """
+        allowed = self._allowed(mode)
+        if not allowed:
+            return None
+        self.health[allowed[0]].begin()
+        return allowed[0]
+
+    # ─────────────────────────────────────────
+    # EXECUTION
+    # ─────────────────────────────────────────
+    def _call(self, name: str, history, system_prompt):
+        self.health[name].begin()
+        started = time.perf_counter()
+        try:
+            result = self.providers[name](history, system_prompt)
+            if not isinstance(result, dict):
+                raise ValueError(f"{name} returned {type(result).__name__}, expected JSON object")
+        except Exception:
+            self.health[name].record((time.perf_counter() - started) * 1000, ok=False)
+            raise
+        self.health[name].record((time.perf_counter() - started) * 1000, ok=True)
+        return result
+
+    def route(self, mode: str, history, system_prompt, exclude: Tuple[str, ...] = ()) -> Tuple[Dict, str]:
+        """
+        Run the turn and return (result, provider name).
+
+        Args:
+            exclude: providers to skip, e.g. one whose streamed call just failed
+
+        Raises:
+            NoProviderAvailable: if every allowed provider fails
+        """
+        allowed = [name for name in self._allowed(mode) if name not in exclude]
+        if not allowed:
+            raise NoProviderAvailable(f"No provider available for {mode} (circuits open or unconfigured)")
+
+        if mode != "THINKING" and self.hedge_fast and len(allowed) >= 2:
+            return self._hedged(allowed[0], allowed[1], history, system_prompt)
+
+        errors = []
+        for name in allowed:
+            try:
+                return self._call(name, history, system_prompt), name
+            except Exception as e:
+                logger.warning(f"Provider {name} failed ({mode}): {e}")
+                errors.append(f"{name}: {e}")
+        raise NoProviderAvailable("; ".join(errors))
+
+    def hedge_delay_ms(self, name: str) -> float:
+        p95 = self.health[name].percentile_ms(0.95)
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY_MS
+        return min(max(p95, HEDGE_MIN_DELAY_MS), HEDGE_MAX_DELAY_MS)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE,
+                                                        thread_name_prefix="router-hedge")
+        return self._executor
+
+    def _hedged(self, primary: str, secondary: str, history, system_prompt) -> Tuple[Dict, str]:
+        """
+        Fire ``primary``; if it has not answered after its hedge delay (or fails),
+        fire ``secondary`` too. The first valid result wins; the loser's result is
+        discarded (a not-yet-started call is cancelled outright).
+        """
+        pool = self._pool()
+        futures = {pool.submit(self._call, primary, history, system_prompt): primary}
+        done, _ = wait(futures, timeout=self.hedge_delay_ms(primary) / 1000)
+
+        if done:
+            future = next(iter(done))
+            if future.exception() is None:
+                return future.result(), primary
+
+        self.hedges_fired += 1
+        futures[pool.submit(self._call, secondary, history, system_prompt)] = secondary
+        pending = set(futures)
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    if name == secondary:
+                        self.hedges_won += 1
+                    return future.result(), name
+                errors.append(f"{name}: {future.exception()}")
+        raise NoProviderAvailable("; ".join(errors))
+
+    # ─────────────────────────────────────────
+    # ASYNC EXECUTION
+    # ─────────────────────────────────────────
+    async def _acall(self, name: str, history, system_prompt):
+        self.health[name].begin()
+        started = time.perf_counter()
+        try:
+            result = await self.async_providers[name](history, system_prompt)
+            if not isinstance(result, dict):
+                raise ValueError(f"{name} returned {type(result).__name__}, expected JSON object")
+        except asyncio.CancelledError:
+            self.health[name].abandon()
+            raise
+        except Exception:
+            self.health[name].record((time.perf_counter() - started) * 1000, ok=False)
+            raise
+        self.health[name].record((time.perf_counter() - started) * 1000, ok=True)
+        return result
+
+    async def aroute(self, mode: str, history, system_prompt, exclude: Tuple[str, ...] = ()) -> Tuple[Dict, str]:
+        """Async variant of route(); only providers with an async implementation are used."""
+        allowed = [
+            name for name in self._allowed(mode)
+            if name not in exclude and name in self.async_providers
+        ]
+        if not allowed:
+            raise NoProviderAvailable(f"No async provider available for {mode}")
+
+        if mode != "THINKING" and self.hedge_fast and len(allowed) >= 2:
+            return await self._ahedged(allowed[0], allowed[1], history, system_prompt)
+
+        errors = []
+        for name in allowed:
+            try:
+                return await self._acall(name, history, system_prompt), name
+            except Exception as e:
+                logger.warning(f"Provider {name} failed ({mode}): {e}")
+                errors.append(f"{name}: {e}")
+        raise NoProviderAvailable("; ".join(errors))
+
+    async def _ahedged(self, primary: str, secondary: str, history, system_prompt) -> Tuple[Dict, str]:
+        """Async hedging: same policy as _hedged(), losers are cancelled."""
+        tasks = {asyncio.ensure_future(self._acall(primary, history, system_prompt)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay_ms(primary) / 1000)
+        if done:
+            task = next(iter(done))
+            if task.exception() is None:
+                return task.result(), primary
+
+        self.hedges_fired += 1
+        tasks[asyncio.ensure_future(self._acall(secondary, history, system_prompt))] = secondary
+        errors = [f"{primary}: {t.exception()}" for t in done]
+        pending = {t for t in tasks if t not in done}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    if name == secondary:
+                        self.hedges_won += 1
+                    return task.result(), name
+                errors.append(f"{name}: {task.exception()}")
+        raise NoProviderAvailable("; ".join(errors))
+
+    def get_stats(self) -> Dict:
+        return {
+            "providers": {name: health.snapshot() for name, health in self.health.items()},
+            "hedge_fast": self.hedge_fast,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+        }
@@ -17,6 +17,8 @@ from enum import Enum
 import uuid
 import logging
 
+from services.audit_sink import audit_sink
+
 logger = logging.getLogger(__name__)
 
 # Try to import WeasyPrint for PDF generation
@@ -861,9 +863,9 @@ class PDIManager:
         old_values: Optional[Dict] = None,
         new_values: Optional[Dict] = None
     ):
-        """Log audit entry"""
+        """Queue audit entry (bulk-inserted in the background)"""
         try:
-            self.supabase.table(self.audit_table).insert({
+            audit_sink.submit(self.audit_table, {
                 "workshop_id": workshop_id,
                 "user_id": user_id,
                 "action": action,
@@ -871,7 +873,7 @@ class PDIManager:
                 "entity_id": entity_id,
                 "old_values": old_values,
                 "new_values": new_values
-            }).execute()
+            }, client=self.supabase)
         except Exception as e:
             logger.error(f"Error logging audit: {e}")
     
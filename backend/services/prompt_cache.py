@@ -0,0 +1,210 @@
+"""
+services/prompt_cache.py
+Precompiled EKA system prompt with provider-side context caching.
+
+The constitution is static; only the [OPERATING_MODE] / [CURRENT_STATUS] /
+[VEHICLE_CONTEXT] tail changes per turn. The static part is always sent
+first and byte-identical so providers can reuse it:
+
+- Claude: the static block carries ``cache_control``; the tail is a second block.
+- Gemini: the static block is registered once per worker as CachedContent and
+  referenced by name; the tail is sent as a leading user turn. When explicit
+  caching is unavailable (prompt below the model minimum, API error) the full
+  prompt goes out as ``system_instruction`` with the static part as a stable
+  prefix, which Gemini can still cache implicitly.
+
+The static token count is precomputed locally, so deciding whether explicit
+caching is worth it never costs a provider round trip. Per-provider input
+token and latency counters show what the cache actually saves.
+"""
+import os
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHARS_PER_TOKEN = 4.0  # local estimate, close enough for English prose and JSON
+GEMINI_CACHE_ENABLED = os.getenv("GEMINI_PROMPT_CACHE", "true").lower() == "true"
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_PROMPT_CACHE_TTL", "3600"))  # seconds
+GEMINI_MIN_CACHE_TOKENS = int(os.getenv("GEMINI_MIN_CACHE_TOKENS", "4096"))  # model minimum
+CLAUDE_MIN_CACHE_TOKENS = 1024  # Sonnet minimum; shorter prefixes are simply not cached
+GEMINI_CACHE_RETRY = 300  # seconds before retrying a failed cache creation
+REFRESH_MARGIN = 60  # recreate the Gemini cache this many seconds before it expires
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate used when no provider tokenizer is at hand."""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+class SystemPrompt:
+    """A system prompt split into the cacheable static part and the per-turn tail."""
+
+    __slots__ = ("static", "dynamic")
+
+    def __init__(self, static: str, dynamic: str):
+        self.static = static
+        self.dynamic = dynamic
+
+    def __str__(self):
+        return f"{self.static}\n{self.dynamic}"
+
+
+class PromptCache:
+    """
+    Builds per-turn prompts around one static block and tracks its cache use.
+
+    Usage:
+        prompt = prompt_cache.build(op_mode, status, context)
+        contents, config = prompt_cache.gemini_request(client, model, prompt, history)
+        system = prompt_cache.claude_system(prompt)
+    """
+
+    def __init__(self, static_text: str, gemini_enabled: bool = GEMINI_CACHE_ENABLED):
+        self.static = static_text
+        self.static_tokens = estimate_tokens(static_text)
+        self.static_hash = hashlib.sha256(static_text.encode()).hexdigest()[:12]
+        self.gemini_enabled = gemini_enabled and self.static_tokens >= GEMINI_MIN_CACHE_TOKENS
+        self._lock = threading.Lock()  # guards Gemini cache creation
+        self._stats_lock = threading.Lock()
+        self._gemini_cache: Optional[Tuple[int, str, str, float]] = None  # (pid, model, name, expires_at)
+        self._gemini_retry_at = 0.0
+        self._stats = {name: self._empty_stats() for name in ("gemini", "claude")}
+
+        if gemini_enabled and not self.gemini_enabled:
+            logger.info(f"ℹ️ Static prompt is ~{self.static_tokens} tokens, below the Gemini "
+                        f"explicit cache minimum ({GEMINI_MIN_CACHE_TOKENS}); using implicit prefix caching")
+
+    @staticmethod
+    def _empty_stats() -> Dict:
+        return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                "latency_ms": 0.0, "streams": 0, "ttft_ms": 0.0}
+
+    def build(self, operating_mode, status: str, context: Optional[Dict]) -> SystemPrompt:
+        """Static constitution plus this turn's dynamic tail."""
+        dynamic = (
+            f"[OPERATING_MODE]: {operating_mode}\n"
+            f"[CURRENT_STATUS]: {status}\n"
+            f"[VEHICLE_CONTEXT]: {json.dumps(context or {})}"
+        )
+        return SystemPrompt(self.static, dynamic)
+
+    # ─────────────────────────────────────────
+    # PROVIDER REQUEST SHAPES
+    # ─────────────────────────────────────────
+    def claude_system(self, prompt):
+        """``system`` argument for Anthropic messages with the static block cache-marked."""
+        if not isinstance(prompt, SystemPrompt):
+            return str(prompt)
+        return [
+            {"type": "text", "text": prompt.static, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": prompt.dynamic},
+        ]
+
+    def gemini_request(self, client, model: str, prompt, history: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """
+        Contents and config overrides for a Gemini call.
+
+        Returns:
+            (contents, config) where config holds either ``cached_content`` or
+            ``system_instruction``.
+        """
+        if isinstance(prompt, SystemPrompt) and prompt.static == self.static:
+            name = self._gemini_cache_name(client, model)
+            if name:
+                tail = {"role": "user", "parts": [{"text": prompt.dynamic}]}
+                return [tail] + list(history), {"cached_content": name}
+        return history, {"system_instruction": str(prompt)}
+
+    def _gemini_cache_name(self, client, model: str) -> Optional[str]:
+        """Name of this worker's CachedContent for the static block, created on demand."""
+        if not self.gemini_enabled or client is None:
+            return None
+        now = time.time()
+        cache = self._gemini_cache
+        if cache and cache[0] == os.getpid() and cache[1] == model and cache[3] - REFRESH_MARGIN > now:
+            return cache[2]
+        if now < self._gemini_retry_at or not self._lock.acquire(blocking=False):
+            return None  # creation in progress or backing off: send the prompt inline
+        try:
+            created = client.caches.create(
+                model=model,
+                config={
+                    "system_instruction": self.static,
+                    "display_name": f"eka-constitution-{self.static_hash}",
+                    "ttl": f"{GEMINI_CACHE_TTL}s",
+                }
+            )
+            self._gemini_cache = (os.getpid(), model, created.name, now + GEMINI_CACHE_TTL)
+            logger.info(f"✅ Registered EKA constitution with Gemini context cache ({created.name})")
+            return created.name
+        except Exception as e:
+            self._gemini_cache = None
+            self._gemini_retry_at = now + GEMINI_CACHE_RETRY
+            logger.warning(f"⚠️ Gemini context cache unavailable, sending prompt inline: {e}")
+            return None
+        finally:
+            self._lock.release()
+
+    def invalidate_gemini(self):
+        """Forget the Gemini cache name, e.g. after a call referencing it failed."""
+        self._gemini_cache = None
+
+    # ─────────────────────────────────────────
+    # METRICS
+    # ─────────────────────────────────────────
+    @staticmethod
+    def usage_tokens(provider: str, usage) -> Tuple[int, int]:
+        """(prompt tokens, of which served from cache) from a provider usage object."""
+        if usage is None:
+            return 0, 0
+        if provider == "claude":
+            cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+            written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+            return (getattr(usage, "input_tokens", 0) or 0) + cached + written, cached
+        prompt = getattr(usage, "prompt_token_count", 0) or 0
+        return prompt, getattr(usage, "cached_content_token_count", 0) or 0
+
+    def record(self, provider: str, usage, latency_ms: float, ttft_ms: Optional[float] = None):
+        """Record one completed call; ``ttft_ms`` is given for streamed calls."""
+        prompt_tokens, cached_tokens = self.usage_tokens(provider, usage)
+        with self._stats_lock:
+            stats = self._stats.setdefault(provider, self._empty_stats())
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["latency_ms"] += latency_ms
+            if ttft_ms is not None:
+                stats["streams"] += 1
+                stats["ttft_ms"] += ttft_ms
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            providers = {}
+            for name, stats in self._stats.items():
+                calls, streams = stats["calls"], stats["streams"]
+                providers[name] = {
+                    "calls": calls,
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "cached_tokens": stats["cached_tokens"],
+                    "uncached_tokens": stats["prompt_tokens"] - stats["cached_tokens"],
+                    "avg_prompt_tokens": round(stats["prompt_tokens"] / calls, 1) if calls else 0.0,
+                    "cached_ratio": round(stats["cached_tokens"] / stats["prompt_tokens"], 4)
+                    if stats["prompt_tokens"] else 0.0,
+                    "avg_latency_ms": round(stats["latency_ms"] / calls, 1) if calls else 0.0,
+                    "avg_ttft_ms": round(stats["ttft_ms"] / streams, 1) if streams else 0.0,
+                }
+        cache = self._gemini_cache
+        return {
+            "static_tokens_estimate": self.static_tokens,
+            "static_hash": self.static_hash,
+            "gemini_explicit_cache": bool(cache and cache[0] == os.getpid()),
+            "claude_cacheable": self.static_tokens >= CLAUDE_MIN_CACHE_TOKENS,
+            "providers": providers,
+        }
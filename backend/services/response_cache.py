@@ -0,0 +1,257 @@
+"""
+services/response_cache.py
+Two-tier response cache in front of the /api/chat model router.
+
+Tier 1: exact match on a hash of the normalized query and its context.
+Tier 2: semantic match via the vector engine, pre-filtered to the same context.
+
+The context scope (job status, operating and intelligence mode, vehicle
+brand/model/year/fuel, workshop and a hash of the earlier conversation
+turns) is part of every key, so a cached answer is never replayed into a
+different job state, for a different vehicle, to another workshop, or as
+the reply to a follow-up ("yes") asked in a different conversation. The
+workshop comes from the caller's bearer token (middleware.auth.optional_auth);
+anonymous /api/chat calls have none and share one global namespace.
+
+Tier-1 keys in Redis are admitted into the vector engine's CacheBudget
+alongside the semantic documents, so both tiers share one size limit and
+the per-workshop quotas.
+"""
+import re
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from services.vector_engine import vector_engine, CACHE_TTL
+from services.cache_budget import EXACT_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LOCAL_EXACT_SIZE = 1000  # Tier-1 entries kept in-process when Redis is down
+BYPASS_HEADER = "X-Cache-Bypass"
+
+TIER_EXACT = "HIT-EXACT"
+TIER_SEMANTIC = "HIT-SEMANTIC"
+MISS = "MISS"
+BYPASS = "BYPASS"
+
+_WS = re.compile(r"\s+")
+_EDGE_PUNCT = re.compile(r"^[\s\.\,\!\?\;\:]+|[\s\.\,\!\?\;\:]+$")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, collapse whitespace and strip edge punctuation."""
+    text = _WS.sub(" ", (text or "").lower())
+    return _EDGE_PUNCT.sub("", text)
+
+
+def conversation_hash(history: Optional[List[Dict]]) -> str:
+    """Hash of every turn before the last one ("" for a first turn)."""
+    prior = (history or [])[:-1]
+    if not prior:
+        return ""
+    raw = json.dumps(prior, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def build_scope(status: str, operating_mode, context: Optional[Dict], history: Optional[List[Dict]] = None,
+                workshop: Optional[str] = None, intelligence_mode: Optional[str] = None) -> Dict:
+    """Context fields an answer is valid for."""
+    context = context or {}
+
+    def field(*names):
+        for name in names:
+            value = context.get(name)
+            if value not in (None, ""):
+                return str(value).strip().lower()
+        return ""
+
+    return {
+        "status": str(status or ""),
+        "operating_mode": str(operating_mode),
+        "brand": field("brand"),
+        "model": field("model"),
+        "year": field("year"),
+        "fuel_type": field("fuel_type", "fuelType"),
+        "intelligence_mode": str(intelligence_mode or ""),
+        "workshop": str(workshop or ""),
+        "conversation": conversation_hash(history),
+    }
+
+
+def scope_key(scope: Dict) -> str:
+    """Stable short hash of a scope, usable as a RediSearch TAG."""
+    raw = json.dumps(scope, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class ChatResponseCache:
+    """
+    Exact + semantic cache for normalized chat envelopes.
+
+    Counters are per-process and cheap to read on every metrics scrape.
+    """
+
+    def __init__(self, engine=vector_engine):
+        self.engine = engine
+        self._local = OrderedDict()  # tier-1 fallback: key -> (expires_at, envelope)
+        self._lock = threading.Lock()
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.latency_saved_ms = 0.0
+        self._avg_miss_ms = 0.0  # EWMA of model latency on misses
+
+    # ─────────────────────────────────────────
+    # LOOKUP / STORE
+    # ─────────────────────────────────────────
+    def _exact_key(self, query: str, scope_hash: str) -> str:
+        digest = hashlib.sha256(f"{scope_hash}:{normalize_query(query)}".encode()).hexdigest()
+        return f"{EXACT_PREFIX}{digest}"
+
+    def lookup(self, query: str, scope: Dict) -> Tuple[Optional[Dict], str]:
+        """
+        Look up a cached envelope for ``query`` within ``scope``.
+
+        Returns:
+            (envelope or None, tier label)
+        """
+        if not normalize_query(query):
+            return None, MISS
+
+        started = time.perf_counter()
+        scope_hash = scope_key(scope)
+
+        tier = TIER_EXACT
+        envelope = self._unwrap(self._get_exact(self._exact_key(query, scope_hash)), scope_hash)
+        if envelope is None:
+            tier = TIER_SEMANTIC
+            hit = self.engine.search_cache(normalize_query(query), scope_hash)
+            envelope = self._unwrap(hit["text"] if hit else None, scope_hash)
+
+        with self._lock:
+            if envelope is None:
+                self.misses += 1
+                return None, MISS
+            if tier == TIER_EXACT:
+                self.hits_exact += 1
+            else:
+                self.hits_semantic += 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.latency_saved_ms += max(self._avg_miss_ms - elapsed_ms, 0.0)
+        return envelope, tier
+
+    def store(self, query: str, scope: Dict, envelope: Dict, model_latency_ms: float = 0.0,
+              owner: Optional[str] = None):
+        """
+        Cache a normalized envelope produced by the model for ``query``.
+        ``owner`` is the workshop charged for both entries (size quota).
+        """
+        with self._lock:
+            if model_latency_ms:
+                self._avg_miss_ms = (
+                    model_latency_ms if not self._avg_miss_ms
+                    else 0.8 * self._avg_miss_ms + 0.2 * model_latency_ms
+                )
+        normalized = normalize_query(query)
+        if not normalized or not envelope:
+            return
+
+        scope_hash = scope_key(scope)
+        payload = json.dumps({"scope": scope_hash, "envelope": envelope})
+        self._set_exact(self._exact_key(query, scope_hash), payload, owner)
+        self.engine.cache_response(
+            normalized, payload,
+            metadata={"scope": scope, "kind": "chat"},
+            scope=scope_hash,
+            latency_ms=model_latency_ms or None,
+            owner=owner
+        )
+        with self._lock:
+            self.stores += 1
+
+    @staticmethod
+    def _unwrap(payload: Optional[str], scope_hash: str) -> Optional[Dict]:
+        """Decode a stored entry, rejecting anything cached under another scope."""
+        if not payload:
+            return None
+        try:
+            entry = json.loads(payload)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("scope") != scope_hash:
+            logger.warning("Discarding cached chat entry with mismatched scope")
+            return None
+        return entry.get("envelope")
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    # ─────────────────────────────────────────
+    # TIER 1 STORAGE
+    # ─────────────────────────────────────────
+    def _get_exact(self, key: str) -> Optional[str]:
+        redis_client = self.engine.redis
+        if redis_client:
+            try:
+                payload = redis_client.get(key)
+            except Exception as e:
+                logger.error(f"❌ Exact cache read failed: {e}")
+                return None
+            if payload:
+                self.engine.budget.touch(key)
+            return payload
+
+        with self._lock:
+            entry = self._local.get(key)
+            if not entry:
+                return None
+            expires_at, payload = entry
+            if expires_at < time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return payload
+
+    def _set_exact(self, key: str, payload: str, owner: Optional[str] = None):
+        redis_client = self.engine.redis
+        if redis_client:
+            try:
+                redis_client.set(key, payload, ex=CACHE_TTL)
+            except Exception as e:
+                logger.error(f"❌ Exact cache write failed: {e}")
+                return
+            self.engine.budget.admit(key, owner)
+            return
+
+        with self._lock:
+            self._local[key] = (time.time() + CACHE_TTL, payload)
+            self._local.move_to_end(key)
+            while len(self._local) > LOCAL_EXACT_SIZE:
+                self._local.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits_exact + self.hits_semantic + self.misses
+            return {
+                "hits_exact": self.hits_exact,
+                "hits_semantic": self.hits_semantic,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "hit_rate": round((self.hits_exact + self.hits_semantic) / lookups, 4) if lookups else 0.0,
+                "latency_saved_ms": round(self.latency_saved_ms, 1),
+                "avg_model_latency_ms": round(self._avg_miss_ms, 1),
+            }
+
+
+# Singleton instance for application use
+chat_cache = ChatResponseCache()
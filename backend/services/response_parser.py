@@ -0,0 +1,277 @@
+"""
+services/response_parser.py
+Tolerant parsing of the EKA JSON envelope returned by the models.
+
+A bare ``json.loads`` fails on defects that are trivial to fix, and every
+failure used to cost a second generation (router failover) or a 500. The
+parser repairs the common ones in a single pass:
+
+- markdown fences (```json ... ```) and prose before the first ``{``
+- trailing text after the closing brace
+- output truncated mid-document (open string closed, dangling comma or
+  member dropped, missing closing brackets added)
+- a JSON document double-encoded as a string
+
+and then validates the result against the EKA output schema. Sections
+with the wrong type are dropped; a ``response_content`` without a string
+``visual_text`` is dropped too, so server.normalize_response fills in its
+default text exactly as it did before this parser existed (counted as the
+``missing_visual_text`` repair, and such replies are never cached). Only
+when no JSON object can be recovered does the caller re-ask the model,
+once, with the broken output and a corrective instruction
+(parse_with_reask). Clean parses, repairs and re-asks are counted per
+provider.
+"""
+import json
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Optional top-level sections of the EKA envelope and their JSON types
+OPTIONAL_FIELDS = {
+    "job_status_update": str,
+    "ui_triggers": dict,
+    "diagnostic_data": dict,
+    "estimate_data": dict,
+    "mg_analysis": dict,
+    "pdi_checklist": dict,
+    "recall_data": dict,
+}
+REASK_INSTRUCTION = (
+    "Your previous reply was not a valid EKA JSON object ({error}). "
+    "Reply again with ONLY the complete JSON object described in the output schema, "
+    "with no markdown fences and no text before or after it."
+)
+
+_CLOSERS = {"{": "}", "[": "]"}
+_decoder = json.JSONDecoder()
+
+
+class ModelOutputError(ValueError):
+    """Model output could not be parsed or repaired into a valid EKA envelope."""
+
+
+def _strip_fences(text: str) -> str:
+    """Content of the first markdown code fence, or the text unchanged."""
+    start = text.find("```")
+    if start == -1:
+        return text
+    body_start = text.find("\n", start)
+    if body_start == -1:
+        return text
+    end = text.find("```", body_start)
+    return text[body_start + 1:end if end != -1 else len(text)]
+
+
+def _close_truncated(text: str) -> Optional[object]:
+    """
+    Complete a document that was cut off.
+
+    Tries the text with the open string and brackets closed, then falls back
+    to cutting at each earlier top-level-or-nested comma (dropping the
+    incomplete member) until something parses.
+    """
+    stack: List[str] = []
+    cut_points: List[Tuple[int, List[str]]] = []
+    in_string = escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+        elif ch == ",":
+            cut_points.append((i, list(stack)))
+
+    head = text
+    if in_string:
+        head = (head[:-1] if escape else head) + '"'
+    head = head.rstrip()
+    if head.endswith(","):
+        head = head[:-1]
+    elif head.endswith(":"):
+        head += " null"
+    candidates = [head + "".join(_CLOSERS[c] for c in reversed(stack))]
+    for index, open_brackets in reversed(cut_points):
+        candidates.append(text[:index] + "".join(_CLOSERS[c] for c in reversed(open_brackets)))
+
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def repair_json(text: str) -> Tuple[object, List[str]]:
+    """
+    Decode ``text`` leniently.
+
+    Returns:
+        (value, repairs) where ``repairs`` names each fix applied (empty for clean JSON)
+    Raises:
+        ModelOutputError: if nothing decodable is found
+    """
+    if text is None:
+        raise ModelOutputError("empty model output")
+    text = text.strip().lstrip("\ufeff")
+    try:
+        return json.loads(text), []
+    except ValueError:
+        pass
+
+    repairs = []
+    unfenced = _strip_fences(text)
+    if unfenced is not text:
+        repairs.append("fence")
+        text = unfenced.strip()
+
+    start = text.find("{")
+    if start == -1:
+        raise ModelOutputError("no JSON object in model output")
+    if start > 0:
+        repairs.append("leading_text")
+
+    try:
+        value, end = _decoder.raw_decode(text, start)
+        if text[end:].strip():
+            repairs.append("trailing_text")
+        return value, repairs
+    except ValueError:
+        pass
+
+    value = _close_truncated(text[start:])
+    if value is None:
+        raise ModelOutputError("unrepairable JSON in model output")
+    repairs.append("truncated")
+    return value, repairs
+
+
+def validate_envelope(value) -> Tuple[Dict, List[str]]:
+    """
+    Check a decoded value against the EKA output schema.
+
+    Returns:
+        (envelope, repairs) with sections of the wrong type dropped, including
+        a ``response_content`` that lacks a string ``visual_text``
+    Raises:
+        ModelOutputError: if the value is not a JSON object
+    """
+    repairs = []
+    if isinstance(value, str):
+        value, inner = repair_json(value)
+        repairs.append("double_encoded")
+        repairs.extend(inner)
+    if not isinstance(value, dict):
+        raise ModelOutputError(f"expected a JSON object, got {type(value).__name__}")
+    content = value.get("response_content")
+    if not isinstance(content, dict) or not isinstance(content.get("visual_text"), str):
+        # normalize_response substitutes its default response_content
+        value.pop("response_content", None)
+        repairs.append("missing_visual_text")
+    elif "audio_text" in content and not isinstance(content["audio_text"], str):
+        content.pop("audio_text")
+        repairs.append("dropped_field")
+    for field, expected in OPTIONAL_FIELDS.items():
+        if field in value and value[field] is not None and not isinstance(value[field], expected):
+            value.pop(field)
+            repairs.append("dropped_field")
+    return value, repairs
+
+
+class ResponseParser:
+    """
+    Parses model output into the EKA envelope and keeps per-provider counters.
+
+    Usage:
+        envelope = response_parser.parse(text, "gemini")
+        envelope = response_parser.parse_with_reask("claude", generate)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+
+    def parse(self, text: str, provider: str = "unknown") -> Dict:
+        """Repair and validate; raises ModelOutputError when the output is unusable."""
+        try:
+            value, repairs = repair_json(text)
+            envelope, fixes = validate_envelope(value)
+        except ModelOutputError:
+            self._count(provider, "unrepairable")
+            raise
+        repairs += fixes
+        if repairs:
+            logger.info(f"Repaired {provider} output: {', '.join(repairs)}")
+            self._count(provider, "repaired", repairs)
+        else:
+            self._count(provider, "clean")
+        return envelope
+
+    @staticmethod
+    def reask_turns(bad_output: str, error: Exception) -> List[Dict]:
+        """History-format turns that show the model its output and ask again."""
+        return [
+            {"role": "model", "parts": [{"text": bad_output or ""}]},
+            {"role": "user", "parts": [{"text": REASK_INSTRUCTION.format(error=error)}]},
+        ]
+
+    def parse_with_reask(self, provider: str, generate: Callable[[List[Dict]], str]) -> Dict:
+        """
+        ``generate(extra_turns)`` returns raw model text for the conversation
+        plus ``extra_turns``. Called once with no extra turns, and a second
+        time only if that output cannot be repaired.
+        """
+        text = generate([])
+        try:
+            return self.parse(text, provider)
+        except ModelOutputError as e:
+            self._count(provider, "reasks")
+            logger.warning(f"⚠️ Re-asking {provider} for valid JSON: {e}")
+            return self._parse_reasked(generate(self.reask_turns(text, e)), provider)
+
+    async def aparse_with_reask(self, provider: str, generate: Callable[[List[Dict]], Awaitable[str]]) -> Dict:
+        """Async variant of parse_with_reask()."""
+        text = await generate([])
+        try:
+            return self.parse(text, provider)
+        except ModelOutputError as e:
+            self._count(provider, "reasks")
+            logger.warning(f"⚠️ Re-asking {provider} for valid JSON: {e}")
+            return self._parse_reasked(await generate(self.reask_turns(text, e)), provider)
+
+    def _parse_reasked(self, text: str, provider: str) -> Dict:
+        try:
+            return self.parse(text, provider)
+        except ModelOutputError:
+            self._count(provider, "reask_failures")
+            raise
+
+    def _count(self, provider: str, name: str, repairs: Optional[List[str]] = None):
+        with self._lock:
+            stats = self._stats.setdefault(provider, {
+                "clean": 0, "repaired": 0, "unrepairable": 0, "reasks": 0, "reask_failures": 0, "repairs": {}
+            })
+            stats[name] += 1
+            for repair in repairs or ():
+                stats["repairs"][repair] = stats["repairs"].get(repair, 0) + 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {provider: {**stats, "repairs": dict(stats["repairs"])} for provider, stats in self._stats.items()}
+
+
+# Singleton instance for application use
+response_parser = ResponseParser()
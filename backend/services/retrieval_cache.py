@@ -0,0 +1,196 @@
+"""
+services/retrieval_cache.py
+Cache of knowledge base search results.
+
+RAGService.query and /api/kb/search both end in KnowledgeBaseManager.search,
+which embeds the query and runs the vector and BM25 searches on every call,
+although the same questions recur across workshops. Results are cached under
+
+    kb:ret:<index version>:<sha256 of query, filters, top_k, mode>
+
+- an in-process LRU (KB_RETRIEVAL_CACHE_SIZE entries) with a TTL
+- optionally Redis, shared by all workers, with the same TTL
+
+The query is lower-cased and whitespace-collapsed before hashing. The index
+version is a Redis counter (``kb:ret:version``) bumped whenever documents
+are added or removed, so every worker stops reading older entries at once;
+those simply age out. Without Redis the version and entries are per worker.
+Search failures are never cached.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_ENABLED = os.getenv("KB_RETRIEVAL_CACHE", "true").lower() == "true"
+CACHE_SIZE = int(os.getenv("KB_RETRIEVAL_CACHE_SIZE", "1024"))  # in-process entries per worker
+CACHE_TTL = int(os.getenv("KB_RETRIEVAL_CACHE_TTL", "3600"))  # seconds, both tiers
+KEY_PREFIX = "kb:ret:"
+VERSION_KEY = f"{KEY_PREFIX}version"
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def retrieval_key(version: int, query: str, top_k: int, filters: Optional[Dict] = None, mode: str = "") -> str:
+    payload = json.dumps([normalize_query(query), filters or None, top_k, mode], sort_keys=True, default=str)
+    return f"{KEY_PREFIX}{version}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class RetrievalCache:
+    """
+    Two-tier, index-versioned cache of search results (lists of JSON-able dicts).
+
+    Usage:
+        rows = retrieval_cache.get_or_search(query, top_k, filters, lambda: run_search(...), mode="hybrid")
+        retrieval_cache.bump()   # after documents are added or removed
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: int = CACHE_TTL,
+                 enabled: bool = CACHE_ENABLED, use_redis: bool = True, redis_client=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.redis = redis_client
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, rows)
+        self._version = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "redis_hits": 0, "misses": 0, "stored": 0,
+                       "expired": 0, "evicted": 0, "invalidations": 0, "redis_errors": 0}
+
+        if self.redis is None and enabled and use_redis and REDIS_AVAILABLE:
+            try:
+                self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+                self.redis.ping()
+            except Exception as e:
+                logger.warning(f"⚠️ Retrieval cache is per-worker only: {e}")
+                self.redis = None
+
+    # ─────────────────────────────────────────
+    # VERSION
+    # ─────────────────────────────────────────
+    def version(self) -> int:
+        """Current index version (shared through Redis when available)."""
+        if self.redis is not None:
+            try:
+                return int(self.redis.get(VERSION_KEY) or 0)
+            except Exception as e:
+                logger.warning(f"⚠️ Retrieval cache version read failed: {e}")
+                self._count("redis_errors")
+        return self._version
+
+    def bump(self) -> int:
+        """Invalidate every cached result; call whenever the indexed documents change."""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+            version = self._version
+        if self.redis is not None:
+            try:
+                version = int(self.redis.incr(VERSION_KEY))
+            except Exception as e:
+                logger.warning(f"⚠️ Retrieval cache version bump failed: {e}")
+                self._count("redis_errors")
+        return version
+
+    # ─────────────────────────────────────────
+    # LOOKUP
+    # ─────────────────────────────────────────
+    def get_or_search(self, query: str, top_k: int, filters: Optional[Dict],
+                      search: Callable[[], List[Dict]], mode: str = "") -> List[Dict]:
+        """Cached results for the search, calling ``search()`` only on a miss."""
+        if not self.enabled:
+            return search()
+        key = retrieval_key(self.version(), query, top_k, filters, mode)
+        rows = self._get(key)
+        if rows is not None:
+            return rows
+        rows = search()
+        self._put(key, rows)
+        return rows
+
+    def _get(self, key: str) -> Optional[List[Dict]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(entry[1])
+                del self._entries[key]
+                self._stats["expired"] += 1
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"⚠️ Retrieval cache read failed: {e}")
+                self._count("redis_errors")
+                raw = None
+            if raw is not None:
+                self._remember(key, raw)
+                self._count("redis_hits")
+                return json.loads(raw)
+
+        self._count("misses")
+        return None
+
+    def _put(self, key: str, rows: List[Dict]):
+        raw = json.dumps(rows, default=str)
+        self._remember(key, raw)
+        self._count("stored")
+        if self.redis is not None:
+            try:
+                self.redis.set(key, raw, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Retrieval cache write failed: {e}")
+                self._count("redis_errors")
+
+    def _remember(self, key: str, raw: str):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, raw)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def clear(self):
+        """Drop the in-process tier (Redis entries expire on their own)."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        stats["version"] = self.version()
+        stats["enabled"] = self.enabled
+        stats["redis"] = self.redis is not None
+        return stats
+
+
+# Singleton instance for application use
+retrieval_cache = RetrievalCache()
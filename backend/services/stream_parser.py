@@ -0,0 +1,187 @@
+"""
+services/stream_parser.py
+Incremental JSON parser for streamed model output.
+
+Models stream the EKA JSON envelope token by token. This parser consumes the
+raw chunks as they arrive and surfaces the decoded characters of one string
+field (``response_content.visual_text`` by default) while it is still being
+generated, so the UI can render text long before the closing brace arrives.
+"""
+import logging
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+VISUAL_TEXT_PATH = ("response_content", "visual_text")
+
+_ESCAPES = {
+    '"': '"', '\\': '\\', '/': '/',
+    'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t',
+}
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Character-level JSON state machine that tracks the current key path.
+
+    It does not build the document; it only follows structure well enough to
+    know when it is inside the target string and to decode that string's
+    escapes. The full raw text is kept in ``text`` for the final ``json.loads``.
+    Anything before the first ``{`` (e.g. a markdown fence) is ignored.
+
+    Usage:
+        parser = IncrementalJSONParser()
+        for chunk in stream:
+            delta = parser.feed(chunk)
+            if delta:
+                send(delta)
+        envelope = json.loads(parser.text)
+    """
+
+    def __init__(self, path: Tuple[str, ...] = VISUAL_TEXT_PATH):
+        self.path = tuple(path)
+        self.text = ""
+        self.value = ""
+        self.complete = False  # target string closed
+        self.finished = False  # root object closed
+
+        self._stack = []  # frames: {"type": "object"|"array", "key": str|None}
+        self._mode = "start"
+        self._string_is_key = False
+        self._string_is_target = False
+        self._key_buf = []
+        self._escape = False
+        self._unicode = None  # hex digits collected after \u
+        self._high_surrogate = None
+
+    def feed(self, chunk: str) -> str:
+        """
+        Consume a raw chunk of model output.
+
+        Returns:
+            Newly decoded characters of the target field (may be empty)
+        """
+        if not chunk:
+            return ""
+        self.text += chunk
+        out = []
+        for ch in chunk:
+            if self.finished:
+                break
+            self._consume(ch, out)
+        delta = "".join(out)
+        self.value += delta
+        return delta
+
+    # ─────────────────────────────────────────
+    # STATE MACHINE
+    # ─────────────────────────────────────────
+    def _current_path(self) -> Tuple:
+        return tuple(f["key"] if f["type"] == "object" else None for f in self._stack)
+
+    def _consume(self, ch: str, out: list):
+        mode = self._mode
+
+        if mode == "string":
+            self._consume_string(ch, out)
+        elif mode == "start":
+            if ch == "{":
+                self._stack.append({"type": "object", "key": None})
+                self._mode = "key"
+        elif mode == "key":
+            if ch == '"':
+                self._begin_string(is_key=True)
+            elif ch == "}":
+                self._close()
+        elif mode == "colon":
+            if ch == ":":
+                self._mode = "value"
+        elif mode == "value":
+            if ch in _WHITESPACE:
+                return
+            if ch == '"':
+                self._begin_string(is_key=False)
+            elif ch == "{":
+                self._stack.append({"type": "object", "key": None})
+                self._mode = "key"
+            elif ch == "[":
+                self._stack.append({"type": "array", "key": None})
+                self._mode = "value"
+            elif ch == "]":
+                self._close()
+            else:
+                self._mode = "scalar"
+        elif mode == "scalar":
+            if ch in _WHITESPACE or ch in ",}]":
+                self._mode = "after"
+                self._consume(ch, out)
+        elif mode == "after":
+            if ch == ",":
+                top = self._stack[-1] if self._stack else None
+                self._mode = "key" if top and top["type"] == "object" else "value"
+            elif ch in "}]":
+                self._close()
+
+    def _close(self):
+        if self._stack:
+            self._stack.pop()
+        if self._stack:
+            self._mode = "after"
+        else:
+            self._mode = "done"
+            self.finished = True
+
+    def _begin_string(self, is_key: bool):
+        self._mode = "string"
+        self._string_is_key = is_key
+        self._key_buf = []
+        self._string_is_target = (not is_key) and self._current_path() == self.path
+
+    def _emit(self, text: str, out: list):
+        if self._string_is_key:
+            self._key_buf.append(text)
+        elif self._string_is_target:
+            out.append(text)
+
+    def _consume_string(self, ch: str, out: list):
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) == 4:
+                self._emit(self._decode_unicode(self._unicode), out)
+                self._unicode = None
+            return
+
+        if self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = ""
+            else:
+                self._emit(_ESCAPES.get(ch, ch), out)
+            return
+
+        if ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            if self._string_is_key:
+                self._stack[-1]["key"] = "".join(self._key_buf)
+                self._mode = "colon"
+            else:
+                if self._string_is_target:
+                    self.complete = True
+                self._mode = "after"
+        else:
+            self._emit(ch, out)
+
+    def _decode_unicode(self, digits: str) -> str:
+        try:
+            code = int(digits, 16)
+        except ValueError:
+            return ""
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return ""
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        return chr(code)
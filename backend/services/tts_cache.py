@@ -0,0 +1,292 @@
+"""
+services/tts_cache.py
+Content-addressed on-disk cache for /api/speak audio.
+
+Clips are keyed by sha256(model, voice, normalized text) and stored as one
+file each under TTS_CACHE_DIR, so every Gunicorn worker (and the pre-warm
+job) shares the same store. File mtime doubles as the LRU clock: hits touch
+it, and when the store grows past TTS_CACHE_MAX_BYTES the least recently
+used clips are deleted.
+
+File layout: ``<dir>/<key[:2]>/<key>.audio`` holding the MIME type on the
+first line followed by the raw audio bytes.
+
+Pre-warm the fixed phrases at deploy time with:
+    python -m services.tts_cache
+"""
+import os
+import sys
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from services.llm_clients import model_clients, GEMINI_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "/tmp/eka_tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024
+TTS_VOICE = os.getenv("TTS_VOICE", "Kore")
+STREAM_CHUNK_SIZE = 16 * 1024
+EVICT_TARGET = 0.9  # evict down to this fraction of the cap
+SUFFIX = ".audio"
+
+# audio_text strings the chat router returns verbatim (normalize_response
+# defaults and the error/safety envelopes); synthesized by the pre-warm job
+FIXED_PHRASES = (
+    "Processing complete.",
+    "System error.",
+    "Request blocked due to safety policy.",
+    "Response withheld due to safety policy.",
+)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def _speech_config(voice: str) -> Dict:
+    return {
+        "response_modalities": ["AUDIO"],
+        "speech_config": {
+            "voice_config": {"prebuilt_voice_config": {"voice_name": voice}}
+        }
+    }
+
+
+def _audio_part(response) -> Tuple[str, bytes]:
+    for part in response.candidates[0].content.parts:
+        if part.inline_data and part.inline_data.mime_type.startswith('audio/'):
+            return part.inline_data.mime_type, part.inline_data.data
+    raise RuntimeError("No audio generated")
+
+
+def synthesize(text: str, voice: str) -> Tuple[str, bytes]:
+    """Gemini TTS; returns (mime type, audio bytes)."""
+    client = model_clients.gemini()
+    if client is None:
+        raise RuntimeError("TTS not configured")
+
+    with model_clients.slot("gemini"):
+        response = client.models.generate_content(
+            model=GEMINI_MODEL, contents=text, config=_speech_config(voice)
+        )
+    return _audio_part(response)
+
+
+async def asynthesize(text: str, voice: str) -> Tuple[str, bytes]:
+    """Async variant of synthesize() for the ASGI serving mode."""
+    client = model_clients.gemini_async()
+    if client is None:
+        raise RuntimeError("TTS not configured")
+
+    async with model_clients.aslot("gemini"):
+        response = await client.models.generate_content(
+            model=GEMINI_MODEL, contents=text, config=_speech_config(voice)
+        )
+    return _audio_part(response)
+
+
+class TTSCache:
+    """
+    Disk-backed LRU of synthesized clips with a total size cap.
+
+    Usage:
+        mime, path, hit = tts_cache.get_or_synthesize(text, voice)
+        audio = tts_cache.read(path)[1]           # whole clip
+        chunks = tts_cache.iter_chunks(path)      # streaming
+    """
+
+    def __init__(self, root: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES,
+                 synthesizer: Callable[[str, str], Tuple[str, bytes]] = synthesize):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.synthesizer = synthesizer
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None  # lazily scanned; approximate between sweeps
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ─────────────────────────────────────────
+    # KEYS / PATHS
+    # ─────────────────────────────────────────
+    @staticmethod
+    def key(text: str, voice: str) -> str:
+        raw = f"{GEMINI_MODEL}\x1f{voice}\x1f{normalize_text(text)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}{SUFFIX}")
+
+    # ─────────────────────────────────────────
+    # LOOKUP / STORE
+    # ─────────────────────────────────────────
+    def get(self, text: str, voice: str = TTS_VOICE) -> Optional[Tuple[str, str]]:
+        """(mime, path) of a cached clip, refreshing its LRU position; None on miss."""
+        path = self._path(self.key(text, voice))
+        try:
+            with open(path, "rb") as f:
+                mime = f.readline().decode().strip()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"❌ TTS cache read failed: {e}")
+            return None
+        return mime, path
+
+    def put(self, text: str, voice: str, mime: str, audio: bytes) -> str:
+        """Store a clip atomically and return its path."""
+        path = self._path(self.key(text, voice))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(mime.encode() + b"\n")
+                f.write(audio)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._scan_bytes()
+            else:
+                self._bytes += len(audio) + len(mime) + 1
+            over = self._bytes > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def lookup(self, text: str, voice: str = TTS_VOICE) -> Optional[Tuple[str, str]]:
+        """get() that counts towards the hit rate; callers synthesize and put() on a miss."""
+        cached = self.get(text, voice)
+        self._count("hits" if cached else "misses")
+        return cached
+
+    def get_or_synthesize(self, text: str, voice: str = TTS_VOICE) -> Tuple[str, str, bool]:
+        """
+        Cached clip for (voice, text), synthesizing and storing it on a miss.
+
+        Returns:
+            (mime, path, hit)
+        """
+        cached = self.lookup(text, voice)
+        if cached:
+            return cached[0], cached[1], True
+
+        mime, audio = self.synthesizer(normalize_text(text), voice)
+        return mime, self.put(text, voice, mime, audio), False
+
+    @staticmethod
+    def read(path: str) -> Tuple[str, bytes]:
+        with open(path, "rb") as f:
+            mime = f.readline().decode().strip()
+            return mime, f.read()
+
+    @staticmethod
+    def iter_chunks(path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """Audio bytes of a cached clip in fixed-size chunks (MIME header skipped)."""
+        with open(path, "rb") as f:
+            f.readline()
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    # ─────────────────────────────────────────
+    # EVICTION
+    # ─────────────────────────────────────────
+    def _entries(self):
+        """(mtime, size, path) for every stored clip."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(SUFFIX):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _scan_bytes(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """Delete least recently used clips until the store is under the target size."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * EVICT_TARGET)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass  # another worker evicted it
+            total -= size
+        with self._lock:
+            self._bytes = total
+            self.evictions += removed
+        if removed:
+            logger.info(f"TTS cache evicted {removed} clips ({total} bytes kept)")
+        return removed
+
+    # ─────────────────────────────────────────
+    # PRE-WARM / STATS
+    # ─────────────────────────────────────────
+    def prewarm(self, phrases=FIXED_PHRASES, voice: str = TTS_VOICE) -> Dict:
+        """Synthesize fixed phrases that are not cached yet."""
+        warmed, failed = 0, 0
+        for phrase in phrases:
+            if self.get(phrase, voice):
+                continue
+            try:
+                mime, audio = self.synthesizer(normalize_text(phrase), voice)
+                self.put(phrase, voice, mime, audio)
+                warmed += 1
+            except Exception as e:
+                failed += 1
+                logger.warning(f"⚠️ TTS pre-warm failed for {phrase!r}: {e}")
+        return {"warmed": warmed, "failed": failed, "total": len(phrases)}
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Singleton instance for application use
+tts_cache = TTSCache()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    result = tts_cache.prewarm()
+    logger.info(f"TTS pre-warm: {result}")
+    sys.exit(1 if result["failed"] else 0)
@@ -4,12 +4,20 @@ Implements Semantic Caching using Redis and Google Gemini Embeddings.
 This module provides "short-term memory" for the AI, reducing latency and costs.
 """
 import os
-import json
+import time
 import logging
 import hashlib
 from typing import Optional, List, Dict, Tuple
 from datetime import datetime, timedelta
 
+import numpy as np
+
+from services.embedding_cache import embedding_cache, QUERY_TASK
+from services.embedding_batcher import EmbeddingBatcher
+from services.local_vector_index import LocalVectorIndex
+from services.cache_stats import CacheStats
+from services.cache_budget import CacheBudget, MAX_ENTRIES
+
 # Configure Logging
 logger = logging.getLogger(__name__)
 
@@ -17,32 +25,125 @@ logger = logging.getLogger(__name__)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 EMBEDDING_MODEL = "models/embedding-001"
 SIMILARITY_THRESHOLD = 0.90  # Cosine similarity threshold (0-1)
+GLOBAL_SCOPE = "global"  # Scope tag for entries not bound to a context
 CACHE_TTL = 86400  # 24 hours in seconds
-MAX_CACHE_SIZE = 10000  # Maximum number of cached entries
+MAX_CACHE_SIZE = MAX_ENTRIES  # Maximum number of cached entries, enforced by CacheBudget
+KNN_K = 5  # neighbours considered by the KNN clause; only the nearest is returned
+SCORE_FIELD = "vector_score"  # cosine distance (1 - similarity) computed by RediSearch
+VECTOR_DIM = 768
+VECTOR_ALGORITHM = os.getenv("VECTOR_INDEX_ALGORITHM", "HNSW").upper()  # FLAT or HNSW
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))  # graph edges per node
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "200"))  # build-time candidate list
+HNSW_EF_RUNTIME = int(os.getenv("VECTOR_HNSW_EF_RUNTIME", "10"))  # query-time candidate list
+LOCAL_INDEX_ENABLED = os.getenv("LOCAL_INDEX_ENABLED", "true").lower() == "true"
+REDIS_RETRY_INTERVAL = float(os.getenv("VECTOR_REDIS_RETRY", "30"))  # seconds between reconnects
 
 # Lazy imports to handle missing dependencies gracefully
 try:
     import redis
-    from redis.commands.search.field import VectorField, TextField
+    from redis.commands.search.field import VectorField, TextField, TagField
     from redis.commands.search.index_definition import IndexDefinition, IndexType
+    from redis.commands.search.query import Query
     REDIS_AVAILABLE = True
+    REDIS_DOWN_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
 except ImportError as e:
     REDIS_AVAILABLE = False
+    REDIS_DOWN_ERRORS = ()
     logger.warning(f"Redis modules not available: {e}. Semantic caching disabled.")
 
 try:
     import google.generativeai as genai
-    import numpy as np
     GENAI_AVAILABLE = True
 except ImportError:
     GENAI_AVAILABLE = False
     logger.warning("Google Generative AI not available. Embeddings disabled.")
 
 
+def embed_queries(texts: List[str]) -> List[List[float]]:
+    """One Gemini call for a batch of query texts."""
+    result = genai.embed_content(
+        model=EMBEDDING_MODEL,
+        content=texts,
+        task_type=QUERY_TASK
+    )
+    return result['embedding']
+
+
+# Concurrent cache lookups share batched embedding calls
+query_batcher = EmbeddingBatcher(embed_queries, name="gemini_query")
+
+
+def vector_attributes(algorithm: str = None, m: int = None, ef_construction: int = None) -> Dict:
+    """VectorField attributes for the configured (or given) index algorithm."""
+    algorithm = (algorithm or VECTOR_ALGORITHM).upper()
+    attributes = {"TYPE": "FLOAT32", "DIM": VECTOR_DIM, "DISTANCE_METRIC": "COSINE"}
+    if algorithm == "HNSW":
+        attributes["M"] = m or HNSW_M
+        attributes["EF_CONSTRUCTION"] = ef_construction or HNSW_EF_CONSTRUCTION
+    elif algorithm != "FLAT":
+        raise ValueError(f"Unsupported vector index algorithm: {algorithm}")
+    return attributes
+
+
+def cache_schema(algorithm: str = None, m: int = None, ef_construction: int = None) -> Tuple:
+    return (
+        TextField("$.query", no_stem=True, as_name="query"),
+        TextField("$.response", no_stem=True, as_name="response"),
+        TagField("$.scope", as_name="scope"),
+        VectorField(
+            "$.vector",
+            (algorithm or VECTOR_ALGORITHM).upper(),
+            vector_attributes(algorithm, m, ef_construction),
+            as_name="vector"
+        )
+    )
+
+
+def physical_index_name(alias: str, algorithm: str = None, m: int = None, ef_construction: int = None) -> str:
+    """Physical index name encoding the settings that require a rebuild (EF_RUNTIME does not)."""
+    algorithm = (algorithm or VECTOR_ALGORITHM).upper()
+    if algorithm == "HNSW":
+        return f"{alias}:hnsw-m{m or HNSW_M}-efc{ef_construction or HNSW_EF_CONSTRUCTION}"
+    return f"{alias}:flat"
+
+
+def index_bytes(info: Dict) -> int:
+    """Index memory reported by FT.INFO, in bytes."""
+    if 'total_index_memory_sz_mb' in info:
+        return int(float(info['total_index_memory_sz_mb']) * 1024 * 1024)
+    fields = ('inverted_sz_mb', 'vector_index_sz_mb', 'offset_vectors_sz_mb', 'doc_table_size_mb',
+              'sortable_values_size_mb', 'key_table_size_mb')
+    return int(sum(float(info.get(f, 0) or 0) for f in fields) * 1024 * 1024)
+
+
+def delete_matching(client, pattern: str, batch: int = 500) -> int:
+    """Delete keys matching ``pattern`` with incremental SCAN (never KEYS)."""
+    deleted = 0
+    keys = []
+    for key in client.scan_iter(match=pattern, count=batch):
+        keys.append(key)
+        if len(keys) >= batch:
+            deleted += client.unlink(*keys)
+            keys = []
+    if keys:
+        deleted += client.unlink(*keys)
+    return deleted
+
+
+def to_vector_bytes(vector) -> bytes:
+    """FLOAT32 blob for a RediSearch vector query parameter."""
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
 class VectorEngine:
     """
     Semantic caching engine using Redis and Gemini embeddings.
     Reduces AI inference costs by caching similar queries.
+    
+    While Redis is unreachable, entries are searched and stored in a
+    per-worker LocalVectorIndex instead; reconnection is retried every
+    REDIS_RETRY_INTERVAL seconds and entries written in the meantime are
+    copied to Redis once it is back.
     """
     
     def __init__(self):
@@ -50,17 +151,14 @@ class VectorEngine:
         self.redis = None
         self.index_name = "semantic_cache_idx"
         self.doc_prefix = "cache:"
+        self.local = LocalVectorIndex() if LOCAL_INDEX_ENABLED else None
+        self._last_connect = 0.0
+        self.stats = CacheStats(lambda: self.redis)
+        self.budget = CacheBudget(lambda: self.redis, prefix=self.doc_prefix,
+                                  on_evict=self.stats.record_evictions)
         
         # Initialize Redis connection
-        if REDIS_AVAILABLE:
-            try:
-                self.redis = redis.from_url(REDIS_URL, decode_responses=True)
-                self.redis.ping()
-                logger.info("✅ Vector Engine connected to Redis.")
-                self._ensure_index()
-            except Exception as e:
-                logger.error(f"❌ Failed to connect to Redis: {e}")
-                self.redis = None
+        self._connect()
         
         # Initialize Gemini
         if GENAI_AVAILABLE:
@@ -76,54 +174,140 @@ class VectorEngine:
                 logger.error(f"❌ Failed to configure Gemini: {e}")
                 self.genai = None
     
+    def _connect(self):
+        if not REDIS_AVAILABLE:
+            return
+        self._last_connect = time.monotonic()
+        try:
+            self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+            self.redis.ping()
+            logger.info("✅ Vector Engine connected to Redis.")
+            self._ensure_index()
+        except Exception as e:
+            logger.error(f"❌ Failed to connect to Redis: {e}")
+            self.redis = None
+    
+    def _redis_ready(self) -> bool:
+        """Whether Redis is usable, reconnecting (and resyncing) when the retry interval has passed."""
+        if self.redis:
+            return True
+        if not REDIS_AVAILABLE or time.monotonic() - self._last_connect < REDIS_RETRY_INTERVAL:
+            return False
+        self._connect()
+        if self.redis:
+            self._resync()
+        return self.redis is not None
+    
+    def _redis_down(self, error: Exception):
+        logger.warning(f"⚠️ Redis unreachable, semantic cache degraded to local index: {error}")
+        self.redis = None
+        self._last_connect = time.monotonic()
+    
+    def _resync(self):
+        """Copy entries cached locally during the outage into Redis."""
+        if self.local is None:
+            return
+        pending = self.local.drain_pending()
+        copied = 0
+        for key, vector, entry in pending:
+            doc = {k: v for k, v in entry.items() if k not in ("key", "expires_at")}
+            try:
+                self.redis.json().set(key, '$', {**doc, 'vector': vector})
+                remaining = entry["expires_at"] - time.time() if entry["expires_at"] else CACHE_TTL
+                self.redis.expire(key, max(1, int(remaining)))
+                copied += 1
+            except Exception as e:
+                logger.error(f"❌ Semantic cache resync stopped after {copied} entries: {e}")
+                break
+        if pending:
+            logger.info(f"✅ Resynced {copied}/{len(pending)} locally cached entries to Redis")
+    
     def _ensure_index(self):
-        """Create RediSearch index if it doesn't exist."""
+        """
+        Make ``index_name`` point at an index built with the configured
+        algorithm, creating or migrating it as needed.
+        
+        ``index_name`` is an alias for a physical index named after its
+        settings (e.g. ``semantic_cache_idx:hnsw-m16-efc200``). When the
+        settings change, a new physical index is created over the same
+        ``cache:`` documents (RediSearch backfills it in the background),
+        the alias is moved to it and the old index is dropped WITHOUT its
+        documents, so no cached entries are lost. Lookups during the
+        backfill may miss; they never fail.
+        """
         if not self.redis:
             return
         
+        target = physical_index_name(self.index_name)
         try:
-            # Check if index exists
+            current = None
             try:
-                self.redis.ft(self.index_name).info()
-                logger.debug(f"Index {self.index_name} already exists.")
-                return
-            except:
+                info = self.redis.ft(self.index_name).info()
+                current = info.get('index_name', self.index_name) if isinstance(info, dict) else self.index_name
+            except Exception:
                 pass
             
-            # Create index
-            schema = (
-                TextField("$.query", no_stem=True, as_name="query"),
-                TextField("$.response", no_stem=True, as_name="response"),
-                VectorField(
-                    "$.vector",
-                    "FLAT",
-                    {
-                        "TYPE": "FLOAT32",
-                        "DIM": 768,
-                        "DISTANCE_METRIC": "COSINE"
-                    },
-                    as_name="vector"
-                )
-            )
-            
-            definition = IndexDefinition(
-                prefix=[self.doc_prefix],
-                index_type=IndexType.JSON
-            )
+            if current == target:
+                logger.debug(f"Index {target} already exists.")
+                self._ensure_scope_field(info)
+                return
             
-            self.redis.ft(self.index_name).create_index(
-                fields=schema,
-                definition=definition
-            )
-            logger.info(f"✅ Created RediSearch index: {self.index_name}")
+            self._create_index(target)
+            if current is None:
+                self.redis.ft(target).aliasadd(self.index_name)
+            elif current == self.index_name:
+                # Index from before aliasing: it owns the name the alias needs
+                self.redis.ft(current).dropindex(delete_documents=False)
+                self.redis.ft(target).aliasadd(self.index_name)
+            else:
+                self.redis.ft(target).aliasupdate(self.index_name)
+                self.redis.ft(current).dropindex(delete_documents=False)
+            if current is not None:
+                logger.info(f"🔁 Migrated semantic cache index {current} -> {target}; "
+                            f"cached entries are re-indexed in the background")
             
         except Exception as e:
             logger.error(f"❌ Failed to create index: {e}")
     
+    def _create_index(self, name: str):
+        try:
+            self.redis.ft(name).info()
+            return  # another worker created it first
+        except Exception:
+            pass
+        
+        definition = IndexDefinition(
+            prefix=[self.doc_prefix],
+            index_type=IndexType.JSON
+        )
+        
+        self.redis.ft(name).create_index(
+            fields=cache_schema(),
+            definition=definition
+        )
+        logger.info(f"✅ Created RediSearch index: {name} ({VECTOR_ALGORITHM})")
+    
+    def _ensure_scope_field(self, info: Dict):
+        """Add the scope TAG to indexes created before scoped caching."""
+        attributes = info.get('attributes', []) if isinstance(info, dict) else []
+        if any('scope' in attr for attr in attributes):
+            return
+        try:
+            self.redis.ft(physical_index_name(self.index_name)).alter_schema_add(
+                [TagField("$.scope", as_name="scope")]
+            )
+            logger.info(f"✅ Added scope field to index {self.index_name}")
+        except Exception as e:
+            logger.error(f"❌ Failed to add scope field: {e}")
+    
     def get_embedding(self, text: str) -> Optional[List[float]]:
         """
         Generate embedding vector for the given text using Gemini.
         
+        Served from the shared embedding cache when the same text was
+        embedded before, so a miss in search_cache followed by
+        cache_response costs one Gemini call, not two.
+        
         Args:
             text: Input text to embed
             
@@ -132,14 +316,11 @@ class VectorEngine:
         """
         if not GENAI_AVAILABLE:
             return None
-        
+        return embedding_cache.get_or_embed(EMBEDDING_MODEL, QUERY_TASK, text, self._embed)
+    
+    def _embed(self, text: str) -> Optional[List[float]]:
         try:
-            result = genai.embed_content(
-                model=EMBEDDING_MODEL,
-                content=text,
-                task_type="retrieval_query"
-            )
-            return result['embedding']
+            return query_batcher.embed(text)
         except Exception as e:
             logger.error(f"❌ Embedding generation failed: {e}")
             return None
@@ -156,29 +337,66 @@ class VectorEngine:
             Similarity score between 0 and 1
         """
         try:
-            dot_product = sum(a * b for a, b in zip(v1, v2))
-            norm_v1 = sum(a * a for a in v1) ** 0.5
-            norm_v2 = sum(b * b for b in v2) ** 0.5
-            
-            if norm_v1 == 0 or norm_v2 == 0:
+            a = np.asarray(v1, dtype=np.float32)
+            b = np.asarray(v2, dtype=np.float32)
+            norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+            if a.shape != b.shape or norm == 0:
                 return 0.0
-            
-            return dot_product / (norm_v1 * norm_v2)
+            return float(np.dot(a, b)) / norm
         except Exception as e:
             logger.error(f"❌ Similarity calculation failed: {e}")
             return 0.0
     
-    def search_cache(self, query_text: str) -> Optional[Dict]:
+    @staticmethod
+    def knn_query(scope: str, k: int = KNN_K, ef_runtime: Optional[int] = None) -> "Query":
+        """
+        Nearest cached entry within ``scope``, returning only the fields a hit
+        needs plus RediSearch's own distance (the stored vector is never sent back).
+        
+        On an HNSW index ``ef_runtime`` (default VECTOR_HNSW_EF_RUNTIME) trades
+        latency for recall per query; pass 0 to omit it (FLAT index).
+        """
+        if ef_runtime is None:
+            ef_runtime = HNSW_EF_RUNTIME if VECTOR_ALGORITHM == "HNSW" else 0
+        ef = f" EF_RUNTIME {ef_runtime}" if ef_runtime else ""
+        return (
+            Query(f"(@scope:{{{scope}}})=>[KNN {k} @vector $vec{ef} AS {SCORE_FIELD}]")
+            .sort_by(SCORE_FIELD)
+            .return_field(SCORE_FIELD)
+            .return_field("response")
+            .return_field("query")
+            .return_field("scope")
+            .return_field("$.timestamp", as_field="timestamp")
+            .return_field("$.latency_ms", as_field="latency_ms")
+            .paging(0, 1)
+            .dialect(2)
+        )
+    
+    def search_cache(self, query_text: str, scope: str = GLOBAL_SCOPE) -> Optional[Dict]:
         """
         Semantic search against the Redis cache.
         
         Args:
             query_text: User query to search for
+            scope: Context tag; only entries cached under the same scope match
             
         Returns:
             Cached response dict with 'text', 'similarity', 'timestamp' or None
         """
-        if not self.redis:
+        started = time.perf_counter()
+        hit = self._search(query_text, scope)
+        if hit:
+            saved = None
+            if hit.get('latency_ms') is not None:
+                saved = float(hit['latency_ms']) - (time.perf_counter() - started) * 1000
+            self.stats.record_hit(saved)
+        else:
+            self.stats.record_miss()
+        return hit
+    
+    def _search(self, query_text: str, scope: str) -> Optional[Dict]:
+        use_redis = self._redis_ready()
+        if not use_redis and self.local is None:
             logger.debug("Redis not available, skipping cache search.")
             return None
         
@@ -188,44 +406,71 @@ class VectorEngine:
             if not query_vector:
                 return None
             
-            # Search using RediSearch
-            # Convert vector to bytes for RediSearch
-            query_vector_bytes = np.array(query_vector, dtype=np.float32).tobytes()
+            if use_redis:
+                try:
+                    # Perform KNN search, pre-filtered to the caller's scope
+                    results = self.redis.ft(self.index_name).search(
+                        self.knn_query(scope),
+                        query_params={"vec": to_vector_bytes(query_vector)}
+                    )
+                    
+                    if not results or not results.docs:
+                        logger.debug("No cache hits found.")
+                        return None
+                    
+                    return self._match(results.docs[0], scope)
+                except REDIS_DOWN_ERRORS as e:
+                    self._redis_down(e)
+                    if self.local is None:
+                        return None
             
-            # Perform KNN search
-            results = self.redis.ft(self.index_name).search(
-                f"*=>[KNN 5 @vector $vec]",
-                query_params={"vec": query_vector_bytes}
-            )
-            
-            if not results or not results.docs:
-                logger.debug("No cache hits found.")
-                return None
-            
-            # Check similarity for top result
-            top_doc = results.docs[0]
-            doc_data = json.loads(top_doc.json)
-            
-            cached_vector = doc_data.get('vector', [])
-            similarity = self.cosine_similarity(query_vector, cached_vector)
-            
-            if similarity >= SIMILARITY_THRESHOLD:
-                logger.info(f"✅ Cache HIT (similarity: {similarity:.3f})")
-                return {
-                    'text': doc_data.get('response'),
-                    'similarity': similarity,
-                    'query': doc_data.get('query'),
-                    'timestamp': doc_data.get('timestamp')
-                }
-            else:
-                logger.debug(f"Cache MISS (similarity too low: {similarity:.3f})")
-                return None
+            return self._match_local(query_vector, scope)
                 
         except Exception as e:
             logger.error(f"❌ Cache search failed: {e}")
             return None
     
-    def cache_response(self, query_text: str, response_text: str, metadata: Dict = None):
+    def _match(self, top_doc, scope: str) -> Optional[Dict]:
+        """Turn the nearest document into a hit if it clears the threshold."""
+        # Guard: never serve an entry from a different context
+        if getattr(top_doc, 'scope', GLOBAL_SCOPE) != scope:
+            logger.warning(f"Cache scope mismatch for {top_doc.id}, ignoring")
+            return None
+        
+        # RediSearch COSINE distance is 1 - cosine similarity
+        similarity = 1.0 - float(getattr(top_doc, SCORE_FIELD))
+        hit = self._hit(similarity, getattr(top_doc, 'response', None), getattr(top_doc, 'query', None),
+                        getattr(top_doc, 'timestamp', None), getattr(top_doc, 'latency_ms', None))
+        if hit:
+            self.budget.touch(top_doc.id)
+        return hit
+    
+    def _match_local(self, query_vector: List[float], scope: str) -> Optional[Dict]:
+        """Degraded-mode lookup in the in-process index (already scope-filtered)."""
+        match = self.local.search(query_vector, scope)
+        if not match:
+            return None
+        similarity, entry = match
+        return self._hit(similarity, entry.get('response'), entry.get('query'), entry.get('timestamp'),
+                         entry.get('latency_ms'))
+    
+    def _hit(self, similarity: float, text, query, timestamp, latency_ms=None) -> Optional[Dict]:
+        self.stats.record_similarity(similarity)
+        if similarity >= SIMILARITY_THRESHOLD:
+            logger.info(f"✅ Cache HIT (similarity: {similarity:.3f})")
+            return {
+                'text': text,
+                'similarity': similarity,
+                'query': query,
+                'timestamp': timestamp,
+                'latency_ms': latency_ms
+            }
+        logger.debug(f"Cache MISS (similarity too low: {similarity:.3f})")
+        return None
+    
+    def cache_response(self, query_text: str, response_text: str, metadata: Dict = None,
+                       scope: str = GLOBAL_SCOPE, latency_ms: Optional[float] = None,
+                       owner: Optional[str] = None):
         """
         Store the query vector and response in Redis.
         
@@ -233,8 +478,13 @@ class VectorEngine:
             query_text: Original query
             response_text: AI response to cache
             metadata: Optional metadata dict
+            scope: Context tag the entry is valid for
+            latency_ms: How long the model took to produce the response;
+                a later hit counts this (minus lookup time) as latency saved
+            owner: Workshop whose request produced the entry (quota accounting)
         """
-        if not self.redis:
+        use_redis = self._redis_ready()
+        if not use_redis and self.local is None:
             logger.debug("Redis not available, skipping cache write.")
             return
         
@@ -245,40 +495,71 @@ class VectorEngine:
                 return
             
             # Create unique key
-            key_hash = hashlib.md5(query_text.encode()).hexdigest()[:12]
+            key_hash = hashlib.md5(f"{scope}:{query_text}".encode()).hexdigest()[:12]
             key = f"{self.doc_prefix}{key_hash}"
             
             # Prepare document
             doc = {
                 'query': query_text,
                 'response': response_text,
+                'scope': scope,
                 'vector': query_vector,
                 'timestamp': datetime.utcnow().isoformat(),
                 'metadata': metadata or {}
             }
+            if latency_ms is not None:
+                doc['latency_ms'] = round(latency_ms, 1)
+            self.stats.record_store()
             
-            # Store in Redis with TTL
-            self.redis.json().set(key, '$', doc)
-            self.redis.expire(key, CACHE_TTL)
+            if use_redis:
+                try:
+                    # Store in Redis with TTL
+                    self.redis.json().set(key, '$', doc)
+                    self.redis.expire(key, CACHE_TTL)
+                    logger.info(f"✅ Cached response for query (key: {key})")
+                    self.budget.admit(key, owner)
+                    return
+                except REDIS_DOWN_ERRORS as e:
+                    self._redis_down(e)
+                    if self.local is None:
+                        return
             
-            logger.info(f"✅ Cached response for query (key: {key})")
+            # Degraded mode: keep it locally until Redis is back
+            entry = {k: v for k, v in doc.items() if k != 'vector'}
+            self.local.add(key, query_vector, entry, ttl=CACHE_TTL, pending=True)
+            logger.info(f"✅ Cached response in local index (key: {key})")
             
         except Exception as e:
             logger.error(f"❌ Failed to cache response: {e}")
     
     def get_cache_stats(self) -> Dict:
-        """Get cache statistics."""
+        """
+        Cache statistics from FT.INFO and the shared counters.
+        
+        Constant cost regardless of cache size: one FT.INFO and one HGETALL
+        (never a key scan), so it is safe on every metrics scrape.
+        """
+        telemetry = self.stats.snapshot()
         if not self.redis:
-            return {'status': 'disabled'}
+            if self.local is not None:
+                return {'status': 'degraded', 'local_index': self.local.get_stats(),
+                        'threshold': SIMILARITY_THRESHOLD, **telemetry}
+            return {'status': 'disabled', **telemetry}
         
         try:
-            # Count keys with prefix
-            keys = self.redis.keys(f"{self.doc_prefix}*")
+            info = self.redis.ft(self.index_name).info()
             return {
                 'status': 'active',
-                'entries': len(keys),
+                'index': info.get('index_name'),
+                'algorithm': VECTOR_ALGORITHM,
+                'entries': int(info.get('num_docs', 0)),
+                'bytes_used': index_bytes(info),
+                'indexing': float(info.get('percent_indexed', 1)) < 1.0,
+                'max_entries': self.budget.max_entries,
+                'eviction_policy': self.budget.policy,
                 'ttl_hours': CACHE_TTL / 3600,
-                'threshold': SIMILARITY_THRESHOLD
+                'threshold': SIMILARITY_THRESHOLD,
+                **telemetry
             }
         except Exception as e:
             logger.error(f"❌ Failed to get stats: {e}")
@@ -289,21 +570,22 @@ class VectorEngine:
 vector_engine = VectorEngine()
 
 
-def get_cached_response(query: str) -> Optional[str]:
+def get_cached_response(query: str, scope: str = GLOBAL_SCOPE) -> Optional[str]:
     """
     Convenience function to check cache for a query.
     
     Args:
         query: User query string
+        scope: Context tag the answer must belong to
         
     Returns:
         Cached response text or None
     """
-    result = vector_engine.search_cache(query)
+    result = vector_engine.search_cache(query, scope)
     return result['text'] if result else None
 
 
-def cache_response(query: str, response: str, metadata: Dict = None):
+def cache_response(query: str, response: str, metadata: Dict = None, scope: str = GLOBAL_SCOPE):
     """
     Convenience function to cache a response.
     
@@ -311,5 +593,6 @@ def cache_response(query: str, response: str, metadata: Dict = None):
         query: Original query
         response: AI response
         metadata: Optional metadata
+        scope: Context tag the answer belongs to
     """
-    vector_engine.cache_response(query, response, metadata)
+    vector_engine.cache_response(query, response, metadata, scope)
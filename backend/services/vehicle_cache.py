@@ -0,0 +1,233 @@
+"""
+services/vehicle_cache.py
+TTL/LRU cache for vehicle context lookups by registration number.
+
+A chat conversation sends the same registrationNumber on every turn, so the
+`vehicles` row is cached in-process (LRU + TTL) and, when Redis is reachable,
+in a shared Redis tier so all Gunicorn workers benefit from one lookup.
+Unknown plates are cached too (negative caching) with a shorter TTL.
+
+Every invalidation bumps a per-plate generation (in-process and, shared
+across workers, ``vehicle:gen:<plate>`` in Redis). A load that started
+before an invalidation sees the generation change and does not write its
+now-stale row back.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+VEHICLE_CACHE_SIZE = int(os.getenv("VEHICLE_CACHE_SIZE", "2048"))
+VEHICLE_CACHE_TTL = int(os.getenv("VEHICLE_CACHE_TTL", "600"))  # seconds
+VEHICLE_NEGATIVE_TTL = int(os.getenv("VEHICLE_NEGATIVE_TTL", "60"))  # seconds, unknown plates
+VEHICLE_LOCAL_TTL = int(os.getenv("VEHICLE_LOCAL_TTL", "15"))  # local tier TTL when Redis is shared
+KEY_PREFIX = "vehicle:reg:"
+GEN_PREFIX = "vehicle:gen:"
+_MISSING = "__missing__"  # stored marker for unknown plates
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def normalize_registration(reg_number: str) -> str:
+    """Plate form used for keys; matches the upper-cased DB lookup."""
+    return (reg_number or "").strip().upper()
+
+
+class VehicleCache:
+    """
+    Two-tier vehicle row cache.
+
+    With Redis available the local tier only holds entries for a few seconds,
+    which bounds staleness in other workers after an invalidation; Redis is
+    the shared source of truth for the full TTL.
+    """
+
+    def __init__(self, use_redis: bool = True):
+        self._local = OrderedDict()  # plate -> (expires_at, row or None)
+        self._generations: Dict[str, int] = {}  # plate -> local invalidation count
+        self._lock = threading.Lock()
+        self.redis = None
+        self.hits = 0
+        self.redis_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_loads = 0
+
+        if use_redis and REDIS_AVAILABLE:
+            try:
+                self.redis = redis.from_url(REDIS_URL, decode_responses=True)
+                self.redis.ping()
+                logger.info("✅ Vehicle cache using shared Redis tier")
+            except Exception as e:
+                logger.warning(f"⚠️ Vehicle cache running in-process only: {e}")
+                self.redis = None
+
+    # ─────────────────────────────────────────
+    # LOOKUP
+    # ─────────────────────────────────────────
+    def get_or_load(self, reg_number: str, loader: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Return the cached vehicle row for ``reg_number``, calling ``loader`` on a miss.
+
+        ``loader`` receives the normalized registration and returns the row or
+        None. Loader exceptions propagate and nothing is cached for them.
+        """
+        plate = normalize_registration(reg_number)
+        if not plate:
+            return None
+
+        found, row = self._get_local(plate)
+        if found:
+            self._count(hit=True, negative=row is None)
+            return row
+
+        found, row = self._get_redis(plate)
+        if found:
+            self._put_local(plate, row)
+            self._count(hit=True, negative=row is None, redis_hit=True)
+            return row
+
+        self._count(hit=False)
+        generation = self._generation(plate)
+        row = loader(plate)
+        if self._generation(plate) != generation:
+            # Invalidated while loading: serve the row but don't cache it
+            with self._lock:
+                self.stale_loads += 1
+            return row
+        self.set(plate, row)
+        return row
+
+    def set(self, reg_number: str, row: Optional[Dict]):
+        """Cache a row (or its absence) for a plate."""
+        plate = normalize_registration(reg_number)
+        if not plate:
+            return
+        self._put_local(plate, row)
+        if self.redis:
+            ttl = VEHICLE_CACHE_TTL if row is not None else VEHICLE_NEGATIVE_TTL
+            try:
+                payload = json.dumps(row, default=str) if row is not None else _MISSING
+                self.redis.set(f"{KEY_PREFIX}{plate}", payload, ex=ttl)
+            except Exception as e:
+                logger.error(f"❌ Vehicle cache write failed: {e}")
+
+    def invalidate(self, reg_number: str):
+        """Drop a plate from both tiers (call whenever its vehicle row changes)."""
+        plate = normalize_registration(reg_number)
+        if not plate:
+            return
+        with self._lock:
+            self._local.pop(plate, None)
+            self._generations[plate] = self._generations.get(plate, 0) + 1
+            self.invalidations += 1
+        if self.redis:
+            try:
+                self.redis.incr(f"{GEN_PREFIX}{plate}")
+                self.redis.expire(f"{GEN_PREFIX}{plate}", VEHICLE_CACHE_TTL)
+                self.redis.delete(f"{KEY_PREFIX}{plate}")
+            except Exception as e:
+                logger.error(f"❌ Vehicle cache invalidation failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    # ─────────────────────────────────────────
+    # TIERS
+    # ─────────────────────────────────────────
+    def _get_local(self, plate: str):
+        with self._lock:
+            entry = self._local.get(plate)
+            if entry is None:
+                return False, None
+            expires_at, row = entry
+            if expires_at < time.time():
+                del self._local[plate]
+                return False, None
+            self._local.move_to_end(plate)
+            return True, row
+
+    def _put_local(self, plate: str, row: Optional[Dict]):
+        ttl = VEHICLE_CACHE_TTL if row is not None else VEHICLE_NEGATIVE_TTL
+        if self.redis:
+            ttl = min(ttl, VEHICLE_LOCAL_TTL)
+        with self._lock:
+            self._local[plate] = (time.time() + ttl, row)
+            self._local.move_to_end(plate)
+            while len(self._local) > VEHICLE_CACHE_SIZE:
+                self._local.popitem(last=False)
+
+    def _generation(self, plate: str) -> Tuple[int, Optional[str]]:
+        """Local and shared invalidation counts for a plate."""
+        with self._lock:
+            local = self._generations.get(plate, 0)
+        shared = None
+        if self.redis:
+            try:
+                shared = self.redis.get(f"{GEN_PREFIX}{plate}")
+            except Exception as e:
+                logger.error(f"❌ Vehicle cache generation read failed: {e}")
+        return local, shared
+
+    def _get_redis(self, plate: str):
+        if not self.redis:
+            return False, None
+        try:
+            raw = self.redis.get(f"{KEY_PREFIX}{plate}")
+        except Exception as e:
+            logger.error(f"❌ Vehicle cache read failed: {e}")
+            return False, None
+        if raw is None:
+            return False, None
+        if raw == _MISSING:
+            return True, None
+        try:
+            return True, json.loads(raw)
+        except ValueError:
+            return False, None
+
+    # ─────────────────────────────────────────
+    # STATS
+    # ─────────────────────────────────────────
+    def _count(self, hit: bool, negative: bool = False, redis_hit: bool = False):
+        with self._lock:
+            if not hit:
+                self.misses += 1
+                return
+            self.hits += 1
+            if negative:
+                self.negative_hits += 1
+            if redis_hit:
+                self.redis_hits += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._local),
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "stale_loads": self.stale_loads,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "shared": self.redis is not None,
+            }
+
+
+# Singleton instance for application use
+vehicle_cache = VehicleCache()
@@ -0,0 +1,151 @@
+"""
+Unit tests for the WSGI/ASGI view bridge (Deferred upstream calls)
+Run with: python -m unittest backend.tests.test_async_bridge
+"""
+
+import unittest
+import asyncio
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify, request, g
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from middleware.async_bridge import AsgiBridge, Deferred, resolve, is_async_request
+
+
+async def call(app, method, path, payload=None, headers=()):
+    """Drive one HTTP request through an ASGI app; returns (status, headers, body)."""
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": b"",
+        "root_path": "", "http_version": "1.1", "scheme": "http",
+        "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(b"content-type", b"application/json"), *headers],
+    }
+    messages = [{"type": "http.request", "body": json.dumps(payload).encode() if payload else b""}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    headers = {k.decode(): v.decode() for k, v in sent[0]["headers"]}
+    return sent[0]["status"], headers, b"".join(m.get("body", b"") for m in sent[1:])
+
+
+class TestBridge(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = {"run": 0, "arun": 0}
+        app = Flask(__name__)
+
+        @app.before_request
+        def set_workshop():
+            g.workshop_id = "ws1"
+
+        @app.route("/api/chat", methods=["POST"])
+        def chat():
+            question = request.get_json()["q"]
+
+            def run():
+                self.calls["run"] += 1
+                time.sleep(0.2)
+                return question.upper()
+
+            async def arun():
+                self.calls["arun"] += 1
+                await asyncio.sleep(0.2)
+                if question == "boom":
+                    raise RuntimeError("provider down")
+                return question.upper()
+
+            def finish(answer):
+                return jsonify({"answer": answer, "workshop": g.workshop_id, "async": is_async_request()})
+
+            return resolve(Deferred(run=run, arun=arun, finish=finish,
+                                    on_error=lambda e: (jsonify({"error": str(e)}), 502)))
+
+        @app.route("/api/job-cards", methods=["GET"])
+        def job_cards():
+            return jsonify({"async": is_async_request()})
+
+        self.app = app
+        self.bridge = AsgiBridge(app, ["/api/chat"], threads=2)
+
+    def test_wsgi_runs_upstream_inline(self):
+        response = self.app.test_client().post("/api/chat", json={"q": "brakes"})
+        self.assertEqual(response.get_json(), {"answer": "BRAKES", "workshop": "ws1", "async": False})
+        self.assertEqual(self.calls, {"run": 1, "arun": 0})
+
+    def test_asgi_awaits_upstream_with_request_context(self):
+        status, headers, body = asyncio.run(call(self.bridge, "POST", "/api/chat", {"q": "brakes"}))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["content-type"], "application/json")
+        self.assertEqual(json.loads(body), {"answer": "BRAKES", "workshop": "ws1", "async": True})
+        self.assertEqual(self.calls, {"run": 0, "arun": 1})
+
+    def test_upstream_error_goes_to_on_error(self):
+        status, _, body = asyncio.run(call(self.bridge, "POST", "/api/chat", {"q": "boom"}))
+        self.assertEqual((status, json.loads(body)), (502, {"error": "provider down"}))
+
+    def test_awaited_calls_do_not_hold_threads(self):
+        """Twenty 200ms upstream calls through a 2-thread pool finish in about one call's time."""
+        async def burst():
+            return await asyncio.gather(*(
+                call(self.bridge, "POST", "/api/chat", {"q": f"q{i}"}) for i in range(20)
+            ))
+
+        started = time.perf_counter()
+        results = asyncio.run(burst())
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertTrue(all(status == 200 for status, _, _ in results))
+        self.assertEqual(self.bridge.get_stats()["peak_awaiting_upstream"], 20)
+
+    def test_other_routes_run_as_plain_wsgi(self):
+        status, _, body = asyncio.run(call(self.bridge, "GET", "/api/job-cards"))
+        self.assertEqual((status, json.loads(body)), (200, {"async": False}))
+        self.assertEqual(self.bridge.get_stats()["sync_requests"], 1)
+
+    def test_async_requests_go_through_wsgi_middleware(self):
+        @self.app.route("/api/speak", methods=["POST"])
+        def speak():
+            return resolve(Deferred(run=lambda: None, arun=lambda: asyncio.sleep(0), finish=lambda _: jsonify(
+                {"ip": request.remote_addr, "scheme": request.scheme})))
+
+        self.app.wsgi_app = ProxyFix(self.app.wsgi_app, x_for=1, x_proto=1)
+        bridge = AsgiBridge(self.app, ["/api/speak"], threads=2)
+        forwarded = [(b"x-forwarded-for", b"1.2.3.4"), (b"x-forwarded-proto", b"https")]
+        _, _, body = asyncio.run(call(bridge, "POST", "/api/speak", {}, headers=forwarded))
+        self.assertEqual(json.loads(body), {"ip": "1.2.3.4", "scheme": "https"})
+        self.assertEqual(bridge.get_stats()["async_requests"], 1)
+
+    def test_lifespan_runs_hooks(self):
+        events = []
+
+        async def startup():
+            events.append("startup")
+
+        bridge = AsgiBridge(self.app, [], on_startup=startup, on_shutdown=lambda: events.append("shutdown"))
+        incoming = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(bridge({"type": "lifespan"}, receive, send))
+        self.assertEqual(events, ["startup", "shutdown"])
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+
+if __name__ == '__main__':
+    unittest.main()
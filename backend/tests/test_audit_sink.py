@@ -0,0 +1,168 @@
+"""
+Unit tests for the batched audit sink
+Run with: python -m unittest backend.tests.test_audit_sink
+"""
+
+import unittest
+import tempfile
+import shutil
+import subprocess
+import json
+import sys
+import os
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from services.audit_sink import AuditSink, rejected
+
+
+class APIError(Exception):
+    """Stand-in for postgrest's APIError, which carries the SQLSTATE as ``code``."""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeSupabase:
+    """Records bulk inserts; ``down`` simulates an outage, rows with ``poison`` violate a constraint."""
+
+    def __init__(self):
+        self.rows = {}
+        self.calls = 0
+        self.down = False
+
+    def table(self, name):
+        self._table = name
+        return self
+
+    def insert(self, records):
+        self._records = records
+        return self
+
+    def execute(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("connection refused")
+        if any(r.get("poison") for r in self._records):
+            raise APIError('null value in column "action" violates not-null constraint', "23502")
+        self.rows.setdefault(self._table, []).extend(self._records)
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestAuditSink(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.spill = os.path.join(self.dir, "spill.jsonl")
+        self.dead = os.path.join(self.dir, "dead.jsonl")
+        self.client = FakeSupabase()
+        self.sink = AuditSink(flush_size=100, flush_interval=60, spill_path=self.spill,
+                              dead_letter_path=self.dead)
+        self.sink.bind(self.client)
+
+    def test_flush_bulk_inserts_one_batch_per_table(self):
+        for i in range(3):
+            self.sink.submit("audit_logs", {"n": i})
+        self.sink.submit("intelligence_logs", {"n": 9})
+        self.sink.flush()
+
+        self.assertEqual([r["n"] for r in self.client.rows["audit_logs"]], [0, 1, 2])
+        self.assertEqual(self.client.calls, 2)
+        stats = self.sink.get_stats()
+        self.assertEqual((stats["enqueued"], stats["inserted"], stats["batches"]), (4, 4, 2))
+        self.assertFalse(stats["spill_pending"])
+
+    def test_outage_spills_the_batch_without_bisecting(self):
+        self.client.down = True
+        self.sink._write([("audit_logs", {"n": i}) for i in range(8)])
+
+        self.assertEqual(self.client.calls, 1)
+        self.assertEqual([e["record"]["n"] for e in read_jsonl(self.spill)], list(range(8)))
+        self.assertEqual(self.sink.get_stats()["spilled"], 8)
+        self.assertFalse(os.path.exists(self.dead))
+
+    def test_spill_is_replayed_after_the_next_successful_flush(self):
+        self.client.down = True
+        self.sink._write([("audit_logs", {"n": 1})])
+        self.client.down = False
+        self.sink._write([("audit_logs", {"n": 2})])
+
+        self.assertEqual([r["n"] for r in self.client.rows["audit_logs"]], [2, 1])
+        stats = self.sink.get_stats()
+        self.assertEqual((stats["inserted"], stats["replayed"]), (1, 1))
+        self.assertFalse(os.path.exists(self.spill))
+
+    def test_poison_row_is_dead_lettered_and_the_rest_inserted(self):
+        rows = [("audit_logs", {"n": i, "poison": i == 2}) for i in range(5)]
+        self.sink._write(rows)
+
+        self.assertEqual([r["n"] for r in self.client.rows["audit_logs"]], [0, 1, 3, 4])
+        dead = read_jsonl(self.dead)
+        self.assertEqual([e["record"]["n"] for e in dead], [2])
+        self.assertIn("not-null", dead[0]["error"])
+        self.assertFalse(os.path.exists(self.spill))
+        stats = self.sink.get_stats()
+        self.assertEqual((stats["inserted"], stats["dead_lettered"]), (4, 1))
+
+    def test_poison_row_in_the_spill_does_not_block_replay(self):
+        with open(self.spill, "w", encoding="utf-8") as f:
+            for i in range(4):
+                f.write(json.dumps({"table": "audit_logs", "record": {"n": i, "poison": i == 0}}) + "\n")
+
+        self.sink._write([("audit_logs", {"n": 10})])
+        self.assertEqual(sorted(r["n"] for r in self.client.rows["audit_logs"]), [1, 2, 3, 10])
+        self.assertFalse(os.path.exists(self.spill))
+        self.assertEqual(len(read_jsonl(self.dead)), 1)
+
+        calls = self.client.calls
+        self.sink._write([("audit_logs", {"n": 11})])
+        self.assertEqual(self.client.calls, calls + 1)
+        self.assertEqual(len(read_jsonl(self.dead)), 1)
+
+    def test_rejected_separates_constraint_errors_from_outages(self):
+        self.assertTrue(rejected(APIError("fk", "23503")))
+        self.assertFalse(rejected(APIError("db unreachable", "PGRST001")))
+        self.assertFalse(rejected(ConnectionError("refused")))
+
+
+class TestAtexitFlush(unittest.TestCase):
+
+    def test_rows_queued_at_exit_are_flushed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        out = os.path.join(directory, "inserted.jsonl")
+        script = f"""
+import json, sys
+sys.path.insert(0, {BACKEND!r})
+from services.audit_sink import audit_sink
+
+class Client:
+    def table(self, name):
+        return self
+    def insert(self, records):
+        self.records = records
+        return self
+    def execute(self):
+        with open({out!r}, "a") as f:
+            for r in self.records:
+                f.write(json.dumps(r) + "\\n")
+
+audit_sink.flush_interval = 60
+audit_sink.spill_path = {os.path.join(directory, "spill.jsonl")!r}
+audit_sink.bind(Client())
+for i in range(3):
+    audit_sink.submit("audit_logs", {{"n": i}})
+"""
+        subprocess.run([sys.executable, "-c", script], check=True, timeout=30)
+        self.assertEqual([r["n"] for r in read_jsonl(out)], [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
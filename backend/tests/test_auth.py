@@ -0,0 +1,62 @@
+"""
+Unit tests for the JWT auth decorators
+Run with: python -m unittest backend.tests.test_auth
+"""
+
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, g, jsonify
+
+from middleware.auth import optional_auth, require_auth, generate_token
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/public', methods=['POST'])
+    @optional_auth()
+    def public():
+        return jsonify({'workshop': getattr(g, 'workshop_id', None)})
+
+    @app.route('/private')
+    @require_auth()
+    def private():
+        return jsonify({'workshop': g.workshop_id})
+
+    return app
+
+
+@patch.dict(os.environ, {'JWT_SECRET': 'test-secret-0123456789abcdef0123456789'})
+class TestOptionalAuth(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_app().test_client()
+
+    def workshop(self, headers=None):
+        return self.client.post('/public', headers=headers or {}).get_json()['workshop']
+
+    def test_valid_token_binds_the_workshop(self):
+        token = generate_token('u1', 'TECHNICIAN', 'ws-1')
+        self.assertEqual(self.workshop({'Authorization': f'Bearer {token}'}), 'ws-1')
+
+    def test_anonymous_and_invalid_tokens_have_no_workshop(self):
+        self.assertIsNone(self.workshop())
+        self.assertIsNone(self.workshop({'Authorization': 'Bearer not-a-jwt'}))
+        with patch.dict(os.environ, {'JWT_SECRET': 'other-secret-0123456789abcdef012345678'}):
+            forged = generate_token('u1', 'OWNER', 'ws-2')
+        self.assertIsNone(self.workshop({'Authorization': f'Bearer {forged}'}))
+
+    def test_require_auth_still_rejects_missing_tokens(self):
+        self.assertEqual(self.client.get('/private').status_code, 401)
+        token = generate_token('u1', 'OWNER', 'ws-3')
+        response = self.client.get('/private', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.get_json()['workshop'], 'ws-3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Unit tests for offline batch inference
+Run with: python -m unittest backend.tests.test_batch_inference
+"""
+
+import unittest
+import tempfile
+import shutil
+import threading
+import json
+import time
+import io
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.batch_inference import (
+    BatchRunner, BatchJobStore, BatchInputError, parse_requests, run_job, estimate_cost, COMPLETED
+)
+
+
+class FakeChat:
+    """Handler stub: echoes the message, optionally slow, cached or failing."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self.owners = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, payload, owner=None):
+        with self.lock:
+            self.calls.append(payload["message"])
+            self.owners.add(owner)
+        time.sleep(self.latency)
+        if payload["message"] == "fail":
+            raise RuntimeError("provider down")
+        if payload["message"].startswith("known"):
+            return {"answer": payload["message"]}, {"cached": "HIT-SEMANTIC"}
+        return {"answer": payload["message"]}, {"provider": "gemini", "tokens_in": 1000, "tokens_out": 200}
+
+
+def jsonl(*records):
+    return [json.dumps(r) for r in records]
+
+
+def read_lines(out):
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_invalid_lines_are_rejected_individually(self):
+        lines = jsonl({"id": "a", "message": "x"}, {"id": "b", "type": "unknown"}) + ["{not json", ""]
+        items, rejected = parse_requests(lines, {"chat"})
+        self.assertEqual([i["id"] for i in items], ["a"])
+        self.assertEqual(items[0], {"id": "a", "type": "chat", "payload": {"message": "x"}})
+        self.assertEqual({r["id"] for r in rejected}, {"b", "line-3"})
+
+    def test_empty_and_oversized_batches_fail(self):
+        with self.assertRaises(BatchInputError):
+            parse_requests(["", "  "], {"chat"})
+        with self.assertRaises(BatchInputError):
+            parse_requests(jsonl(*({"message": str(i)} for i in range(4))), {"chat"}, max_items=3)
+
+
+class TestRunner(unittest.TestCase):
+
+    def run_batch(self, records, handler, **kwargs):
+        items, rejected = parse_requests(jsonl(*records), {"chat"})
+        out = io.StringIO()
+        runner = BatchRunner({"chat": handler}, **kwargs)
+        return runner, runner.run(items, out, rejected), read_lines(out)
+
+    def test_identical_requests_run_once(self):
+        handler = FakeChat()
+        records = [{"id": f"r{i}", "message": "brake noise", "context": {"brand": "Tata"}} for i in range(5)]
+        records.append({"id": "other", "message": "ac not cooling"})
+        _, summary, lines = self.run_batch(records, handler)
+        self.assertEqual(sorted(handler.calls), ["ac not cooling", "brake noise"])
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(sum(line["deduplicated"] for line in lines), 4)
+        self.assertEqual((summary["unique"], summary["deduplicated"], summary["succeeded"]), (2, 4, 6))
+
+    def test_concurrency_is_bounded(self):
+        handler = FakeChat(latency=0.05)
+        runner, summary, _ = self.run_batch([{"message": f"q{i}"} for i in range(20)], handler, concurrency=3)
+        self.assertEqual(runner.peak_in_flight, 3)
+        self.assertEqual(summary["state"], COMPLETED)
+        self.assertGreater(summary["throughput_per_s"], 0)
+
+    def test_failures_cache_hits_and_cost_are_reported(self):
+        records = [{"id": "ok", "message": "q"}, {"id": "bad", "message": "fail"},
+                   {"id": "hit", "message": "known answer"}]
+        _, summary, lines = self.run_batch(records, FakeChat())
+        by_id = {line["id"]: line for line in lines}
+        self.assertEqual(by_id["bad"]["error"], "provider down")
+        self.assertEqual(by_id["hit"]["cached"], "HIT-SEMANTIC")
+        self.assertEqual(by_id["hit"]["cost_usd"], 0.0)
+        self.assertEqual((summary["failed"], summary["cache_hits"]), (1, 1))
+        self.assertAlmostEqual(summary["cost_usd"], estimate_cost("gemini", 1000, 200), places=6)
+
+    def test_cache_hits_count_every_served_copy(self):
+        records = [{"id": f"hit{i}", "message": "known answer"} for i in range(3)]
+        _, summary, _ = self.run_batch(records, FakeChat())
+        self.assertEqual((summary["deduplicated"], summary["succeeded"], summary["cache_hits"]), (2, 3, 3))
+
+    def test_progress_is_reported_while_running(self):
+        reports = []
+        self.run_batch([{"message": f"q{i}"} for i in range(6)], FakeChat(latency=0.02),
+                       concurrency=1, on_progress=reports.append, progress_interval=0.0)
+        self.assertTrue(reports)
+        self.assertEqual([r["done"] for r in reports], sorted(r["done"] for r in reports))
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = BatchJobStore(root=self.root, use_redis=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_job_streams_results_and_final_status(self):
+        job_id = self.store.create(jsonl({"id": "a", "message": "q1"}, {"id": "b", "message": "q2"}), owner="ws1")
+        self.assertEqual(self.store.load(job_id)["state"], "QUEUED")
+
+        chat = FakeChat()
+        summary = run_job(job_id, {"chat": chat}, store=self.store)
+        self.assertEqual(chat.owners, {"ws1"})
+        status = self.store.load(job_id)
+        self.assertEqual((status["state"], status["owner"], status["succeeded"]), (COMPLETED, "ws1", 2))
+        with open(self.store.path(job_id, "output.jsonl")) as f:
+            self.assertEqual({json.loads(line)["id"] for line in f}, {"a", "b"})
+        self.assertEqual(summary["total"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
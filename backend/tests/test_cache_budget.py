@@ -0,0 +1,269 @@
+"""
+Unit tests for the semantic cache size budget
+Run with: python -m unittest backend.tests.test_cache_budget
+"""
+
+import unittest
+import fnmatch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cache_budget import CacheBudget, USAGE_KEY, OWNERS_KEY, WORKSHOP_PREFIX
+
+
+class Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+
+class ZSetRedis:
+    """Stand-in for the sorted-set, hash and key commands the budget uses."""
+
+    def __init__(self):
+        self.docs = {}  # key -> type
+        self.zsets = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+    # keys
+    def exists(self, key):
+        return int(key in self.docs)
+
+    def unlink(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += int(self.docs.pop(key, None) is not None)
+            removed += int(self.zsets.pop(key, None) is not None)
+            removed += int(self.hashes.pop(key, None) is not None)
+        return removed
+
+    def scan_iter(self, match, count=None, _type=None):
+        keys = [k for k, t in self.docs.items() if _type is None or t == _type]
+        if _type is None:
+            keys += list(self.zsets) + list(self.hashes)
+        return [k for k in keys if fnmatch.fnmatch(k, match)]
+
+    # sorted sets
+    def zadd(self, key, mapping, nx=False, xx=False, incr=False):
+        zset = self.zsets.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            present = member in zset
+            if (nx and present) or (xx and not present):
+                continue
+            added += int(not present)
+            zset[member] = zset.get(member, 0) + score if incr else score
+        if not zset:
+            del self.zsets[key]
+        return added
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    def zrem(self, key, *members):
+        zset = self.zsets.get(key, {})
+        return sum(1 for m in members if zset.pop(m, None) is not None)
+
+    def zpopmin(self, key, count=1):
+        zset = self.zsets.get(key, {})
+        popped = sorted(zset.items(), key=lambda item: (item[1], item[0]))[:count]
+        for member, _ in popped:
+            del zset[member]
+        return popped
+
+    def zscan_iter(self, key, count=None):
+        return list(self.zsets.get(key, {}).items())
+
+    # hashes
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hmget(self, key, fields):
+        return [self.hget(key, f) for f in fields]
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        h = self.hashes.setdefault(key, {})
+        if field is not None:
+            h[field] = value
+        h.update(mapping or {})
+
+    def hdel(self, key, *fields):
+        h = self.hashes.get(key, {})
+        return sum(1 for f in fields if h.pop(f, None) is not None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCacheBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = ZSetRedis()
+        self.clock = Clock()
+        self.evicted = []
+
+    def budget(self, **kwargs):
+        kwargs.setdefault("max_entries", 3)
+        kwargs.setdefault("workshop_quota", 100)
+        return CacheBudget(lambda: self.redis, on_evict=self.evicted.append, clock=self.clock, **kwargs)
+
+    def write(self, budget, key, owner=None):
+        self.redis.docs[key] = "ReJSON-RL"
+        self.clock.now += 1
+        return budget.admit(key, owner)
+
+    def test_global_cap_evicts_least_frequently_used(self):
+        budget = self.budget(policy="lfu")
+        for key in ("cache:a", "cache:b", "cache:c"):
+            self.write(budget, key)
+        budget.touch("cache:a")
+        budget.touch("cache:a")
+        budget.touch("cache:c")
+
+        self.assertEqual(self.write(budget, "cache:d"), 1)
+        self.assertNotIn("cache:b", self.redis.docs)
+        self.assertEqual(set(self.redis.docs), {"cache:a", "cache:c", "cache:d"})
+        self.assertEqual(self.redis.zcard(USAGE_KEY), 3)
+        self.assertIsNone(self.redis.hget(OWNERS_KEY, "cache:b"))
+        self.assertEqual(self.evicted, [1])
+
+    def test_global_cap_evicts_least_recently_used(self):
+        budget = self.budget(policy="lru")
+        for key in ("cache:a", "cache:b", "cache:c"):
+            self.write(budget, key)
+        self.clock.now += 1
+        budget.touch("cache:a")
+
+        self.write(budget, "cache:d")
+        self.assertEqual(set(self.redis.docs), {"cache:a", "cache:c", "cache:d"})
+
+    def test_lfu_hits_decay_with_age(self):
+        budget = self.budget(policy="lfu")
+        self.write(budget, "cache:old")
+        budget.touch("cache:old")
+        self.clock.now += 3 * 3600  # three decay periods outweigh one hit
+        self.write(budget, "cache:b")
+        self.write(budget, "cache:c")
+
+        self.write(budget, "cache:d")
+        self.assertNotIn("cache:old", self.redis.docs)
+
+    def test_rewrite_keeps_lfu_hits(self):
+        budget = self.budget(policy="lfu")
+        self.write(budget, "cache:a")
+        budget.touch("cache:a")
+        score = self.redis.zscore(USAGE_KEY, "cache:a")
+        self.write(budget, "cache:a")
+        self.assertEqual(self.redis.zscore(USAGE_KEY, "cache:a"), score)
+
+    def test_workshop_quota_evicts_only_that_workshop(self):
+        budget = self.budget(max_entries=100, workshop_quota=2)
+        self.write(budget, "cache:other", owner="ws-2")
+        for key in ("cache:1", "cache:2", "cache:3"):
+            self.write(budget, key, owner="ws-1")
+
+        self.assertEqual(set(self.redis.docs), {"cache:other", "cache:2", "cache:3"})
+        self.assertEqual(self.redis.zcard(f"{WORKSHOP_PREFIX}ws-1"), 2)
+        self.assertEqual(self.redis.zcard(USAGE_KEY), 3)
+
+    def test_shared_entries_are_not_held_to_a_quota(self):
+        budget = self.budget(max_entries=100, workshop_quota=1)
+        for key in ("cache:1", "cache:2", "cache:3"):
+            self.write(budget, key)
+        self.assertEqual(len(self.redis.docs), 3)
+
+    def test_sweep_forgets_expired_and_adopts_untracked(self):
+        budget = self.budget(max_entries=100)
+        self.write(budget, "cache:expired", owner="ws-1")
+        del self.redis.docs["cache:expired"]  # TTL ran out
+        self.redis.docs["cache:legacy"] = "ReJSON-RL"
+
+        report = budget.sweep(batch=1)
+        self.assertEqual(report, {"stale": 1, "adopted": 1, "evicted": 0, "entries": 1})
+        self.assertIsNone(self.redis.zscore(USAGE_KEY, "cache:expired"))
+        self.assertEqual(self.redis.zcard(f"{WORKSHOP_PREFIX}ws-1"), 0)
+        self.assertEqual(self.redis.zscore(USAGE_KEY, "cache:legacy"), 0)
+
+    def test_sweep_evicts_adopted_entries_first(self):
+        budget = self.budget(max_entries=2)
+        self.write(budget, "cache:a")
+        self.write(budget, "cache:b")
+        self.redis.docs["cache:legacy"] = "ReJSON-RL"
+
+        report = budget.sweep()
+        self.assertEqual(report["evicted"], 1)
+        self.assertEqual(set(self.redis.docs), {"cache:a", "cache:b"})
+
+    def test_sweep_never_touches_other_keys(self):
+        budget = self.budget(max_entries=0)
+        protected = {"ratelimit:1.2.3.4": "string", "singleflight:chat:x": "string",
+                     "cache:not-a-document": "string", "chat:exact:not-a-string": "hash"}
+        self.redis.docs.update(protected)
+        self.redis.zadd(USAGE_KEY, {"ratelimit:1.2.3.4": 0})  # foreign member
+
+        budget.sweep()
+        for key in protected:
+            self.assertIn(key, self.redis.docs)
+
+    def test_exact_tier_shares_the_cap_and_workshop_quota(self):
+        budget = self.budget(max_entries=100, workshop_quota=3)
+        self.write(budget, "cache:1", owner="ws-1")
+        self.redis.docs["chat:exact:1"] = "string"
+        budget.admit("chat:exact:1", "ws-1")
+        self.write(budget, "cache:2", owner="ws-1")
+        self.redis.docs["chat:exact:2"] = "string"
+        self.clock.now += 1
+        self.assertEqual(budget.admit("chat:exact:2", "ws-1"), 1)
+
+        self.assertEqual(set(self.redis.docs), {"chat:exact:1", "cache:2", "chat:exact:2"})
+        self.assertEqual(self.redis.zcard(f"{WORKSHOP_PREFIX}ws-1"), 3)
+
+    def test_sweep_adopts_and_evicts_exact_tier_keys(self):
+        budget = self.budget(max_entries=1)
+        self.write(budget, "cache:a")
+        self.redis.docs["chat:exact:legacy"] = "string"
+
+        report = budget.sweep()
+        self.assertEqual((report["adopted"], report["evicted"]), (1, 1))
+        self.assertEqual(set(self.redis.docs), {"cache:a"})
+
+    def test_redis_down_is_a_no_op(self):
+        budget = CacheBudget(lambda: None)
+        self.assertEqual(budget.admit("cache:a"), 0)
+        budget.touch("cache:a")
+        self.assertEqual(budget.sweep(), {"status": "disabled"})
+
+    def test_reset_drops_bookkeeping(self):
+        budget = self.budget()
+        self.write(budget, "cache:a", owner="ws-1")
+        budget.reset()
+        self.assertEqual(self.redis.zsets, {})
+        self.assertEqual(self.redis.hashes, {})
+        self.assertIn("cache:a", self.redis.docs)
+
+
+if __name__ == '__main__':
+    unittest.main()
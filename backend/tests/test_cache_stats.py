@@ -0,0 +1,147 @@
+"""
+Unit tests for semantic cache telemetry
+Run with: python -m unittest backend.tests.test_cache_stats
+"""
+
+import unittest
+import threading
+import fnmatch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cache_stats import CacheStats, similarity_field
+from services.cache_budget import CacheBudget
+from services.local_vector_index import LocalVectorIndex
+from services.vector_engine import VectorEngine, delete_matching
+
+
+class HashRedis:
+    """Stand-in for the hash, scan and FT.INFO commands the telemetry uses."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.keys = {}
+        self.lock = threading.Lock()
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+    def hincrby(self, key, field, amount):
+        with self.lock:
+            h = self.hashes.setdefault(key, {})
+            h[field] = str(int(h.get(field, 0)) + amount)
+
+    def hincrbyfloat(self, key, field, amount):
+        with self.lock:
+            h = self.hashes.setdefault(key, {})
+            h[field] = str(float(h.get(field, 0)) + amount)
+
+    def hgetall(self, key):
+        self.commands.append("HGETALL")
+        return dict(self.hashes.get(key, {}))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    def scan_iter(self, match, count):
+        self.commands.append("SCAN")
+        return [k for k in list(self.keys) if fnmatch.fnmatch(k, match)]
+
+    def unlink(self, *keys):
+        for key in keys:
+            self.keys.pop(key)
+        return len(keys)
+
+    def ft(self, name):
+        redis = self
+
+        class Index:
+            def info(self):
+                redis.commands.append("FT.INFO")
+                return {"index_name": f"{name}:hnsw-m16-efc200", "num_docs": "42", "percent_indexed": "1",
+                        "vector_index_sz_mb": "1.5", "inverted_sz_mb": "0.5"}
+        return Index()
+
+
+class TestCacheStats(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = HashRedis()
+
+    def test_workers_share_counters(self):
+        workers = [CacheStats(lambda: self.redis, flush_interval=0) for _ in range(2)]
+        workers[0].record_hit(latency_saved_ms=1200.0)
+        workers[1].record_hit(latency_saved_ms=800.0)
+        workers[1].record_miss()
+        workers[0].record_similarity(0.93)
+        workers[1].record_similarity(0.42)
+        snapshot = workers[0].snapshot()
+        self.assertEqual((snapshot["hits"], snapshot["misses"]), (2, 1))
+        self.assertEqual(snapshot["avg_latency_saved_ms"], 1000.0)
+        self.assertEqual(snapshot["similarity_histogram"]["sim_le_0.95"], 1)
+        self.assertEqual(snapshot["similarity_histogram"]["sim_le_0.5"], 1)
+        self.assertEqual(snapshot["counters"], "redis")
+
+    def test_flushes_are_throttled(self):
+        stats = CacheStats(lambda: self.redis, flush_interval=3600)
+        for _ in range(50):
+            stats.record_miss()
+        self.assertEqual(self.redis.hashes, {})
+        self.assertEqual(stats.snapshot()["misses"], 50)  # reading flushes first
+
+    def test_counts_stay_local_while_redis_is_down(self):
+        client = [None]
+        stats = CacheStats(lambda: client[0], flush_interval=0)
+        stats.record_store()
+        stats.record_evictions(3)
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot["stores"], snapshot["evictions"], snapshot["counters"]), (1, 3, "local"))
+        client[0] = self.redis
+        stats.record_miss()
+        self.assertEqual(self.redis.hashes["semantic_cache:stats"]["evictions"], "3")
+
+    def test_similarity_buckets(self):
+        self.assertEqual(similarity_field(0.9), "sim_le_0.9")
+        self.assertEqual(similarity_field(0.905), "sim_le_0.95")
+        self.assertEqual(similarity_field(1.0), "sim_le_1")
+
+
+class TestEngineStats(unittest.TestCase):
+
+    def engine(self, redis):
+        engine = VectorEngine.__new__(VectorEngine)
+        engine.redis, engine.index_name, engine.local = redis, "semantic_cache_idx", LocalVectorIndex(dim=4)
+        engine.stats = CacheStats(lambda: engine.redis, flush_interval=0)
+        engine.budget = CacheBudget(lambda: engine.redis)
+        return engine
+
+    def test_stats_use_ft_info_not_key_scans(self):
+        redis = HashRedis()
+        engine = self.engine(redis)
+        engine.stats.record_hit(500.0)
+        stats = engine.get_cache_stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["bytes_used"]), (42, 1, 2 * 1024 * 1024))
+        self.assertEqual(sorted(set(redis.commands)), ["FT.INFO", "HGETALL"])
+
+    def test_degraded_stats(self):
+        stats = self.engine(None).get_cache_stats()
+        self.assertEqual(stats["status"], "degraded")
+        self.assertIn("hit_rate", stats)
+
+    def test_delete_matching_scans_in_batches(self):
+        redis = HashRedis()
+        redis.keys = {f"cache:{i}": 1 for i in range(7)}
+        redis.keys["semantic_cache:stats"] = 1
+        self.assertEqual(delete_matching(redis, "cache:*", batch=3), 7)
+        self.assertEqual(list(redis.keys), ["semantic_cache:stats"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Unit tests for micro-batched embedding calls
+Run with: python -m unittest backend.tests.test_embedding_batcher
+"""
+
+import unittest
+import asyncio
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_batcher import EmbeddingBatcher, FakeEmbedder, Histogram
+
+
+def run_concurrently(n, target):
+    results = [None] * n
+    start = threading.Barrier(n)
+
+    def worker(i):
+        start.wait()
+        results[i] = target(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class TestFakeEmbedder(unittest.TestCase):
+
+    def test_deterministic_unit_vectors(self):
+        embedder = FakeEmbedder(dim=16)
+        a, b = embedder(["brake noise", "brake noise"])
+        self.assertEqual(a, b)
+        self.assertEqual(a, FakeEmbedder(dim=16).vector("brake noise"))
+        self.assertNotEqual(a, embedder.vector("ac not cooling"))
+        self.assertAlmostEqual(sum(x * x for x in a), 1.0, places=5)
+
+
+class TestEmbeddingBatcher(unittest.TestCase):
+
+    def test_concurrent_submissions_share_a_call(self):
+        embedder = FakeEmbedder(dim=8)
+        batcher = EmbeddingBatcher(embedder, max_batch=64, max_wait_ms=50)
+        vectors = run_concurrently(20, lambda i: batcher.embed(f"query {i}"))
+        self.assertEqual(vectors, [embedder.vector(f"query {i}") for i in range(20)])
+        self.assertLess(len(embedder.calls), 20)
+        self.assertEqual(sum(len(c) for c in embedder.calls), 20)
+        stats = batcher.get_stats()
+        self.assertEqual((stats["texts"], stats["batch_size"]["count"]), (20, len(embedder.calls)))
+
+    def test_batch_size_is_capped(self):
+        embedder = FakeEmbedder(dim=4, latency=0.02)
+        batcher = EmbeddingBatcher(embedder, max_batch=5, max_wait_ms=20, concurrency=1)
+        self.assertEqual(len(batcher.embed_documents([f"t{i}" for i in range(23)])), 23)
+        self.assertLessEqual(max(len(c) for c in embedder.calls), 5)
+
+    def test_identical_texts_in_a_batch_are_embedded_once(self):
+        embedder = FakeEmbedder(dim=4)
+        batcher = EmbeddingBatcher(embedder, max_wait_ms=50)
+        vectors = run_concurrently(8, lambda i: batcher.embed("same question"))
+        self.assertEqual(len(set(map(tuple, vectors))), 1)
+        self.assertEqual(sum(len(c) for c in embedder.calls), len(embedder.calls))
+        self.assertEqual(batcher.get_stats()["deduplicated"], 8 - len(embedder.calls))
+
+    def test_provider_failure_fails_every_future_in_the_batch(self):
+        def broken(texts):
+            raise RuntimeError("quota exceeded")
+
+        batcher = EmbeddingBatcher(broken, max_wait_ms=20)
+        futures = [batcher.submit(f"t{i}") for i in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(5)
+        self.assertGreaterEqual(batcher.get_stats()["failures"], 1)
+        # The loop survives and serves later requests
+        batcher.embed_many = FakeEmbedder(dim=4)
+        self.assertEqual(len(batcher.embed("after")), 4)
+
+    def test_async_callers(self):
+        batcher = EmbeddingBatcher(FakeEmbedder(dim=4), max_wait_ms=20)
+
+        async def main():
+            return await asyncio.gather(*(batcher.aembed(f"q{i}") for i in range(5)))
+
+        self.assertEqual(len(asyncio.run(main())), 5)
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        h = Histogram([1, 10])
+        for value in (0.5, 1, 5, 50):
+            h.observe(value)
+        snapshot = h.snapshot()
+        self.assertEqual(snapshot["buckets"], {"le_1": 2, "le_10": 1, "+Inf": 1})
+        self.assertEqual(snapshot["count"], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
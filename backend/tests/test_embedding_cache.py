@@ -0,0 +1,137 @@
+"""
+Unit tests for the shared embedding cache
+Run with: python -m unittest backend.tests.test_embedding_cache
+"""
+
+import unittest
+import asyncio
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_cache import EmbeddingCache, CachedEmbeddings, embedding_key, pack, unpack
+
+
+class BytesRedis:
+    """Minimal stand-in for the Redis commands the embedding cache uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+        self.ttls = {}
+
+    def mget(self, keys):
+        with self.lock:
+            return [self.data.get(k) for k in keys]
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.data[key] = value
+            self.ttls[key] = ex
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+class FakeProvider:
+    """Deterministic embedder that counts provider calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def vector(self, text):
+        return [len(text) / 10.0, 0.5, -1.0 / 3.0]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return self.vector(text)
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self.vector(t) for t in texts]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = BytesRedis()
+        self.cache = EmbeddingCache(max_entries=2, redis_client=self.redis, ttl=60)
+        self.provider = FakeProvider()
+
+    def test_second_lookup_does_not_call_provider(self):
+        first = self.cache.get_or_embed("m", "retrieval_query", "brake noise", self.provider.embed_query)
+        second = self.cache.get_or_embed("m", "retrieval_query", "brake noise", self.provider.embed_query)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.provider.calls), 1)
+        self.assertEqual(self.cache.get_stats()["memory_hits"], 1)
+
+    def test_key_includes_model_and_task_type(self):
+        self.assertNotEqual(embedding_key("a", "retrieval_query", "x"), embedding_key("b", "retrieval_query", "x"))
+        self.assertNotEqual(embedding_key("a", "retrieval_query", "x"), embedding_key("a", "retrieval_document", "x"))
+        self.cache.get_or_embed("m", "retrieval_query", "x", self.provider.embed_query)
+        self.cache.get_or_embed("m", "retrieval_document", "x", self.provider.embed_query)
+        self.assertEqual(len(self.provider.calls), 2)
+
+    def test_redis_tier_is_shared_and_stores_float32(self):
+        self.cache.put("m", "retrieval_query", "q", [0.1, 0.2])
+        blob = self.redis.data[embedding_key("m", "retrieval_query", "q")]
+        self.assertEqual(len(blob), 8)
+        self.assertEqual(self.redis.ttls[embedding_key("m", "retrieval_query", "q")], 60)
+
+        other_worker = EmbeddingCache(redis_client=self.redis)
+        self.assertEqual(other_worker.get("m", "retrieval_query", "q"), unpack(pack([0.1, 0.2])))
+        self.assertEqual(other_worker.get_stats()["redis_hits"], 1)
+
+    def test_lru_bound(self):
+        for text in ("a", "b", "c"):
+            self.cache.put("m", "t", text, [1.0])
+        self.assertEqual(self.cache.get_stats()["entries"], 2)
+
+    def test_failures_are_not_cached(self):
+        self.assertIsNone(self.cache.get_or_embed("m", "t", "x", lambda text: None))
+        self.assertEqual(self.redis.data, {})
+
+    def test_batch_embeds_only_distinct_misses(self):
+        self.cache.put("m", "retrieval_document", "known", [9.0, 9.0, 9.0])
+        vectors = self.cache.get_or_embed_many("m", "retrieval_document", ["new", "known", "new"],
+                                               self.provider.embed_documents)
+        self.assertEqual(self.provider.calls, [["new"]])
+        self.assertEqual(vectors[0], vectors[2])
+        self.assertEqual(vectors[1], [9.0, 9.0, 9.0])
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = FakeProvider()
+        self.embeddings = CachedEmbeddings(self.provider, "m", cache=EmbeddingCache(use_redis=False))
+
+    def test_query_and_documents_are_memoized(self):
+        self.embeddings.embed_query("q")
+        self.embeddings.embed_query("q")
+        self.embeddings.embed_documents(["d1", "d2"])
+        self.embeddings.embed_documents(["d2", "d3"])
+        self.assertEqual(self.provider.calls, [["q"], ["d1", "d2"], ["d3"]])
+
+    def test_async_variants_share_the_cache(self):
+        self.embeddings.embed_query("q")
+        vector = asyncio.run(self.embeddings.aembed_query("q"))
+        vectors = asyncio.run(self.embeddings.aembed_documents(["d", "d"]))
+        self.assertEqual(vector, unpack(pack(self.provider.vector("q"))))
+        self.assertEqual(len(vectors), 2)
+        self.assertEqual(self.provider.calls, [["q"], ["d"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Unit tests for token-budgeted chat history compaction
+Run with: python -m unittest backend.tests.test_history_manager
+"""
+
+import unittest
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.history_manager import (
+    HistoryManager, SUMMARY_LABEL, conversation_id, message_text, message_tokens
+)
+
+
+def make_history(turns, words=50):
+    """Alternating user/model messages, each roughly ``words`` words long."""
+    history = []
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "model"
+        history.append({"role": role, "parts": [{"text": f"msg{i} " + "word " * words}]})
+    return history
+
+
+class FakeSummarizer:
+    def __init__(self, block=None):
+        self.calls = []
+        self.block = block
+
+    def __call__(self, previous, messages):
+        if self.block:
+            self.block.wait(5)
+        self.calls.append((previous, [message_text(m).split()[0] for m in messages]))
+        return f"summary of {len(messages)} messages"
+
+
+class TestCompaction(unittest.TestCase):
+
+    def manager(self, summarizer=None, budget=400, keep=4):
+        return HistoryManager(summarizer=summarizer, token_budget=budget, keep_turns=keep, use_redis=False)
+
+    def test_under_budget_unchanged(self):
+        history = make_history(4)
+        self.assertIs(self.manager(budget=10_000).compact("c1", history), history)
+
+    def test_over_budget_trims_and_keeps_recent_verbatim(self):
+        history = make_history(20)
+        compacted = self.manager().compact("c1", history)
+        self.assertLessEqual(sum(message_tokens(m) for m in compacted), 400)
+        self.assertEqual(compacted[-4:], history[-4:])
+        self.assertEqual(compacted[0]["role"], "user")
+
+    def test_request_path_does_not_wait_for_summary(self):
+        gate = threading.Event()
+        summarizer = FakeSummarizer(block=gate)
+        manager = self.manager(summarizer)
+        history = make_history(20)
+        compacted = manager.compact("c1", history)  # returns while the summarizer is blocked
+        self.assertFalse(any(SUMMARY_LABEL in message_text(m) for m in compacted))
+        self.assertEqual(manager.get_stats()["summaries_pending"], 1)
+        gate.set()
+        manager.wait_idle()
+        self.assertEqual(manager.get_stats()["summaries_built"], 1)
+
+    def test_summary_replaces_older_turns(self):
+        summarizer = FakeSummarizer()
+        manager = self.manager(summarizer)
+        history = make_history(20)
+        manager.compact("c1", history)
+        manager.wait_idle()
+
+        compacted = manager.compact("c1", history)
+        self.assertTrue(message_text(compacted[0]).startswith(f"{SUMMARY_LABEL}: summary of 16 messages"))
+        self.assertEqual(compacted[-3:], history[-3:])
+        self.assertEqual(manager.get_stats()["summary_hits"], 1)
+
+    def test_summary_rolls_forward(self):
+        summarizer = FakeSummarizer()
+        manager = self.manager(summarizer)
+        history = make_history(20)
+        manager.compact("c1", history)
+        manager.wait_idle()
+
+        manager.compact("c1", history + make_history(4))
+        manager.wait_idle()
+        previous, new_messages = summarizer.calls[-1]
+        self.assertEqual(previous, "summary of 16 messages")
+        self.assertEqual(len(new_messages), 4)
+
+    def test_summary_for_other_messages_is_ignored(self):
+        summarizer = FakeSummarizer()
+        manager = self.manager(summarizer)
+        manager.compact("c1", make_history(20))
+        manager.wait_idle()
+
+        other = make_history(20, words=51)
+        compacted = manager.compact("c1", other)
+        self.assertFalse(any(SUMMARY_LABEL in message_text(m) for m in compacted))
+
+    def test_conversation_id(self):
+        history = make_history(3)
+        self.assertEqual(conversation_id(history, "abc"), "abc")
+        self.assertEqual(conversation_id(history, None, "MH01"), conversation_id(history + history, None, "MH01"))
+        self.assertNotEqual(conversation_id(history, None, "MH01"), conversation_id(history, None, "KA05"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+"""
+Unit tests for hybrid (BM25 + vector) knowledge base retrieval
+Run with: python -m unittest backend.tests.test_kb_hybrid_search
+"""
+
+import unittest
+import tempfile
+import threading
+import shutil
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base.lexical_index import LexicalIndex, tokenize
+from knowledge_base.hybrid_search import HybridRetriever, SearchResult, reciprocal_rank_fusion
+from knowledge_base.filters import (
+    containment_filter, matches_filters, relaxations, vehicle_filters, vehicle_metadata,
+)
+
+ROWS = [
+    {"id": 1, "content": "DTC P0301 cylinder 1 misfire. Swap the ignition coil.",
+     "metadata": {"source": "swift.pdf", "car_model": "Swift", "brand": "Maruti"}},
+    {"id": 2, "content": "DTC P0302 cylinder 2 misfire. Check the spark plug gap.",
+     "metadata": {"source": "swift.pdf", "car_model": "Swift", "brand": "Maruti"}},
+    {"id": 3, "content": "Oil filter part number 16510-61J00, drain plug torque 35 Nm.",
+     "metadata": {"source": "swift.pdf", "car_model": "Swift", "brand": "Maruti"}},
+    {"id": 4, "content": "Engine shakes at idle: check coils, plugs and injectors on every cylinder.",
+     "metadata": {"source": "creta.pdf", "car_model": "Creta", "brand": "Hyundai"}},
+    {"id": 5, "content": "Wheel nut torque 107-127 Nm, tighten diagonally.",
+     "metadata": {"source": "creta.pdf", "car_model": "Creta", "brand": "Hyundai"}},
+]
+
+
+def vector_search_returning(*ids, similarity=0.8):
+    """Vector leg stand-in that ranks the given row ids in order."""
+    calls = []
+
+    def search(query, count, filters=None):
+        calls.append((query, count, filters))
+        rows = [dict(next(r for r in ROWS if r["id"] == i), similarity=similarity - 0.1 * n)
+                for n, i in enumerate(ids)]
+        return [r for r in rows if matches_filters(r["metadata"], filters)][:count]
+    search.calls = calls
+    return search
+
+
+class TestLexicalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = LexicalIndex()
+        self.index.build(ROWS, fingerprint="5:5")
+
+    def test_tokenizer_keeps_codes_and_their_parts(self):
+        tokens = tokenize("Part 16510-61J00 and P0301 at 5W-30, 12.5 Nm")
+        for token in ("16510-61j00", "16510", "61j00", "p0301", "5w-30", "12.5", "nm"):
+            self.assertIn(token, tokens)
+        self.assertNotIn("and", tokens)
+
+    def test_exact_dtc_ranks_first(self):
+        self.assertEqual(self.index.search("P0302")[0][0], 2)
+        self.assertEqual(self.index.search("what does p0301 mean")[0][0], 1)
+
+    def test_part_number_matches_with_or_without_dash(self):
+        self.assertEqual(self.index.search("16510-61J00")[0][0], 3)
+        self.assertEqual(self.index.search("16510 61J00")[0][0], 3)
+
+    def test_filters_and_unknown_terms(self):
+        hits = self.index.search("torque", filters={"car_model": "creta"})
+        self.assertEqual([row_id for row_id, _ in hits], [5])
+        self.assertEqual(self.index.search("zzzz"), [])
+
+    def test_round_trips_through_disk(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        saved = LexicalIndex(directory)
+        saved.build(ROWS, fingerprint="5:5")
+
+        loaded = LexicalIndex(directory)
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.fingerprint, "5:5")
+        self.assertEqual(loaded.search("misfire coil"), saved.search("misfire coil"))
+        self.assertEqual(loaded.get(3)["content"], ROWS[2]["content"])
+        self.assertFalse(LexicalIndex(os.path.join(directory, "missing")).load())
+
+    def test_concurrent_rebuilds_never_mix_builds(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        builds = {n: ROWS[:n] for n in (2, 5)}
+
+        def rebuild(n):
+            for _ in range(20):
+                LexicalIndex(directory).build(builds[n], fingerprint=f"{n}:{n}")
+        threads = [threading.Thread(target=rebuild, args=(n,)) for n in builds for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        loaded = LexicalIndex(directory)
+        self.assertTrue(loaded.load())
+        n = int(loaded.fingerprint.split(":")[0])
+        self.assertEqual(len(loaded), n)
+        self.assertEqual(len(loaded.doc_lengths), n)
+        self.assertEqual(os.listdir(directory), ["lexical.npz"])
+
+
+class TestHybridRetriever(unittest.TestCase):
+
+    def setUp(self):
+        self.lexical = LexicalIndex()
+        self.lexical.build(ROWS)
+
+    def test_rrf_rewards_agreement(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+        self.assertEqual([key for key, _ in fused], [1, 3, 2])
+        self.assertAlmostEqual(fused[0][1], 1 / 61 + 1 / 62)
+
+    def test_hybrid_recovers_exact_token_the_vector_leg_misses(self):
+        # The dense model confuses P0301 and P0302; BM25 does not
+        retriever = HybridRetriever(vector_search_returning(2, 4, 1), self.lexical)
+        results = retriever.search("P0301", top_k=3)
+        self.assertEqual(results[0].node_id, "1")
+        self.assertIsInstance(results[0], SearchResult)
+        self.assertEqual(results[0].source, "swift.pdf")
+        self.assertIsNotNone(results[0].vector_score)
+        self.assertIsNotNone(results[0].lexical_score)
+
+    def test_lexical_only_hits_come_from_the_index(self):
+        retriever = HybridRetriever(vector_search_returning(4), self.lexical)
+        results = retriever.search("16510-61J00", top_k=5)
+        by_id = {r.node_id: r for r in results}
+        self.assertEqual(by_id["3"].content, ROWS[2]["content"])
+        self.assertIsNone(by_id["3"].vector_score)
+
+    def test_scores_are_scaled_to_one(self):
+        retriever = HybridRetriever(vector_search_returning(1, 2), self.lexical)
+        results = retriever.search("P0301 misfire", top_k=5)
+        self.assertEqual(results[0].score, 1.0)
+        self.assertTrue(all(0 < r.score <= 1 for r in results))
+        self.assertEqual([r.score for r in results], sorted((r.score for r in results), reverse=True))
+
+    def test_modes_select_retrievers(self):
+        vector = vector_search_returning(4)
+        retriever = HybridRetriever(vector, self.lexical)
+        self.assertEqual([r.node_id for r in retriever.search("P0302", mode="vector")], ["4"])
+        self.assertEqual(retriever.search("P0302", mode="lexical")[0].node_id, "2")
+        self.assertEqual(len(vector.calls), 1)
+        with self.assertRaises(ValueError):
+            HybridRetriever(vector, self.lexical, mode="fuzzy")
+
+    def test_filters_reach_both_legs(self):
+        vector = vector_search_returning(1, 4, 5)
+        retriever = HybridRetriever(vector, self.lexical, candidates=10)
+        results = retriever.search("torque misfire", top_k=5, filters={"brand": "Hyundai"}, fallback=False)
+        self.assertEqual({r.metadata["brand"] for r in results}, {"Hyundai"})
+        self.assertEqual(vector.calls[0], ("torque misfire", 10, {"brand": "Hyundai"}))
+
+    def test_small_partition_falls_back_to_wider_search(self):
+        vector = vector_search_returning(5, 1, 2, 3)
+        retriever = HybridRetriever(vector, self.lexical, candidates=10, min_results=3)
+        filters = {"brand": "Hyundai", "car_model": "Creta", "year": "2021"}
+        results = retriever.search("torque", top_k=3, filters=filters)
+        # No 2021 chunks: drop year, Creta gives one hit, drop the model, then brand
+        self.assertEqual([call[2] for call in vector.calls], relaxations(filters)[:4])
+        self.assertEqual(results[0].node_id, "5")
+        self.assertEqual(len(results), 3)
+        self.assertEqual(retriever.get_stats()["filter_fallbacks"], 1)
+
+    def test_large_enough_partition_is_not_relaxed(self):
+        vector = vector_search_returning(1, 2, 3)
+        retriever = HybridRetriever(vector, self.lexical, candidates=10, min_results=2)
+        results = retriever.search("misfire", top_k=5, filters={"car_model": "Swift"})
+        self.assertEqual(len(vector.calls), 1)
+        self.assertEqual({r.metadata["car_model"] for r in results}, {"Swift"})
+        self.assertEqual(retriever.get_stats()["filter_fallbacks"], 0)
+
+
+class TestVehicleFilters(unittest.TestCase):
+
+    def test_relaxation_ladder(self):
+        ladder = relaxations({"brand": "Maruti", "car_model": "Swift", "year": 2019, "source": "swift.pdf"})
+        self.assertEqual(ladder, [
+            {"brand": "Maruti", "car_model": "Swift", "year": 2019, "source": "swift.pdf"},
+            {"brand": "Maruti", "car_model": "Swift", "source": "swift.pdf"},
+            {"brand": "Maruti", "source": "swift.pdf"},
+            {"source": "swift.pdf"},
+            None,
+        ])
+        self.assertEqual(relaxations({"brand": "Maruti"}), [{"brand": "Maruti"}, None])
+        self.assertEqual(relaxations({"year": ""}), [None])
+
+    def test_containment_filter_uses_normalised_vehicle_fields(self):
+        self.assertEqual(containment_filter({"brand": " Maruti", "year": 2019, "source": "swift.pdf"}),
+                         {"vehicle": {"brand": "maruti", "year": "2019"}, "source": "swift.pdf"})
+        self.assertEqual(vehicle_metadata({"car_model": "Swift", "year": None}), {"car_model": "swift"})
+
+    def test_vehicle_context_maps_to_filters(self):
+        self.assertEqual(vehicle_filters({"brand": "Maruti", "model": "Swift", "year": "2019", "fuel_type": "Petrol"}),
+                         {"brand": "Maruti", "car_model": "Swift", "year": "2019"})
+        self.assertIsNone(vehicle_filters({"fuel_type": "Diesel"}))
+        self.assertIsNone(vehicle_filters(None))
+
+    def test_matching_is_case_insensitive(self):
+        self.assertTrue(matches_filters({"brand": "Maruti", "year": 2019}, {"brand": "maruti", "year": "2019"}))
+        self.assertTrue(matches_filters({"brand": "Tata"}, {"brand": ["Maruti", "TATA"]}))
+        self.assertFalse(matches_filters({"brand": "Tata"}, {"car_model": "Nexon"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,284 @@
+"""
+Unit tests for the knowledge base ingestion pipeline
+Run with: python -m unittest backend.tests.test_kb_ingestion
+"""
+
+import unittest
+import tempfile
+import random
+import shutil
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from knowledge_base.ingestion import (
+    IngestionPipeline, StreamingChunker, Document, write_text_pdf, extract_pages, file_digest, content_hash,
+    PAGE_SEPARATOR
+)
+
+WORDS = "brake pad rotor caliper fluid engine oil filter spark plug coolant gasket.".split()
+
+
+def manual(pages, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(f"p{p}w{w}-{rng.choice(WORDS)}" for w in range(250)) for p in range(pages)]
+
+
+class Embedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(len(texts))
+        return [[float(len(t)), 0.0] for t in texts]
+
+
+class Table:
+    """In-memory documents table; optionally fails on the n-th bulk insert."""
+
+    def __init__(self, fail_on=None):
+        self.rows = []
+        self.calls = 0
+        self.fail_on = fail_on
+        self.next_id = 1
+
+    def existing(self, source):
+        hashes = {}
+        for row in self.rows:
+            if row["source"] == source:
+                hashes.setdefault(row["content_hash"], []).append(row["id"])
+        return hashes
+
+    def insert(self, rows):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise ConnectionError("supabase unavailable")
+        for row in rows:
+            self.rows.append({**row, "id": self.next_id})
+            self.next_id += 1
+
+    def stamp(self, ids, version, source=None):
+        for row in self.rows:
+            if row["id"] in ids:
+                row["version"] = version
+                if source is not None:
+                    row["source"] = source
+
+    def delete_stale(self, source, version):
+        stale = [r for r in self.rows if r["source"] == source and r["version"] != version]
+        self.rows = [r for r in self.rows if r not in stale]
+        return len(stale)
+
+
+class TestStreamingChunker(unittest.TestCase):
+
+    def test_matches_splitting_the_whole_document(self):
+        rng = random.Random(3)
+        pages = ["\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14))) for _ in range(30))
+                 for _ in range(8)]
+        chunker = StreamingChunker()
+        chunks = [c for page, text in enumerate(pages) for c in chunker.feed(page, text)] + chunker.finish()
+
+        whole = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_text(
+            PAGE_SEPARATOR.join(pages))
+        self.assertEqual([c.text for c in chunks], whole)
+        self.assertEqual([c.index for c in chunks], list(range(len(whole))))
+
+    def test_chunks_know_where_they_start(self):
+        pages = manual(4)
+        chunker = StreamingChunker(chunk_size=300, chunk_overlap=50)
+        chunks = [c for page, text in enumerate(pages) for c in chunker.feed(page, text)] + chunker.finish()
+        for chunk in chunks:
+            first_word = chunk.text.split()[0]
+            self.assertTrue(pages[chunk.page][chunk.offset:].startswith(first_word))
+
+
+class TestIngestionPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.pages = manual(24)
+        self.pdf = os.path.join(self.dir, "manual.pdf")
+        write_text_pdf(self.pdf, self.pages)
+
+    def pipeline(self, table, embedder=None, **kwargs):
+        kwargs.setdefault("workers", 1)
+        return IngestionPipeline(embedder or Embedder(), table, pages_per_task=4, embed_batch=8,
+                                 insert_batch=16, checkpoint_dir=self.dir, **kwargs)
+
+    def test_extracts_page_text(self):
+        texts, _ = extract_pages(self.pdf, 2, 4)
+        self.assertEqual(len(texts), 2)
+        self.assertTrue(texts[0].startswith("p2w0-"))
+
+    def test_batches_embeddings_and_inserts(self):
+        embedder, table = Embedder(), Table()
+        report = self.pipeline(table, embedder).run(self.pdf, {"car_model": "Swift"})
+
+        self.assertEqual(report["pages"], 24)
+        self.assertEqual(report["added"], len(table.rows))
+        self.assertTrue(all(n <= 8 for n in embedder.calls))
+        self.assertEqual(sum(embedder.calls), len(table.rows))
+        self.assertEqual(table.calls, -(-len(table.rows) // 16))
+        self.assertEqual(table.rows[0]["metadata"], {"car_model": "Swift", "source": "manual.pdf", "page": 1, "chunk": 0,
+                                                      "vehicle": {"car_model": "swift"}})
+        self.assertEqual(table.rows[0]["content_hash"], content_hash(table.rows[0]["content"]))
+        self.assertEqual(table.rows[-1]["metadata"]["page"], 24)
+        self.assertTrue({"extract", "chunk", "embed", "insert"} <= set(report["stages"]))
+        self.assertEqual(report["stages"]["extract"]["items"], 24)
+
+    def test_process_pool_gives_the_same_rows(self):
+        serial, parallel = Table(), Table()
+        self.pipeline(serial).run(self.pdf, {})
+        self.pipeline(parallel, workers=2).run(self.pdf, {})
+        self.assertEqual([r["content"] for r in parallel.rows], [r["content"] for r in serial.rows])
+
+    def test_resumes_after_a_failed_insert(self):
+        table = Table(fail_on=3)
+        with self.assertRaises(ConnectionError):
+            self.pipeline(table).run(self.pdf, {})
+        committed = len(table.rows)
+        checkpoint = self.pipeline(table).load_checkpoint(file_digest(self.pdf))
+        self.assertEqual(checkpoint["chunk"], committed)
+        self.assertGreater(checkpoint["page"], 0)
+
+        report = self.pipeline(table).run(self.pdf, {})
+        self.assertTrue(report["resumed"])
+        self.assertEqual(report["added"], len(table.rows) - committed)
+        self.assertEqual(report["removed"], 0)
+        self.assertLess(report["stages"]["extract"]["items"], 24)
+        self.assertEqual([r["metadata"]["chunk"] for r in table.rows], list(range(len(table.rows))))
+        stored = " ".join(r["content"] for r in table.rows)
+        for page, text in enumerate(self.pages):
+            for word in (f"p{page}w0-", f"p{page}w249-"):
+                self.assertIn(word, stored)
+        self.assertIsNone(self.pipeline(table).load_checkpoint(file_digest(self.pdf)))
+
+
+
+class TestIncrementalIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.v1 = manual(12)
+        self.v2 = self.v1[:4] + manual(2, seed=9) + self.v1[6:11]  # pages 5-6 rewritten, page 12 dropped
+        self.table, self.embedder = Table(), Embedder()
+        self.pipeline = IngestionPipeline(self.embedder, self.table, workers=1, embed_batch=8,
+                                          insert_batch=16, checkpoint_dir=self.dir)
+        self.pipeline.run(self.pdf("v1", self.v1), {"source": "swift.pdf"})
+        self.embedder.calls.clear()
+
+    def pdf(self, name, pages):
+        path = os.path.join(self.dir, f"{name}.pdf")
+        write_text_pdf(path, pages)
+        return path
+
+    def hashes(self, table):
+        return sorted(r["content_hash"] for r in table.rows)
+
+    def test_same_file_embeds_nothing(self):
+        before = list(self.table.rows)
+        report = self.pipeline.run(self.pdf("v1", self.v1), {"source": "swift.pdf"})
+        self.assertEqual((report["added"], report["removed"]), (0, 0))
+        self.assertEqual(report["unchanged"], len(before))
+        self.assertEqual(self.embedder.calls, [])
+        self.assertEqual(self.table.rows, before)
+
+    def test_new_version_embeds_only_the_delta(self):
+        report = self.pipeline.run(self.pdf("v2", self.v2), {"source": "swift.pdf"})
+
+        fresh = Table()
+        IngestionPipeline(Embedder(), fresh, workers=1, checkpoint_dir=self.dir).run(
+            self.pdf("v2", self.v2), {"source": "swift.pdf"})
+        self.assertEqual(self.hashes(self.table), self.hashes(fresh))
+        self.assertEqual(sum(self.embedder.calls), report["added"])
+        self.assertLess(report["added"], len(fresh.rows) / 2)
+        self.assertGreater(report["removed"], 0)
+        self.assertTrue(set(report["added_pages"]) <= {4, 5, 6, 7})
+        self.assertEqual({r["version"] for r in self.table.rows}, {report["version"]})
+
+    def test_dry_run_reports_without_writing(self):
+        before = [dict(r) for r in self.table.rows]
+        plan = self.pipeline.run(self.pdf("v2", self.v2), {"source": "swift.pdf"}, dry_run=True)
+        self.assertEqual(self.table.rows, before)
+        self.assertEqual(self.embedder.calls, [])
+
+        report = self.pipeline.run(self.pdf("v2", self.v2), {"source": "swift.pdf"})
+        for field in ("added", "removed", "unchanged", "added_pages"):
+            self.assertEqual(plan[field], report[field], field)
+
+    def test_duplicate_rows_are_collapsed(self):
+        self.table.rows.append({**self.table.rows[0], "id": 999, "version": None})  # pre-dedup duplicate
+        report = self.pipeline.run(self.pdf("v1", self.v1), {"source": "swift.pdf"})
+        self.assertEqual((report["added"], report["removed"]), (0, 1))
+        self.assertEqual(len(self.hashes(self.table)), len(set(self.hashes(self.table))))
+
+    def test_resume_after_a_stamp_triggered_commit_keeps_every_chunk(self):
+        v1 = manual(30, seed=3)
+        v2 = [manual(1, seed=40 + p)[0] if p % 3 == 1 else text for p, text in enumerate(v1)]
+        table = Table()
+        pipeline = IngestionPipeline(Embedder(), table, workers=1, embed_batch=16, insert_batch=20,
+                                     checkpoint_dir=self.dir)
+        pipeline.run(self.pdf("long_v1", v1), {"source": "long.pdf"})
+        table.fail_on = table.calls + 2
+        with self.assertRaises(ConnectionError):
+            pipeline.run(self.pdf("long_v2", v2), {"source": "long.pdf"})
+        pipeline.run(self.pdf("long_v2", v2), {"source": "long.pdf"})
+
+        fresh = Table()
+        IngestionPipeline(Embedder(), fresh, workers=1, checkpoint_dir=self.dir).run(
+            self.pdf("long_v2", v2), {"source": "long.pdf"})
+        self.assertEqual(self.hashes(table), self.hashes(fresh))
+
+    def test_legacy_rows_without_a_source_are_claimed(self):
+        for row in self.table.rows:  # as stored by the old ingest_pdf
+            row["source"] = row["version"] = None
+        legacy = len(self.table.rows)
+        plan = self.pipeline.run(self.pdf("v1", self.v1), {"source": "swift.pdf"}, dry_run=True)
+        self.assertEqual((plan["added"], plan["unchanged"]), (0, legacy))
+
+        report = self.pipeline.run(self.pdf("v1", self.v1), {"source": "swift.pdf"})
+        self.assertEqual((report["added"], report["unchanged"]), (0, legacy))
+        self.assertEqual(self.embedder.calls, [])
+        self.assertEqual(len(self.table.rows), legacy)
+        self.assertEqual({r["source"] for r in self.table.rows}, {"swift.pdf"})
+
+    def test_other_sources_are_untouched(self):
+        self.pipeline.run(self.pdf("other", manual(2, seed=5)), {"source": "baleno.pdf"})
+        self.pipeline.run(self.pdf("v2", self.v2), {"source": "swift.pdf"})
+        self.assertTrue(any(r["source"] == "baleno.pdf" for r in self.table.rows))
+
+
+class TestAddDocuments(unittest.TestCase):
+
+    def setUp(self):
+        self.table, self.embedder = Table(), Embedder()
+        self.pipeline = IngestionPipeline(self.embedder, self.table, workers=1, embed_batch=8, insert_batch=16)
+
+    def test_chunks_embed_and_insert_in_batches(self):
+        documents = [Document(text, {"brand": "Maruti"}) for text in manual(3)]
+        report = self.pipeline.add_documents(documents, "bulletin")
+        self.assertEqual(report["added"], len(self.table.rows))
+        self.assertGreater(report["added"], len(documents))
+        self.assertTrue(all(n <= 8 for n in self.embedder.calls))
+        self.assertEqual(self.table.calls, -(-len(self.table.rows) // 16))
+        row = self.table.rows[0]
+        self.assertEqual(row["source"], "bulletin")
+        self.assertEqual(row["metadata"]["vehicle"], {"brand": "maruti"})
+        self.assertEqual(row["metadata"]["source_type"], "bulletin")
+
+    def test_already_stored_chunks_are_skipped(self):
+        documents = [Document("Torque the drain plug to 35 Nm.", {"source": "tsb-12"})]
+        self.pipeline.add_documents(documents)
+        report = self.pipeline.add_documents(documents + [Document("Replace the gasket.", {"source": "tsb-12"})])
+        self.assertEqual((report["added"], report["duplicate"]), (1, 1))
+        self.assertEqual([r["source"] for r in self.table.rows], ["tsb-12", "tsb-12"])
+
+
+if __name__ == '__main__':
+    unittest.main()
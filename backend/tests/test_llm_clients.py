@@ -0,0 +1,55 @@
+"""
+Unit tests for the pooled LLM client shutdown
+Run with: python -m unittest backend.tests.test_llm_clients
+"""
+
+import unittest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.llm_clients import ModelClientPool
+
+
+class SyncClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncClient:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TestShutdown(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ModelClientPool()
+        self.pool._ensure_process()
+        self.sync, self.async_client = SyncClient(), AsyncClient()
+        self.pool._clients.update({"gemini": self.sync, "gemini_async": self.async_client})
+
+    def test_close_leaves_async_clients_for_aclose(self):
+        self.pool.close()
+        self.assertTrue(self.sync.closed)
+        self.assertEqual(list(self.pool._clients), ["gemini_async"])
+        asyncio.run(self.pool.aclose())
+        self.assertTrue(self.async_client.closed)
+        self.assertEqual(self.pool._clients, {})
+
+    def test_aclose_then_close_closes_everything(self):
+        asyncio.run(self.pool.aclose())
+        self.pool.close()
+        self.assertTrue(self.sync.closed and self.async_client.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
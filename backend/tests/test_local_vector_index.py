@@ -0,0 +1,213 @@
+"""
+Unit tests for the in-process ANN fallback index
+Run with: python -m unittest backend.tests.test_local_vector_index
+"""
+
+import unittest
+import tempfile
+import shutil
+import time
+import threading
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.local_vector_index import LocalVectorIndex
+from services.embedding_batcher import FakeEmbedder
+from services.vector_engine import VectorEngine
+from services.cache_stats import CacheStats
+
+
+def clustered(n, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    return centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, dim))
+
+
+class TestRecallAndLatency(unittest.TestCase):
+    """IVF search against exact brute force over the same rows."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.n, cls.dim = 20000, 128
+        cls.data = clustered(cls.n, cls.dim, clusters=200)
+        cls.index = LocalVectorIndex(dim=cls.dim, capacity=cls.n, directory=cls.root, nprobe=8)
+        for i, vector in enumerate(cls.data):
+            cls.index.add(f"k{i}", vector, {"scope": "global", "response": str(i)})
+        cls.index.wait_for_training()
+        rng = np.random.default_rng(1)
+        picks = rng.integers(cls.n, size=200)
+        cls.queries = cls.data[picks] + 0.1 * rng.standard_normal((200, cls.dim))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def test_recall_at_1(self):
+        agree = sum(
+            self.index.search(q, "global")[1]["key"] == self.index.search(q, "global", exact=True)[1]["key"]
+            for q in self.queries
+        )
+        self.assertGreaterEqual(agree / len(self.queries), 0.95)
+        self.assertGreater(self.index.get_stats()["ivf_lists"], 1)
+
+    def test_faster_than_brute_force(self):
+        def timed(exact):
+            started = time.perf_counter()
+            for q in self.queries:
+                self.index.search(q, "global", exact=exact)
+            return time.perf_counter() - started
+
+        timed(False), timed(True)  # warm up
+        self.assertLess(timed(False), timed(True))
+
+
+class TestLocalVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.now = [1000.0]
+        self.index = LocalVectorIndex(dim=4, capacity=3, directory=self.root, clock=lambda: self.now[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_scope_filter(self):
+        self.index.add("a", [1, 0, 0, 0], {"scope": "ws1"})
+        self.index.add("b", [0, 1, 0, 0], {"scope": "ws2"})
+        similarity, entry = self.index.search([1, 0.1, 0, 0], "ws2")
+        self.assertEqual(entry["key"], "b")
+        self.assertLess(similarity, 0.5)
+        self.assertIsNone(self.index.search([1, 0, 0, 0], "ws3"))
+
+    def test_lru_eviction(self):
+        for i, key in enumerate("abc"):
+            self.index.add(key, np.eye(4)[i], {"scope": "s"})
+        self.index.search(np.eye(4)[0], "s")  # touch "a"
+        self.index.add("d", np.eye(4)[3], {"scope": "s"})
+        self.assertEqual(len(self.index), 3)
+        self.assertNotEqual(self.index.search(np.eye(4)[1], "s", exact=True)[1]["key"], "b")
+        self.assertEqual(self.index.get_stats()["evictions"], 1)
+
+    def test_expiry_and_pending(self):
+        self.index.add("a", [1, 0, 0, 0], {"scope": "s"}, ttl=60, pending=True)
+        self.index.add("b", [0, 1, 0, 0], {"scope": "s"}, ttl=600)
+        drained = self.index.drain_pending()
+        self.assertEqual([key for key, _, _ in drained], ["a"])
+        self.assertEqual(self.index.drain_pending(), [])
+        self.now[0] += 120
+        self.assertEqual(self.index.search([1, 0, 0, 0], "s", exact=True)[1]["key"], "b")
+        self.assertEqual(len(self.index), 1)
+        self.now[0] += 600
+        self.assertIsNone(self.index.search([1, 0, 0, 0], "s", exact=True))
+
+    def test_expired_nearest_falls_through_to_the_next_live_entry(self):
+        self.index.add("near", [1, 0, 0, 0], {"scope": "s"}, ttl=60)
+        self.index.add("next", [1, 0.2, 0, 0], {"scope": "s"}, ttl=600)
+        self.index.add("other", [1, 0, 0, 0], {"scope": "t"}, ttl=600)
+        self.now[0] += 120
+        similarity, entry = self.index.search([1, 0, 0, 0], "s")
+        self.assertEqual(entry["key"], "next")
+        self.assertGreater(similarity, 0.9)
+        self.assertEqual(len(self.index), 2)
+
+
+class TestBackgroundTraining(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_add_does_not_wait_for_training(self):
+        import services.local_vector_index as module
+        release = threading.Event()
+        kmeans = module.spherical_kmeans
+
+        def slow_kmeans(*args, **kwargs):
+            release.wait(5)
+            return kmeans(*args, **kwargs)
+
+        index = LocalVectorIndex(dim=8, capacity=200, directory=self.root, train_min=64)
+        data = clustered(100, 8, clusters=4)
+        with patch.object(module, "spherical_kmeans", slow_kmeans):
+            started = time.perf_counter()
+            for i, vector in enumerate(data):
+                index.add(f"k{i}", vector, {"scope": "s"})
+            self.assertLess(time.perf_counter() - started, 2)
+            self.assertTrue(index.get_stats()["training"])
+            self.assertEqual(index.search(data[80], "s")[1]["key"], "k80")  # exact until trained
+            release.set()
+            index.wait_for_training(5)
+
+        stats = index.get_stats()
+        self.assertFalse(stats["training"])
+        self.assertEqual(stats["ivf_lists"], 8)
+        # rows added after the snapshot were assigned to a list at swap time
+        self.assertTrue((index._assign[:100] >= 0).all())
+        self.assertEqual(index.search(data[99], "s")[1]["key"], "k99")
+
+
+class FakeJson:
+    def __init__(self, store):
+        self.store = store
+
+    def set(self, key, path, doc):
+        self.store[key] = doc
+
+
+class FakeRedis:
+    def __init__(self):
+        self.docs, self.ttls = {}, {}
+
+    def json(self):
+        return FakeJson(self.docs)
+
+    def expire(self, key, ttl):
+        self.ttls[key] = ttl
+
+
+class TestDegradedVectorEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.engine = VectorEngine.__new__(VectorEngine)
+        self.engine.redis = None
+        self.engine.doc_prefix = "cache:"
+        self.engine.local = LocalVectorIndex(dim=16, capacity=100, directory=self.root)
+        self.engine._last_connect = time.monotonic()
+        self.engine.stats = CacheStats(lambda: None)
+        embedder = FakeEmbedder(dim=16)
+        self.engine.get_embedding = embedder.vector
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_cache_works_without_redis_and_resyncs(self):
+        self.engine.cache_response("car won't start", "Check the battery.", scope="ws1")
+        hit = self.engine.search_cache("car won't start", scope="ws1")
+        self.assertEqual(hit["text"], "Check the battery.")
+        self.assertIsNone(self.engine.search_cache("car won't start", scope="ws2"))
+        self.assertEqual(self.engine.get_cache_stats()["status"], "degraded")
+
+        fake = FakeRedis()
+
+        def reconnect():
+            self.engine.redis = fake
+
+        self.engine._last_connect = 0.0
+        with patch("services.vector_engine.REDIS_AVAILABLE", True), \
+                patch.object(self.engine, "_connect", reconnect):
+            self.assertTrue(self.engine._redis_ready())
+        (key, doc), = fake.docs.items()
+        self.assertEqual((doc["response"], doc["scope"], len(doc["vector"])), ("Check the battery.", "ws1", 16))
+        self.assertNotIn("expires_at", doc)
+        self.assertGreater(fake.ttls[key], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+"""
+Unit tests for the latency-aware model router
+Run with: python -m unittest backend.tests.test_model_router
+"""
+
+import unittest
+import asyncio
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import model_router
+from services.model_router import ModelRouter, NoProviderAvailable, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeProvider:
+    """Provider stub with scripted latency and outcomes."""
+
+    def __init__(self, name, latency=0.0, fail=False, script=None):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.script = list(script or [])  # per-call (latency, fail) overrides
+        self.calls = 0
+
+    def __call__(self, history, system_prompt):
+        self.calls += 1
+        latency, fail = self.script.pop(0) if self.script else (self.latency, self.fail)
+        time.sleep(latency)
+        if fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        return {"job_status_update": "CREATED", "provider": self.name}
+
+
+class AsyncFakeProvider(FakeProvider):
+    """Awaitable variant for aroute()."""
+
+    async def __call__(self, history, system_prompt):
+        self.calls += 1
+        latency, fail = self.script.pop(0) if self.script else (self.latency, self.fail)
+        await asyncio.sleep(latency)
+        if fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        return {"job_status_update": "CREATED", "provider": self.name}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(gemini, claude, **kwargs):
+    return ModelRouter({"gemini": gemini, "claude": claude}, **kwargs)
+
+
+class TestRouting(unittest.TestCase):
+    """Provider preference and failover."""
+
+    def test_mode_preference(self):
+        """THINKING prefers Claude, FAST prefers Gemini."""
+        router = make_router(FakeProvider("gemini"), FakeProvider("claude"))
+        self.assertEqual(router.route("THINKING", [], "")[1], "claude")
+        self.assertEqual(router.route("FAST", [], "")[1], "gemini")
+
+    def test_unconfigured_provider_skipped(self):
+        """A provider reported unavailable is never called."""
+        claude = FakeProvider("claude")
+        router = make_router(FakeProvider("gemini"), claude, available={"claude": lambda: False})
+        self.assertEqual(router.route("THINKING", [], "")[1], "gemini")
+        self.assertEqual(claude.calls, 0)
+
+    def test_failover_goes_to_other_provider(self):
+        """A failing primary is not retried; the other provider answers."""
+        gemini = FakeProvider("gemini", fail=True)
+        claude = FakeProvider("claude")
+        router = make_router(gemini, claude)
+        result, name = router.route("FAST", [], "")
+        self.assertEqual(name, "claude")
+        self.assertEqual(result["provider"], "claude")
+        self.assertEqual(gemini.calls, 1)
+
+    def test_all_failed_raises(self):
+        router = make_router(FakeProvider("gemini", fail=True), FakeProvider("claude", fail=True))
+        with self.assertRaises(NoProviderAvailable):
+            router.route("FAST", [], "")
+
+    def test_non_dict_result_counts_as_failure(self):
+        """Only a JSON object is a valid result."""
+        router = ModelRouter({"gemini": lambda h, s: ["not", "an", "object"],
+                              "claude": FakeProvider("claude")})
+        self.assertEqual(router.route("FAST", [], "")[1], "claude")
+        self.assertEqual(router.health["gemini"].failures, 1)
+
+    def test_ewma_latency_tracking(self):
+        gemini = FakeProvider("gemini", latency=0.02)
+        router = make_router(gemini, FakeProvider("claude"))
+        for _ in range(3):
+            router.route("FAST", [], "")
+        stats = router.get_stats()["providers"]["gemini"]
+        self.assertEqual(stats["calls"], 3)
+        self.assertGreaterEqual(stats["latency_ewma_ms"], 15)
+        self.assertEqual(stats["error_rate_ewma"], 0.0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Breaker opens on sustained failures and probes after cooldown."""
+
+    def test_opens_after_consecutive_failures_and_recovers(self):
+        clock = FakeClock()
+        gemini = FakeProvider("gemini", fail=True)
+        claude = FakeProvider("claude")
+        router = make_router(gemini, claude, clock=clock)
+
+        for _ in range(model_router.BREAKER_FAILURES):
+            router.route("FAST", [], "")
+        self.assertEqual(router.health["gemini"].state, OPEN)
+
+        # While open, Gemini is skipped entirely
+        router.route("FAST", [], "")
+        self.assertEqual(gemini.calls, model_router.BREAKER_FAILURES)
+
+        # After cooldown one probe goes through; success closes the circuit
+        clock.now += model_router.BREAKER_COOLDOWN
+        gemini.fail = False
+        self.assertEqual(router.health["gemini"].allow(), True)
+        self.assertEqual(router.health["gemini"].state, HALF_OPEN)
+        self.assertEqual(router.route("FAST", [], "")[1], "gemini")
+        self.assertEqual(router.health["gemini"].state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        clock = FakeClock()
+        router = make_router(FakeProvider("gemini", fail=True), FakeProvider("claude"), clock=clock)
+        for _ in range(model_router.BREAKER_FAILURES):
+            router.route("FAST", [], "")
+        clock.now += model_router.BREAKER_COOLDOWN
+        router.route("FAST", [], "")
+        self.assertEqual(router.health["gemini"].state, OPEN)
+        self.assertEqual(router.health["gemini"].opened_at, clock.now)
+
+    def test_only_one_probe_in_half_open(self):
+        clock = FakeClock()
+        router = make_router(FakeProvider("gemini", fail=True), FakeProvider("claude"), clock=clock)
+        for _ in range(model_router.BREAKER_FAILURES):
+            router.route("FAST", [], "")
+        clock.now += model_router.BREAKER_COOLDOWN
+        self.assertEqual(router.pick("FAST"), "gemini")  # claims the probe
+        self.assertEqual(router.pick("FAST"), "claude")
+
+    def test_abandoned_probe_is_released(self):
+        clock = FakeClock()
+        router = make_router(FakeProvider("gemini", fail=True), FakeProvider("claude"), clock=clock)
+        for _ in range(model_router.BREAKER_FAILURES):
+            router.route("FAST", [], "")
+        clock.now += model_router.BREAKER_COOLDOWN
+        self.assertEqual(router.pick("FAST"), "gemini")
+        router.abandon("gemini")  # e.g. the streaming client disconnected
+        self.assertEqual(router.pick("FAST"), "gemini")
+
+
+class TestHedging(unittest.TestCase):
+    """FAST-mode hedged requests."""
+
+    def setUp(self):
+        self._default_delay = model_router.HEDGE_DEFAULT_DELAY_MS
+        model_router.HEDGE_DEFAULT_DELAY_MS = 50.0
+
+    def tearDown(self):
+        model_router.HEDGE_DEFAULT_DELAY_MS = self._default_delay
+
+    def test_slow_primary_is_hedged(self):
+        """The secondary fires after the hedge delay and its answer wins."""
+        gemini = FakeProvider("gemini", latency=0.6)
+        claude = FakeProvider("claude", latency=0.01)
+        router = make_router(gemini, claude, hedge_fast=True)
+        started = time.perf_counter()
+        result, name = router.route("FAST", [], "")
+        elapsed = time.perf_counter() - started
+        self.assertEqual(name, "claude")
+        self.assertLess(elapsed, 0.4)
+        self.assertEqual(router.hedges_fired, 1)
+        self.assertEqual(router.hedges_won, 1)
+
+    def test_fast_primary_is_not_hedged(self):
+        gemini = FakeProvider("gemini", latency=0.0)
+        claude = FakeProvider("claude")
+        router = make_router(gemini, claude, hedge_fast=True)
+        self.assertEqual(router.route("FAST", [], "")[1], "gemini")
+        self.assertEqual(claude.calls, 0)
+        self.assertEqual(router.hedges_fired, 0)
+
+    def test_primary_failure_triggers_hedge_immediately(self):
+        gemini = FakeProvider("gemini", fail=True)
+        claude = FakeProvider("claude", latency=0.01)
+        router = make_router(gemini, claude, hedge_fast=True)
+        self.assertEqual(router.route("FAST", [], "")[1], "claude")
+
+    def test_primary_wins_race_after_hedge(self):
+        """If the primary answers first after the hedge fires, it still wins."""
+        gemini = FakeProvider("gemini", latency=0.08)
+        claude = FakeProvider("claude", latency=0.5)
+        router = make_router(gemini, claude, hedge_fast=True)
+        self.assertEqual(router.route("FAST", [], "")[1], "gemini")
+        self.assertEqual(router.hedges_fired, 1)
+        self.assertEqual(router.hedges_won, 0)
+
+    def test_thinking_mode_never_hedges(self):
+        gemini = FakeProvider("gemini")
+        claude = FakeProvider("claude", latency=0.1)
+        router = make_router(gemini, claude, hedge_fast=True)
+        self.assertEqual(router.route("THINKING", [], "")[1], "claude")
+        self.assertEqual(gemini.calls, 0)
+
+    def test_hedge_delay_tracks_p95(self):
+        router = make_router(FakeProvider("gemini"), FakeProvider("claude"))
+        for latency in range(1, 101):
+            router.record("gemini", latency * 10.0, ok=True)
+        self.assertAlmostEqual(router.hedge_delay_ms("gemini"), 960.0)
+
+
+class TestAsyncRouting(unittest.TestCase):
+    """aroute(): same policy as route(), awaited on the event loop."""
+
+    def setUp(self):
+        self._default_delay = model_router.HEDGE_DEFAULT_DELAY_MS
+        model_router.HEDGE_DEFAULT_DELAY_MS = 50.0
+
+    def tearDown(self):
+        model_router.HEDGE_DEFAULT_DELAY_MS = self._default_delay
+
+    def make(self, gemini, claude, **kwargs):
+        return make_router(FakeProvider("gemini"), FakeProvider("claude"),
+                           async_providers={"gemini": gemini, "claude": claude}, **kwargs)
+
+    def test_failover_and_shared_health(self):
+        router = self.make(AsyncFakeProvider("gemini", fail=True), AsyncFakeProvider("claude"))
+        result, name = asyncio.run(router.aroute("FAST", [], ""))
+        self.assertEqual((name, result["provider"]), ("claude", "claude"))
+        self.assertEqual(router.get_stats()["providers"]["gemini"]["failures"], 1)
+
+    def test_concurrent_calls_overlap(self):
+        """Fifty awaited 100ms calls finish together, not back to back."""
+        router = self.make(AsyncFakeProvider("gemini", latency=0.1), AsyncFakeProvider("claude"))
+
+        async def burst():
+            return await asyncio.gather(*(router.aroute("FAST", [], "") for _ in range(50)))
+
+        started = time.perf_counter()
+        results = asyncio.run(burst())
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertTrue(all(name == "gemini" for _, name in results))
+
+    def test_slow_primary_is_hedged_and_loser_cancelled(self):
+        gemini = AsyncFakeProvider("gemini", latency=0.6)
+        router = self.make(gemini, AsyncFakeProvider("claude", latency=0.01), hedge_fast=True)
+        router.health["gemini"].state = HALF_OPEN
+        started = time.perf_counter()
+        self.assertEqual(asyncio.run(router.aroute("FAST", [], ""))[1], "claude")
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(router.hedges_won, 1)
+        # the cancelled probe does not block the next one
+        self.assertTrue(router.health["gemini"].allow())
+
+    def test_provider_without_async_variant_is_skipped(self):
+        router = make_router(FakeProvider("gemini"), FakeProvider("claude"),
+                             async_providers={"claude": AsyncFakeProvider("claude")})
+        self.assertEqual(asyncio.run(router.aroute("FAST", [], ""))[1], "claude")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Unit tests for the precompiled system prompt and provider context caching
+Run with: python -m unittest backend.tests.test_prompt_cache
+"""
+
+import unittest
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.prompt_cache import PromptCache, SystemPrompt, estimate_tokens
+
+STATIC = "EKA CONSTITUTION " * 2000  # comfortably above the Gemini minimum
+
+
+class FakeCaches:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError("caching not supported")
+        self.created.append((model, config))
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+
+class TestPromptShape(unittest.TestCase):
+
+    def test_full_text_matches_legacy_prompt(self):
+        cache = PromptCache("RULES", gemini_enabled=False)
+        prompt = cache.build(1, "CREATED", {"brand": "Tata"})
+        self.assertEqual(
+            str(prompt),
+            'RULES\n[OPERATING_MODE]: 1\n[CURRENT_STATUS]: CREATED\n[VEHICLE_CONTEXT]: {"brand": "Tata"}'
+        )
+
+    def test_claude_static_block_is_cache_marked(self):
+        cache = PromptCache(STATIC, gemini_enabled=False)
+        blocks = cache.claude_system(cache.build(0, "CREATED", {}))
+        self.assertEqual(blocks[0]["text"], STATIC)
+        self.assertEqual(blocks[0]["cache_control"], {"type": "ephemeral"})
+        self.assertNotIn("cache_control", blocks[1])
+        self.assertIn("[CURRENT_STATUS]: CREATED", blocks[1]["text"])
+
+    def test_static_token_estimate(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(PromptCache(STATIC).static_tokens, estimate_tokens(STATIC))
+
+
+class TestGeminiContextCache(unittest.TestCase):
+
+    def test_cache_created_once_and_tail_sent_per_call(self):
+        caches = FakeCaches()
+        client = SimpleNamespace(caches=caches)
+        cache = PromptCache(STATIC, gemini_enabled=True)
+        history = [{"role": "user", "parts": [{"text": "Brake noise"}]}]
+
+        for status in ("CREATED", "DIAGNOSED"):
+            contents, config = cache.gemini_request(client, "gemini-x", cache.build(0, status, {}), history)
+            self.assertEqual(config, {"cached_content": "cachedContents/1"})
+            self.assertIn(f"[CURRENT_STATUS]: {status}", contents[0]["parts"][0]["text"])
+            self.assertEqual(contents[1:], history)
+        self.assertEqual(len(caches.created), 1)
+        self.assertEqual(caches.created[0][1]["system_instruction"], STATIC)
+
+    def test_short_prompt_sent_inline(self):
+        caches = FakeCaches()
+        cache = PromptCache("SHORT RULES", gemini_enabled=True)
+        prompt = cache.build(0, "CREATED", {})
+        contents, config = cache.gemini_request(SimpleNamespace(caches=caches), "gemini-x", prompt, [])
+        self.assertEqual(config, {"system_instruction": str(prompt)})
+        self.assertEqual(caches.created, [])
+
+    def test_creation_failure_backs_off(self):
+        caches = FakeCaches(fail=True)
+        client = SimpleNamespace(caches=caches)
+        cache = PromptCache(STATIC, gemini_enabled=True)
+        prompt = cache.build(0, "CREATED", {})
+        self.assertIn("system_instruction", cache.gemini_request(client, "gemini-x", prompt, [])[1])
+        caches.fail = False
+        self.assertIn("system_instruction", cache.gemini_request(client, "gemini-x", prompt, [])[1])
+        cache._gemini_retry_at = 0
+        self.assertIn("cached_content", cache.gemini_request(client, "gemini-x", prompt, [])[1])
+
+
+class TestUsageMetrics(unittest.TestCase):
+
+    def test_token_accounting(self):
+        cache = PromptCache(STATIC, gemini_enabled=False)
+        cache.record("claude", SimpleNamespace(input_tokens=40, cache_read_input_tokens=960,
+                                               cache_creation_input_tokens=0), 800.0, ttft_ms=300.0)
+        cache.record("gemini", SimpleNamespace(prompt_token_count=1000, cached_content_token_count=900), 500.0)
+        stats = cache.get_stats()["providers"]
+        self.assertEqual(stats["claude"]["prompt_tokens"], 1000)
+        self.assertEqual(stats["claude"]["uncached_tokens"], 40)
+        self.assertEqual(stats["claude"]["avg_ttft_ms"], 300.0)
+        self.assertEqual(stats["gemini"]["cached_ratio"], 0.9)
+        self.assertEqual(stats["gemini"]["avg_ttft_ms"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Unit tests for the /api/chat response cache scope
+Run with: python -m unittest backend.tests.test_response_cache
+"""
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.response_cache import ChatResponseCache, build_scope, scope_key, TIER_EXACT, MISS
+
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+class MissingEngine:
+    """Semantic tier that never matches and ignores stores (no Redis: tier 1 stays in-process)."""
+
+    redis = None
+
+    def search_cache(self, query, scope_hash):
+        return None
+
+    def cache_response(self, *args, **kwargs):
+        return None
+
+
+class RecordingBudget:
+    def __init__(self):
+        self.admitted = []
+        self.touched = []
+
+    def admit(self, key, owner=None):
+        self.admitted.append((key, owner))
+        return 0
+
+    def touch(self, key):
+        self.touched.append(key)
+
+
+class DictRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+class RedisEngine(MissingEngine):
+    """Semantic tier that never matches, with tier 1 in (fake) Redis under a budget."""
+
+    def __init__(self):
+        self.redis = DictRedis()
+        self.budget = RecordingBudget()
+
+
+VEHICLE = {"brand": "Maruti", "model": "Swift", "year": 2019}
+
+
+class TestScope(unittest.TestCase):
+
+    def scope(self, history, workshop="ws1", mode="FAST"):
+        return build_scope("CREATED", 0, VEHICLE, history=history, workshop=workshop, intelligence_mode=mode)
+
+    def test_follow_ups_in_different_conversations_do_not_share_a_scope(self):
+        brakes = [turn("user", "Should I replace the brake pads?"), turn("model", "Yes, below 3mm."), turn("user", "yes")]
+        clutch = [turn("user", "Is the clutch slipping?"), turn("model", "Probably."), turn("user", "yes")]
+        self.assertNotEqual(scope_key(self.scope(brakes)), scope_key(self.scope(clutch)))
+
+    def test_first_turns_share_a_scope_within_a_workshop_and_mode(self):
+        first = self.scope([turn("user", "AC not cooling")])
+        self.assertEqual(scope_key(first), scope_key(self.scope([turn("user", "ac not cooling?")])))
+        self.assertNotEqual(scope_key(first), scope_key(self.scope([turn("user", "AC not cooling")], workshop="ws2")))
+        self.assertNotEqual(scope_key(first), scope_key(self.scope([turn("user", "AC not cooling")], mode="PRO")))
+
+    def test_cached_answer_is_not_replayed_into_another_conversation(self):
+        cache = ChatResponseCache(engine=MissingEngine())
+        brakes = self.scope([turn("user", "Replace the pads?"), turn("model", "Yes."), turn("user", "yes")])
+        clutch = self.scope([turn("user", "Clutch slipping?"), turn("model", "Maybe."), turn("user", "yes")])
+        cache.store("yes", brakes, {"response_content": {"visual_text": "Fit new pads"}})
+        self.assertEqual(cache.lookup("yes", brakes)[1], TIER_EXACT)
+        self.assertEqual(cache.lookup("yes", clutch), (None, MISS))
+        self.assertEqual(cache.lookup("yes", {**brakes, "workshop": "ws2"}), (None, MISS))
+
+
+
+class TestExactTierBudget(unittest.TestCase):
+
+    def test_exact_entries_are_admitted_for_the_owner_and_touched_on_hit(self):
+        engine = RedisEngine()
+        cache = ChatResponseCache(engine=engine)
+        scope = build_scope("CREATED", 0, VEHICLE, workshop="ws1")
+        cache.store("Brake noise", scope, {"response_content": {"visual_text": "Check the pads"}}, owner="ws1")
+
+        [(key, owner)] = engine.budget.admitted
+        self.assertTrue(key.startswith("chat:exact:"))
+        self.assertEqual(owner, "ws1")
+        self.assertEqual(cache.lookup("brake noise", scope)[1], TIER_EXACT)
+        self.assertEqual(engine.budget.touched, [key])
+
+
+if __name__ == '__main__':
+    unittest.main()
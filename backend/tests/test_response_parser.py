@@ -0,0 +1,134 @@
+"""
+Unit tests for tolerant model-output parsing and repair
+Run with: python -m unittest backend.tests.test_response_parser
+"""
+
+import unittest
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.response_parser import ResponseParser, ModelOutputError, repair_json
+
+ENVELOPE = {
+    "response_content": {"visual_text": "Check the battery terminals.", "audio_text": "Check the battery."},
+    "job_status_update": "DIAGNOSED",
+    "diagnostic_data": {"code": "P0562", "possible_causes": ["Weak battery", "Loose ground"]},
+}
+RAW = json.dumps(ENVELOPE)
+
+
+class TestRepair(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = ResponseParser()
+
+    def assertRepaired(self, text, kind):
+        self.assertEqual(self.parser.parse(text, "gemini"), ENVELOPE)
+        self.assertIn(kind, self.parser.get_stats()["gemini"]["repairs"])
+
+    def test_clean_json_is_not_counted_as_repair(self):
+        self.assertEqual(self.parser.parse(RAW, "gemini"), ENVELOPE)
+        self.assertEqual(self.parser.get_stats()["gemini"]["clean"], 1)
+        self.assertEqual(self.parser.get_stats()["gemini"]["repaired"], 0)
+
+    def test_markdown_fence(self):
+        self.assertRepaired(f"```json\n{RAW}\n```", "fence")
+
+    def test_leading_and_trailing_prose(self):
+        self.assertRepaired(f"Here is the diagnosis:\n{RAW}", "leading_text")
+        self.assertRepaired(f"{RAW}\n\nLet me know if you need anything else.", "trailing_text")
+
+    def test_missing_closing_braces(self):
+        self.assertRepaired(RAW[:-1], "truncated")
+        self.assertRepaired(RAW[:-2], "truncated")
+
+    def test_truncated_inside_string_keeps_partial_text(self):
+        cut = RAW.index("terminals") + 4
+        envelope = self.parser.parse(RAW[:cut], "claude")
+        self.assertEqual(envelope["response_content"]["visual_text"], "Check the battery term")
+
+    def test_truncated_member_is_dropped(self):
+        text = RAW[:RAW.index('"diagnostic_data"') + 8]
+        envelope = self.parser.parse(text, "gemini")
+        self.assertEqual(envelope["job_status_update"], "DIAGNOSED")
+        self.assertNotIn("diagnostic_data", envelope)
+
+    def test_double_encoded_and_wrong_typed_sections(self):
+        envelope = self.parser.parse(json.dumps(json.dumps({**ENVELOPE, "ui_triggers": "orange"})), "gemini")
+        self.assertEqual(envelope, ENVELOPE)
+        self.assertEqual(set(self.parser.get_stats()["gemini"]["repairs"]), {"double_encoded", "dropped_field"})
+
+    def test_unusable_output_raises(self):
+        for text in ("I cannot help with that.", "[1, 2]", "", None):
+            with self.assertRaises(ModelOutputError):
+                self.parser.parse(text, "gemini")
+        self.assertEqual(self.parser.get_stats()["gemini"]["unrepairable"], 4)
+
+    def test_missing_visual_text_is_left_to_the_default(self):
+        for text in ('{"job_status_update": "CREATED"}',
+                     '{"response_content": {"audio_text": "Done."}, "job_status_update": "CREATED"}'):
+            self.assertEqual(self.parser.parse(text, "gemini"), {"job_status_update": "CREATED"})
+        stats = self.parser.get_stats()["gemini"]
+        self.assertEqual((stats["repaired"], stats["unrepairable"]), (2, 0))
+        self.assertEqual(stats["repairs"], {"missing_visual_text": 2})
+
+    def test_repair_json_reports_nothing_for_valid_input(self):
+        self.assertEqual(repair_json(" [1, 2] "), ([1, 2], []))
+
+
+class TestReask(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = ResponseParser()
+
+    def generator(self, outputs):
+        calls = []
+
+        def generate(extra_turns):
+            calls.append(extra_turns)
+            return outputs[len(calls) - 1]
+        return generate, calls
+
+    def test_repairable_output_does_not_reask(self):
+        generate, calls = self.generator([f"```json\n{RAW}```"])
+        self.assertEqual(self.parser.parse_with_reask("gemini", generate), ENVELOPE)
+        self.assertEqual(calls, [[]])
+        self.assertEqual(self.parser.get_stats()["gemini"]["reasks"], 0)
+
+    def test_unrepairable_output_reasks_once_with_feedback(self):
+        generate, calls = self.generator(["Sorry, something went wrong.", RAW])
+        self.assertEqual(self.parser.parse_with_reask("claude", generate), ENVELOPE)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1][0], {"role": "model", "parts": [{"text": "Sorry, something went wrong."}]})
+        self.assertEqual(calls[1][1]["role"], "user")
+        stats = self.parser.get_stats()["claude"]
+        self.assertEqual((stats["reasks"], stats["reask_failures"], stats["clean"]), (1, 0, 1))
+
+    def test_missing_visual_text_does_not_reask(self):
+        generate, calls = self.generator(['{"job_status_update": "DIAGNOSED"}'])
+        self.assertEqual(self.parser.parse_with_reask("claude", generate), {"job_status_update": "DIAGNOSED"})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.parser.get_stats()["claude"]["reasks"], 0)
+
+    def test_failed_reask_raises_for_router_failover(self):
+        generate, _ = self.generator(["no json", "still no json"])
+        with self.assertRaises(ModelOutputError):
+            self.parser.parse_with_reask("gemini", generate)
+        self.assertEqual(self.parser.get_stats()["gemini"]["reask_failures"], 1)
+
+    def test_async_reask(self):
+        outputs = ["not json", RAW]
+
+        async def generate(extra_turns):
+            return outputs.pop(0)
+
+        self.assertEqual(asyncio.run(self.parser.aparse_with_reask("gemini", generate)), ENVELOPE)
+        self.assertEqual(self.parser.get_stats()["gemini"]["reasks"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
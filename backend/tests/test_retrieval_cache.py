@@ -0,0 +1,116 @@
+"""
+Unit tests for the knowledge base retrieval result cache
+Run with: python -m unittest backend.tests.test_retrieval_cache
+"""
+
+import unittest
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.retrieval_cache import RetrievalCache, retrieval_key, VERSION_KEY
+
+
+class StrRedis:
+    """Minimal stand-in for the Redis commands the retrieval cache uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+
+class Search:
+    """Search stand-in that counts calls."""
+
+    def __init__(self, rows=None):
+        self.calls = 0
+        self.rows = rows if rows is not None else [{"content": "Swap the coil", "score": 1.0}]
+
+    def __call__(self):
+        self.calls += 1
+        return self.rows
+
+
+class TestRetrievalCache(unittest.TestCase):
+
+    def test_repeated_query_is_served_from_cache(self):
+        cache, search = RetrievalCache(use_redis=False), Search()
+        first = cache.get_or_search("P0301 misfire", 5, {"brand": "Maruti"}, search)
+        second = cache.get_or_search("  p0301   MISFIRE ", 5, {"brand": "Maruti"}, search)
+        self.assertEqual(first, second)
+        self.assertEqual(search.calls, 1)
+        stats = cache.get_stats()
+        self.assertEqual((stats["memory_hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_key_covers_filters_top_k_and_mode(self):
+        base = retrieval_key(0, "misfire", 5, {"brand": "Maruti", "year": "2019"}, "hybrid")
+        self.assertEqual(base, retrieval_key(0, "misfire", 5, {"year": "2019", "brand": "Maruti"}, "hybrid"))
+        for other in (retrieval_key(0, "misfire", 3, {"brand": "Maruti", "year": "2019"}, "hybrid"),
+                      retrieval_key(0, "misfire", 5, {"brand": "Tata"}, "hybrid"),
+                      retrieval_key(0, "misfire", 5, {"brand": "Maruti", "year": "2019"}, "vector"),
+                      retrieval_key(1, "misfire", 5, {"brand": "Maruti", "year": "2019"}, "hybrid")):
+            self.assertNotEqual(base, other)
+
+    def test_bump_invalidates(self):
+        cache, search = RetrievalCache(use_redis=False), Search()
+        cache.get_or_search("misfire", 5, None, search)
+        cache.bump()
+        cache.get_or_search("misfire", 5, None, search)
+        self.assertEqual(search.calls, 2)
+        self.assertEqual(cache.get_stats()["invalidations"], 1)
+
+    def test_ttl_and_size_bounds(self):
+        cache, search = RetrievalCache(max_entries=2, ttl=0.05, use_redis=False), Search()
+        for query in ("a", "b", "c"):
+            cache.get_or_search(query, 5, None, search)
+        self.assertEqual(cache.get_stats()["entries"], 2)
+        self.assertEqual(cache.get_stats()["evicted"], 1)
+        time.sleep(0.06)
+        cache.get_or_search("c", 5, None, search)
+        self.assertEqual(search.calls, 4)
+        self.assertEqual(cache.get_stats()["expired"], 1)
+
+    def test_workers_share_entries_and_version_through_redis(self):
+        redis = StrRedis()
+        first, second = RetrievalCache(redis_client=redis), RetrievalCache(redis_client=redis)
+        search = Search()
+        first.get_or_search("misfire", 5, None, search)
+        self.assertEqual(second.get_or_search("misfire", 5, None, search), search.rows)
+        self.assertEqual(second.get_stats()["redis_hits"], 1)
+
+        first.bump()  # e.g. documents added through another worker
+        self.assertEqual(redis.data[VERSION_KEY], "1")
+        second.get_or_search("misfire", 5, None, search)
+        self.assertEqual(search.calls, 2)
+
+    def test_failures_are_not_cached_and_disabled_cache_passes_through(self):
+        cache = RetrievalCache(use_redis=False)
+
+        def broken():
+            raise ConnectionError("supabase unavailable")
+        with self.assertRaises(ConnectionError):
+            cache.get_or_search("misfire", 5, None, broken)
+        self.assertEqual(cache.get_stats()["entries"], 0)
+
+        disabled, search = RetrievalCache(enabled=False, use_redis=False), Search()
+        disabled.get_or_search("misfire", 5, None, search)
+        disabled.get_or_search("misfire", 5, None, search)
+        self.assertEqual(search.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+"""
+Unit tests for single-flight request coalescing
+Run with: python -m unittest backend.tests.test_single_flight
+"""
+
+import unittest
+import threading
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify, g
+
+from middleware.single_flight import SingleFlight, flight_key, COALESCED_HEADER
+
+
+class DictRedis:
+    """Minimal thread-safe stand-in for the Redis commands single-flight uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, px=None, ex=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+def run_concurrently(n, target):
+    results = [None] * n
+    start = threading.Barrier(n)
+
+    def worker(i):
+        start.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+class TestKeys(unittest.TestCase):
+
+    def test_key_ignores_order_and_whitespace(self):
+        a = flight_key("chat", {"query": "brake  noise ", "top_k": 5}, "ws1")
+        b = flight_key("chat", {"top_k": 5, "query": "brake noise"}, "ws1")
+        self.assertEqual(a, b)
+
+    def test_key_separates_workshops_and_endpoints(self):
+        payload = {"query": "brake noise"}
+        self.assertNotEqual(flight_key("chat", payload, "ws1"), flight_key("chat", payload, "ws2"))
+        self.assertNotEqual(flight_key("chat", payload, "ws1"), flight_key("kb_query", payload, "ws1"))
+
+
+class TestLocalCoalescing(unittest.TestCase):
+
+    def test_concurrent_duplicates_share_one_call(self):
+        sf = SingleFlight(use_redis=False)
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"answer": 42}
+
+        results = run_concurrently(5, lambda: sf.do("k", upstream))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result == {"answer": 42} for result, _ in results))
+        self.assertEqual(sum(shared for _, shared in results), 4)
+        self.assertEqual(sf.get_stats()["coalesced_local"], 4)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        sf = SingleFlight(use_redis=False)
+        calls = []
+        for _ in range(3):
+            sf.do("k", lambda: calls.append(1) or len(calls))
+        self.assertEqual(len(calls), 3)
+
+    def test_error_propagates_to_waiters(self):
+        sf = SingleFlight(use_redis=False)
+
+        def upstream():
+            time.sleep(0.1)
+            raise RuntimeError("provider down")
+
+        def call():
+            try:
+                sf.do("k", upstream)
+            except RuntimeError as e:
+                return str(e)
+
+        self.assertEqual(run_concurrently(3, call), ["provider down"] * 3)
+
+
+class TestRedisCoalescing(unittest.TestCase):
+
+    def make(self, shared_redis):
+        sf = SingleFlight(use_redis=False)
+        sf.redis = shared_redis
+        return sf
+
+    def test_duplicates_across_workers_share_result(self):
+        shared = DictRedis()
+        workers = [self.make(shared) for _ in range(3)]
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            time.sleep(0.3)
+            return {"answer": "ok"}
+
+        results = [None] * 3
+
+        def worker(i):
+            time.sleep(0.05 * i)  # worker 0 takes the lock first
+            results[i] = workers[i].do("k", upstream)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r[0] for r in results], [{"answer": "ok"}] * 3)
+        self.assertEqual(sum(w.get_stats()["coalesced_remote"] for w in workers), 2)
+        self.assertNotIn("sf:lock:k", shared.data)
+
+    def test_waiter_takes_over_when_leader_disappears(self):
+        shared = DictRedis()
+        shared.set("sf:lock:k", "dead-owner")
+        sf = self.make(shared)
+
+        def expire_lock():
+            time.sleep(0.1)
+            shared.delete("sf:lock:k")
+
+        threading.Thread(target=expire_lock).start()
+        result, was_shared = sf.do("k", lambda: "fresh")
+        self.assertEqual((result, was_shared), ("fresh", False))
+        self.assertEqual(sf.get_stats()["takeovers"], 1)
+
+
+class TestFlaskDecorator(unittest.TestCase):
+
+    def setUp(self):
+        self.sf = SingleFlight(use_redis=False)
+        self.calls = []
+        app = Flask(__name__)
+
+        @app.before_request
+        def set_workshop():
+            g.workshop_id = "ws1"
+
+        @app.route("/api/kb/query", methods=["POST"])
+        @self.sf.coalesce("kb_query", skip_if=lambda data: data.get("stream"))
+        def kb_query():
+            self.calls.append(1)
+            time.sleep(0.2)
+            response = jsonify({"answer": "check the fuse"})
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        self.app = app
+
+    def post(self, payload):
+        with self.app.test_client() as client:
+            return client.post("/api/kb/query", json=payload)
+
+    def test_duplicate_requests_get_copied_response(self):
+        responses = run_concurrently(4, lambda: self.post({"query": "fuse"}))
+        self.assertEqual(len(self.calls), 1)
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {"answer": "check the fuse"})
+            self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(sum(1 for r in responses if r.headers.get(COALESCED_HEADER)), 3)
+
+    def test_skip_predicate_runs_every_request(self):
+        run_concurrently(3, lambda: self.post({"query": "fuse", "stream": True}))
+        self.assertEqual(len(self.calls), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Unit tests for the incremental JSON stream parser
+Run with: python -m unittest backend.tests.test_stream_parser
+"""
+
+import unittest
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.stream_parser import IncrementalJSONParser
+
+
+ENVELOPE = {
+    "job_status_update": "DIAGNOSED",
+    "ui_triggers": {"theme_color": "#f18a22", "show_orange_border": True},
+    "diagnostic_data": {"code": "P0301", "possible_causes": ["Spark plug", {"visual_text": "decoy"}]},
+    "response_content": {
+        "audio_text": "Cylinder one misfire.",
+        "visual_text": "<b>P0301</b>: \"Cylinder 1\" misfire\nCheck coil ✓ \\ plug"
+    },
+    "estimate_data": None
+}
+
+
+def feed_in_chunks(raw, size):
+    parser = IncrementalJSONParser()
+    streamed = ""
+    for i in range(0, len(raw), size):
+        streamed += parser.feed(raw[i:i + size])
+    return parser, streamed
+
+
+class TestIncrementalJSONParser(unittest.TestCase):
+    """Test cases for streaming visual_text extraction."""
+
+    def test_streams_visual_text_for_any_chunking(self):
+        """Deltas reassemble to the final field regardless of chunk boundaries."""
+        raw = json.dumps(ENVELOPE)
+        for size in (1, 2, 3, 7, 64, len(raw)):
+            parser, streamed = feed_in_chunks(raw, size)
+            self.assertEqual(streamed, ENVELOPE["response_content"]["visual_text"])
+            self.assertTrue(parser.complete)
+            self.assertTrue(parser.finished)
+            self.assertEqual(json.loads(parser.text), ENVELOPE)
+
+    def test_ignores_nested_fields_with_same_name(self):
+        """Only response_content.visual_text is streamed, not decoys elsewhere."""
+        _, streamed = feed_in_chunks(json.dumps(ENVELOPE), 5)
+        self.assertNotIn("decoy", streamed)
+
+    def test_decodes_unicode_escapes_and_surrogates(self):
+        """\\uXXXX escapes (including surrogate pairs) decode correctly."""
+        raw = json.dumps({"response_content": {"visual_text": "₹800 🚗"}}, ensure_ascii=True)
+        _, streamed = feed_in_chunks(raw, 3)
+        self.assertEqual(streamed, "₹800 🚗")
+
+    def test_skips_leading_markdown_fence(self):
+        """Prose or fences before the first brace are ignored."""
+        raw = "```json\n" + json.dumps(ENVELOPE, indent=2) + "\n```"
+        parser, streamed = feed_in_chunks(raw, 4)
+        self.assertEqual(streamed, ENVELOPE["response_content"]["visual_text"])
+        self.assertTrue(parser.finished)
+
+    def test_partial_stream_reports_progress(self):
+        """A truncated stream still exposes the text seen so far."""
+        raw = json.dumps(ENVELOPE)
+        cut = raw.index("Check coil")
+        parser = IncrementalJSONParser()
+        parser.feed(raw[:cut])
+        self.assertTrue(parser.value.startswith("<b>P0301</b>"))
+        self.assertFalse(parser.complete)
+        self.assertFalse(parser.finished)
+
+
+if __name__ == '__main__':
+    unittest.main()
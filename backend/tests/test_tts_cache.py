@@ -0,0 +1,80 @@
+"""
+Unit tests for the content-addressed TTS audio cache
+Run with: python -m unittest backend.tests.test_tts_cache
+"""
+
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.tts_cache import TTSCache, FIXED_PHRASES
+
+
+class FakeSynth:
+    def __init__(self, size=1000):
+        self.calls = []
+        self.size = size
+
+    def __call__(self, text, voice):
+        self.calls.append((text, voice))
+        return "audio/L16;codec=pcm;rate=24000", (f"{voice}:{text}|".encode() * self.size)[:self.size]
+
+
+class TestTTSCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.synth = FakeSynth()
+        self.cache = TTSCache(root=self.root, max_bytes=10_000, synthesizer=self.synth)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_second_request_is_served_from_disk(self):
+        mime, path, hit = self.cache.get_or_synthesize("Processing complete.", "Kore")
+        self.assertFalse(hit)
+        mime2, path2, hit2 = self.cache.get_or_synthesize("  Processing   complete. ", "Kore")
+        self.assertTrue(hit2)
+        self.assertEqual((mime, path), (mime2, path2))
+        self.assertEqual(len(self.synth.calls), 1)
+        self.assertEqual(self.cache.read(path)[1], self.synth("Processing complete.", "Kore")[1])
+
+    def test_voice_is_part_of_the_key(self):
+        self.cache.get_or_synthesize("System error.", "Kore")
+        _, _, hit = self.cache.get_or_synthesize("System error.", "Puck")
+        self.assertFalse(hit)
+
+    def test_chunks_reassemble_audio(self):
+        _, path, _ = self.cache.get_or_synthesize("System error.", "Kore")
+        chunks = list(self.cache.iter_chunks(path, chunk_size=128))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks), self.cache.read(path)[1])
+
+    def test_size_cap_evicts_least_recently_used(self):
+        paths = []
+        for i in range(9):
+            _, path, _ = self.cache.get_or_synthesize(f"phrase {i}", "Kore")
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+            paths.append(path)
+        self.cache.get("phrase 0", "Kore")  # touch: now most recently used
+
+        self.cache.get_or_synthesize("phrase 9", "Kore")
+        self.cache.get_or_synthesize("phrase 10", "Kore")
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertLessEqual(self.cache._scan_bytes(), 10_000)
+        self.assertGreater(self.cache.get_stats()["evictions"], 0)
+
+    def test_prewarm_synthesizes_missing_phrases_once(self):
+        self.assertEqual(self.cache.prewarm()["warmed"], len(FIXED_PHRASES))
+        self.assertEqual(self.cache.prewarm()["warmed"], 0)
+        self.assertEqual(len(self.synth.calls), len(FIXED_PHRASES))
+
+
+if __name__ == '__main__':
+    unittest.main()
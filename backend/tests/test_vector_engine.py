@@ -0,0 +1,163 @@
+"""
+Unit tests for the semantic cache search path
+Run with: python -m unittest backend.tests.test_vector_engine
+"""
+
+import unittest
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_cache import EmbeddingCache
+from services.cache_stats import CacheStats
+from services.cache_budget import CacheBudget
+from services.vector_engine import (
+    VectorEngine, SCORE_FIELD, SIMILARITY_THRESHOLD, to_vector_bytes, REDIS_AVAILABLE,
+    physical_index_name, vector_attributes
+)
+
+
+def doc(distance, scope="global", response="Check the battery terminals."):
+    return SimpleNamespace(id="cache:abc", scope=scope, response=response, query="car won't start",
+                           timestamp="2026-01-01T00:00:00", **{SCORE_FIELD: str(distance)})
+
+
+class TestSearchPath(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = VectorEngine.__new__(VectorEngine)
+        self.engine.stats = CacheStats(lambda: None)
+        self.engine.budget = CacheBudget(lambda: None)
+
+    def test_hit_uses_redisearch_distance(self):
+        hit = self.engine._match(doc(0.04), "global")
+        self.assertAlmostEqual(hit["similarity"], 0.96)
+        self.assertEqual(hit["text"], "Check the battery terminals.")
+        self.assertEqual(hit["timestamp"], "2026-01-01T00:00:00")
+
+    def test_threshold_and_scope_guard(self):
+        self.assertIsNone(self.engine._match(doc(1.0 - SIMILARITY_THRESHOLD + 0.01), "global"))
+        self.assertIsNone(self.engine._match(doc(0.0, scope="ws1"), "ws2"))
+
+    def test_cosine_similarity(self):
+        self.assertAlmostEqual(self.engine.cosine_similarity([1, 0], [1, 1]), 1 / np.sqrt(2), places=6)
+        self.assertEqual(self.engine.cosine_similarity([0, 0], [1, 1]), 0.0)
+        self.assertEqual(self.engine.cosine_similarity([1, 0], [1, 0, 0]), 0.0)
+
+    def test_query_vector_is_float32(self):
+        blob = to_vector_bytes([0.5, -1.0, 2.0])
+        self.assertEqual(np.frombuffer(blob, dtype=np.float32).tolist(), [0.5, -1.0, 2.0])
+
+    def test_query_is_embedded_once(self):
+        calls = []
+        self.engine._embed = lambda text: calls.append(text) or [0.1, 0.2, 0.3]
+        with patch("services.vector_engine.GENAI_AVAILABLE", True), \
+                patch("services.vector_engine.embedding_cache", EmbeddingCache(use_redis=False)):
+            first = self.engine.get_embedding("car won't start")
+            second = self.engine.get_embedding("car won't start")
+        self.assertEqual(first, second)
+        self.assertEqual(calls, ["car won't start"])
+
+    @unittest.skipUnless(REDIS_AVAILABLE, "redis-py search commands not installed")
+    def test_query_returns_score_not_vector(self):
+        args = VectorEngine.knn_query("ws1", ef_runtime=0).get_args()
+        self.assertIn("(@scope:{ws1})=>[KNN 5 @vector $vec AS vector_score]", args)
+        returned = args[args.index("RETURN") + 1:args.index("SORTBY")]
+        self.assertIn(SCORE_FIELD, returned)
+        self.assertIn("response", returned)
+        self.assertNotIn("vector", returned)
+        self.assertNotIn("$", returned)
+        self.assertEqual(args[-3:], ["LIMIT", 0, 1])
+
+
+    @unittest.skipUnless(REDIS_AVAILABLE, "redis-py search commands not installed")
+    def test_hnsw_query_sets_ef_runtime(self):
+        args = VectorEngine.knn_query("ws1", ef_runtime=64).get_args()
+        self.assertIn("(@scope:{ws1})=>[KNN 5 @vector $vec EF_RUNTIME 64 AS vector_score]", args)
+
+
+class FakeIndex:
+    def __init__(self, server, name):
+        self.server, self.name = server, name
+
+    def info(self):
+        physical = self.server.aliases.get(self.name, self.name)
+        if physical not in self.server.indexes:
+            raise Exception("Unknown index name")
+        return {"index_name": physical, "attributes": [["identifier", "$.scope", "attribute", "scope"]]}
+
+    def create_index(self, fields, definition):
+        self.server.indexes[self.name] = fields
+        self.server.log.append(("create", self.name))
+
+    def aliasadd(self, alias):
+        self.server.aliases[alias] = self.name
+
+    def aliasupdate(self, alias):
+        self.server.aliases[alias] = self.name
+
+    def dropindex(self, delete_documents=False):
+        self.server.indexes.pop(self.name)
+        self.server.log.append(("drop", self.name, delete_documents))
+
+
+class FakeSearchServer:
+    def __init__(self, indexes=()):
+        self.indexes = {name: None for name in indexes}
+        self.aliases = {}
+        self.log = []
+
+    def ft(self, name):
+        return FakeIndex(self, name)
+
+
+@unittest.skipUnless(REDIS_AVAILABLE, "redis-py search commands not installed")
+class TestIndexMigration(unittest.TestCase):
+
+    def engine(self, server):
+        engine = VectorEngine.__new__(VectorEngine)
+        engine.redis, engine.index_name, engine.doc_prefix = server, "semantic_cache_idx", "cache:"
+        return engine
+
+    def test_attributes(self):
+        self.assertEqual(vector_attributes("HNSW", 32, 400)["M"], 32)
+        self.assertNotIn("M", vector_attributes("FLAT"))
+        self.assertEqual(physical_index_name("idx", "HNSW", 32, 400), "idx:hnsw-m32-efc400")
+        with self.assertRaises(ValueError):
+            vector_attributes("IVF")
+
+    def test_fresh_install_creates_aliased_index(self):
+        server = FakeSearchServer()
+        with patch("services.vector_engine.VECTOR_ALGORITHM", "HNSW"):
+            self.engine(server)._ensure_index()
+        target = physical_index_name("semantic_cache_idx", "HNSW")
+        self.assertEqual(server.aliases, {"semantic_cache_idx": target})
+        self.assertEqual(server.log, [("create", target)])
+
+    def test_legacy_flat_index_is_migrated_without_dropping_documents(self):
+        server = FakeSearchServer(["semantic_cache_idx"])
+        with patch("services.vector_engine.VECTOR_ALGORITHM", "HNSW"):
+            self.engine(server)._ensure_index()
+        target = physical_index_name("semantic_cache_idx", "HNSW")
+        self.assertEqual(server.log, [("create", target), ("drop", "semantic_cache_idx", False)])
+        self.assertEqual(server.aliases["semantic_cache_idx"], target)
+
+    def test_switching_back_to_flat_moves_the_alias(self):
+        server = FakeSearchServer()
+        with patch("services.vector_engine.VECTOR_ALGORITHM", "HNSW"):
+            self.engine(server)._ensure_index()
+        with patch("services.vector_engine.VECTOR_ALGORITHM", "FLAT"):
+            self.engine(server)._ensure_index()
+            self.engine(server)._ensure_index()  # already current: no-op
+        hnsw = physical_index_name("semantic_cache_idx", "HNSW")
+        self.assertEqual(server.aliases["semantic_cache_idx"], "semantic_cache_idx:flat")
+        self.assertEqual(server.log[1:], [("create", "semantic_cache_idx:flat"), ("drop", hnsw, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
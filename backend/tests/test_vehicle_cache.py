@@ -0,0 +1,132 @@
+"""
+Unit tests for the vehicle context cache
+Run with: python -m unittest backend.tests.test_vehicle_cache
+"""
+
+import unittest
+from unittest import mock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.vehicle_cache import (
+    VehicleCache, KEY_PREFIX, VEHICLE_CACHE_TTL, VEHICLE_NEGATIVE_TTL,
+)
+
+
+class StrRedis:
+    """Minimal stand-in for the Redis commands the vehicle cache uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+
+class Loader:
+    """Vehicle lookup stand-in that counts calls; ``during`` runs mid-load."""
+
+    def __init__(self, rows=None, during=None):
+        self.rows = rows or {}
+        self.during = during
+        self.calls = 0
+
+    def __call__(self, plate):
+        self.calls += 1
+        if self.during:
+            during, self.during = self.during, None
+            during()
+        return self.rows.get(plate)
+
+
+SWIFT = {"registration_number": "MH12AB1234", "brand": "Maruti", "model": "Swift"}
+
+
+def shared_cache(redis_client):
+    cache = VehicleCache(use_redis=False)
+    cache.redis = redis_client
+    return cache
+
+
+class TestVehicleCache(unittest.TestCase):
+
+    def test_miss_loads_once_then_hits(self):
+        cache, loader = VehicleCache(use_redis=False), Loader({"MH12AB1234": SWIFT})
+        self.assertEqual(cache.get_or_load(" mh12ab1234 ", loader), SWIFT)
+        self.assertEqual(cache.get_or_load("MH12AB1234", loader), SWIFT)
+        self.assertEqual(loader.calls, 1)
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_unknown_plate_is_cached_for_the_negative_ttl(self):
+        cache, loader = VehicleCache(use_redis=False), Loader()
+        with mock.patch("services.vehicle_cache.time.time", return_value=1000.0):
+            self.assertIsNone(cache.get_or_load("KA01ZZ0001", loader))
+            self.assertIsNone(cache.get_or_load("KA01ZZ0001", loader))
+        self.assertEqual((loader.calls, cache.get_stats()["negative_hits"]), (1, 1))
+
+        with mock.patch("services.vehicle_cache.time.time", return_value=1000.0 + VEHICLE_NEGATIVE_TTL + 1):
+            cache.get_or_load("KA01ZZ0001", loader)
+        self.assertEqual(loader.calls, 2)
+
+    def test_redis_tier_is_shared_between_workers(self):
+        redis_client = StrRedis()
+        loader = Loader({"MH12AB1234": SWIFT})
+        shared_cache(redis_client).get_or_load("MH12AB1234", loader)
+        shared_cache(redis_client).get_or_load("KA01ZZ0001", loader)
+        self.assertEqual(redis_client.ttls[f"{KEY_PREFIX}MH12AB1234"], VEHICLE_CACHE_TTL)
+        self.assertEqual(redis_client.ttls[f"{KEY_PREFIX}KA01ZZ0001"], VEHICLE_NEGATIVE_TTL)
+
+        other = shared_cache(redis_client)
+        self.assertEqual(other.get_or_load("MH12AB1234", loader), SWIFT)
+        self.assertEqual(loader.calls, 2)
+        self.assertEqual(other.get_stats()["redis_hits"], 1)
+
+    def test_invalidate_drops_both_tiers(self):
+        redis_client = StrRedis()
+        cache, loader = shared_cache(redis_client), Loader({"MH12AB1234": SWIFT})
+        cache.get_or_load("MH12AB1234", loader)
+        cache.invalidate("mh12ab1234")
+        self.assertNotIn(f"{KEY_PREFIX}MH12AB1234", redis_client.data)
+
+        cache.get_or_load("MH12AB1234", loader)
+        self.assertEqual(loader.calls, 2)
+
+    def test_load_racing_an_invalidation_is_not_cached(self):
+        cache = VehicleCache(use_redis=False)
+        loader = Loader({"MH12AB1234": SWIFT}, during=lambda: cache.invalidate("MH12AB1234"))
+        self.assertEqual(cache.get_or_load("MH12AB1234", loader), SWIFT)
+
+        cache.get_or_load("MH12AB1234", loader)
+        self.assertEqual(loader.calls, 2)
+        self.assertEqual(cache.get_stats()["stale_loads"], 1)
+
+    def test_invalidation_in_another_worker_stops_the_stale_write(self):
+        redis_client = StrRedis()
+        loading, webhook = shared_cache(redis_client), shared_cache(redis_client)
+        loader = Loader({"MH12AB1234": SWIFT}, during=lambda: webhook.invalidate("MH12AB1234"))
+        loading.get_or_load("MH12AB1234", loader)
+
+        self.assertNotIn(f"{KEY_PREFIX}MH12AB1234", redis_client.data)
+        self.assertEqual(loading.get_stats()["stale_loads"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
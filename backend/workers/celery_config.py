@@ -53,10 +53,10 @@ celery_app.conf.update(
             'schedule': crontab(hour=2, minute=0),  # 2 AM daily
         },
         
-        # Cache cleanup
+        # Semantic cache budget sweep
         'cache-cleanup': {
             'task': 'workers.tasks.cleanup_old_cache',
-            'schedule': crontab(hour=0, minute=0),  # Midnight
+            'schedule': crontab(minute='*/15'),
         },
         
         # Audit log rotation
@@ -199,25 +199,22 @@ def perform_daily_backup(self):
 @celery_app.task(bind=True)
 def cleanup_old_cache(self):
     """
-    Clean up expired cache entries.
-    Runs at midnight.
+    Reconcile the semantic cache budget: forget expired entries, adopt
+    untracked ones and evict down to the global and per-workshop limits.
+    Runs every 15 minutes; each pass is an incremental SCAN.
     """
     try:
         logger.info("Starting cache cleanup")
         
         from services.vector_engine import vector_engine
         
-        stats_before = vector_engine.get_cache_stats()
-        # Cleanup logic here
-        stats_after = vector_engine.get_cache_stats()
+        report = vector_engine.budget.sweep()
         
-        logger.info("Cache cleanup completed", extra={
-            "entries_before": stats_before.get("count"),
-            "entries_after": stats_after.get("count")
-        })
+        logger.info("Cache cleanup completed", extra=report)
         
         return {
             "status": "success",
+            **report,
             "cleaned_at": datetime.utcnow().isoformat()
         }
         
@@ -273,6 +270,28 @@ def send_job_card_reminder(self, job_card_id: str, reminder_type: str):
         return {"status": "error", "error": str(exc)}
 
 
+@celery_app.task(bind=True)
+def run_batch_job(self, job_id: str):
+    """
+    Run an offline batch of chat/diagnose requests (POST /api/batch/jobs).
+    Progress is published to the job status and to the Celery task state.
+    """
+    try:
+        from services.batch_inference import run_job
+        from server import BATCH_HANDLERS
+        
+        logger.info(f"Starting batch job {job_id}")
+        
+        def progress(status):
+            self.update_state(state="PROGRESS", meta=status)
+        
+        return run_job(job_id, BATCH_HANDLERS, on_progress=progress)
+        
+    except Exception as exc:
+        logger.error(f"Batch job {job_id} failed: {exc}")
+        return {"status": "error", "job_id": job_id, "error": str(exc)}
+
+
 # Health check task
 @celery_app.task
 def health_check():